@@ -7,6 +7,7 @@ sys.path.insert(0, '.')
 
 from database import SessionLocal
 from models.hr import EventType
+from settings_cache import bump_version, LOOKUPS
 
 def add_permesso_improvviso():
     db = SessionLocal()
@@ -25,6 +26,7 @@ def add_permesso_improvviso():
             icon="⚡"
         )
         db.add(new_type)
+        bump_version(db, LOOKUPS)  # worker già avviati: rileggono i tipi evento
         db.commit()
         db.refresh(new_type)
         print(f"✅ Aggiunto 'Permesso Improvviso' (ID: {new_type.id}, punti: -1)")
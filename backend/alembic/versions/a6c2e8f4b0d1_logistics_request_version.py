@@ -0,0 +1,38 @@
+"""logistics request version
+
+Versione di riga su logistics_requests (+1 a ogni UPDATE), inviata con gli
+eventi del pool logistica: il pool in memoria scarta gli eventi del broker
+più vecchi dello stato già applicato.
+
+Revision ID: a6c2e8f4b0d1
+Revises: f3b9d1e7c5a2
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a6c2e8f4b0d1'
+down_revision: Union[str, Sequence[str], None] = 'f3b9d1e7c5a2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('logistics_requests'):
+        return
+    if 'version' not in {c['name'] for c in inspector.get_columns('logistics_requests')}:
+        with op.batch_alter_table('logistics_requests') as batch_op:
+            batch_op.add_column(sa.Column('version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('logistics_requests') as batch_op:
+        batch_op.drop_column('version')
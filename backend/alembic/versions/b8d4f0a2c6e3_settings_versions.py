@@ -0,0 +1,44 @@
+"""settings versions
+
+Versione per namespace della cache impostazioni (settings_cache): ogni
+scrittura la incrementa e gli altri worker rileggono il namespace. Le righe
+partono da 0 per ogni namespace.
+
+Revision ID: b8d4f0a2c6e3
+Revises: a6c2e8f4b0d1
+Create Date: 2026-10-17 18:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8d4f0a2c6e3'
+down_revision: Union[str, Sequence[str], None] = 'a6c2e8f4b0d1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Copia dei namespace di settings_cache al momento della migration
+NAMESPACES = ('logistics', 'lookups', 'staffing', 'system')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('settings_versions'):
+        settings_versions = op.create_table(
+            'settings_versions',
+            sa.Column('namespace', sa.String(length=30), nullable=False),
+            sa.Column('version', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('namespace'),
+        )
+        # Righe già presenti: gli UPDATE di versione non devono mai inserire in concorrenza
+        op.bulk_insert(settings_versions, [{'namespace': name, 'version': 0} for name in NAMESPACES])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('settings_versions')
@@ -0,0 +1,46 @@
+"""conversation member unread counters
+
+Contatore non letti denormalizzato (unread_count) e puntatore all'ultimo
+messaggio non cancellato (last_message_id) su conversation_members, come
+nel modello e nel lifespan di main.py. Lo scheduler li riconcilia al primo
+giro (reconcile_chat_counters).
+
+Revision ID: c1e7a3f5d9b2
+Revises: b8d4f0a2c6e3
+Create Date: 2026-10-17 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c1e7a3f5d9b2'
+down_revision: Union[str, Sequence[str], None] = 'b8d4f0a2c6e3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+FK_NAME = 'fk_conversation_members_last_message_id_messages'
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('conversation_members'):
+        return
+    existing = {c['name'] for c in inspector.get_columns('conversation_members')}
+    with op.batch_alter_table('conversation_members') as batch_op:
+        if 'unread_count' not in existing:
+            batch_op.add_column(sa.Column('unread_count', sa.Integer(), nullable=False, server_default='0'))
+        if 'last_message_id' not in existing:
+            batch_op.add_column(sa.Column('last_message_id', sa.Integer(), nullable=True))
+            batch_op.create_foreign_key(FK_NAME, 'messages', ['last_message_id'], ['id'], ondelete='SET NULL')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('conversation_members') as batch_op:
+        batch_op.drop_column('last_message_id')
+        batch_op.drop_column('unread_count')
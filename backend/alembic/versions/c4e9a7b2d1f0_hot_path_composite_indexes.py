@@ -0,0 +1,53 @@
+"""hot path composite indexes (merge heads)
+
+Indici compositi per i filtri più frequenti: pool logistica ed escalation,
+badge notifiche, turni per dipendente/giorno, KPI per settore/giorno/turno,
+forno, ferie per dipendente e cicli di ricarica per mezzo.
+
+Revision ID: c4e9a7b2d1f0
+Revises: 57d47c7e675a, a8f2c1d3e456
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e9a7b2d1f0'
+down_revision: Union[str, Sequence[str], None] = ('57d47c7e675a', 'a8f2c1d3e456')
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (nome indice, tabella, colonne) — stessi indici dichiarati in __table_args__ dei modelli
+INDEXES = [
+    ('ix_logistics_requests_status_created', 'logistics_requests', ['status', 'created_at']),
+    ('ix_notifications_user_read_created', 'notifications', ['recipient_user_id', 'is_read', 'created_at']),
+    ('ix_notifications_role_read_created', 'notifications', ['recipient_role', 'is_read', 'created_at']),
+    ('ix_shift_assignments_employee_date', 'shift_assignments', ['employee_id', 'work_date']),
+    ('ix_kpi_entries_config_date_shift', 'kpi_entries', ['kpi_config_id', 'work_date', 'shift_type']),
+    ('ix_oven_items_status', 'oven_items', ['status']),
+    ('ix_leave_requests_employee_status_start', 'leave_requests', ['employee_id', 'status', 'start_date']),
+    ('ix_fleet_charge_cycles_vehicle_status', 'fleet_charge_cycles', ['vehicle_id', 'status']),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    inspector = sa.inspect(op.get_bind())
+    for name, table, columns in INDEXES:
+        # Tabelle create dal lifespan (create_all) potrebbero non esistere su DB molto vecchi
+        if not inspector.has_table(table):
+            continue
+        op.create_index(name, table, columns, unique=False, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    inspector = sa.inspect(op.get_bind())
+    for name, table, _columns in reversed(INDEXES):
+        if inspector.has_table(table):
+            op.drop_index(name, table_name=table, if_exists=True)
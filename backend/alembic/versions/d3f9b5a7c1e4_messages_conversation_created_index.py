@@ -0,0 +1,35 @@
+"""messages conversation created index
+
+Indice composito (conversation_id, created_at) su messages per ultimo
+messaggio e non letti per conversazione, come in __table_args__ di Message
+e nel lifespan di main.py.
+
+Revision ID: d3f9b5a7c1e4
+Revises: c1e7a3f5d9b2
+Create Date: 2026-10-17 19:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd3f9b5a7c1e4'
+down_revision: Union[str, Sequence[str], None] = 'c1e7a3f5d9b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if sa.inspect(op.get_bind()).has_table('messages'):
+        op.create_index('ix_messages_conv_created', 'messages', ['conversation_id', 'created_at'],
+                        unique=False, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if sa.inspect(op.get_bind()).has_table('messages'):
+        op.drop_index('ix_messages_conv_created', table_name='messages', if_exists=True)
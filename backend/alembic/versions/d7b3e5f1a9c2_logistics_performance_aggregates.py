@@ -0,0 +1,52 @@
+"""logistics performance aggregates
+
+Aggregati incrementali del tempo di reazione (count/sum/max + sketch per
+p50/p95) e conteggi ETA su logistics_performance. Dopo l'upgrade eseguire
+scripts/rebuild_logistics_performance.py per ricostruire lo storico.
+
+Revision ID: d7b3e5f1a9c2
+Revises: c4e9a7b2d1f0
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd7b3e5f1a9c2'
+down_revision: Union[str, Sequence[str], None] = 'c4e9a7b2d1f0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _columns():
+    return [
+        sa.Column('reaction_count', sa.Integer(), nullable=True, server_default='0'),
+        sa.Column('reaction_total_seconds', sa.Integer(), nullable=True, server_default='0'),
+        sa.Column('slowest_reaction_seconds', sa.Integer(), nullable=True),
+        sa.Column('reaction_sketch', sa.Text(), nullable=True),
+        sa.Column('eta_checked', sa.Integer(), nullable=True, server_default='0'),
+        sa.Column('eta_respected_count', sa.Integer(), nullable=True, server_default='0'),
+    ]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('logistics_performance'):
+        return
+    existing = {c['name'] for c in inspector.get_columns('logistics_performance')}
+    with op.batch_alter_table('logistics_performance') as batch_op:
+        for column in _columns():
+            if column.name not in existing:
+                batch_op.add_column(column)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('logistics_performance') as batch_op:
+        for column in reversed(_columns()):
+            batch_op.drop_column(column.name)
@@ -0,0 +1,80 @@
+"""kpi rollup tables
+
+Totali KPI pre-aggregati per giorno/settore/turno e per mese/settore
+(feriali/weekend), letti da /kpi/report/trend e dal report avanzato PDF.
+Dopo l'upgrade eseguire scripts/rebuild_kpi_rollups.py (all'avvio l'app lo
+fa da sola se i rollup sono vuoti e le KpiEntry no).
+
+Revision ID: e2a8c6d4b1f3
+Revises: d7b3e5f1a9c2
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2a8c6d4b1f3'
+down_revision: Union[str, Sequence[str], None] = 'd7b3e5f1a9c2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _totals():
+    return [
+        sa.Column('entries_count', sa.Integer(), nullable=True),
+        sa.Column('quantity_produced', sa.Integer(), nullable=True),
+        sa.Column('hours_total', sa.Float(), nullable=True),
+        sa.Column('hours_downtime', sa.Float(), nullable=True),
+        sa.Column('hours_net', sa.Float(), nullable=True),
+        sa.Column('hours_net_target', sa.Float(), nullable=True),
+    ]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('kpi_daily_rollups'):
+        op.create_table(
+            'kpi_daily_rollups',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('work_day', sa.Date(), nullable=False),
+            sa.Column('weekday', sa.Integer(), nullable=False),
+            sa.Column('kpi_config_id', sa.Integer(), nullable=False),
+            sa.Column('shift_type', sa.String(length=20), nullable=False),
+            *_totals(),
+            sa.ForeignKeyConstraint(['kpi_config_id'], ['kpi_configs.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('work_day', 'kpi_config_id', 'shift_type', name='uq_kpi_daily_rollup'),
+        )
+        op.create_index(op.f('ix_kpi_daily_rollups_id'), 'kpi_daily_rollups', ['id'], unique=False)
+        op.create_index(op.f('ix_kpi_daily_rollups_work_day'), 'kpi_daily_rollups', ['work_day'], unique=False)
+        op.create_index('ix_kpi_daily_rollups_config_day', 'kpi_daily_rollups', ['kpi_config_id', 'work_day'],
+                        unique=False)
+    if not inspector.has_table('kpi_monthly_rollups'):
+        op.create_table(
+            'kpi_monthly_rollups',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('year', sa.Integer(), nullable=False),
+            sa.Column('month', sa.Integer(), nullable=False),
+            sa.Column('kpi_config_id', sa.Integer(), nullable=False),
+            sa.Column('is_weekend', sa.Boolean(), nullable=False),
+            *_totals(),
+            sa.ForeignKeyConstraint(['kpi_config_id'], ['kpi_configs.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('year', 'month', 'kpi_config_id', 'is_weekend', name='uq_kpi_monthly_rollup'),
+        )
+        op.create_index(op.f('ix_kpi_monthly_rollups_id'), 'kpi_monthly_rollups', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_kpi_monthly_rollups_id'), table_name='kpi_monthly_rollups')
+    op.drop_table('kpi_monthly_rollups')
+    op.drop_index('ix_kpi_daily_rollups_config_day', table_name='kpi_daily_rollups')
+    op.drop_index(op.f('ix_kpi_daily_rollups_work_day'), table_name='kpi_daily_rollups')
+    op.drop_index(op.f('ix_kpi_daily_rollups_id'), table_name='kpi_daily_rollups')
+    op.drop_table('kpi_daily_rollups')
@@ -0,0 +1,70 @@
+"""report jobs and data versions
+
+Job di export PDF/Excel in background (report_jobs) e versione per tabella
+dei dati letti dai report (data_versions), usata nella chiave della cache
+degli artefatti. Le righe di data_versions partono da 0 per ogni tabella.
+
+Revision ID: f3b9d1e7c5a2
+Revises: e2a8c6d4b1f3
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3b9d1e7c5a2'
+down_revision: Union[str, Sequence[str], None] = 'e2a8c6d4b1f3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Copia di data_versions.DATA_VERSION_TABLES al momento della migration
+VERSIONED_TABLES = (
+    'banchine', 'block_requests', 'bonuses', 'checklist_web', 'departments', 'employee_events',
+    'employees', 'kpi_configs', 'kpi_daily_rollups', 'kpi_entries', 'leave_requests',
+    'production_materials', 'shift_assignments', 'users',
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('data_versions'):
+        data_versions = op.create_table(
+            'data_versions',
+            sa.Column('table_name', sa.String(length=64), nullable=False),
+            sa.Column('version', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('table_name'),
+        )
+        # Righe già presenti: gli UPDATE di versione non devono mai inserire in concorrenza
+        op.bulk_insert(data_versions, [{'table_name': name, 'version': 0} for name in VERSIONED_TABLES])
+    if not inspector.has_table('report_jobs'):
+        op.create_table(
+            'report_jobs',
+            sa.Column('id', sa.String(length=32), nullable=False),
+            sa.Column('report_type', sa.String(length=50), nullable=False),
+            sa.Column('params', sa.Text(), nullable=False),
+            sa.Column('cache_key', sa.String(length=64), nullable=False),
+            sa.Column('status', sa.String(length=20), nullable=False),
+            sa.Column('filename', sa.String(length=255), nullable=True),
+            sa.Column('media_type', sa.String(length=100), nullable=True),
+            sa.Column('error', sa.Text(), nullable=True),
+            sa.Column('requested_by', sa.Integer(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('finished_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['requested_by'], ['users.id'], ondelete='SET NULL'),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index(op.f('ix_report_jobs_cache_key'), 'report_jobs', ['cache_key'], unique=False)
+        op.create_index('ix_report_jobs_user_created', 'report_jobs', ['requested_by', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_report_jobs_user_created', table_name='report_jobs')
+    op.drop_index(op.f('ix_report_jobs_cache_key'), table_name='report_jobs')
+    op.drop_table('report_jobs')
+    op.drop_table('data_versions')
@@ -0,0 +1,313 @@
+"""
+SL Enterprise - Analytics
+Motore di aggregazione colonnare (pandas/NumPy) per i report KPI e produzione.
+
+I dati di un periodo vengono letti con UNA SELECT di sole colonne (niente
+oggetti ORM, niente joinedload) in un DataFrame; raggruppamenti, efficienza
+sul target, fascia turno dall'ora ed esclusione weekend sono operazioni
+vettoriali. Le stesse funzioni sono usate da:
+- /kpi/report/daily, /kpi/report/trend, /kpi/report/advanced/pdf
+- /production/reports (JSON ed Excel)
+- kpi_rollups.rebuild_kpi_rollups
+
+Le definizioni sono quelle dei vecchi cicli Python: target = kpi_target_8h *
+ore_nette / 8 (solo ore nette > 0), efficienza = round(quantità / target * 100).
+"""
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+from sqlalchemy.orm import Session, aliased
+
+from models.core import User
+from models.production import KpiConfig, KpiEntry, BlockRequest, ProductionMaterial
+from date_ranges import between_days
+
+# Fasce orarie dei turni produzione (ora di creazione)
+SHIFT_HOURS = {"morning": (6, 14), "afternoon": (14, 22)}  # night: il resto (22-06)
+CANCELLED_STATUSES = ("cancelled", "cancelled_acked")
+SECTOR_LABELS = {"pantografo": "Pantografo", "giostra": "Giostra", "altro": "Altro"}
+
+
+# ============================================================
+# CARICAMENTO
+# ============================================================
+
+def load_frame(db: Session, statement) -> pd.DataFrame:
+    """Esegue una SELECT di colonne e restituisce le righe come DataFrame (nessuna idratazione ORM)."""
+    result = db.execute(statement)
+    columns = list(result.keys())
+    return pd.DataFrame.from_records(result.all(), columns=columns)
+
+
+def kpi_entries_frame(db: Session, start_date=None, end_date=None, sector_name: Optional[str] = None) -> pd.DataFrame:
+    """KpiEntry del periodo (estremi inclusi) con nome settore e target del settore."""
+    statement = select(
+        KpiEntry.id, KpiEntry.work_date, KpiEntry.kpi_config_id, KpiConfig.sector_name, KpiConfig.kpi_target_8h,
+        KpiEntry.shift_type, KpiEntry.hours_total, KpiEntry.hours_downtime, KpiEntry.hours_net,
+        KpiEntry.quantity_produced, KpiEntry.efficiency_percent, KpiEntry.staffing_status,
+        KpiEntry.staffing_delta, KpiEntry.downtime_reason, KpiEntry.downtime_notes
+    ).join(KpiConfig, KpiConfig.id == KpiEntry.kpi_config_id)
+    if start_date is not None:
+        statement = statement.where(between_days(KpiEntry.work_date, start_date, end_date or start_date))
+    if sector_name:
+        statement = statement.where(KpiConfig.sector_name == sector_name)
+    return load_frame(db, statement.order_by(KpiEntry.id))
+
+
+def block_requests_frame(db: Session, start, end) -> pd.DataFrame:
+    """BlockRequest creati in [start, end] con etichette materiali e nomi utenti (join esterni)."""
+    material, density, color, supplier = (aliased(ProductionMaterial) for _ in range(4))
+    creator, processor = aliased(User), aliased(User)
+    statement = select(
+        BlockRequest.id, BlockRequest.created_at, BlockRequest.processed_at, BlockRequest.delivered_at,
+        BlockRequest.request_type, BlockRequest.target_sector, BlockRequest.dimensions, BlockRequest.is_trimmed,
+        BlockRequest.quantity, BlockRequest.status, BlockRequest.is_urgent, BlockRequest.notes,
+        material.id.label("material_ref"), material.label.label("material_label"),
+        density.label.label("density_label"), color.label.label("color_label"),
+        supplier.label.label("supplier_label"),
+        creator.id.label("creator_ref"), creator.full_name.label("creator_name"),
+        processor.id.label("processor_ref"), processor.full_name.label("processor_name"),
+    ).outerjoin(material, material.id == BlockRequest.material_id
+    ).outerjoin(density, density.id == BlockRequest.density_id
+    ).outerjoin(color, color.id == BlockRequest.color_id
+    ).outerjoin(supplier, supplier.id == BlockRequest.supplier_id
+    ).outerjoin(creator, creator.id == BlockRequest.created_by_id
+    ).outerjoin(processor, processor.id == BlockRequest.processed_by_id
+    ).where(
+        BlockRequest.created_at >= start, BlockRequest.created_at <= end
+    ).order_by(BlockRequest.id)
+    return load_frame(db, statement)
+
+
+# ============================================================
+# OPERAZIONI VETTORIALI
+# ============================================================
+
+def efficiency(quantity, target) -> np.ndarray:
+    """round(quantità / target * 100), 0 dove il target non è positivo (interi)."""
+    quantity = np.asarray(quantity, dtype=float)
+    target = np.asarray(target, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        eff = np.where(target > 0, np.rint(quantity / target * 100), 0)
+    return eff.astype(int)
+
+
+def net_target(hours_net, kpi_target_8h) -> np.ndarray:
+    """Target sulle ore nette: kpi_target_8h * ore_nette / 8 (0 se ore nette o target non positivi)."""
+    hours_net = np.nan_to_num(np.asarray(hours_net, dtype=float))
+    target_8h = np.nan_to_num(np.asarray(kpi_target_8h, dtype=float))
+    return np.where((hours_net > 0) & (target_8h > 0), target_8h * (hours_net / 8.0), 0.0)
+
+
+def weekdays_only(df: pd.DataFrame, column: str) -> pd.DataFrame:
+    """Solo righe da lunedì a venerdì."""
+    return df[pd.to_datetime(df[column]).dt.weekday < 5]
+
+
+def shift_of_hour(hours) -> np.ndarray:
+    """Fascia turno dall'ora: morning 6-14, afternoon 14-22, night il resto."""
+    hours = np.asarray(hours)
+    conditions = [(hours >= start) & (hours < end) for start, end in SHIFT_HOURS.values()]
+    return np.select(conditions, list(SHIFT_HOURS.keys()), default="night")
+
+
+def minute_labels(values: pd.Series) -> pd.Series:
+    """Date/ore come "YYYY-MM-DD HH:MM" (come strftime, ma vettoriale)."""
+    labels = np.datetime_as_string(values.to_numpy(dtype="datetime64[m]"))
+    return pd.Series(labels, index=values.index).str.replace("T", " ", regex=False)
+
+
+def sum_by(df: pd.DataFrame, keys: Sequence[str], columns: Sequence[str]) -> pd.DataFrame:
+    """Somme per gruppo nell'ordine di prima apparizione (come i vecchi dict), chiavi nulle incluse."""
+    return df.groupby(list(keys), sort=False, dropna=False)[list(columns)].sum().reset_index()
+
+
+def counts(series: pd.Series, weights: pd.Series) -> Dict:
+    """{valore: somma pesi} nell'ordine di prima apparizione."""
+    grouped = weights.groupby(series, sort=False, dropna=False).sum()
+    return {key: int(value) for key, value in grouped.items()}
+
+
+def records(df: pd.DataFrame, columns: Optional[Iterable[str]] = None) -> List[dict]:
+    """Righe come dict con tipi Python (NaN/NaT -> None)."""
+    columns = list(columns) if columns is not None else list(df.columns)
+    values = [
+        df[column].astype(object).where(df[column].notna(), None).tolist() if df[column].hasnans
+        else df[column].tolist()
+        for column in columns
+    ]
+    return [dict(zip(columns, row)) for row in zip(*values)]
+
+
+def _native(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+# ============================================================
+# KPI
+# ============================================================
+
+def kpi_daily_report(df: pd.DataFrame) -> List[dict]:
+    """Settori della giornata: turni e totali (ex ciclo di /kpi/report/daily)."""
+    if df.empty:
+        return []
+    totals = sum_by(df, ["sector_name"], ["hours_total", "hours_downtime", "quantity_produced"])
+    totals["hours_net"] = totals["hours_total"] - totals["hours_downtime"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        totals["qty_per_hour"] = np.where(totals["hours_net"] > 0,
+                                          totals["quantity_produced"] / totals["hours_net"], 0)
+    targets = df.groupby("sector_name", sort=False)["kpi_target_8h"].first()
+
+    shift_fields = df.rename(columns={"quantity_produced": "quantity", "efficiency_percent": "efficiency"})
+    shift_columns = ["hours_total", "hours_downtime", "hours_net", "quantity", "efficiency",
+                     "staffing_status", "staffing_delta"]
+    shifts: Dict[str, Dict[str, dict]] = {}
+    for sector, shift_type, row in zip(df["sector_name"], df["shift_type"], records(shift_fields, shift_columns)):
+        if row["staffing_delta"] is not None:
+            row["staffing_delta"] = int(row["staffing_delta"])
+        shifts.setdefault(sector, {})[shift_type] = row
+
+    return [
+        {
+            "sector_name": t["sector_name"],
+            "kpi_target_8h": _native(targets[t["sector_name"]]),
+            "shifts": shifts[t["sector_name"]],
+            "total_hours": t["hours_total"],
+            "total_downtime": t["hours_downtime"],
+            "total_quantity": int(t["quantity_produced"]),
+            "total_hours_net": t["hours_net"],
+            "total_qty_per_hour": t["qty_per_hour"],
+        }
+        for t in records(totals)
+    ]
+
+
+def kpi_shift_table(df: pd.DataFrame) -> dict:
+    """
+    Righe del report avanzato (una per giorno/reparto/turno, già ordinate) con
+    target netto, pezzi mancanti/extra ed efficienza; subtotali per giorno e
+    reparto; totale periodo.
+    """
+    df = df.copy()
+    df["target"] = net_target(df["hours_net"], df["kpi_target_8h"])
+    df["efficiency"] = efficiency(df["quantity_produced"], df["target"])
+    df["missing"], df["extra"] = _missing_extra(df["quantity_produced"] - df["target"])
+
+    groups = sum_by(df, ["work_date", "sector_name"], ["quantity_produced", "target", "hours_downtime"])
+    groups["size"] = df.groupby(["work_date", "sector_name"], sort=False).size().to_numpy()
+    groups["efficiency"] = efficiency(groups["quantity_produced"], groups["target"])
+    groups["missing"], groups["extra"] = _missing_extra(groups["quantity_produced"] - groups["target"])
+
+    total_quantity = int(df["quantity_produced"].sum())
+    total_target = float(df["target"].sum())
+    return {
+        "rows": df,
+        "groups": groups,
+        "total_quantity": total_quantity,
+        "total_downtime": float(df["hours_downtime"].sum()),
+        "total_efficiency": int(efficiency([total_quantity], [total_target])[0]),
+    }
+
+
+def _missing_extra(delta: pd.Series):
+    """Pezzi mancanti (delta < 0) ed extra (delta > 0) come testo, troncati come int()."""
+    pieces = np.trunc(np.abs(delta.to_numpy(dtype=float))).astype(int).astype(str)
+    return np.where(delta < 0, pieces, ""), np.where(delta > 0, pieces, "")
+
+
+# ============================================================
+# PRODUZIONE
+# ============================================================
+
+def production_report(df: pd.DataFrame, shift_type: Optional[str] = "all", target_sector: Optional[str] = None):
+    """
+    Statistiche e righe di dettaglio Excel di /production/reports.
+    Ritorna (stats, dettaglio DataFrame).
+    """
+    if shift_type in ("morning", "afternoon", "night") and not df.empty:
+        df = df[shift_of_hour(pd.to_datetime(df["created_at"]).dt.hour) == shift_type]
+    if target_sector:
+        df = df[df["target_sector"] == target_sector]
+    df = df.reset_index(drop=True)
+
+    quantity = df["quantity"].fillna(0).astype(int)
+    is_memory = (df["request_type"] == "memory").to_numpy()
+    is_trimmed = df["is_trimmed"].fillna(False).astype(bool).to_numpy()
+    material_label = np.where(
+        is_memory,
+        "Memory " + df["material_label"].where(df["material_ref"].notna(), "?").astype(str),
+        "Spugna " + df["density_label"].fillna("?").astype(str) + " " + df["color_label"].fillna("?").astype(str)
+    ) if not df.empty else np.array([], dtype=object)
+    dims = df["dimensions"].astype(str) + np.where(is_trimmed, " (Rifilato)", "")
+    creator = df["creator_name"].where(df["creator_ref"].notna(), "Unknown")
+    processed = df["processor_ref"].notna()
+    sector_key = df["target_sector"].where(df["target_sector"].fillna("") != "", "non_specificato").str.lower()
+
+    memory_qty = quantity.where(is_memory, 0)
+    by_sector_totals = pd.DataFrame({"sector": sector_key, "memory": memory_qty,
+                                     "sponge": quantity - memory_qty, "total": quantity})
+    by_sector = {
+        row["sector"]: {"memory": int(row["memory"]), "sponge": int(row["sponge"]), "total": int(row["total"])}
+        for row in sum_by(by_sector_totals, ["sector"], ["memory", "sponge", "total"]).to_dict("records")
+    }
+
+    created_at = pd.to_datetime(df["created_at"])
+    processed_at = pd.to_datetime(df["processed_at"])
+    delivered_at = pd.to_datetime(df["delivered_at"])
+    wait_min = (processed_at - created_at).dt.total_seconds() / 60
+    work_min = (delivered_at - processed_at).dt.total_seconds() / 60
+    avg_wait = float(wait_min.mean()) if wait_min.notna().any() else 0
+    avg_work = float(work_min.mean()) if work_min.notna().any() else 0
+
+    total_blocks = int(quantity.sum())
+    memory_count = int(memory_qty.sum())
+    trimmed_count = int(quantity[is_trimmed].sum())
+    cancelled_count = int(quantity[df["status"].isin(CANCELLED_STATUSES).to_numpy()].sum())
+    urgent_count = int(quantity[df["is_urgent"].fillna(False).astype(bool).to_numpy()].sum())
+
+    def percentage(count):
+        return round((count / total_blocks * 100) if total_blocks > 0 else 0, 1)
+
+    stats = {
+        "total_blocks": total_blocks,
+        "by_type": counts(pd.Series(material_label, dtype=object), quantity),
+        "by_dims": counts(dims, quantity),
+        "user_perf": counts(creator, quantity),
+        "supply_perf": counts(df["processor_name"][processed], quantity[processed]),
+        "avg_wait_min": round(avg_wait, 1),
+        "avg_work_min": round(avg_work, 1),
+        "memory_count": memory_count,
+        "sponge_count": total_blocks - memory_count,
+        "trimmed_count": trimmed_count,
+        "trimmed_percentage": percentage(trimmed_count),
+        "cancelled_count": cancelled_count,
+        "cancelled_percentage": percentage(cancelled_count),
+        "urgent_count": urgent_count,
+        "urgent_percentage": percentage(urgent_count),
+        "by_sector": by_sector,
+    }
+
+    def minutes(values: pd.Series, present: pd.Series) -> pd.Series:
+        # Stesso arrotondamento di round(x, 1) (NumPy arrotonda diversamente i casi .x5)
+        return values.map(lambda v: round(v, 1)).astype(object).where(present & values.notna(), "")
+
+    detail = pd.DataFrame({
+        "ID": df["id"],
+        "Data": minute_labels(created_at),
+        "Utente Ordine": creator,
+        "Settore": df["target_sector"].fillna("").str.lower().map(SECTOR_LABELS).fillna(""),
+        "Tipo": df["request_type"],
+        "Materiale": material_label,
+        "Misure": df["dimensions"],
+        "Rifilato": np.where(is_trimmed, "SI", "NO"),
+        "Fornitore": df["supplier_label"].fillna(""),
+        "Quantità": df["quantity"],
+        "Stato": df["status"],
+        "Supply User": df["processor_name"].where(processed, ""),
+        "Note": df["notes"].fillna(""),
+        "Attesa Presa in Carico (min)": minutes(wait_min, processed_at.notna()),
+        "Tempo Lavorazione (min)": minutes(work_min, processed_at.notna() & delivered_at.notna()),
+    })
+    return stats, detail
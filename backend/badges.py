@@ -0,0 +1,149 @@
+"""
+SL Enterprise - Badge Counters
+Contatori dei badge (notifiche, chat, approvazioni HR) spinti ai client via
+WebSocket (/ws/badges, BadgeConnectionManager) invece del polling.
+
+- get_badge_snapshot(): valori completi, inviati alla connessione
+- delta raccolti durante la transazione e inviati SOLO dopo il commit:
+  * automaticamente da after_flush per Notification, LeaveRequest,
+    EmployeeEvent e ConversationMember.unread_count modificati via ORM
+  * esplicitamente con queue_badge_delta() per gli UPDATE/INSERT in blocco
+    (NotificationService, contatori chat, segna-tutte-lette)
+"""
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import event, func, inspect
+from sqlalchemy.orm import Session
+
+from models.core import Notification
+from models.hr import LeaveRequest, EmployeeEvent
+from models.chat import ConversationMember
+from websocket_manager import (
+    get_badge_manager, schedule, visible_notification_roles, HR_BADGE_ROLES
+)
+
+_INFO_KEY = "badge_deltas"
+
+
+def queue_badge_delta(
+    db: Session,
+    counter: str,
+    delta: int,
+    users: Iterable[int] = (),
+    notification_roles: Iterable[str] = (),
+    user_roles: Iterable[str] = (),
+    conversation_id: Optional[int] = None
+):
+    """Accoda un delta da inviare al commit della sessione (scartato in caso di rollback)."""
+    if not delta:
+        return
+    db.info.setdefault(_INFO_KEY, []).append({
+        "counter": counter,
+        "delta": delta,
+        "users": list(users),
+        "notification_roles": list(notification_roles),
+        "user_roles": list(user_roles),
+        "conversation_id": conversation_id,
+    })
+
+
+def queue_notification_delta(db: Session, recipient_user_id: Optional[int], recipient_role: Optional[str], delta: int):
+    """Delta sul contatore notifiche del destinatario (utente o ruolo)."""
+    if recipient_user_id is not None:
+        queue_badge_delta(db, "notifications", delta, users=[recipient_user_id])
+    elif recipient_role:
+        queue_badge_delta(db, "notifications", delta, notification_roles=[recipient_role])
+
+
+def get_badge_snapshot(db: Session, user) -> dict:
+    """Valori completi dei contatori dell'utente (stessa logica degli endpoint di polling)."""
+    from chat_summary import get_unread_counts
+
+    roles = visible_notification_roles(user.role)
+    notifications = db.query(func.count(Notification.id)).filter(
+        (Notification.recipient_user_id == user.id) | Notification.recipient_role.in_(roles),
+        Notification.is_read == False
+    ).scalar() or 0
+
+    chat = get_unread_counts(db, user.id)
+
+    pending_events = pending_leaves = 0
+    if user.role in HR_BADGE_ROLES:
+        pending_events = db.query(func.count(EmployeeEvent.id)).filter(EmployeeEvent.status == "pending").scalar() or 0
+        pending_leaves = db.query(func.count(LeaveRequest.id)).filter(LeaveRequest.status == "pending").scalar() or 0
+
+    return {
+        "type": "badges",
+        "counters": {
+            "notifications": notifications,
+            "chat": sum(chat.values()),
+            "pending_events": pending_events,
+            "pending_leaves": pending_leaves,
+        },
+        "chat_conversations": {str(conv_id): count for conv_id, count in chat.items()},
+    }
+
+
+# ============================================================
+# TRACCIAMENTO MODIFICHE ORM
+# ============================================================
+
+def _old_value(obj, attr: str):
+    """(cambiato, valore precedente) dell'attributo nel flush corrente."""
+    history = inspect(obj).attrs[attr].history
+    if not history.has_changes():
+        return False, None
+    return True, history.deleted[0] if history.deleted else None
+
+
+def _pending_delta(db: Session, obj, counter: str, state: str):
+    """Delta +1/-1 sulle approvazioni HR quando lo status entra/esce da 'pending'."""
+    if state == "new":
+        if (obj.status or "pending") == "pending":
+            queue_badge_delta(db, counter, 1, user_roles=HR_BADGE_ROLES)
+    elif state == "deleted":
+        if obj.status == "pending":
+            queue_badge_delta(db, counter, -1, user_roles=HR_BADGE_ROLES)
+    else:
+        changed, old = _old_value(obj, "status")
+        if changed and (old == "pending") != (obj.status == "pending"):
+            queue_badge_delta(db, counter, 1 if obj.status == "pending" else -1, user_roles=HR_BADGE_ROLES)
+
+
+def _after_flush(session: Session, flush_context):
+    for state, objects in (("new", session.new), ("dirty", session.dirty), ("deleted", session.deleted)):
+        for obj in objects:
+            if isinstance(obj, Notification):
+                if state == "new" and not obj.is_read:
+                    queue_notification_delta(session, obj.recipient_user_id, obj.recipient_role, 1)
+                elif state == "deleted" and not obj.is_read:
+                    queue_notification_delta(session, obj.recipient_user_id, obj.recipient_role, -1)
+                elif state == "dirty":
+                    changed, old = _old_value(obj, "is_read")
+                    if changed and bool(old) != bool(obj.is_read):
+                        queue_notification_delta(session, obj.recipient_user_id, obj.recipient_role,
+                                                 -1 if obj.is_read else 1)
+            elif isinstance(obj, LeaveRequest):
+                _pending_delta(session, obj, "pending_leaves", state)
+            elif isinstance(obj, EmployeeEvent):
+                _pending_delta(session, obj, "pending_events", state)
+            elif isinstance(obj, ConversationMember) and state == "dirty":
+                changed, old = _old_value(obj, "unread_count")
+                if changed and old is not None:
+                    queue_badge_delta(session, "chat", (obj.unread_count or 0) - old,
+                                      users=[obj.user_id], conversation_id=obj.conversation_id)
+
+
+def _after_commit(session: Session):
+    deltas: List[Dict] = session.info.pop(_INFO_KEY, None)
+    if deltas:
+        schedule(get_badge_manager().send_deltas(deltas))
+
+
+def _after_rollback(session: Session, previous_transaction):
+    session.info.pop(_INFO_KEY, None)
+
+
+event.listen(Session, "after_flush", _after_flush)
+event.listen(Session, "after_commit", _after_commit)
+event.listen(Session, "after_soft_rollback", _after_rollback)
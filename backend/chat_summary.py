@@ -0,0 +1,260 @@
+"""
+SL Enterprise - Chat Summary
+Riepilogo conversazioni (ultimo messaggio, non letti, membri) calcolato
+per TUTTE le conversazioni di un utente con un numero fisso di query.
+
+I non letti e l'ultimo messaggio sono denormalizzati su conversation_members
+(unread_count, last_message_id): li aggiornano gli helper on_* qui sotto,
+reconcile_counters() ripara eventuali derive (job scheduler).
+Le variazioni dei non letti sono accodate come delta del badge "chat"
+(badges.py) e inviate ai client dopo il commit.
+"""
+from datetime import datetime
+from typing import Dict, List
+from sqlalchemy import and_, func, select, update
+from sqlalchemy.orm import Session
+
+from models.core import User
+from models.chat import Conversation, ConversationMember, Message
+from badges import queue_badge_delta
+
+
+def _user_conversation_ids(user_id: int):
+    """Subquery degli ID conversazione di cui l'utente è membro."""
+    return select(ConversationMember.conversation_id).where(
+        ConversationMember.user_id == user_id
+    )
+
+
+def get_unread_counts(db: Session, user_id: int) -> Dict[int, int]:
+    """
+    Conteggio non letti per conversazione in UNA query.
+    Legge il contatore denormalizzato su conversation_members (nessuna scansione di messages).
+    """
+    rows = db.query(
+        ConversationMember.conversation_id, ConversationMember.unread_count
+    ).filter(
+        ConversationMember.user_id == user_id,
+        ConversationMember.unread_count > 0
+    ).all()
+
+    return {conv_id: count for conv_id, count in rows}
+
+
+def get_unread_total(db: Session, user_id: int) -> int:
+    """Totale non letti (badge sidebar)."""
+    total = db.query(func.sum(ConversationMember.unread_count)).filter(
+        ConversationMember.user_id == user_id
+    ).scalar()
+    return total or 0
+
+
+def get_last_messages(db: Session, user_id: int) -> Dict[int, Message]:
+    """Ultimo messaggio per ogni conversazione dell'utente, via puntatore last_message_id (UNA query)."""
+    messages = db.query(Message).join(
+        ConversationMember,
+        and_(
+            ConversationMember.last_message_id == Message.id,
+            ConversationMember.user_id == user_id,
+        )
+    ).all()
+
+    return {m.conversation_id: m for m in messages}
+
+
+def get_rosters(db: Session, user_id: int) -> Dict[int, List[dict]]:
+    """Membri (con dati utente) di tutte le conversazioni dell'utente (UNA query)."""
+    rows = db.query(
+        ConversationMember.conversation_id,
+        ConversationMember.role,
+        User.id,
+        User.username,
+        User.full_name
+    ).join(
+        User, User.id == ConversationMember.user_id
+    ).filter(
+        ConversationMember.conversation_id.in_(_user_conversation_ids(user_id))
+    ).order_by(ConversationMember.conversation_id, ConversationMember.id).all()
+
+    rosters: Dict[int, List[dict]] = {}
+    for conv_id, role, uid, username, full_name in rows:
+        rosters.setdefault(conv_id, []).append({
+            "user_id": uid,
+            "username": username,
+            "full_name": full_name,
+            "role": role
+        })
+    return rosters
+
+
+def _display_name(conv: Conversation, members: List[dict], user_id: int):
+    """Per chat dirette, usa il nome dell'altro utente."""
+    if conv.type == "direct":
+        for m in members:
+            if m["user_id"] != user_id:
+                return m["full_name"] or m["username"]
+    return conv.name
+
+
+def get_conversation_summaries(
+    db: Session,
+    user_id: int,
+    with_last_message: bool = True,
+    with_members: bool = True
+) -> List[dict]:
+    """
+    Riepilogo di tutte le conversazioni dell'utente.
+
+    Query eseguite (indipendenti dal numero di conversazioni):
+    1. conversazioni dell'utente
+    2. non letti per conversazione
+    3. ultimo messaggio per conversazione (se with_last_message)
+    4. membri + utenti (se with_members)
+
+    Returns:
+        Lista di dict ordinata per ultimo messaggio (più recente prima)
+    """
+    conversations = db.query(Conversation).join(
+        ConversationMember,
+        and_(
+            ConversationMember.conversation_id == Conversation.id,
+            ConversationMember.user_id == user_id,
+        )
+    ).all()
+
+    if not conversations:
+        return []
+
+    unread = get_unread_counts(db, user_id)
+    last_messages = get_last_messages(db, user_id) if with_last_message else {}
+    rosters = get_rosters(db, user_id) if with_members else {}
+
+    result = []
+    for conv in conversations:
+        last_msg = last_messages.get(conv.id)
+        members = rosters.get(conv.id, [])
+        result.append({
+            "id": conv.id,
+            "type": conv.type,
+            "name": _display_name(conv, members, user_id),
+            "created_at": conv.created_at,
+            "last_message": last_msg.content[:50] if last_msg else None,
+            "last_message_at": last_msg.created_at if last_msg else None,
+            "unread_count": unread.get(conv.id, 0),
+            "members": members
+        })
+
+    result.sort(key=lambda x: x["last_message_at"] or x["created_at"], reverse=True)
+    return result
+
+
+# ============================================================
+# MANUTENZIONE CONTATORI DENORMALIZZATI
+# ============================================================
+
+def on_message_sent(db: Session, message: Message):
+    """
+    Nuovo messaggio: +1 non letti per gli altri membri, puntatore aggiornato per tutti.
+    Il mittente ha letto tutto. Non esegue commit (lo fa il chiamante).
+    """
+    members = db.query(ConversationMember.user_id, ConversationMember.unread_count).filter(
+        ConversationMember.conversation_id == message.conversation_id
+    ).all()
+    for user_id, unread in members:
+        delta = -(unread or 0) if user_id == message.sender_id else 1
+        queue_badge_delta(db, "chat", delta, users=[user_id], conversation_id=message.conversation_id)
+
+    db.execute(
+        update(ConversationMember)
+        .where(
+            ConversationMember.conversation_id == message.conversation_id,
+            ConversationMember.user_id != message.sender_id
+        )
+        .values(
+            unread_count=ConversationMember.unread_count + 1,
+            last_message_id=message.id
+        )
+    )
+    db.execute(
+        update(ConversationMember)
+        .where(
+            ConversationMember.conversation_id == message.conversation_id,
+            ConversationMember.user_id == message.sender_id
+        )
+        .values(unread_count=0, last_message_id=message.id, last_read_at=datetime.utcnow())
+    )
+
+
+def mark_read(membership: ConversationMember):
+    """Azzera i non letti del membro. Non esegue commit."""
+    membership.last_read_at = datetime.utcnow()
+    membership.unread_count = 0
+
+
+def on_message_deleted(db: Session, message: Message):
+    """
+    Messaggio cancellato (soft delete): -1 per chi non l'aveva ancora letto,
+    e se era l'ultimo messaggio il puntatore torna al precedente non cancellato.
+    Non esegue commit.
+    """
+    unread_filter = (
+        ConversationMember.conversation_id == message.conversation_id,
+        ConversationMember.user_id != message.sender_id,
+        ConversationMember.last_read_at < message.created_at,
+        ConversationMember.unread_count > 0
+    )
+    for (user_id,) in db.query(ConversationMember.user_id).filter(*unread_filter).all():
+        queue_badge_delta(db, "chat", -1, users=[user_id], conversation_id=message.conversation_id)
+
+    db.execute(
+        update(ConversationMember)
+        .where(*unread_filter)
+        .values(unread_count=ConversationMember.unread_count - 1)
+    )
+
+    previous = db.query(Message.id).filter(
+        Message.conversation_id == message.conversation_id,
+        Message.deleted_at == None,
+        Message.id != message.id
+    ).order_by(Message.created_at.desc(), Message.id.desc()).limit(1).scalar()
+
+    db.execute(
+        update(ConversationMember)
+        .where(
+            ConversationMember.conversation_id == message.conversation_id,
+            ConversationMember.last_message_id == message.id
+        )
+        .values(last_message_id=previous)
+    )
+
+
+def reconcile_counters(db: Session) -> int:
+    """
+    Ricalcola unread_count e last_message_id da messages e corregge solo le righe divergenti.
+
+    Returns:
+        Numero di membership corrette
+    """
+    expected_unread = select(func.count(Message.id)).where(
+        Message.conversation_id == ConversationMember.conversation_id,
+        Message.created_at > ConversationMember.last_read_at,
+        Message.sender_id != ConversationMember.user_id,
+        Message.deleted_at == None
+    ).scalar_subquery()
+
+    expected_last = select(Message.id).where(
+        Message.conversation_id == ConversationMember.conversation_id,
+        Message.deleted_at == None
+    ).order_by(Message.created_at.desc(), Message.id.desc()).limit(1).scalar_subquery()
+
+    result = db.execute(
+        update(ConversationMember)
+        .where(
+            (ConversationMember.unread_count != expected_unread)
+            | (ConversationMember.last_message_id.is_distinct_from(expected_last))
+        )
+        .values(unread_count=expected_unread, last_message_id=expected_last)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount
@@ -0,0 +1,105 @@
+"""
+SL Enterprise - Data Versions
+Contatore di versione per le tabelle lette dai report esportati (PDF/Excel).
+
+Ogni scrittura ORM su una tabella di DATA_VERSION_TABLES incrementa
+data_versions.version per quella tabella, nella stessa transazione:
+- listener after_flush: oggetti creati, modificati o eliminati (qualsiasi
+  endpoint o script che passi dalla Session)
+- listener do_orm_execute: update/delete/insert in blocco (db.query(...).update(),
+  db.execute(update(Model)...))
+Rollback -> anche le versioni tornano indietro.
+
+L'incremento è un upsert (db_profile.increment_counter): la prima scrittura
+di una tabella su un DB creato da create_tables() (righe non ancora presenti)
+non fa scontrare due worker sulla chiave primaria.
+
+Per le tabelle di DATA_VERSION_COLUMNS conta solo la modifica delle colonne
+che i report leggono: di users i renderer usano solo full_name, quindi login,
+sessione e altri campi del profilo non invalidano gli export in cache.
+
+Le versioni entrano nella chiave della cache dei report (report_jobs): un
+report già generato resta valido finché le tabelle che legge non cambiano.
+Le scritture fuori dall'ORM (SQL a mano, Core su connection) non sono viste:
+per questo gli artefatti in cache hanno comunque una durata massima.
+"""
+from typing import Dict, Iterable, Set
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+
+from db_profile import increment_counter
+from models.config import DataVersion
+
+# Tabelle versionate (quelle lette dai report registrati in report_jobs)
+DATA_VERSION_TABLES = frozenset({
+    "kpi_entries", "kpi_configs", "kpi_daily_rollups",
+    "shift_assignments", "leave_requests", "employees", "departments", "banchine",
+    "bonuses", "employee_events", "users",
+    "checklist_web", "block_requests", "production_materials",
+})
+
+# Tabelle lette dai report solo in parte: versione incrementata solo se cambiano queste colonne
+# (update ORM di singoli oggetti; inserimenti e update in blocco incrementano sempre)
+DATA_VERSION_COLUMNS = {
+    "users": frozenset({"full_name"}),
+}
+
+
+def bump_tables(db: Session, tables: Iterable[str]):
+    """Incrementa la versione delle tabelle indicate (ordine fisso: niente deadlock tra transazioni)."""
+    conn = db.connection()
+    for table in sorted(set(tables)):
+        increment_counter(conn, DataVersion, "table_name", table)
+
+
+def get_versions(db: Session, tables: Iterable[str]) -> Dict[str, int]:
+    """Versione attuale delle tabelle indicate (0 se mai scritta)."""
+    tables = sorted(set(tables))
+    found = dict(db.execute(
+        select(DataVersion.table_name, DataVersion.version).where(DataVersion.table_name.in_(tables))
+    ).all())
+    return {table: found.get(table, 0) for table in tables}
+
+
+# ============================================================
+# LISTENER
+# ============================================================
+
+def _table_of(obj) -> str:
+    table = getattr(obj, "__table__", None)
+    return table.name if table is not None else ""
+
+
+def _is_relevant_change(session: Session, obj, table: str) -> bool:
+    columns = DATA_VERSION_COLUMNS.get(table)
+    if columns is None:
+        return session.is_modified(obj, include_collections=False)
+    state = inspect(obj)
+    return any(state.attrs[name].history.has_changes() for name in columns)
+
+
+def _after_flush(session: Session, flush_context):
+    tables: Set[str] = set()
+    for state, objects in (("new", session.new), ("dirty", session.dirty), ("deleted", session.deleted)):
+        for obj in objects:
+            table = _table_of(obj)
+            if table in DATA_VERSION_TABLES and table not in tables and (
+                state != "dirty" or _is_relevant_change(session, obj, table)
+            ):
+                tables.add(table)
+    if tables:
+        bump_tables(session, tables)
+
+
+def _do_orm_execute(orm_execute_state):
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert):
+        return
+    mapper = orm_execute_state.bind_mapper
+    table = mapper.local_table.name if mapper is not None else ""
+    if table in DATA_VERSION_TABLES:
+        bump_tables(orm_execute_state.session, (table,))
+
+
+event.listen(Session, "after_flush", _after_flush)
+event.listen(Session, "do_orm_execute", _do_orm_execute)
@@ -3,6 +3,8 @@ from sqlalchemy.orm import sessionmaker
 import os
 from dotenv import load_dotenv
 
+from db_profile import engine_options, apply_profile
+
 # Import Base and ALL models to ensure they are registered in metadata
 from models.base import Base
 from models.core import Role, User, Department, AuditLog, Notification, Announcement
@@ -18,12 +20,16 @@ from models.shifts import ShiftRequirement, ShiftAssignment
 from models.production import (
     ProductionSession, DowntimeLog, ProductionEntry, 
     MachineDowntime, KpiConfig, KpiEntry, SessionOperator,
-    DowntimeReason, ProductionMaterial, BlockRequest
+    DowntimeReason, ProductionMaterial, BlockRequest,
+    KpiDailyRollup, KpiMonthlyRollup
 )
 from models.logistics import ReturnTicket
 from models.maintenance import MaintenanceRequest
 from models.chat import Conversation, ConversationMember, Message, PushSubscription
 from models.checklist_web import ChecklistWebEntry
+from models.config import SystemSetting, SettingsVersion, DataVersion
+from models.reports import ReportJob
+import data_versions  # Listener: versione delle tabelle lette dai report (cache degli export)
 
 # Force absolute path to avoid CWD confusion
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -34,19 +40,20 @@ load_dotenv(env_path)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 db_path = os.path.join(BASE_DIR, "sl_enterprise.db")
 DATABASE_URL = os.getenv("DATABASE_URL", f"sqlite:///{db_path}")
-connect_args = {"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
-
-engine = create_engine(
-    DATABASE_URL,
-    connect_args=connect_args,
-    pool_size=20,
-    max_overflow=30,
-    pool_timeout=10,
-    pool_pre_ping=True,
-    pool_recycle=300,
-)
+# Replica in sola lettura (MySQL). Se assente le letture usano lo stesso DB con un pool dedicato.
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL", DATABASE_URL)
+
+# Profilo per dialetto (PRAGMA WAL/busy_timeout su SQLite, READ COMMITTED/timeout su MySQL)
+engine = apply_profile(create_engine(DATABASE_URL, **engine_options(DATABASE_URL)))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Pool separato per le sole letture: non compete con le connessioni che scrivono
+read_engine = apply_profile(
+    create_engine(DATABASE_READ_URL, **engine_options(DATABASE_READ_URL, read_only=True)),
+    read_only=True
+)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
 def get_db():
     """Dependency per ottenere sessione DB."""
     db = SessionLocal()
@@ -55,6 +62,14 @@ def get_db():
     finally:
         db.close()
 
+def get_read_db():
+    """Dependency per endpoint di sola lettura (pool read-only, nessun commit possibile)."""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
 def create_tables():
     """Crea tutte le tabelle nel database."""
     Base.metadata.create_all(bind=engine)
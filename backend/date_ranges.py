@@ -0,0 +1,54 @@
+"""
+SL Enterprise - Date Range Helpers
+Filtri su colonne DateTime per giorno/periodo con intervalli semiaperti
+[giorno, giorno+1), al posto di func.date(colonna) == giorno.
+
+func.date() avvolge la colonna e impedisce l'uso degli indici (full scan che
+cresce con lo storico); un confronto di range sulla colonna nuda usa l'indice.
+
+I limiti vengono passati come stringhe 'YYYY-MM-DD': su SQLite il confronto è
+lessicografico e copre sia i valori salvati da SQLAlchemy ('YYYY-MM-DD HH:MM:SS.ffffff')
+sia eventuali date pure ('YYYY-MM-DD') inserite da script; MySQL converte la
+costante in DATETIME mantenendo l'uso dell'indice.
+"""
+from datetime import date, datetime, timedelta
+from typing import Union
+
+from sqlalchemy import and_, bindparam, String
+
+DayLike = Union[date, datetime, str]
+
+
+def as_date(day: DayLike) -> date:
+    """Normalizza datetime / date / 'YYYY-MM-DD' in date."""
+    if isinstance(day, datetime):
+        return day.date()
+    if isinstance(day, date):
+        return day
+    return datetime.strptime(day[:10], "%Y-%m-%d").date()
+
+
+def _bound(day: date):
+    return bindparam(None, day.isoformat(), type_=String())
+
+
+def on_day(column, day: DayLike):
+    """column in [day, day+1)"""
+    d = as_date(day)
+    return and_(column >= _bound(d), column < _bound(d + timedelta(days=1)))
+
+
+def between_days(column, first_day: DayLike, last_day: DayLike):
+    """column in [first_day, last_day+1) — estremi inclusi come giorni interi."""
+    return and_(
+        column >= _bound(as_date(first_day)),
+        column < _bound(as_date(last_day) + timedelta(days=1))
+    )
+
+
+def overlaps_days(start_column, end_column, first_day: DayLike, last_day: DayLike):
+    """Intervallo [start_column, end_column] che tocca almeno un giorno tra first_day e last_day."""
+    return and_(
+        start_column < _bound(as_date(last_day) + timedelta(days=1)),
+        end_column >= _bound(as_date(first_day))
+    )
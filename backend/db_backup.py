@@ -0,0 +1,483 @@
+"""
+SL Enterprise - Backup Database SQLite
+Backup online (senza fermare l'applicazione) con snapshot compressi e verificati.
+
+- FULL: copia con la backup API di SQLite a blocchi di BACKUP_PAGES_PER_STEP
+  pagine, con una pausa tra un blocco e l'altro per lasciare spazio agli
+  scrittori; il file viene salvato compresso (gzip).
+- INCREMENTALE: stessa copia online, ma viene salvato solo l'elenco delle pagine
+  cambiate rispetto all'ultimo FULL (hash per pagina). Per ripristinare basta
+  il FULL di riferimento + l'incrementale scelto (niente catene).
+- Ogni snapshot ha un manifest JSON con SHA-256 del file salvato e del database
+  ricostruito; la verifica ricostruisce il DB e lo apre in sola lettura
+  eseguendo PRAGMA integrity_check.
+
+Uso da riga di comando:
+    python db_backup.py list
+    python db_backup.py full | incremental
+    python db_backup.py verify [snapshot]
+    python db_backup.py restore <snapshot> [destinazione.db]
+"""
+import glob
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import struct
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKUP_DIR = os.getenv("BACKUP_DIR", os.path.join(BASE_DIR, "backups"))
+
+BACKUP_PAGES_PER_STEP = int(os.getenv("BACKUP_PAGES_PER_STEP", "256"))
+BACKUP_STEP_SLEEP = float(os.getenv("BACKUP_STEP_SLEEP", "0.005"))
+BACKUP_FULL_INTERVAL_HOURS = int(os.getenv("BACKUP_FULL_INTERVAL_HOURS", "24"))
+BACKUP_KEEP_FULL = int(os.getenv("BACKUP_KEEP_FULL", "3"))
+BACKUP_KEEP_INCREMENTAL = int(os.getenv("BACKUP_KEEP_INCREMENTAL", "48"))
+# Se un incrementale cambia più di questa frazione di pagine conviene un nuovo FULL
+BACKUP_MAX_DELTA_RATIO = float(os.getenv("BACKUP_MAX_DELTA_RATIO", "0.5"))
+
+FORMAT_VERSION = 1
+DELTA_MAGIC = b"SLDELTA1"
+PAGE_HASH_SIZE = 16
+COPY_CHUNK = 1024 * 1024
+
+
+class BackupError(Exception):
+    """Snapshot mancante, corrotto o non verificabile."""
+
+
+def get_sqlite_path() -> Optional[str]:
+    """Path del DB SQLite in uso (None se DATABASE_URL punta a MySQL/altro)."""
+    url = os.getenv("DATABASE_URL", f"sqlite:///{os.path.join(BASE_DIR, 'sl_enterprise.db')}")
+    if not url.startswith("sqlite:///"):
+        return None
+    path = url[len("sqlite:///"):]
+    return path if os.path.isabs(path) else os.path.join(BASE_DIR, path)
+
+
+# ============================================================
+# UTILS
+# ============================================================
+
+def _sha256_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(COPY_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _page_hashes(db_file: str, page_size: int) -> bytes:
+    """Hash (blake2b 16 byte) di ogni pagina, concatenati."""
+    out = bytearray()
+    with open(db_file, "rb") as f:
+        for page in iter(lambda: f.read(page_size), b""):
+            out += hashlib.blake2b(page, digest_size=PAGE_HASH_SIZE).digest()
+    return bytes(out)
+
+
+def _manifest_path(name: str) -> str:
+    return os.path.join(BACKUP_DIR, f"{name}.json")
+
+
+def _write_manifest(manifest: dict):
+    tmp = _manifest_path(manifest["name"]) + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, _manifest_path(manifest["name"]))
+
+
+def load_manifest(name: str) -> dict:
+    """Manifest di uno snapshot (accetta nome, nome.json o path)."""
+    name = os.path.basename(name)
+    for suffix in (".json", ".db.gz", ".delta.gz"):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    path = _manifest_path(name)
+    if not os.path.exists(path):
+        raise BackupError(f"Manifest non trovato: {path}")
+    with open(path) as f:
+        return json.load(f)
+
+
+def list_snapshots(kind: Optional[str] = None) -> List[dict]:
+    """Manifest di tutti gli snapshot, dal più vecchio al più recente."""
+    manifests = []
+    for path in glob.glob(os.path.join(BACKUP_DIR, "sl_enterprise_*.json")):
+        try:
+            with open(path) as f:
+                m = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if kind is None or m.get("kind") == kind:
+            manifests.append(m)
+    manifests.sort(key=lambda m: m["created_at"])
+    return manifests
+
+
+# ============================================================
+# COPIA ONLINE
+# ============================================================
+
+def _online_copy(src_path: str, dest_path: str) -> dict:
+    """
+    Copia consistente del DB con la backup API a passi di BACKUP_PAGES_PER_STEP
+    pagine (tra un passo e l'altro il lock viene rilasciato per BACKUP_STEP_SLEEP).
+    La copia viene portata in journal_mode=DELETE così è un file unico apribile in sola lettura.
+    """
+    src = sqlite3.connect(f"file:{src_path}?mode=ro", uri=True, timeout=30)
+    dst = sqlite3.connect(dest_path)
+    try:
+        src.backup(dst, pages=BACKUP_PAGES_PER_STEP, sleep=BACKUP_STEP_SLEEP)
+        dst.execute("PRAGMA journal_mode=DELETE")
+        page_size = dst.execute("PRAGMA page_size").fetchone()[0]
+        page_count = dst.execute("PRAGMA page_count").fetchone()[0]
+    finally:
+        dst.close()
+        src.close()
+    return {"page_size": page_size, "page_count": page_count}
+
+
+# ============================================================
+# SNAPSHOT FULL / INCREMENTALE
+# ============================================================
+
+def _new_name(kind: str) -> str:
+    base = f"sl_enterprise_{kind}_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}"
+    name, n = base, 1
+    while os.path.exists(_manifest_path(name)):
+        n += 1
+        name = f"{base}_{n}"
+    return name
+
+
+def create_full_snapshot(src_path: Optional[str] = None) -> dict:
+    """Snapshot completo compresso + hash delle pagine (base per gli incrementali)."""
+    src_path = src_path or get_sqlite_path()
+    if not src_path or not os.path.exists(src_path):
+        raise BackupError(f"Database SQLite non trovato: {src_path}")
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+
+    name = _new_name("full")
+    data_file = f"{name}.db.gz"
+    pages_file = f"{name}.pages"
+    fd, raw_path = tempfile.mkstemp(dir=BACKUP_DIR, suffix=".db.tmp")
+    os.close(fd)
+    try:
+        info = _online_copy(src_path, raw_path)
+        db_sha256 = _sha256_file(raw_path)
+        with open(os.path.join(BACKUP_DIR, pages_file), "wb") as f:
+            f.write(_page_hashes(raw_path, info["page_size"]))
+        with open(raw_path, "rb") as src, gzip.open(os.path.join(BACKUP_DIR, data_file), "wb", compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, COPY_CHUNK)
+        raw_size = os.path.getsize(raw_path)
+    finally:
+        os.remove(raw_path)
+
+    manifest = {
+        "format": FORMAT_VERSION,
+        "kind": "full",
+        "name": name,
+        "file": data_file,
+        "pages_file": pages_file,
+        "base": None,
+        "created_at": datetime.now().isoformat(),
+        "page_size": info["page_size"],
+        "page_count": info["page_count"],
+        "changed_pages": info["page_count"],
+        "db_size": raw_size,
+        "stored_size": os.path.getsize(os.path.join(BACKUP_DIR, data_file)),
+        "sha256": _sha256_file(os.path.join(BACKUP_DIR, data_file)),
+        "db_sha256": db_sha256,
+        "verified": False,
+    }
+    _write_manifest(manifest)
+    return manifest
+
+
+def create_incremental_snapshot(base: Optional[dict] = None, src_path: Optional[str] = None) -> dict:
+    """
+    Snapshot incrementale: solo le pagine diverse dal FULL `base` (default: l'ultimo).
+
+    Raises:
+        BackupError se non esiste un FULL o se il page_size è cambiato (serve un nuovo FULL)
+    """
+    src_path = src_path or get_sqlite_path()
+    if not src_path or not os.path.exists(src_path):
+        raise BackupError(f"Database SQLite non trovato: {src_path}")
+    if base is None:
+        fulls = list_snapshots("full")
+        if not fulls:
+            raise BackupError("Nessun backup FULL di riferimento")
+        base = fulls[-1]
+    with open(os.path.join(BACKUP_DIR, base["pages_file"]), "rb") as f:
+        base_hashes = f.read()
+
+    name = _new_name("incr")
+    data_file = f"{name}.delta.gz"
+    fd, raw_path = tempfile.mkstemp(dir=BACKUP_DIR, suffix=".db.tmp")
+    os.close(fd)
+    try:
+        info = _online_copy(src_path, raw_path)
+        page_size = info["page_size"]
+        if page_size != base["page_size"]:
+            raise BackupError("page_size cambiato rispetto al FULL, serve un nuovo backup completo")
+        db_sha256 = _sha256_file(raw_path)
+
+        changed = 0
+        with open(raw_path, "rb") as src, gzip.open(os.path.join(BACKUP_DIR, data_file), "wb", compresslevel=6) as dst:
+            dst.write(DELTA_MAGIC + struct.pack(">II", page_size, info["page_count"]))
+            for pgno, page in enumerate(iter(lambda: src.read(page_size), b""), start=1):
+                digest = hashlib.blake2b(page, digest_size=PAGE_HASH_SIZE).digest()
+                offset = (pgno - 1) * PAGE_HASH_SIZE
+                if base_hashes[offset:offset + PAGE_HASH_SIZE] != digest:
+                    dst.write(struct.pack(">I", pgno))
+                    dst.write(page)
+                    changed += 1
+        raw_size = os.path.getsize(raw_path)
+    except BaseException:
+        if os.path.exists(os.path.join(BACKUP_DIR, data_file)):
+            os.remove(os.path.join(BACKUP_DIR, data_file))
+        raise
+    finally:
+        os.remove(raw_path)
+
+    manifest = {
+        "format": FORMAT_VERSION,
+        "kind": "incremental",
+        "name": name,
+        "file": data_file,
+        "pages_file": None,
+        "base": base["name"],
+        "created_at": datetime.now().isoformat(),
+        "page_size": page_size,
+        "page_count": info["page_count"],
+        "changed_pages": changed,
+        "db_size": raw_size,
+        "stored_size": os.path.getsize(os.path.join(BACKUP_DIR, data_file)),
+        "sha256": _sha256_file(os.path.join(BACKUP_DIR, data_file)),
+        "db_sha256": db_sha256,
+        "verified": False,
+    }
+    _write_manifest(manifest)
+    return manifest
+
+
+# ============================================================
+# RICOSTRUZIONE / VERIFICA / RESTORE
+# ============================================================
+
+def _check_stored_file(manifest: dict):
+    path = os.path.join(BACKUP_DIR, manifest["file"])
+    if not os.path.exists(path):
+        raise BackupError(f"File snapshot mancante: {manifest['file']}")
+    if _sha256_file(path) != manifest["sha256"]:
+        raise BackupError(f"Checksum non valido: {manifest['file']}")
+
+
+def materialize_snapshot(snapshot, dest_path: str) -> str:
+    """
+    Ricostruisce in dest_path il file .db di uno snapshot (nome o manifest):
+    FULL decompresso, oppure FULL di base + pagine dell'incrementale.
+    Verifica i checksum del file salvato e del DB ricostruito.
+    """
+    manifest = snapshot if isinstance(snapshot, dict) else load_manifest(snapshot)
+    base = load_manifest(manifest["base"]) if manifest["kind"] == "incremental" else manifest
+    _check_stored_file(base)
+
+    with gzip.open(os.path.join(BACKUP_DIR, base["file"]), "rb") as src, open(dest_path, "wb") as dst:
+        shutil.copyfileobj(src, dst, COPY_CHUNK)
+
+    if manifest["kind"] == "incremental":
+        _check_stored_file(manifest)
+        with gzip.open(os.path.join(BACKUP_DIR, manifest["file"]), "rb") as src, open(dest_path, "r+b") as dst:
+            header = src.read(len(DELTA_MAGIC) + 8)
+            if header[:len(DELTA_MAGIC)] != DELTA_MAGIC:
+                raise BackupError(f"Formato delta non riconosciuto: {manifest['file']}")
+            page_size, page_count = struct.unpack(">II", header[len(DELTA_MAGIC):])
+            while True:
+                raw_pgno = src.read(4)
+                if not raw_pgno:
+                    break
+                pgno = struct.unpack(">I", raw_pgno)[0]
+                dst.seek((pgno - 1) * page_size)
+                dst.write(src.read(page_size))
+            dst.truncate(page_count * page_size)
+
+    if _sha256_file(dest_path) != manifest["db_sha256"]:
+        raise BackupError(f"Database ricostruito non corrisponde al checksum: {manifest['name']}")
+    return dest_path
+
+
+def _integrity_check(db_file: str) -> str:
+    conn = sqlite3.connect(f"file:{db_file}?mode=ro", uri=True)
+    try:
+        return conn.execute("PRAGMA integrity_check").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def verify_snapshot(snapshot) -> dict:
+    """
+    Ricostruisce lo snapshot in un file temporaneo, lo apre in SOLA LETTURA ed
+    esegue PRAGMA integrity_check. Aggiorna il manifest con l'esito.
+    """
+    manifest = snapshot if isinstance(snapshot, dict) else load_manifest(snapshot)
+    fd, tmp_path = tempfile.mkstemp(dir=BACKUP_DIR, suffix=".verify.db")
+    os.close(fd)
+    try:
+        try:
+            materialize_snapshot(manifest, tmp_path)
+            result = _integrity_check(tmp_path)
+        except (BackupError, sqlite3.DatabaseError, OSError) as e:
+            result = str(e)
+    finally:
+        os.remove(tmp_path)
+
+    manifest["verified"] = result == "ok"
+    manifest["integrity"] = result
+    manifest["verified_at"] = datetime.now().isoformat()
+    _write_manifest(manifest)
+    return manifest
+
+
+def restore_snapshot(snapshot, target_path: Optional[str] = None) -> str:
+    """
+    Ripristina uno snapshot su target_path (default: DB in uso).
+    Il DB attuale e gli eventuali -wal/-shm vengono spostati in *.pre_restore_<timestamp>.
+    Da eseguire con l'applicazione FERMA.
+    """
+    target_path = target_path or get_sqlite_path()
+    if not target_path:
+        raise BackupError("Restore supportato solo verso un database SQLite")
+    target_dir = os.path.dirname(os.path.abspath(target_path))
+    fd, tmp_path = tempfile.mkstemp(dir=target_dir, suffix=".restore.db")
+    os.close(fd)
+    try:
+        materialize_snapshot(snapshot, tmp_path)
+        result = _integrity_check(tmp_path)
+        if result != "ok":
+            raise BackupError(f"integrity_check fallito: {result}")
+        stamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(target_path + suffix):
+                os.replace(target_path + suffix, f"{target_path}{suffix}.pre_restore_{stamp}")
+        os.replace(tmp_path, target_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return target_path
+
+
+def resolve_backup_file(path: str, work_dir: Optional[str] = None) -> str:
+    """
+    Path di un .db utilizzabile direttamente: i backup legacy (.db) sono
+    restituiti così come sono, gli snapshot nuovi (.json/.db.gz/.delta.gz)
+    vengono ricostruiti in un file temporaneo.
+    """
+    if path.endswith(".db") and os.path.exists(path):
+        return path
+    fd, tmp_path = tempfile.mkstemp(dir=work_dir, suffix=".db")
+    os.close(fd)
+    return materialize_snapshot(path, tmp_path)
+
+
+# ============================================================
+# JOB PIANIFICATO + RETENTION
+# ============================================================
+
+def _delete_snapshot(manifest: dict):
+    for fname in (manifest.get("file"), manifest.get("pages_file"), f"{manifest['name']}.json"):
+        if fname and os.path.exists(os.path.join(BACKUP_DIR, fname)):
+            os.remove(os.path.join(BACKUP_DIR, fname))
+
+
+def prune_snapshots() -> int:
+    """Mantiene gli ultimi BACKUP_KEEP_FULL full e BACKUP_KEEP_INCREMENTAL incrementali (con base ancora presente)."""
+    removed = 0
+    fulls = list_snapshots("full")
+    for m in fulls[:-BACKUP_KEEP_FULL] if BACKUP_KEEP_FULL else []:
+        _delete_snapshot(m)
+        removed += 1
+    kept_fulls = {m["name"] for m in fulls[-BACKUP_KEEP_FULL:]}
+    incrementals = list_snapshots("incremental")
+    orphans = [m for m in incrementals if m["base"] not in kept_fulls]
+    live = [m for m in incrementals if m["base"] in kept_fulls]
+    for m in orphans + live[:-BACKUP_KEEP_INCREMENTAL]:
+        _delete_snapshot(m)
+        removed += 1
+    return removed
+
+
+def run_scheduled_backup() -> Optional[dict]:
+    """
+    FULL se manca o è più vecchio di BACKUP_FULL_INTERVAL_HOURS (o se l'ultimo
+    incrementale era già oltre BACKUP_MAX_DELTA_RATIO), altrimenti INCREMENTALE.
+    Ogni snapshot viene verificato subito; uno snapshot non valido viene scartato.
+    """
+    if not get_sqlite_path():
+        logger.info("Backup SQLite saltato: DATABASE_URL non è SQLite")
+        return None
+
+    fulls = list_snapshots("full")
+    last_full = fulls[-1] if fulls else None
+    need_full = (
+        last_full is None
+        or datetime.fromisoformat(last_full["created_at"]) < datetime.now() - timedelta(hours=BACKUP_FULL_INTERVAL_HOURS)
+    )
+    if not need_full:
+        incrementals = [m for m in list_snapshots("incremental") if m["base"] == last_full["name"]]
+        if incrementals and incrementals[-1]["changed_pages"] > BACKUP_MAX_DELTA_RATIO * max(incrementals[-1]["page_count"], 1):
+            need_full = True
+
+    if need_full:
+        manifest = create_full_snapshot()
+    else:
+        try:
+            manifest = create_incremental_snapshot(last_full)
+        except BackupError as e:
+            logger.warning(f"Incrementale non possibile ({e}), eseguo backup completo")
+            manifest = create_full_snapshot()
+
+    manifest = verify_snapshot(manifest)
+    if not manifest["verified"]:
+        _delete_snapshot(manifest)
+        raise BackupError(f"Verifica fallita per {manifest['name']}: {manifest.get('integrity')}")
+
+    prune_snapshots()
+    return manifest
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "list"
+    if cmd == "list":
+        for m in list_snapshots():
+            print(f"{m['name']:<48} {m['kind']:<12} pagine {m['changed_pages']}/{m['page_count']}  "
+                  f"{m['stored_size'] / 1024:.0f} KB  verificato={m.get('verified')}")
+    elif cmd == "full":
+        print(verify_snapshot(create_full_snapshot())["name"])
+    elif cmd == "incremental":
+        print(verify_snapshot(create_incremental_snapshot())["name"])
+    elif cmd == "verify":
+        targets = [load_manifest(sys.argv[2])] if len(sys.argv) > 2 else list_snapshots()
+        failed = 0
+        for m in targets:
+            m = verify_snapshot(m)
+            failed += not m["verified"]
+            print(f"{m['name']}: {m['integrity']}")
+        sys.exit(1 if failed else 0)
+    elif cmd == "restore" and len(sys.argv) > 2:
+        print(f"Ripristinato in {restore_snapshot(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None)}")
+    else:
+        print(__doc__)
+        sys.exit(1)
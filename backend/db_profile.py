@@ -0,0 +1,158 @@
+"""
+SL Enterprise - Database Profiles
+Parametri di connessione/pool per dialetto e PRAGMA applicati a ogni connessione.
+
+SQLite:
+- WAL (lettori e scrittore non si bloccano a vicenda), synchronous=NORMAL,
+  busy_timeout invece di "database is locked" immediato, cache e mmap dimensionati.
+- Nessun pre_ping/recycle: è un file locale, il ping costerebbe solo una query in più.
+- Pool di sola lettura separato (PRAGMA query_only) per le letture pesanti.
+
+MySQL/MariaDB (PyMySQL):
+- READ COMMITTED, utf8mb4, timeout di connessione/lettura/scrittura,
+  pool_recycle sotto il wait_timeout del server e pre_ping.
+- Pool di sola lettura verso DATABASE_READ_URL (replica) se configurato,
+  altrimenti verso lo stesso server con sessioni READ ONLY.
+
+increment_counter(): contatore +1 con l'upsert del dialetto (ON CONFLICT /
+ON DUPLICATE KEY), usato dai contatori di versione condivisi tra worker.
+"""
+import os
+from sqlalchemy import event, insert, update
+from sqlalchemy.engine import Connection, Engine
+
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "16384"))       # per connessione
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "30"))
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "10"))
+DB_READ_MAX_OVERFLOW = int(os.getenv("DB_READ_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "10"))
+
+MYSQL_POOL_RECYCLE = int(os.getenv("MYSQL_POOL_RECYCLE", "280"))
+MYSQL_CONNECT_TIMEOUT = int(os.getenv("MYSQL_CONNECT_TIMEOUT", "5"))
+MYSQL_READ_TIMEOUT = int(os.getenv("MYSQL_READ_TIMEOUT", "30"))
+MYSQL_WRITE_TIMEOUT = int(os.getenv("MYSQL_WRITE_TIMEOUT", "30"))
+
+
+def is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
+
+
+def engine_options(url: str, read_only: bool = False) -> dict:
+    """Argomenti per create_engine() in base al dialetto."""
+    pool_size = DB_READ_POOL_SIZE if read_only else DB_POOL_SIZE
+    max_overflow = DB_READ_MAX_OVERFLOW if read_only else DB_MAX_OVERFLOW
+
+    if is_sqlite(url):
+        return {
+            "connect_args": {
+                "check_same_thread": False,
+                "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000,
+            },
+            "pool_size": pool_size,
+            "max_overflow": max_overflow,
+            "pool_timeout": DB_POOL_TIMEOUT,
+        }
+
+    options = {
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_pre_ping": True,
+        "pool_recycle": MYSQL_POOL_RECYCLE if url.startswith("mysql") else 300,
+    }
+    if url.startswith("mysql"):
+        options["isolation_level"] = "READ COMMITTED"
+        options["connect_args"] = {
+            "charset": "utf8mb4",
+            "connect_timeout": MYSQL_CONNECT_TIMEOUT,
+            "read_timeout": MYSQL_READ_TIMEOUT,
+            "write_timeout": MYSQL_WRITE_TIMEOUT,
+        }
+    return options
+
+
+def _sqlite_pragmas(dbapi_conn, read_only: bool):
+    cursor = dbapi_conn.cursor()
+    try:
+        if not read_only:
+            # Persistente nel file: basta che lo imposti una connessione scrivente
+            cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+    finally:
+        cursor.close()
+
+
+def apply_profile(engine: Engine, read_only: bool = False) -> Engine:
+    """Registra i PRAGMA/SET di sessione eseguiti a ogni nuova connessione del pool."""
+    if engine.dialect.name == "sqlite":
+        @event.listens_for(engine, "connect")
+        def _on_connect(dbapi_conn, connection_record):
+            _sqlite_pragmas(dbapi_conn, read_only)
+
+    elif engine.dialect.name == "mysql" and read_only:
+        @event.listens_for(engine, "connect")
+        def _on_connect(dbapi_conn, connection_record):
+            cursor = dbapi_conn.cursor()
+            try:
+                cursor.execute("SET SESSION TRANSACTION READ ONLY")
+            finally:
+                cursor.close()
+
+    return engine
+
+
+def describe(engine: Engine) -> dict:
+    """PRAGMA effettivi di una connessione (diagnostica /health)."""
+    if engine.dialect.name != "sqlite":
+        return {"dialect": engine.dialect.name, "pool_size": engine.pool.size()}
+    with engine.connect() as conn:
+        raw = conn.connection.dbapi_connection
+        cursor = raw.cursor()
+        try:
+            info = {"dialect": "sqlite", "pool_size": engine.pool.size()}
+            for pragma in ("journal_mode", "synchronous", "busy_timeout", "cache_size", "mmap_size", "query_only"):
+                info[pragma] = cursor.execute(f"PRAGMA {pragma}").fetchone()[0]
+            return info
+        finally:
+            cursor.close()
+
+
+def increment_counter(conn: Connection, table, key_column: str, key, counter_column: str = "version"):
+    """
+    counter + 1 sulla riga `key` (creata a 1 se manca) in un'unica istruzione:
+    due worker alla prima scrittura della stessa chiave non si scontrano
+    sulla chiave primaria (UPDATE a vuoto seguito da due INSERT).
+    """
+    table = getattr(table, "__table__", table)
+    counter = table.c[counter_column]
+    dialect = conn.dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        conn.execute(
+            dialect_insert(table).values({key_column: key, counter_column: 1})
+            .on_conflict_do_update(index_elements=[table.c[key_column]], set_={counter_column: counter + 1})
+        )
+    elif dialect in ("mysql", "mariadb"):
+        from sqlalchemy.dialects.mysql import insert as dialect_insert
+        conn.execute(
+            dialect_insert(table).values({key_column: key, counter_column: 1})
+            .on_duplicate_key_update({counter_column: counter + 1})
+        )
+    else:
+        result = conn.execute(update(table).where(table.c[key_column] == key).values({counter_column: counter + 1}))
+        if result.rowcount == 0:
+            conn.execute(insert(table).values({key_column: key, counter_column: 1}))
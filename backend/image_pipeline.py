@@ -0,0 +1,268 @@
+"""
+SL Enterprise - Image Pipeline
+Ingestione immagini caricate (checklist mezzi, chat, allegati task).
+
+- L'upload viene copiato su disco a blocchi (mai letto tutto in memoria).
+- Decodifica, verifica, resize e codifica girano in un ProcessPoolExecutor,
+  così l'event loop resta libero durante l'elaborazione delle foto.
+- I worker partono da un processo forkserver e non dal processo dell'API:
+  un fork dopo l'avvio di scheduler e thread di background può ereditare
+  lock già acquisiti e bloccarsi.
+- Per ogni immagine viene generata una miniatura JPEG "thumb_<nome>.jpg"
+  nella stessa cartella, da usare nelle liste.
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from PIL import Image, ImageOps
+from starlette.concurrency import run_in_threadpool
+
+try:
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+except ImportError:
+    pass
+
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+IMAGE_MAX_WIDTH = int(os.getenv("IMAGE_MAX_WIDTH", "1280"))
+IMAGE_THUMB_SIZE = int(os.getenv("IMAGE_THUMB_SIZE", "320"))
+IMAGE_MAX_UPLOAD_BYTES = int(os.getenv("IMAGE_MAX_UPLOAD_BYTES", str(25 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+JPEG_QUALITY = 70
+THUMB_QUALITY = 60
+THUMB_PREFIX = "thumb_"
+
+# Formati per cui ha senso generare la miniatura
+THUMBNAIL_MIMES = ("image/jpeg", "image/png", "image/gif", "image/webp", "image/heic", "image/heif")
+
+
+class UploadTooLarge(Exception):
+    """Upload oltre il limite consentito (il file parziale viene rimosso)."""
+
+
+# ============================================================
+# ELABORAZIONE (eseguita nei processi worker)
+# ============================================================
+
+def thumbnail_name(filename: str) -> str:
+    """Nome della miniatura associata a un file: thumb_<stem>.jpg"""
+    return f"{THUMB_PREFIX}{os.path.splitext(os.path.basename(filename))[0]}.jpg"
+
+
+def thumbnail_url(url: Optional[str]) -> Optional[str]:
+    """URL della miniatura a partire dall'URL dell'immagine (/uploads/x/y.png -> /uploads/x/thumb_y.jpg)."""
+    if not url:
+        return None
+    directory, filename = url.rsplit("/", 1) if "/" in url else ("", url)
+    return f"{directory}/{thumbnail_name(filename)}" if directory else thumbnail_name(filename)
+
+
+def _flatten_rgb(img: Image.Image) -> Image.Image:
+    """Converte in RGB; la trasparenza diventa sfondo bianco (JPEG non ha alpha)."""
+    if img.mode == "RGB":
+        return img
+    if img.mode in ("RGBA", "LA", "P"):
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel("A"))
+        return background
+    return img.convert("RGB")
+
+
+def _save_thumbnail(img: Image.Image, thumb_path: str, size: int):
+    thumb = img.copy()
+    thumb.thumbnail((size, size), Image.Resampling.LANCZOS)
+    _flatten_rgb(thumb).save(thumb_path, "JPEG", quality=THUMB_QUALITY, optimize=True)
+
+
+def process_image_file(
+    src_path: str,
+    dest_path: Optional[str],
+    thumb_path: Optional[str],
+    save_format: str = "JPEG",
+    max_width: int = IMAGE_MAX_WIDTH,
+    thumb_size: int = IMAGE_THUMB_SIZE
+) -> dict:
+    """
+    Verifica l'immagine in src_path, la ridimensiona a max_width e la salva
+    in dest_path (se indicato), poi genera la miniatura in thumb_path.
+    Funzione top-level per poter essere eseguita nel process pool.
+
+    Raises:
+        Exception di Pillow se il file non è un'immagine valida
+    """
+    with Image.open(src_path) as probe:
+        probe.verify()  # Verifica integrità (chiude il file)
+
+    with Image.open(src_path) as img:
+        # JPEG: decodifica direttamente a scala ridotta (DCT) se molto più grande del target
+        if img.format == "JPEG":
+            img.draft("RGB", (max_width, max(1, int(img.height * max_width / img.width))))
+        img.load()
+
+        if dest_path:
+            out = img
+            if out.width > max_width:
+                ratio = max_width / out.width
+                out = out.resize((max_width, int(out.height * ratio)), Image.Resampling.LANCZOS)
+            if save_format == "JPEG":
+                if out.mode != "RGB":
+                    out = out.convert("RGB")
+                out.save(dest_path, "JPEG", quality=JPEG_QUALITY, optimize=True)
+            else:
+                out.save(dest_path, "PNG", optimize=True)
+        else:
+            # Originale conservato così com'è: il browser applica l'orientamento EXIF,
+            # quindi la miniatura va ruotata allo stesso modo
+            out = ImageOps.exif_transpose(img)
+
+        if thumb_path:
+            _save_thumbnail(out, thumb_path, thumb_size)
+
+        return {"width": out.width, "height": out.height}
+
+
+# ============================================================
+# PROCESS POOL
+# ============================================================
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def get_image_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS,
+                                        mp_context=multiprocessing.get_context("forkserver"))
+        return _pool
+
+
+def shutdown_image_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
+            print("[IMAGES] Process pool fermato")
+
+
+async def run_in_image_pool(func, *args):
+    """Esegue func(*args) nel process pool; se il pool è rotto (worker crashato) lo ricrea una volta."""
+    global _pool
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(get_image_pool(), func, *args)
+    except BrokenProcessPool:
+        with _pool_lock:
+            _pool = None
+        return await loop.run_in_executor(get_image_pool(), func, *args)
+
+
+# ============================================================
+# UPLOAD
+# ============================================================
+
+async def save_upload_to_disk(upload_file, dest_path: str, max_bytes: int = IMAGE_MAX_UPLOAD_BYTES) -> int:
+    """
+    Copia un UploadFile su disco a blocchi di UPLOAD_CHUNK_SIZE.
+
+    Returns:
+        Numero di byte scritti
+
+    Raises:
+        UploadTooLarge se il file supera max_bytes
+    """
+    written = 0
+    out = await run_in_threadpool(open, dest_path, "wb")
+    try:
+        while True:
+            chunk = await upload_file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            written += len(chunk)
+            if max_bytes and written > max_bytes:
+                raise UploadTooLarge(f"Upload oltre {max_bytes} byte")
+            await run_in_threadpool(out.write, chunk)
+    except BaseException:
+        out.close()
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        raise
+    out.close()
+    return written
+
+
+async def ingest_image(upload_file, dest_dir: str, prefix: str = "") -> Optional[dict]:
+    """
+    Pipeline completa per le foto: upload su file temporaneo, poi nel process pool
+    verifica + resize (max IMAGE_MAX_WIDTH) + codifica JPEG/PNG + miniatura.
+    HEIC/HEIF vengono sempre convertiti in JPEG.
+
+    Returns:
+        {"filename", "thumbnail", "width", "height"} oppure None se il file
+        manca, è vuoto, troppo grande o non è un'immagine valida.
+    """
+    ext = ".jpg"
+    save_format = "JPEG"
+    ct = (upload_file.content_type or "").lower()
+    fn = (upload_file.filename or "").lower()
+    if ct == "image/png" or fn.endswith(".png"):
+        ext = ".png"
+        save_format = "PNG"
+
+    filename = f"{prefix}{uuid.uuid4()}{ext}"
+    dest_path = os.path.join(dest_dir, filename)
+    thumb = thumbnail_name(filename)
+    tmp_path = os.path.join(dest_dir, f".{filename}.part")
+
+    try:
+        size = await save_upload_to_disk(upload_file, tmp_path)
+    except UploadTooLarge:
+        print(f"[IMAGES] Upload troppo grande: {upload_file.filename}")
+        return None
+
+    try:
+        # Guard: file vuoto
+        if size < 100:
+            print(f"[IMAGES] File vuoto o troppo piccolo ({size} bytes)")
+            return None
+        try:
+            info = await run_in_image_pool(
+                process_image_file, tmp_path, dest_path, os.path.join(dest_dir, thumb), save_format
+            )
+        except Exception as img_err:
+            print(f"[IMAGES] Impossibile leggere immagine: {img_err}, content_type={upload_file.content_type}, filename={upload_file.filename}, size={size}")
+            for path in (dest_path, os.path.join(dest_dir, thumb)):
+                if os.path.exists(path):
+                    os.remove(path)
+            return None
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return {"filename": filename, "thumbnail": thumb, **info}
+
+
+async def make_thumbnail(src_path: str) -> Optional[str]:
+    """
+    Genera (nel process pool) la miniatura di un file già salvato, lasciando
+    intatto l'originale. Ritorna il path della miniatura o None se non è un'immagine.
+    """
+    thumb_path = os.path.join(os.path.dirname(src_path), thumbnail_name(src_path))
+    try:
+        await run_in_image_pool(process_image_file, src_path, None, thumb_path)
+    except Exception as e:
+        print(f"[IMAGES] Miniatura non generata per {src_path}: {e}")
+        if os.path.exists(thumb_path):
+            os.remove(thumb_path)
+        return None
+    return thumb_path
@@ -8,6 +8,7 @@ from models.logistics import (
     LogisticsMaterialType, LogisticsPresetMessage, 
     LogisticsEtaOption, LogisticsConfig
 )
+from settings_cache import bump_version, LOGISTICS
 
 
 def seed_material_types(db):
@@ -110,6 +111,7 @@ def seed_config(db):
             db.add(LogisticsConfig(**c))
             print(f"[OK] Creata config: {c['config_key']} = {c['config_value']}")
     
+    bump_version(db, LOGISTICS)  # worker già avviati: rileggono la configurazione
     db.commit()
 
 
@@ -8,6 +8,7 @@ from database import engine, SessionLocal
 from models.logistics import (
     LogisticsConfig, LogisticsEtaOption, LogisticsPresetMessage, LogisticsMaterialType, Base
 )
+from settings_cache import bump_version, LOGISTICS
 
 def init_db():
     print("Inizializzazione Tabelle Logistica...")
@@ -64,6 +65,7 @@ def init_db():
             for content, icon in msgs:
                 db.add(LogisticsPresetMessage(content=content, icon=icon))
                 
+        bump_version(db, LOGISTICS)  # worker già avviati: rileggono la configurazione
         db.commit()
         print("Inizializzazione COMPLETATA con successo!")
         
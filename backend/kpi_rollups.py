@@ -0,0 +1,286 @@
+"""
+SL Enterprise - KPI Rollups
+Totali KPI pre-aggregati per i report di periodo (trend, riepilogo settori).
+
+- kpi_daily_rollups:   per giorno, settore e turno
+- kpi_monthly_rollups: per mese e settore (feriali e weekend separati, per
+                       il filtro "escludi weekend")
+
+Aggiornamento incrementale: un listener after_flush raccoglie le KpiEntry
+create, modificate o eliminate (da qualsiasi endpoint: /kpi/entries, mobile,
+script) e ricalcola nella stessa transazione solo le righe toccate: il
+giorno/settore dalle sue KpiEntry (poche righe), il mese/settore dai suoi
+totali giornalieri. Rollback -> anche i rollup tornano indietro.
+
+I totali non contengono il target: target = kpi_target_8h * ore_nette / 8 è
+calcolato alla lettura con il target ATTUALE del settore, come prima.
+rebuild_kpi_rollups() ricostruisce tutto (scripts/rebuild_kpi_rollups.py).
+"""
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+import pandas as pd
+from sqlalchemy import delete, event, func, inspect, insert, select
+from sqlalchemy.orm import Session
+
+from models.production import KpiConfig, KpiEntry, KpiDailyRollup, KpiMonthlyRollup
+from date_ranges import on_day, between_days
+from analytics import kpi_entries_frame, records, sum_by
+
+SUM_FIELDS = ("entries_count", "quantity_produced", "hours_total", "hours_downtime", "hours_net", "hours_net_target")
+
+
+def _as_day(value) -> Optional[date]:
+    if value is None:
+        return None
+    return value.date() if isinstance(value, datetime) else value
+
+
+def _empty() -> Dict[str, float]:
+    return {"entries_count": 0, "quantity_produced": 0, "hours_total": 0.0, "hours_downtime": 0.0,
+            "hours_net": 0.0, "hours_net_target": 0.0}
+
+
+def _accumulate(totals: Dict[str, float], quantity, hours_total, hours_downtime, hours_net):
+    totals["entries_count"] += 1
+    totals["quantity_produced"] += quantity or 0
+    totals["hours_total"] += hours_total or 0.0
+    totals["hours_downtime"] += hours_downtime or 0.0
+    totals["hours_net"] += hours_net or 0.0
+    if hours_net and hours_net > 0:
+        totals["hours_net_target"] += hours_net
+
+
+def _month_range(year: int, month: int) -> Tuple[date, date]:
+    first = date(year, month, 1)
+    last = (date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)) - timedelta(days=1)
+    return first, last
+
+
+# ============================================================
+# AGGIORNAMENTO (per giorno/settore toccato)
+# ============================================================
+
+def refresh_days(db: Session, keys: Iterable[Tuple[int, date]]):
+    """Ricalcola i rollup dei (kpi_config_id, giorno) indicati e dei relativi mesi."""
+    conn = db.connection()
+    months: Set[Tuple[int, int, int]] = set()
+    for config_id, day in keys:
+        rows = conn.execute(
+            select(KpiEntry.shift_type, KpiEntry.quantity_produced, KpiEntry.hours_total,
+                   KpiEntry.hours_downtime, KpiEntry.hours_net)
+            .where(KpiEntry.kpi_config_id == config_id, on_day(KpiEntry.work_date, day))
+        ).all()
+        by_shift: Dict[str, Dict[str, float]] = defaultdict(_empty)
+        for shift_type, *values in rows:
+            _accumulate(by_shift[shift_type], *values)
+        conn.execute(delete(KpiDailyRollup).where(
+            KpiDailyRollup.kpi_config_id == config_id, KpiDailyRollup.work_day == day))
+        if by_shift:
+            conn.execute(insert(KpiDailyRollup), [
+                {"work_day": day, "weekday": day.weekday(), "kpi_config_id": config_id,
+                 "shift_type": shift_type, **totals}
+                for shift_type, totals in by_shift.items()
+            ])
+        months.add((config_id, day.year, day.month))
+
+    for config_id, year, month in months:
+        first, last = _month_range(year, month)
+        rows = conn.execute(
+            select(KpiDailyRollup.weekday, *(getattr(KpiDailyRollup, f) for f in SUM_FIELDS))
+            .where(KpiDailyRollup.kpi_config_id == config_id,
+                   KpiDailyRollup.work_day >= first, KpiDailyRollup.work_day <= last)
+        ).all()
+        by_weekend: Dict[bool, Dict[str, float]] = defaultdict(_empty)
+        for weekday, *values in rows:
+            totals = by_weekend[weekday >= 5]
+            for field, value in zip(SUM_FIELDS, values):
+                totals[field] += value or 0
+        conn.execute(delete(KpiMonthlyRollup).where(
+            KpiMonthlyRollup.kpi_config_id == config_id,
+            KpiMonthlyRollup.year == year, KpiMonthlyRollup.month == month))
+        if by_weekend:
+            conn.execute(insert(KpiMonthlyRollup), [
+                {"year": year, "month": month, "kpi_config_id": config_id, "is_weekend": is_weekend, **totals}
+                for is_weekend, totals in by_weekend.items()
+            ])
+
+
+def rebuild_kpi_rollups(db: Session) -> int:
+    """Ricostruisce tutti i rollup dalle KpiEntry in un solo passaggio. Non fa commit. Ritorna i giorni/settore."""
+    entries = kpi_entries_frame(db)
+    entries["work_day"] = pd.to_datetime(entries["work_date"]).dt.normalize()
+    for field in ("quantity_produced", "hours_total", "hours_downtime", "hours_net"):
+        entries[field] = entries[field].fillna(0)
+    entries["hours_net_target"] = entries["hours_net"].where(entries["hours_net"] > 0, 0.0)
+    entries["entries_count"] = 1
+
+    daily = sum_by(entries, ["work_day", "kpi_config_id", "shift_type"], SUM_FIELDS)
+    daily["weekday"] = daily["work_day"].dt.weekday
+    daily["year"], daily["month"] = daily["work_day"].dt.year, daily["work_day"].dt.month
+    daily["is_weekend"] = daily["weekday"] >= 5
+    monthly = sum_by(daily, ["year", "month", "kpi_config_id", "is_weekend"], SUM_FIELDS)
+    daily["work_day"] = daily["work_day"].dt.date
+
+    db.execute(delete(KpiDailyRollup))
+    db.execute(delete(KpiMonthlyRollup))
+    if not daily.empty:
+        db.execute(insert(KpiDailyRollup),
+                   records(daily, ["work_day", "weekday", "kpi_config_id", "shift_type", *SUM_FIELDS]))
+        db.execute(insert(KpiMonthlyRollup), records(monthly))
+    return len(daily[["work_day", "kpi_config_id"]].drop_duplicates())
+
+
+def _touched_keys(obj: KpiEntry, state: str) -> List[Tuple[int, date]]:
+    keys = [(obj.kpi_config_id, _as_day(obj.work_date))]
+    if state == "dirty":
+        # Entry spostata di giorno o settore: anche il vecchio va ricalcolato
+        attrs = inspect(obj).attrs
+        old_config = attrs.kpi_config_id.history.deleted
+        old_date = attrs.work_date.history.deleted
+        if old_config or old_date:
+            keys.append((old_config[0] if old_config else obj.kpi_config_id,
+                         _as_day(old_date[0]) if old_date else _as_day(obj.work_date)))
+    return [(config_id, day) for config_id, day in keys if config_id is not None and day is not None]
+
+
+def _after_flush(session: Session, flush_context):
+    keys: Set[Tuple[int, date]] = set()
+    for state, objects in (("new", session.new), ("dirty", session.dirty), ("deleted", session.deleted)):
+        for obj in objects:
+            if isinstance(obj, KpiEntry) and (state != "dirty" or session.is_modified(obj)):
+                keys.update(_touched_keys(obj, state))
+    if keys:
+        refresh_days(session, sorted(keys))
+
+
+event.listen(Session, "after_flush", _after_flush)
+
+
+# ============================================================
+# LETTURA
+# ============================================================
+
+def _scope(query, model, sector_name: Optional[str], exclude_weekends: bool):
+    query = query.join(KpiConfig, KpiConfig.id == model.kpi_config_id)
+    if sector_name:
+        query = query.where(KpiConfig.sector_name == sector_name)
+    if exclude_weekends:
+        query = query.where(model.weekday < 5) if model is KpiDailyRollup else query.where(model.is_weekend.is_(False))
+    return query
+
+
+def daily_series(db: Session, start_date: date, end_date: date, sector_name: Optional[str] = None,
+                 exclude_weekends: bool = False) -> List[dict]:
+    """Totali per giorno (tutti i settori/turni): quantità, ore nette e target."""
+    query = _scope(select(
+        KpiDailyRollup.work_day,
+        func.sum(KpiDailyRollup.quantity_produced),
+        func.sum(KpiDailyRollup.hours_net),
+        func.sum(KpiDailyRollup.hours_net_target * KpiConfig.kpi_target_8h),
+    ), KpiDailyRollup, sector_name, exclude_weekends).where(
+        KpiDailyRollup.work_day >= start_date, KpiDailyRollup.work_day <= end_date
+    ).group_by(KpiDailyRollup.work_day).order_by(KpiDailyRollup.work_day)
+    return [
+        {"day": _as_day(day), "quantity": quantity or 0, "hours_net": hours_net or 0,
+         "target_total": (weighted or 0) / 8}
+        for day, quantity, hours_net, weighted in db.execute(query).all()
+    ]
+
+
+def sector_totals(db: Session, start_date: date, end_date: date, sector_name: Optional[str] = None,
+                  exclude_weekends: bool = False) -> List[dict]:
+    """
+    Totali per settore nel periodo: mesi interi dai rollup mensili, i giorni
+    ai bordi dai rollup giornalieri. Ordinati come la configurazione KPI.
+    """
+    first_full = date(start_date.year, start_date.month, 1)
+    if first_full < start_date:
+        first_full = _month_range(start_date.year, start_date.month)[1] + timedelta(days=1)
+    last_full_end = _month_range(end_date.year, end_date.month)[1]
+    if last_full_end > end_date:
+        last_full_end = date(end_date.year, end_date.month, 1) - timedelta(days=1)
+
+    columns = (KpiConfig.id, KpiConfig.sector_name, KpiConfig.kpi_target_8h, KpiConfig.display_order)
+    parts = []
+    if first_full <= last_full_end:
+        month_index = KpiMonthlyRollup.year * 12 + KpiMonthlyRollup.month
+        parts.append(_scope(
+            select(*columns, *(func.sum(getattr(KpiMonthlyRollup, f)) for f in SUM_FIELDS)),
+            KpiMonthlyRollup, sector_name, exclude_weekends
+        ).where(
+            month_index >= first_full.year * 12 + first_full.month,
+            month_index <= last_full_end.year * 12 + last_full_end.month
+        ).group_by(*columns))
+        day_ranges = [(start_date, first_full - timedelta(days=1)), (last_full_end + timedelta(days=1), end_date)]
+    else:
+        day_ranges = [(start_date, end_date)]
+    for first, last in day_ranges:
+        if first <= last:
+            parts.append(_scope(
+                select(*columns, *(func.sum(getattr(KpiDailyRollup, f)) for f in SUM_FIELDS)),
+                KpiDailyRollup, sector_name, exclude_weekends
+            ).where(KpiDailyRollup.work_day >= first, KpiDailyRollup.work_day <= last).group_by(*columns))
+
+    sectors: Dict[int, dict] = {}
+    for query in parts:
+        for config_id, name, target_8h, display_order, *sums in db.execute(query).all():
+            s = sectors.setdefault(config_id, {"sector_name": name, "kpi_target_8h": target_8h,
+                                               "display_order": display_order or 0, **_empty()})
+            for field, value in zip(SUM_FIELDS, sums):
+                s[field] += value or 0
+    result = []
+    for s in sorted(sectors.values(), key=lambda s: (s["display_order"], s["sector_name"])):
+        if s["entries_count"]:
+            s["target_accumulated"] = s["kpi_target_8h"] * s["hours_net_target"] / 8
+            result.append(s)
+    return result
+
+
+class ShiftRow(NamedTuple):
+    """Riga del report avanzato: totali di un giorno/reparto/turno."""
+    work_date: datetime
+    sector_name: str
+    shift_type: str
+    quantity_produced: int
+    hours_downtime: float
+    hours_net: float
+    kpi_target_8h: int
+    note: str
+
+
+def shift_rows(db: Session, start_date: date, end_date: date, sector_name: Optional[str] = None) -> List[ShiftRow]:
+    """Righe per giorno, reparto e turno ordinate come il report; note di fermo dalle sole entry che le hanno."""
+    query = select(
+        KpiDailyRollup.work_day, KpiDailyRollup.kpi_config_id, KpiConfig.sector_name, KpiDailyRollup.shift_type,
+        KpiDailyRollup.quantity_produced, KpiDailyRollup.hours_downtime, KpiDailyRollup.hours_net,
+        KpiConfig.kpi_target_8h
+    ).join(KpiConfig, KpiConfig.id == KpiDailyRollup.kpi_config_id).where(
+        KpiDailyRollup.work_day >= start_date, KpiDailyRollup.work_day <= end_date
+    )
+    notes_query = select(
+        KpiEntry.kpi_config_id, KpiEntry.work_date, KpiEntry.shift_type, KpiEntry.downtime_reason, KpiEntry.downtime_notes
+    ).where(
+        between_days(KpiEntry.work_date, start_date, end_date),
+        (KpiEntry.downtime_reason.isnot(None)) | (KpiEntry.downtime_notes.isnot(None))
+    ).order_by(KpiEntry.id)
+    if sector_name:
+        query = query.where(KpiConfig.sector_name == sector_name)
+        notes_query = notes_query.join(KpiConfig, KpiConfig.id == KpiEntry.kpi_config_id).where(
+            KpiConfig.sector_name == sector_name)
+
+    notes: Dict[Tuple[int, date, str], List[str]] = defaultdict(list)
+    for config_id, work_date, shift_type, reason, details in db.execute(notes_query).all():
+        note = (reason or "") + (" " + details if details else "")
+        if note:
+            notes[(config_id, _as_day(work_date), shift_type)].append(note)
+
+    rows = db.execute(query.order_by(
+        KpiDailyRollup.work_day, KpiConfig.sector_name, KpiDailyRollup.shift_type)).all()
+    return [
+        ShiftRow(datetime.combine(_as_day(day), datetime.min.time()), name, shift_type, quantity or 0,
+                 hours_downtime or 0.0, hours_net or 0.0, target_8h,
+                 "; ".join(notes.get((config_id, _as_day(day), shift_type), ())))
+        for day, config_id, name, shift_type, quantity, hours_downtime, hours_net, target_8h in rows
+    ]
@@ -0,0 +1,378 @@
+"""
+SL Enterprise - Logistics Escalation Engine
+Escalation dei ritardi di ritiro logistica guidata dagli eventi.
+
+Invece di scansionare ogni minuto tutte le richieste pending, il motore tiene
+in memoria un min-heap delle scadenze (richiesta, livello successivo):
+- all'avvio viene popolato dal DB (richieste pending)
+- gli endpoint logistica lo aggiornano quando una richiesta viene creata,
+  presa in carico, preparata, rilasciata, annullata o eliminata
+- un thread dorme fino alla scadenza più vicina (escalation al secondo,
+  non "entro 60 s") e processa in blocco le richieste scadute insieme
+
+Soglie e destinatari per livello sono in LogisticsConfig:
+    escalation_l{N}_minutes   minuti di attesa (default 3 / 7 / 10)
+    escalation_l{N}_targets   destinatari separati da virgola:
+                              role:<ruolo>, perm:<permesso>, user:<id>
+I destinatari si risolvono dall'indice permessi in memoria; le notifiche di
+ogni livello vengono scritte con un solo INSERT multiplo (NotificationService).
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session, joinedload
+
+from models.logistics import LogisticsRequest
+from notification_service import NotificationService
+from settings_cache import get_settings, LOGISTICS
+
+ESCALATION_RESYNC_MINUTES = int(os.getenv("ESCALATION_RESYNC_MINUTES", "10"))
+
+# livello -> (minuti, destinatari, tipo notifica)
+DEFAULT_LEVELS: Dict[int, Tuple[float, str, str]] = {
+    1: (3, "role:coordinator", "alert"),
+    2: (7, "role:factory_controller,role:super_admin", "urgent"),
+    3: (10, "role:admin,role:super_admin", "critical"),
+}
+
+
+class EscalationLevel:
+    """Soglia e destinatari di un livello di escalation."""
+    __slots__ = ("level", "minutes", "targets", "notif_type")
+
+    def __init__(self, level: int, minutes: float, targets: str, notif_type: str):
+        self.level = level
+        self.minutes = minutes
+        self.targets = targets
+        self.notif_type = notif_type
+
+    @property
+    def seconds(self) -> float:
+        return self.minutes * 60.0
+
+
+def load_levels(db: Session) -> List[EscalationLevel]:
+    """Livelli di escalation da LogisticsConfig (con default), ordinati per soglia."""
+    values = get_settings(db, LOGISTICS)
+    levels = []
+    for level, (minutes, targets, notif_type) in DEFAULT_LEVELS.items():
+        try:
+            minutes = float(values.get(f"escalation_l{level}_minutes", minutes))
+        except ValueError:
+            pass
+        targets = values.get(f"escalation_l{level}_targets", targets)
+        levels.append(EscalationLevel(level, minutes, targets, notif_type))
+    return sorted(levels, key=lambda l: l.level)
+
+
+def resolve_targets(db: Session, targets: str) -> Set[int]:
+    """ID utenti attivi per una lista 'role:x,perm:y,user:z'."""
+    from permission_index import get_permission_index
+
+    roles, perms, user_ids = [], [], set()
+    for token in (t.strip() for t in targets.split(",")):
+        kind, _, value = token.partition(":")
+        if not value:
+            continue
+        if kind == "role":
+            roles.append(value)
+        elif kind == "perm":
+            perms.append(value)
+        elif kind == "user" and value.isdigit():
+            user_ids.add(int(value))
+
+    result = get_permission_index().resolve_user_ids(db, permissions=perms, roles=roles, include_wildcard=False)
+    if user_ids:
+        from models.core import User
+        result |= {
+            uid for (uid,) in db.query(User.id).filter(User.id.in_(user_ids), User.is_active == True).all()
+        }
+    return result
+
+
+class EscalationEngine:
+    """
+    Min-heap (scadenza, seq, request_id, generazione) servito da un thread.
+
+    _tracked contiene lo stato corrente di ogni richiesta pending:
+    request_id -> (created_at, livello raggiunto, generazione). Le voci dello
+    heap di una generazione superata (richiesta presa, annullata, ri-tracciata)
+    vengono scartate quando arrivano in cima.
+    """
+
+    def __init__(self, session_factory=None):
+        if session_factory is None:
+            from database import SessionLocal
+            session_factory = SessionLocal
+        self.session_factory = session_factory
+
+        self._heap: List[tuple] = []
+        self._seq = itertools.count()
+        self._generation = itertools.count(1)
+        self._tracked: Dict[int, Tuple[datetime, int, int]] = {}
+        self._levels: List[EscalationLevel] = []
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+
+        self.stats = {"escalated": 0, "notifications": 0, "batches": 0}
+
+    # --- lifecycle ---
+
+    def start(self):
+        if self._running:
+            return
+        self.reload()
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, name="logistics-escalation", daemon=True)
+        self._thread.start()
+        print(f"[ESCALATION] Motore avviato ({len(self._tracked)} richieste pending)")
+
+    def stop(self, timeout: float = 5.0):
+        if not self._running:
+            return
+        self._running = False
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def reload(self):
+        """Rilegge soglie/destinatari e risincronizza le richieste pending dal DB."""
+        db = self.session_factory()
+        try:
+            levels = load_levels(db)
+            rows = db.query(
+                LogisticsRequest.id, LogisticsRequest.created_at, LogisticsRequest.escalation_level
+            ).filter(LogisticsRequest.status == "pending").all()
+        finally:
+            db.close()
+
+        with self._cond:
+            levels_changed = [(l.level, l.minutes) for l in levels] != [(l.level, l.minutes) for l in self._levels]
+            self._levels = levels
+            pending = {rid for rid, _, _ in rows}
+            for rid in list(self._tracked):
+                if rid not in pending:
+                    del self._tracked[rid]
+            for rid, created_at, level in rows:
+                if created_at is None:
+                    continue
+                state = self._tracked.get(rid)
+                if not levels_changed and state and state[:2] == (created_at, level or 0):
+                    continue  # Già pianificata con le stesse soglie
+                self._track_locked(rid, created_at, level or 0)
+            self._cond.notify()
+
+    # --- eventi dagli endpoint ---
+
+    def track(self, request_id: int, created_at: datetime, level: int = 0):
+        """Richiesta (di nuovo) pending: pianifica il prossimo livello."""
+        with self._cond:
+            self._track_locked(request_id, created_at, level or 0)
+            self._cond.notify()
+
+    def untrack(self, request_id: int):
+        """Richiesta non più pending (presa, preparata, annullata, eliminata)."""
+        with self._cond:
+            self._tracked.pop(request_id, None)
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._tracked)
+
+    def _track_locked(self, request_id: int, created_at: datetime, level: int):
+        generation = next(self._generation)
+        self._tracked[request_id] = (created_at, level, generation)
+        due = self._next_due(created_at, level)
+        if due is not None:
+            heapq.heappush(self._heap, (due, next(self._seq), request_id, generation))
+
+    def _next_due(self, created_at: datetime, level: int) -> Optional[float]:
+        """Istante (time.monotonic) in cui scatta il primo livello oltre quello raggiunto."""
+        for lvl in self._levels:
+            if lvl.level > level:
+                elapsed = (datetime.utcnow() - created_at).total_seconds()
+                return time.monotonic() + max(0.0, lvl.seconds - elapsed)
+        return None
+
+    # --- worker ---
+
+    def _next_batch(self) -> Optional[Dict[int, Tuple[datetime, int, int]]]:
+        """Attende la scadenza più vicina e ritorna tutte le richieste scadute."""
+        with self._cond:
+            while self._running:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                wait = self._heap[0][0] - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                batch = {}
+                now = time.monotonic()
+                while self._heap and self._heap[0][0] <= now:
+                    _, _, rid, generation = heapq.heappop(self._heap)
+                    state = self._tracked.get(rid)
+                    if state and state[2] == generation:
+                        batch[rid] = state
+                if batch:
+                    return batch
+        return None
+
+    def _loop(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                self.process(batch)
+            except Exception as e:
+                print(f"[ESCALATION ERROR] {e}")
+                # Le richieste restano tracciate: nuovo tentativo tra 30 s
+                with self._cond:
+                    for rid, (created_at, level, generation) in batch.items():
+                        if self._tracked.get(rid, (None, None, None))[2] == generation:
+                            heapq.heappush(self._heap, (time.monotonic() + 30, next(self._seq), rid, generation))
+
+    def process(self, batch: Dict[int, Tuple[datetime, int, int]]) -> int:
+        """
+        Escalation di un blocco di richieste scadute: una query per caricarle,
+        un UPDATE condizionato per richiesta (claim del livello) e un INSERT
+        multiplo di notifiche per livello, un solo commit.
+
+        Con più worker ognuno ha il proprio motore: notifica solo chi porta
+        davvero la riga al nuovo livello (rowcount 1), gli altri la saltano.
+        """
+        with self._cond:
+            levels = list(self._levels)
+
+        db = self.session_factory()
+        try:
+            requests = db.query(LogisticsRequest).options(
+                joinedload(LogisticsRequest.banchina),
+                joinedload(LogisticsRequest.material_type)
+            ).filter(
+                LogisticsRequest.id.in_(list(batch)),
+                LogisticsRequest.status == "pending"
+            ).all()
+
+            now = datetime.utcnow()
+            by_level: Dict[int, List[LogisticsRequest]] = {}
+            for req in requests:
+                minutes_waiting = (now - req.created_at).total_seconds() / 60.0
+                current = req.escalation_level or 0
+                # Come prima: solo il livello più alto raggiunto (niente raffica di livelli intermedi)
+                reached = [l for l in levels if l.level > current and minutes_waiting >= l.minutes]
+                if reached:
+                    by_level.setdefault(reached[-1].level, []).append(req)
+
+            notifier = NotificationService(db)
+            notifications = 0
+            claimed: Dict[int, LogisticsRequest] = {}
+            for level_no, reqs in by_level.items():
+                # Claim prima della notifica: la riga passa al livello una sola volta
+                reqs = [req for req in reqs if db.execute(
+                    update(LogisticsRequest)
+                    .where(
+                        LogisticsRequest.id == req.id,
+                        LogisticsRequest.status == "pending",
+                        func.coalesce(LogisticsRequest.escalation_level, 0) < level_no
+                    )
+                    .values(escalation_level=level_no)
+                    .execution_options(synchronize_session=False)
+                ).rowcount]
+                if not reqs:
+                    continue
+                claimed.update((req.id, req) for req in reqs)
+                level = next(l for l in levels if l.level == level_no)
+                targets = resolve_targets(db, level.targets)
+                entries = [
+                    (targets, (), {
+                        "notif_type": level.notif_type,
+                        "title": f"⚠️ RITARDO RITIRO DA {int(level.minutes)} MINUTI",
+                        "message": (
+                            f"Banchina {req.banchina.code if req.banchina else '?'} aspetta da "
+                            f"{int((now - req.created_at).total_seconds() / 60)} min. "
+                            f"Materiale: {req.material_type.label if req.material_type else '?'}."
+                        ),
+                        "link_url": "/logistics/pool",
+                        "created_at": now,
+                    })
+                    for req in reqs
+                ]
+                # Niente deduplica: ogni livello scatta una sola volta per richiesta (claim sopra)
+                notifications += notifier.notify_batch(entries, dedupe=False)
+            db.commit()
+
+            # Anche le righe portate al livello da un altro worker: niente nuovo tentativo
+            escalated = {r.id: (r.created_at, lvl) for lvl, reqs in by_level.items() for r in reqs}
+            still_pending = {r.id: r.created_at for r in requests}
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        with self._cond:
+            for rid, (_, level, generation) in batch.items():
+                state = self._tracked.get(rid)
+                if not state or state[2] != generation:
+                    continue  # Cambiata nel frattempo (presa/annullata/ri-tracciata)
+                if rid not in still_pending:
+                    del self._tracked[rid]
+                elif rid in escalated:
+                    self._track_locked(rid, *escalated[rid])
+                else:
+                    self._track_locked(rid, still_pending[rid], level)
+            self._cond.notify()
+
+        self.stats["batches"] += 1
+        self.stats["escalated"] += len(claimed)
+        self.stats["notifications"] += notifications
+        return len(claimed)
+
+
+_engine: Optional[EscalationEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_escalation_engine() -> EscalationEngine:
+    """Motore singleton (avviato al primo utilizzo)."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = EscalationEngine()
+        _engine.start()
+        return _engine
+
+
+def shutdown_escalation_engine():
+    """Ferma il motore (shutdown applicazione)."""
+    if _engine is not None:
+        _engine.stop()
+
+
+def track_request(request: LogisticsRequest):
+    """Hook endpoint: la richiesta è pending, pianifica l'escalation."""
+    try:
+        get_escalation_engine().track(request.id, request.created_at, request.escalation_level or 0)
+    except Exception as e:
+        print(f"[ESCALATION ERROR] track {request.id}: {e}")
+
+
+def untrack_requests(request_ids: Iterable[int]):
+    """Hook endpoint: le richieste non sono più pending."""
+    try:
+        engine = get_escalation_engine()
+        for rid in request_ids:
+            engine.untrack(rid)
+    except Exception as e:
+        print(f"[ESCALATION ERROR] untrack: {e}")
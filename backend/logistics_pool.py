@@ -0,0 +1,358 @@
+"""
+SL Enterprise - Logistics Live Pool
+Stato in memoria delle richieste logistica ATTIVE per la dashboard pool.
+
+La vista pool (GET /logistics/requests?status=pending|active) è la schermata
+più letta del magazzino: invece di rileggerla dal DB a ogni refresh, ogni
+worker tiene le richieste attive (pending, preparing, prepared, processing)
+già arricchite, con indici per stato, banchina e magazziniere assegnato.
+
+- all'avvio viene popolato dal DB (reload)
+- ogni endpoint di modifica in routers/logistics.py passa da
+  broadcast_request_event: la richiesta arricchita viene applicata qui e poi
+  pubblicata sul canale "pool" del broker WebSocket (ws_broker), a cui il
+  pool è iscritto -> anche gli altri worker restano allineati
+- ogni evento porta la versione della riga (LogisticsRequest.version, +1 a
+  ogni UPDATE): un evento più vecchio dello stato già applicato (es. arrivato
+  in ritardo dal relay di un altro worker) viene scartato; le richieste uscite
+  dal pool restano ricordate per un intervallo di resync
+- le modifiche alle etichette arricchite (tipo materiale, banchina, nome
+  utente) non passano da una richiesta: invalidate_live_pool() fa ricaricare
+  il pool su tutti i worker (canale "pool_state")
+- i campi che dipendono dall'ora (wait_time_seconds, is_overdue,
+  is_auto_urgent) si ricalcolano alla lettura
+- un resync periodico (LIVE_POOL_RESYNC_MINUTES) riallinea le modifiche fatte
+  fuori dagli endpoint; check_consistency() confronta il pool con il DB
+"""
+import heapq
+import math
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session, joinedload
+
+from models.logistics import LogisticsRequest
+
+LIVE_POOL_RESYNC_MINUTES = int(os.getenv("LIVE_POOL_RESYNC_MINUTES", "5"))
+
+ACTIVE_STATUSES = ("pending", "preparing", "prepared", "processing")
+# Pool "da ritirare": include anche 'prepared' (pronto al ritiro)
+POOL_STATUSES = ("pending", "prepared")
+
+# Versione registrata per una richiesta eliminata: nessun evento successivo la riporta nel pool
+DELETED_VERSION = math.inf
+
+# Calcolati sull'istante di lettura
+TIME_DERIVED_FIELDS = ("wait_time_seconds", "is_overdue", "is_auto_urgent")
+
+
+def _parse_dt(value) -> Optional[datetime]:
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+
+class LivePoolEntry:
+    """Richiesta attiva arricchita (formato JSON di GET /requests) + date per i calcoli."""
+    __slots__ = ("item", "id", "status", "is_urgent", "created_at", "prepared_at", "taken_at", "promised_eta_minutes")
+
+    def __init__(self, item: dict):
+        self.item = item
+        self.id = item["id"]
+        self.status = item["status"]
+        self.is_urgent = bool(item["is_urgent"])
+        self.created_at = _parse_dt(item["created_at"])
+        self.prepared_at = _parse_dt(item["prepared_at"])
+        self.taken_at = _parse_dt(item["taken_at"])
+        self.promised_eta_minutes = item["promised_eta_minutes"]
+
+    @property
+    def sort_key(self) -> Tuple[bool, datetime, int]:
+        # Come la query SQL: urgenti prima, poi per tempo attesa
+        return (not self.is_urgent, self.created_at, self.id)
+
+    def render(self, now: datetime, threshold_sla: int) -> dict:
+        """Stessi calcoli di LogisticsRequest.wait_time_seconds/is_overdue e di with_auto_urgent."""
+        item = dict(self.item)
+        base_time = self.prepared_at if self.prepared_at and self.status == "prepared" else self.created_at
+        if self.taken_at and self.status != "prepared":
+            item["wait_time_seconds"] = (self.taken_at - base_time).total_seconds()
+        else:
+            item["wait_time_seconds"] = (now - base_time).total_seconds()
+        item["is_overdue"] = bool(self.taken_at and self.promised_eta_minutes) and \
+            (now - self.taken_at).total_seconds() > self.promised_eta_minutes * 60
+        item["is_auto_urgent"] = self.status in POOL_STATUSES and \
+            (now - base_time).total_seconds() > threshold_sla * 60
+        return item
+
+
+class LivePool:
+    """Richieste attive in memoria, indicizzate per stato, banchina e assegnatario."""
+
+    def __init__(self, session_factory=None):
+        if session_factory is None:
+            from database import SessionLocal
+            session_factory = SessionLocal
+        self.session_factory = session_factory
+        self.loaded = False
+        self._lock = threading.Lock()
+        self._entries: Dict[int, LivePoolEntry] = {}
+        self._by_status: Dict[str, Set[int]] = {}
+        self._by_banchina: Dict[int, Set[int]] = {}
+        self._by_assignee: Dict[int, Set[int]] = {}
+        # Ultima versione applicata per richiesta (anche uscite dal pool) e quando è uscita
+        self._versions: Dict[int, float] = {}
+        self._retired: Dict[int, float] = {}
+        # Eventi applicati durante un reload: riapplicati sopra lo snapshot letto dal DB
+        self._touched_during_reload: Optional[Dict[int, Tuple[Optional[dict], Optional[float]]]] = None
+        self.stats = {"reloads": 0, "events": 0, "stale": 0, "reads": 0}
+
+    # ---------------------------------------------------------- caricamento
+
+    def reload(self):
+        """Ricostruisce il pool dalle richieste attive sul DB (avvio e resync)."""
+        from fastapi.encoders import jsonable_encoder
+        from routers.logistics import enrich_request_response
+
+        with self._lock:
+            self._touched_during_reload = {}
+        db = self.session_factory()
+        try:
+            requests = db.query(LogisticsRequest).options(
+                joinedload(LogisticsRequest.material_type),
+                joinedload(LogisticsRequest.banchina),
+                joinedload(LogisticsRequest.requester),
+                joinedload(LogisticsRequest.assigned_to),
+                joinedload(LogisticsRequest.prepared_by)
+            ).filter(LogisticsRequest.status.in_(ACTIVE_STATUSES)).all()
+            items = [jsonable_encoder(enrich_request_response(r)) for r in requests]
+            versions = {r.id: r.version for r in requests}
+        except Exception:
+            with self._lock:
+                self._touched_during_reload = None
+            raise
+        finally:
+            db.close()
+
+        with self._lock:
+            touched, self._touched_during_reload = self._touched_during_reload, None
+            self._entries.clear()
+            self._by_status.clear()
+            self._by_banchina.clear()
+            self._by_assignee.clear()
+            # Uscite dal pool: ricordate per un intervallo di resync contro gli eventi in ritardo
+            horizon = time.monotonic() - LIVE_POOL_RESYNC_MINUTES * 60
+            self._retired = {
+                rid: at for rid, at in self._retired.items() if at >= horizon and rid not in versions
+            }
+            self._versions = {rid: self._versions[rid] for rid in self._retired if rid in self._versions}
+            self._versions.update(versions)
+            for item in items:
+                self._upsert_locked(item)
+            for request_id, (item, version) in touched.items():
+                if not self._is_stale_locked(request_id, version):
+                    self._apply_locked(request_id, item, version)
+            self.loaded = True
+        self.stats["reloads"] += 1
+
+    def invalidate(self):
+        """Stato non più affidabile (evento perso): la prossima lettura ricarica dal DB."""
+        self.loaded = False
+
+    def ensure_loaded(self) -> bool:
+        if not self.loaded:
+            try:
+                self.reload()
+            except Exception as e:
+                print(f"[LIVE POOL ERROR] Caricamento fallito: {e}")
+        return self.loaded
+
+    # ---------------------------------------------------------- aggiornamenti
+
+    def _index(self, entry: LivePoolEntry) -> List[Set[int]]:
+        indexes = [self._by_status.setdefault(entry.status, set())]
+        if entry.item["banchina_id"] is not None:
+            indexes.append(self._by_banchina.setdefault(entry.item["banchina_id"], set()))
+        if entry.item["assigned_to_id"] is not None:
+            indexes.append(self._by_assignee.setdefault(entry.item["assigned_to_id"], set()))
+        return indexes
+
+    def _remove_locked(self, request_id: int):
+        entry = self._entries.pop(request_id, None)
+        if entry is not None:
+            for index in self._index(entry):
+                index.discard(request_id)
+
+    def _upsert_locked(self, item: dict):
+        self._remove_locked(item["id"])
+        entry = LivePoolEntry(item)
+        self._entries[entry.id] = entry
+        for index in self._index(entry):
+            index.add(entry.id)
+
+    def _is_stale_locked(self, request_id: int, version: Optional[float]) -> bool:
+        known = self._versions.get(request_id)
+        return known is not None and version is not None and version < known
+
+    def _apply_locked(self, request_id: int, item: Optional[dict], version: Optional[float]):
+        if version is not None:
+            self._versions[request_id] = version
+        if item is not None and item["status"] in ACTIVE_STATUSES:
+            self._retired.pop(request_id, None)
+            self._upsert_locked(dict(item))
+        else:
+            self._retired[request_id] = time.monotonic()
+            self._remove_locked(request_id)
+
+    def apply(self, request_id: int, item: Optional[dict], version: Optional[float] = None) -> bool:
+        """
+        Richiesta arricchita dopo una modifica (None = eliminata). Idempotente.
+        Scartata (False) se `version` è più vecchia dell'ultima applicata.
+        """
+        if item is None:
+            version = DELETED_VERSION
+        with self._lock:
+            if self._is_stale_locked(request_id, version):
+                self.stats["stale"] += 1
+                return False
+            self._apply_locked(request_id, item, version)
+            if self._touched_during_reload is not None:
+                self._touched_during_reload[request_id] = (item, version)
+        self.stats["events"] += 1
+        return True
+
+    def apply_event(self, event: dict) -> bool:
+        """Evento delta di broadcast_request_event (type, request_id, version, request?)."""
+        return self.apply(event["request_id"], event.get("request"), event.get("version"))
+
+    def on_broker_event(self, payload: dict):
+        """Handler del canale "pool" del broker: eventi di questo e degli altri worker."""
+        if payload.get("pool") == "logistics" and "request_id" in payload["message"]:
+            self.apply_event(payload["message"])
+
+    def on_state_event(self, payload: dict):
+        """Handler del canale "pool_state": etichette arricchite cambiate su un worker."""
+        self.invalidate()
+
+    # ---------------------------------------------------------- letture
+
+    def _counters_locked(self) -> dict:
+        pending_count = len(self._by_status.get("pending", ())) + len(self._by_status.get("prepared", ()))
+        urgent_count = sum(
+            1 for status in ("pending", "processing")
+            for rid in self._by_status.get(status, ()) if self._entries[rid].is_urgent
+        )
+        return {"pending_count": pending_count, "urgent_count": urgent_count}
+
+    def counters(self) -> dict:
+        """Stessi contatori di get_pool_counters (pending+prepared, urgenti attivi)."""
+        with self._lock:
+            return self._counters_locked()
+
+    def query(self, status: str, banchina_id: Optional[int] = None, requester_id: Optional[int] = None,
+              assignee_id: Optional[int] = None, limit: int = 50,
+              threshold_sla: int = 3) -> Tuple[List[dict], dict]:
+        """Richieste attive filtrate e ordinate come list_requests, più i contatori."""
+        if status == "active":
+            statuses = ACTIVE_STATUSES
+        elif status == "pending":
+            statuses = POOL_STATUSES
+        else:
+            statuses = (status,)
+
+        with self._lock:
+            ids: Set[int] = set()
+            for s in statuses:
+                ids |= self._by_status.get(s, set())
+            if banchina_id:
+                ids &= self._by_banchina.get(banchina_id, set())
+            if assignee_id is not None:
+                ids &= self._by_assignee.get(assignee_id, set())
+            entries = [self._entries[rid] for rid in ids]
+            if requester_id is not None:
+                entries = [e for e in entries if e.item["requester_id"] == requester_id]
+            selected = heapq.nsmallest(limit, entries, key=lambda e: e.sort_key)
+            counters = self._counters_locked()
+
+        now = datetime.utcnow()
+        self.stats["reads"] += 1
+        return [e.render(now, threshold_sla) for e in selected], counters
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                **self.stats,
+                "loaded": self.loaded,
+                "active": len(self._entries),
+                "by_status": {s: len(ids) for s, ids in self._by_status.items() if ids},
+            }
+
+
+_pool: Optional[LivePool] = None
+_pool_lock = threading.Lock()
+
+
+def get_live_pool() -> LivePool:
+    """Pool singleton, iscritto ai canali "pool" e "pool_state" del broker WebSocket."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            from ws_broker import get_ws_broker
+            _pool = LivePool()
+            broker = get_ws_broker()
+            broker.subscribe("pool", _pool.on_broker_event)
+            broker.subscribe("pool_state", _pool.on_state_event)
+        return _pool
+
+
+def invalidate_live_pool():
+    """Etichette mostrate nel pool cambiate (materiale, banchina, nome utente): ricarica su tutti i worker."""
+    get_live_pool().invalidate()
+    try:
+        from ws_broker import get_ws_broker
+        get_ws_broker().publish("pool_state", {"invalidate": True})
+    except Exception as e:
+        print(f"[LIVE POOL] Invalidazione non pubblicata: {e}")
+
+
+def check_consistency(db: Session, pool: Optional[LivePool] = None) -> List[str]:
+    """
+    Confronta il pool in memoria con il DB: stesse richieste attive, stessi campi
+    (esclusi quelli calcolati sull'ora), stessi contatori. Lista vuota = allineato.
+    """
+    from fastapi.encoders import jsonable_encoder
+    from routers.logistics import enrich_request_response, get_pool_counters
+
+    pool = pool or get_live_pool()
+    requests = db.query(LogisticsRequest).options(
+        joinedload(LogisticsRequest.material_type),
+        joinedload(LogisticsRequest.banchina),
+        joinedload(LogisticsRequest.requester),
+        joinedload(LogisticsRequest.assigned_to),
+        joinedload(LogisticsRequest.prepared_by)
+    ).filter(LogisticsRequest.status.in_(ACTIVE_STATUSES)).all()
+    expected = {r.id: jsonable_encoder(enrich_request_response(r)) for r in requests}
+
+    with pool._lock:
+        actual = {rid: dict(e.item) for rid, e in pool._entries.items()}
+        counters = pool._counters_locked()
+
+    differences = []
+    for rid in sorted(expected.keys() - actual.keys()):
+        differences.append(f"richiesta {rid} attiva sul DB ma assente dal pool")
+    for rid in sorted(actual.keys() - expected.keys()):
+        differences.append(f"richiesta {rid} nel pool ma non attiva sul DB")
+    for rid in sorted(expected.keys() & actual.keys()):
+        fields = [
+            key for key, value in expected[rid].items()
+            if key not in TIME_DERIVED_FIELDS and actual[rid].get(key) != value
+        ]
+        if fields:
+            differences.append(f"richiesta {rid}: campi diversi {fields}")
+    sql_counters = get_pool_counters(db)
+    if counters != sql_counters:
+        differences.append(f"contatori pool {counters} != DB {sql_counters}")
+    return differences
@@ -0,0 +1,226 @@
+"""
+SL Enterprise - Logistics Stats
+Aggregati incrementali delle performance magazzinieri (LogisticsPerformance).
+
+Per ogni dipendente e mese si tengono count/sum/min/max del tempo di
+reazione (presa in carico - creazione richiesta) e uno sketch a bucket
+logaritmici per p50/p95, più il conteggio delle ETA valutate/rispettate:
+- al completamento di una missione record_completion() aggiorna gli
+  aggregati in O(1); media, record e % ETA sono derivati dagli aggregati
+  (prima: avg = (vecchia + nuova) / 2, che non è una media)
+- rebuild_performance() ricostruisce gli stessi aggregati da
+  logistics_requests in un solo passaggio: backfill di tutti i mesi
+  (scripts/rebuild_logistics_performance.py) e ricalcolo dopo
+  un'eliminazione (minimo e massimo non si possono "togliere")
+
+Punti, penalità, missioni rilasciate e solleciti restano aggiornati dagli
+endpoint: penalità di rilascio e solleciti non sono ricostruibili dalle richieste.
+"""
+import json
+import math
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from models.hr import Employee
+from models.logistics import LogisticsPerformance, LogisticsRequest
+
+# Errore relativo massimo dei percentili stimati (2%)
+SKETCH_RELATIVE_ACCURACY = 0.02
+_GAMMA = (1 + SKETCH_RELATIVE_ACCURACY) / (1 - SKETCH_RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+
+# Campi ricostruiti da rebuild_performance (gli altri restano invariati)
+AGGREGATE_FIELDS = (
+    "missions_completed", "missions_urgent",
+    "reaction_count", "reaction_total_seconds", "fastest_reaction_seconds", "slowest_reaction_seconds",
+    "reaction_sketch", "avg_reaction_seconds",
+    "eta_checked", "eta_respected_count", "eta_accuracy_percent",
+)
+
+
+class ReactionSketch:
+    """
+    Istogramma a bucket logaritmici (tipo DDSketch): il bucket i contiene i
+    valori in (gamma^(i-1), gamma^i], il bucket 0 i valori <= 1 secondo.
+    Unibile e serializzabile in JSON; quantili con errore relativo <= 2%.
+    """
+    __slots__ = ("buckets", "count")
+
+    def __init__(self, buckets: Optional[Dict[int, int]] = None):
+        self.buckets = buckets or {}
+        self.count = sum(self.buckets.values())
+
+    @classmethod
+    def from_json(cls, raw: Optional[str]) -> "ReactionSketch":
+        if not raw:
+            return cls()
+        return cls({int(k): v for k, v in json.loads(raw).items()})
+
+    def to_json(self) -> Optional[str]:
+        if not self.buckets:
+            return None
+        return json.dumps({str(k): v for k, v in sorted(self.buckets.items())}, separators=(",", ":"))
+
+    @staticmethod
+    def _bucket(value: float) -> int:
+        if value <= 1:
+            return 0
+        return max(1, math.ceil(math.log(value) / _LOG_GAMMA))
+
+    def add(self, value: float, n: int = 1):
+        key = self._bucket(value)
+        self.buckets[key] = self.buckets.get(key, 0) + n
+        self.count += n
+
+    def merge(self, other: "ReactionSketch"):
+        for key, n in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + n
+        self.count += other.count
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Valore al quantile q (0..1), rango inferiore come sorted(values)[int(q * (n - 1))]."""
+        if not self.count:
+            return None
+        rank = int(q * (self.count - 1))
+        seen = 0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                if key == 0:
+                    return 0.0
+                # Punto medio (relativo) del bucket
+                return 2 * _GAMMA ** key / (_GAMMA + 1)
+        return None
+
+
+def reaction_seconds(request: LogisticsRequest) -> Optional[int]:
+    """Tempo di reazione di una missione completata (come wait_time_seconds dopo la presa in carico)."""
+    if not request.taken_at or not request.created_at:
+        return None
+    return max(0, int((request.taken_at - request.created_at).total_seconds()))
+
+
+def _reset(perf: LogisticsPerformance):
+    perf.missions_completed = 0
+    perf.missions_urgent = 0
+    perf.reaction_count = 0
+    perf.reaction_total_seconds = 0
+    perf.fastest_reaction_seconds = None
+    perf.slowest_reaction_seconds = None
+    perf.reaction_sketch = None
+    perf.eta_checked = 0
+    perf.eta_respected_count = 0
+
+
+def _derive(perf: LogisticsPerformance):
+    """Campi letti da classifica e /performance, calcolati dagli aggregati."""
+    perf.avg_reaction_seconds = round(perf.reaction_total_seconds / perf.reaction_count) \
+        if perf.reaction_count else None
+    perf.eta_accuracy_percent = round(100 * perf.eta_respected_count / perf.eta_checked, 1) \
+        if perf.eta_checked else None
+
+
+def _add_observation(perf: LogisticsPerformance, reaction: Optional[int], eta_respected: Optional[bool],
+                     sketch: ReactionSketch):
+    if reaction is not None:
+        perf.reaction_count = (perf.reaction_count or 0) + 1
+        perf.reaction_total_seconds = (perf.reaction_total_seconds or 0) + reaction
+        if perf.fastest_reaction_seconds is None or reaction < perf.fastest_reaction_seconds:
+            perf.fastest_reaction_seconds = reaction
+        if perf.slowest_reaction_seconds is None or reaction > perf.slowest_reaction_seconds:
+            perf.slowest_reaction_seconds = reaction
+        sketch.add(reaction)
+    if eta_respected is not None:
+        perf.eta_checked = (perf.eta_checked or 0) + 1
+        if eta_respected:
+            perf.eta_respected_count = (perf.eta_respected_count or 0) + 1
+
+
+def record_completion(perf: LogisticsPerformance, request: LogisticsRequest):
+    """Aggiunge una missione completata agli aggregati del mese (tempo di reazione ed ETA)."""
+    sketch = ReactionSketch.from_json(perf.reaction_sketch)
+    _add_observation(perf, reaction_seconds(request), request.eta_respected, sketch)
+    perf.reaction_sketch = sketch.to_json()
+    _derive(perf)
+
+
+def reaction_summary(perf: LogisticsPerformance) -> dict:
+    """Percentili e massimo del tempo di reazione per le risposte API."""
+    sketch = ReactionSketch.from_json(perf.reaction_sketch)
+    p50, p95 = sketch.quantile(0.5), sketch.quantile(0.95)
+    return {
+        "reaction_count": perf.reaction_count or 0,
+        "reaction_p50_seconds": round(p50) if p50 is not None else None,
+        "reaction_p95_seconds": round(p95) if p95 is not None else None,
+        "slowest_reaction_seconds": perf.slowest_reaction_seconds,
+    }
+
+
+def _month_bounds(year: int, month: Optional[int]) -> Tuple[datetime, datetime]:
+    if month is None:
+        return datetime(year, 1, 1), datetime(year + 1, 1, 1)
+    if month == 12:
+        return datetime(year, 12, 1), datetime(year + 1, 1, 1)
+    return datetime(year, month, 1), datetime(year, month + 1, 1)
+
+
+def rebuild_performance(db: Session, year: Optional[int] = None, month: Optional[int] = None,
+                        employee_id: Optional[int] = None) -> int:
+    """
+    Ricostruisce gli aggregati (AGGREGATE_FIELDS) dalle richieste completate,
+    accreditate all'operatore assegnato nel mese di completamento.
+    Senza filtri: tutti i mesi e tutti i dipendenti in un solo passaggio.
+    Non fa commit. Ritorna il numero di record performance aggiornati.
+    """
+    if month is not None and year is None:
+        raise ValueError("month richiede year")
+
+    query = db.query(
+        Employee.id, LogisticsRequest.completed_at, LogisticsRequest.created_at, LogisticsRequest.taken_at,
+        LogisticsRequest.is_urgent, LogisticsRequest.eta_respected
+    ).join(
+        Employee, Employee.user_id == LogisticsRequest.assigned_to_id
+    ).filter(
+        LogisticsRequest.status == "completed",
+        LogisticsRequest.completed_at.isnot(None)
+    )
+    existing = db.query(LogisticsPerformance)
+    if year is not None:
+        start, end = _month_bounds(year, month)
+        query = query.filter(LogisticsRequest.completed_at >= start, LogisticsRequest.completed_at < end)
+        existing = existing.filter(LogisticsPerformance.year == year)
+        if month is not None:
+            existing = existing.filter(LogisticsPerformance.month == month)
+    if employee_id is not None:
+        query = query.filter(Employee.id == employee_id)
+        existing = existing.filter(LogisticsPerformance.employee_id == employee_id)
+
+    records: Dict[Tuple[int, int, int], LogisticsPerformance] = {}
+    for perf in existing.all():
+        _reset(perf)
+        records[(perf.employee_id, perf.year, perf.month)] = perf
+
+    sketches: Dict[Tuple[int, int, int], ReactionSketch] = {}
+    for emp_id, completed_at, created_at, taken_at, is_urgent, eta_respected in query.yield_per(1000):
+        key = (emp_id, completed_at.year, completed_at.month)
+        perf = records.get(key)
+        if perf is None:
+            perf = LogisticsPerformance(employee_id=emp_id, year=key[1], month=key[2],
+                                        total_points=0, penalties_received=0, missions_released=0,
+                                        urgency_requests_received=0)
+            _reset(perf)
+            db.add(perf)
+            records[key] = perf
+        perf.missions_completed += 1
+        if is_urgent:
+            perf.missions_urgent += 1
+        reaction = max(0, int((taken_at - created_at).total_seconds())) if taken_at and created_at else None
+        _add_observation(perf, reaction, eta_respected, sketches.setdefault(key, ReactionSketch()))
+
+    for key, perf in records.items():
+        sketch = sketches.get(key)
+        perf.reaction_sketch = sketch.to_json() if sketch else None
+        _derive(perf)
+    return len(records)
@@ -13,7 +13,7 @@ from routers import (
     auth, users, employees, leaves, disciplinary, notifications, expiries, fleet, returns,
     tasks, events, audit, hr_stats, shifts, announcements, facility, factory, kpi, roles,
     admin_settings, mobile, maintenance, reports, bonuses, chat, production, logistics,
-    block_calculator, oven, fleet_charge, checklist_web
+    block_calculator, oven, fleet_charge, checklist_web, report_jobs
 )
 
 
@@ -22,6 +22,11 @@ from routers import (
 # ============================================================
 
 from scheduler import start_scheduler, shutdown_scheduler
+from push_service import shutdown_push_dispatcher
+from image_pipeline import shutdown_image_pool
+from report_jobs import shutdown_report_pool
+from websocket_manager import bind_event_loop
+from ws_broker import start_ws_broker, shutdown_ws_broker
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -46,6 +51,18 @@ async def lifespan(app: FastAPI):
                      conn.execute(text("ALTER TABLE conversation_members ADD COLUMN banned_until DATETIME NULL"))
                      conn.commit()
 
+             # 1b. Contatori non letti denormalizzati su conversation_members
+             if inspector.has_table("conversation_members"):
+                 cols = [c['name'] for c in inspector.get_columns("conversation_members")]
+                 if "unread_count" not in cols:
+                     print("[MIGRATION] Aggiunto campo 'unread_count' a conversation_members")
+                     conn.execute(text("ALTER TABLE conversation_members ADD COLUMN unread_count INTEGER NOT NULL DEFAULT 0"))
+                     conn.commit()
+                 if "last_message_id" not in cols:
+                     print("[MIGRATION] Aggiunto campo 'last_message_id' a conversation_members")
+                     conn.execute(text("ALTER TABLE conversation_members ADD COLUMN last_message_id INTEGER NULL REFERENCES messages(id) ON DELETE SET NULL"))
+                     conn.commit()
+
              # 2. deleted_at su messages
              if inspector.has_table("messages"):
                  cols = [c['name'] for c in inspector.get_columns("messages")]
@@ -90,6 +107,78 @@ async def lifespan(app: FastAPI):
                      conn.execute(text("ALTER TABLE fleet_checklists ADD COLUMN vehicle_photo_url VARCHAR(255) NULL"))
                      conn.commit()
 
+             # 6b. Indice messaggi per conversazione (riepilogo chat set-based)
+             if inspector.has_table("messages"):
+                 conn.execute(text(
+                     "CREATE INDEX IF NOT EXISTS ix_messages_conv_created "
+                     "ON messages (conversation_id, created_at)"
+                 ))
+                 conn.commit()
+
+             # 6c. Indici compositi hot path (stessi della migration c4e9a7b2d1f0, per DB non migrati con Alembic)
+             from database import Base
+             for table_name in ("logistics_requests", "notifications", "shift_assignments", "kpi_entries",
+                                "oven_items", "leave_requests", "fleet_charge_cycles"):
+                 if not inspector.has_table(table_name):
+                     continue
+                 existing = {ix["name"] for ix in inspector.get_indexes(table_name)}
+                 for index in Base.metadata.tables[table_name].indexes:
+                     if index.name not in existing and not index.unique:
+                         print(f"[MIGRATION] Creato indice '{index.name}'")
+                         index.create(bind=conn)
+                         conn.commit()
+
+             # 6d. Aggregati incrementali performance logistica (+ backfill dallo storico)
+             if inspector.has_table("logistics_performance"):
+                 cols = [c['name'] for c in inspector.get_columns("logistics_performance")]
+                 added = False
+                 for col_name, col_def in (
+                     ("reaction_count", "INTEGER DEFAULT 0"),
+                     ("reaction_total_seconds", "INTEGER DEFAULT 0"),
+                     ("slowest_reaction_seconds", "INTEGER NULL"),
+                     ("reaction_sketch", "TEXT NULL"),
+                     ("eta_checked", "INTEGER DEFAULT 0"),
+                     ("eta_respected_count", "INTEGER DEFAULT 0"),
+                 ):
+                     if col_name not in cols:
+                         print(f"[MIGRATION] Aggiunto campo '{col_name}' a logistics_performance")
+                         conn.execute(text(f"ALTER TABLE logistics_performance ADD COLUMN {col_name} {col_def}"))
+                         conn.commit()
+                         added = True
+                 if added:
+                     from database import SessionLocal
+                     from logistics_stats import rebuild_performance
+                     backfill_db = SessionLocal()
+                     try:
+                         rebuilt = rebuild_performance(backfill_db)
+                         backfill_db.commit()
+                         print(f"[MIGRATION] Aggregati performance logistica ricostruiti ({rebuilt} record)")
+                     finally:
+                         backfill_db.close()
+
+             # 6e. Rollup KPI appena creati su DB con storico: backfill dalle KpiEntry
+             if inspector.has_table("kpi_entries"):
+                 has_entries = conn.execute(text("SELECT 1 FROM kpi_entries LIMIT 1")).first()
+                 has_rollups = conn.execute(text("SELECT 1 FROM kpi_daily_rollups LIMIT 1")).first()
+                 if has_entries and not has_rollups:
+                     from database import SessionLocal
+                     from kpi_rollups import rebuild_kpi_rollups
+                     backfill_db = SessionLocal()
+                     try:
+                         rebuilt = rebuild_kpi_rollups(backfill_db)
+                         backfill_db.commit()
+                         print(f"[MIGRATION] Rollup KPI ricostruiti ({rebuilt} giorni/settore)")
+                     finally:
+                         backfill_db.close()
+
+             # 6f. Versione di riga su logistics_requests (eventi del pool logistica)
+             if inspector.has_table("logistics_requests"):
+                 cols = [c['name'] for c in inspector.get_columns("logistics_requests")]
+                 if "version" not in cols:
+                     print("[MIGRATION] Aggiunto campo 'version' a logistics_requests")
+                     conn.execute(text("ALTER TABLE logistics_requests ADD COLUMN version INTEGER NOT NULL DEFAULT 0"))
+                     conn.commit()
+
              # 6. Auto-fix: assegna role_id a utenti con role_id NULL
              orphans = conn.execute(text(
                  "SELECT u.id, u.role FROM users u WHERE u.role_id IS NULL AND u.is_active = 1"
@@ -124,6 +213,15 @@ async def lifespan(app: FastAPI):
 
     print("[STARTUP] Database pronto!")
     
+    # Event loop per le notifiche pubblicate dai job in background
+    import asyncio
+    bind_event_loop(asyncio.get_running_loop())
+    # Broker eventi WebSocket tra worker (WS_BROKER=local|sqlite)
+    await start_ws_broker()
+    # Pool logistica in memoria (richieste attive), aggiornato dagli eventi del broker
+    from logistics_pool import get_live_pool
+    get_live_pool().ensure_loaded()
+
     # Avvio Scheduler
     print("[STARTUP] Avvio Scheduler...")
     start_scheduler()
@@ -133,6 +231,10 @@ async def lifespan(app: FastAPI):
     # Shutdown
     print("[SHUTDOWN] Chiusura applicazione...")
     shutdown_scheduler()
+    shutdown_push_dispatcher()
+    shutdown_image_pool()
+    shutdown_report_pool()
+    await shutdown_ws_broker()
 
 
 # ============================================================
@@ -265,6 +367,7 @@ app.include_router(events.router)
 app.include_router(shifts.router)
 app.include_router(hr_stats.router)
 app.include_router(reports.router)
+app.include_router(report_jobs.router)  # Export PDF/Excel in background
 app.include_router(bonuses.router)
 app.include_router(facility.router)
 app.include_router(factory.router)
@@ -332,6 +435,54 @@ async def production_websocket(websocket: WebSocket, pool: str = "production_blo
     except WebSocketDisconnect:
         manager.disconnect(websocket, pool)
 
+# ============================================================
+# BADGE WEBSOCKET (contatori non letti / approvazioni, sostituisce il polling)
+# ============================================================
+from database import SessionLocal, User
+from websocket_manager import get_badge_manager
+
+def _badge_snapshot(user_id: int) -> dict:
+    from badges import get_badge_snapshot
+    db = SessionLocal()
+    try:
+        return get_badge_snapshot(db, db.get(User, user_id))
+    finally:
+        db.close()
+
+@app.websocket("/ws/badges")
+async def badges_websocket(websocket: WebSocket, token: str = ""):
+    """
+    WebSocket per utente con i contatori dei badge.
+    All'apertura invia lo snapshot completo ({"type": "badges"}), poi solo
+    delta ({"type": "badge_delta"}). Il client può inviare "refresh" per
+    ricevere di nuovo lo snapshot (es. dopo una riconnessione).
+    """
+    from security import decode_token
+
+    token_data = decode_token(token) if token else None
+    user = None
+    if token_data is not None:
+        db = SessionLocal()
+        try:
+            user = db.query(User).filter(User.username == token_data.username, User.is_active == True).first()
+        finally:
+            db.close()
+    if user is None:
+        await websocket.close(code=4401)
+        return
+
+    manager = get_badge_manager()
+    await manager.connect(websocket, user.id, user.role)
+    try:
+        await manager.send_to_socket(websocket, _badge_snapshot(user.id))
+        while True:
+            if await websocket.receive_text() == "refresh":
+                await manager.send_to_socket(websocket, _badge_snapshot(user.id))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        manager.disconnect(websocket, user.id)
+
 # ============================================================
 # STATIC FILES (per preview documenti)
 # ============================================================
@@ -357,10 +508,18 @@ def read_root():
 @app.get("/health", tags=["Root"])
 def health_check():
     """Verifica stato del sistema."""
+    from security import get_user_cache_stats
+    from websocket_manager import get_ws_stats
+    from logistics_pool import get_live_pool
+    from settings_cache import get_settings_cache
     return {
         "status": "healthy",
         "database": "connected",
-        "version": "2.0.0"
+        "version": "2.0.0",
+        "auth_cache": get_user_cache_stats(),
+        "websockets": get_ws_stats(),
+        "logistics_live_pool": get_live_pool().get_stats(),
+        "settings_cache": get_settings_cache().get_stats()
     }
 
 
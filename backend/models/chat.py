@@ -44,6 +44,12 @@ class ConversationMember(Base):
     # Timestamp ultima lettura (per calcolo non letti)
     last_read_at = Column(DateTime, default=datetime.utcnow)
     
+    # Contatore non letti denormalizzato (mantenuto da chat_summary, riconciliato dallo scheduler)
+    unread_count = Column(Integer, default=0, nullable=False)
+    
+    # Puntatore all'ultimo messaggio non cancellato della conversazione
+    last_message_id = Column(Integer, ForeignKey("messages.id", ondelete="SET NULL"), nullable=True)
+    
     # Silenziato fino a (NULL = non silenziato)
     muted_until = Column(DateTime, nullable=True)
 
@@ -55,6 +61,7 @@ class ConversationMember(Base):
     # Relazioni
     conversation = relationship("Conversation", back_populates="members")
     user = relationship("User")
+    last_message = relationship("Message", foreign_keys=[last_message_id])
     
     # Indice unico per evitare duplicati
     __table_args__ = (
@@ -94,6 +101,11 @@ class Message(Base):
     sender = relationship("User", foreign_keys=[sender_id])
     reply_to = relationship("Message", remote_side=[id])
     
+    # Indice per ultimo messaggio / non letti per conversazione
+    __table_args__ = (
+        Index('ix_messages_conv_created', 'conversation_id', 'created_at'),
+    )
+    
     @property
     def is_deleted(self):
         return self.deleted_at is not None
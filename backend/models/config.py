@@ -1,5 +1,5 @@
-from sqlalchemy import Column, String
-from database import Base
+from sqlalchemy import Column, Integer, String
+from .base import Base
 
 class SystemSetting(Base):
     __tablename__ = "system_settings"
@@ -7,3 +7,19 @@ class SystemSetting(Base):
     key = Column(String(50), primary_key=True, index=True)
     value = Column(String(255), nullable=False)
     description = Column(String(255), nullable=True)
+
+
+class SettingsVersion(Base):
+    """Versione di ogni namespace della cache impostazioni (settings_cache), incrementata a ogni scrittura."""
+    __tablename__ = "settings_versions"
+
+    namespace = Column(String(30), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+class DataVersion(Base):
+    """Versione dei dati di ogni tabella letta dai report (data_versions), incrementata a ogni scrittura ORM."""
+    __tablename__ = "data_versions"
+
+    table_name = Column(String(64), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
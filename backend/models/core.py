@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Text, Float, JSON
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Text, Float, JSON, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .base import Base
@@ -163,6 +163,10 @@ class AuditLog(Base):
 class Notification(Base):
     """Centro notifiche."""
     __tablename__ = "notifications"
+    __table_args__ = (
+        Index('ix_notifications_user_read_created', 'recipient_user_id', 'is_read', 'created_at'),
+        Index('ix_notifications_role_read_created', 'recipient_role', 'is_read', 'created_at'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     
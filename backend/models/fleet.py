@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Text, Float, JSON
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Text, Float, JSON, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .base import Base
@@ -139,6 +139,9 @@ class FleetChargeCycle(Base):
     Stato: in_use → charging/parked → completed (al prossimo prelievo).
     """
     __tablename__ = "fleet_charge_cycles"
+    __table_args__ = (
+        Index('ix_fleet_charge_cycles_vehicle_status', 'vehicle_id', 'status'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
 
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Text, Float, JSON
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Text, Float, JSON, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .base import Base
@@ -159,6 +159,9 @@ class MedicalExam(Base):
 class LeaveRequest(Base):
     """Richieste ferie e permessi."""
     __tablename__ = "leave_requests"
+    __table_args__ = (
+        Index('ix_leave_requests_employee_status_start', 'employee_id', 'status', 'start_date'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     employee_id = Column(Integer, ForeignKey("employees.id"), nullable=False)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Text, Float, JSON
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Text, Float, JSON, Index, literal_column
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .base import Base
@@ -73,6 +73,9 @@ class LogisticsRequest(Base):
     Traccia tutto il ciclo di vita dalla creazione alla consegna.
     """
     __tablename__ = "logistics_requests"
+    __table_args__ = (
+        Index('ix_logistics_requests_status_created', 'status', 'created_at'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     
@@ -124,6 +127,11 @@ class LogisticsRequest(Base):
     penalty_applied = Column(Integer, default=0)     # Penalità applicate
     eta_respected = Column(Boolean, nullable=True)   # ETA rispettata?
     actual_duration_seconds = Column(Integer, nullable=True)  # Tempo reale impiegato
+
+    # Versione riga: +1 a ogni UPDATE (anche in blocco), usata dal pool in memoria
+    # per scartare eventi del broker più vecchi dell'ultimo stato applicato
+    version = Column(Integer, nullable=False, default=0, server_default="0",
+                     onupdate=literal_column("version + 1"))
     
     # Relazioni
     material_type = relationship("LogisticsMaterialType", back_populates="requests")
@@ -174,10 +182,19 @@ class LogisticsPerformance(Base):
     total_points = Column(Integer, default=0)
     penalties_received = Column(Integer, default=0)
     
-    # Performance
+    # Performance (derivati dagli aggregati sotto, vedi logistics_stats)
     avg_reaction_seconds = Column(Integer, nullable=True)  # Media tempo presa in carico
     fastest_reaction_seconds = Column(Integer, nullable=True)  # Record personale
     eta_accuracy_percent = Column(Float, nullable=True)  # % ETA rispettate
+
+    # Aggregati incrementali tempo di reazione (count/sum/max + sketch percentili)
+    reaction_count = Column(Integer, default=0)
+    reaction_total_seconds = Column(Integer, default=0)
+    slowest_reaction_seconds = Column(Integer, nullable=True)
+    reaction_sketch = Column(Text, nullable=True)  # JSON {bucket: conteggio}
+    # ETA: missioni con promessa valutata / rispettate
+    eta_checked = Column(Integer, default=0)
+    eta_respected_count = Column(Integer, default=0)
     
     # Solleciti ricevuti (negativo)
     urgency_requests_received = Column(Integer, default=0)
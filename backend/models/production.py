@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Text, Float, JSON, Index
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Date, Text, Float, JSON, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone, timedelta
 
@@ -178,6 +178,9 @@ class KpiConfig(Base):
 class KpiEntry(Base):
     """Registrazione giornaliera KPI per turno."""
     __tablename__ = "kpi_entries"
+    __table_args__ = (
+        Index('ix_kpi_entries_config_date_shift', 'kpi_config_id', 'work_date', 'shift_type'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     
@@ -217,6 +220,52 @@ class KpiEntry(Base):
     recorder = relationship("User")
 
 
+class KpiDailyRollup(Base):
+    """
+    Totali KPI per giorno, settore e turno (somme delle KpiEntry).
+    Mantenuti da kpi_rollups ad ogni scrittura di KpiEntry: non modificare a mano.
+    """
+    __tablename__ = "kpi_daily_rollups"
+    __table_args__ = (
+        UniqueConstraint('work_day', 'kpi_config_id', 'shift_type', name='uq_kpi_daily_rollup'),
+        Index('ix_kpi_daily_rollups_config_day', 'kpi_config_id', 'work_day'),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    work_day = Column(Date, nullable=False, index=True)
+    weekday = Column(Integer, nullable=False)  # 0=Lun ... 6=Dom (filtro weekend senza funzioni SQL)
+    kpi_config_id = Column(Integer, ForeignKey("kpi_configs.id"), nullable=False)
+    shift_type = Column(String(20), nullable=False)
+
+    entries_count = Column(Integer, default=0)
+    quantity_produced = Column(Integer, default=0)
+    hours_total = Column(Float, default=0.0)
+    hours_downtime = Column(Float, default=0.0)
+    hours_net = Column(Float, default=0.0)
+    hours_net_target = Column(Float, default=0.0)  # Ore nette > 0: target = kpi_target_8h * ore / 8
+
+
+class KpiMonthlyRollup(Base):
+    """Totali KPI per mese e settore, separati feriali/weekend (somme dei KpiDailyRollup)."""
+    __tablename__ = "kpi_monthly_rollups"
+    __table_args__ = (
+        UniqueConstraint('year', 'month', 'kpi_config_id', 'is_weekend', name='uq_kpi_monthly_rollup'),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    year = Column(Integer, nullable=False)
+    month = Column(Integer, nullable=False)
+    kpi_config_id = Column(Integer, ForeignKey("kpi_configs.id"), nullable=False)
+    is_weekend = Column(Boolean, nullable=False, default=False)
+
+    entries_count = Column(Integer, default=0)
+    quantity_produced = Column(Integer, default=0)
+    hours_total = Column(Float, default=0.0)
+    hours_downtime = Column(Float, default=0.0)
+    hours_net = Column(Float, default=0.0)
+    hours_net_target = Column(Float, default=0.0)
+
+
 class DowntimeReason(Base):
     """Causali di fermo configurabili dall'admin."""
     __tablename__ = "downtime_reasons"
@@ -401,6 +450,9 @@ OVEN_MAX_MINUTES = 180  # Durata massima accensione forno
 class OvenItem(Base):
     """Tracciamento materiali nel forno industriale."""
     __tablename__ = "oven_items"
+    __table_args__ = (
+        Index('ix_oven_items_status', 'status'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
 
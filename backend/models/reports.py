@@ -0,0 +1,32 @@
+"""
+Report Jobs — Esportazioni PDF/Excel generate in background.
+Il file prodotto sta nella cache artefatti su disco (report_jobs), indicizzata
+per cache_key = hash(tipo report, parametri, versione dei dati).
+"""
+from datetime import datetime
+
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Index
+
+from .base import Base
+
+
+class ReportJob(Base):
+    """Richiesta di generazione di un report."""
+    __tablename__ = "report_jobs"
+    __table_args__ = (
+        Index('ix_report_jobs_user_created', 'requested_by', 'created_at'),
+    )
+
+    id = Column(String(32), primary_key=True)  # uuid4 hex
+    report_type = Column(String(50), nullable=False)  # kpi_daily_pdf, shifts_pdf, production_excel, ...
+    params = Column(Text, nullable=False)  # JSON canonico dei parametri
+    cache_key = Column(String(64), nullable=False, index=True)
+
+    status = Column(String(20), nullable=False, default="pending")  # pending, running, done, failed
+    filename = Column(String(255), nullable=True)
+    media_type = Column(String(100), nullable=True)
+    error = Column(Text, nullable=True)
+
+    requested_by = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
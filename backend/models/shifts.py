@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Text, Float, JSON
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Text, Float, JSON, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .base import Base
@@ -30,6 +30,9 @@ class ShiftRequirement(Base):
 class ShiftAssignment(Base):
     """Turni di lavoro assegnati con Macchina/Ruolo."""
     __tablename__ = "shift_assignments"
+    __table_args__ = (
+        Index('ix_shift_assignments_employee_date', 'employee_id', 'work_date'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     employee_id = Column(Integer, ForeignKey("employees.id"), nullable=False)
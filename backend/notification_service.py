@@ -0,0 +1,180 @@
+"""
+SL Enterprise - Notification Service
+Fan-out delle notifiche del centro notifiche in blocco.
+
+- notify() / notify_batch(): destinatari (utenti e/o ruoli) + payload,
+  scritti con UN SOLO INSERT multiplo (executemany) invece di un db.add()
+  per destinatario
+- deduplica: una notifica identica (stesso destinatario, titolo e messaggio)
+  ancora non letta e più recente di NOTIFICATION_DEDUPE_MINUTES, o già
+  presente nello stesso batch, non viene duplicata; evita la "pila di alert"
+  dei job ripetuti. Le notifiche di eventi (task, guasti, forno) passano
+  dedupe=False: ogni evento conta, anche due eventi identici nello stesso batch
+- pubblicazione opzionale via WebSocket ai client connessi, eseguita DOPO il
+  commit della sessione (niente notifiche fantasma se la transazione fallisce)
+- delta del badge notifiche accodati sulla sessione (badges.py): l'INSERT
+  multiplo non passa dal flush ORM
+
+Il commit resta al chiamante, come per i db.add() che sostituisce.
+"""
+import os
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event, insert, or_
+from sqlalchemy.orm import Session
+
+from models.core import Notification
+from badges import queue_notification_delta
+from websocket_manager import schedule
+
+NOTIFICATION_DEDUPE_MINUTES = int(os.getenv("NOTIFICATION_DEDUPE_MINUTES", "30"))
+
+# (user_ids, roles, payload) — payload: notif_type, title, message, link_url, [created_at]
+NotificationEntry = Tuple[Iterable[int], Iterable[str], dict]
+
+class NotificationService:
+    """Scrittura in blocco (e pubblicazione) di notifiche su una sessione."""
+
+    def __init__(self, db: Session, publish: bool = True, dedupe_minutes: int = NOTIFICATION_DEDUPE_MINUTES):
+        self.db = db
+        self.publish = publish
+        self.dedupe_minutes = dedupe_minutes
+        self._to_publish: List[dict] = []
+        self._listening = False
+
+    def notify(
+        self,
+        user_ids: Iterable[int] = (),
+        roles: Iterable[str] = (),
+        *,
+        notif_type: str,
+        title: str,
+        message: str,
+        link_url: Optional[str] = None,
+        created_at: Optional[datetime] = None,
+        dedupe: bool = True
+    ) -> int:
+        """Stesso payload a più destinatari. Ritorna il numero di notifiche scritte."""
+        payload = {"notif_type": notif_type, "title": title, "message": message, "link_url": link_url}
+        if created_at is not None:
+            payload["created_at"] = created_at
+        return self.notify_batch([(user_ids, roles, payload)], dedupe=dedupe)
+
+    def notify_batch(self, entries: Sequence[NotificationEntry], dedupe: bool = True) -> int:
+        """Payload diversi (es. uno per richiesta) scritti con un unico INSERT multiplo."""
+        now = datetime.utcnow()
+        rows: List[dict] = []
+        seen = set()
+        for user_ids, roles, payload in entries:
+            # Un destinatario ripetuto nello stesso evento riceve una sola notifica
+            recipients = list(dict.fromkeys(
+                [("user", uid) for uid in user_ids if uid is not None] + [("role", role) for role in roles if role]
+            ))
+            for kind, recipient in recipients:
+                if dedupe:
+                    # Stesso alert per lo stesso destinatario più volte nel batch: uno solo
+                    key = (kind, recipient, payload["title"], payload["message"])
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                rows.append({
+                    "recipient_user_id": recipient if kind == "user" else None,
+                    "recipient_role": recipient if kind == "role" else None,
+                    "notif_type": payload["notif_type"],
+                    "title": payload["title"],
+                    "message": payload["message"],
+                    "link_url": payload.get("link_url"),
+                    "is_read": False,
+                    "created_at": payload.get("created_at") or now,
+                })
+
+        if dedupe and self.dedupe_minutes > 0 and rows:
+            rows = self._drop_duplicates(rows, now - timedelta(minutes=self.dedupe_minutes))
+        if not rows:
+            return 0
+
+        self.db.execute(insert(Notification), rows)
+        for row in rows:
+            queue_notification_delta(self.db, row["recipient_user_id"], row["recipient_role"], 1)
+        if self.publish:
+            self._queue_publish(rows)
+        return len(rows)
+
+    def _drop_duplicates(self, rows: List[dict], since: datetime) -> List[dict]:
+        """Scarta le righe con una notifica identica non letta nella finestra (una sola query)."""
+        user_ids = {r["recipient_user_id"] for r in rows if r["recipient_user_id"] is not None}
+        roles = {r["recipient_role"] for r in rows if r["recipient_role"] is not None}
+        recipient_filter = []
+        if user_ids:
+            recipient_filter.append(Notification.recipient_user_id.in_(user_ids))
+        if roles:
+            recipient_filter.append(Notification.recipient_role.in_(roles))
+
+        existing = {
+            (uid, role, title, message)
+            for uid, role, title, message in self.db.query(
+                Notification.recipient_user_id, Notification.recipient_role,
+                Notification.title, Notification.message
+            ).filter(
+                or_(*recipient_filter),
+                Notification.is_read == False,
+                Notification.created_at >= since,
+                Notification.title.in_({r["title"] for r in rows})
+            ).all()
+        }
+        return [
+            r for r in rows
+            if (r["recipient_user_id"], r["recipient_role"], r["title"], r["message"]) not in existing
+        ]
+
+    # --- pubblicazione WebSocket ---
+
+    def _queue_publish(self, rows: List[dict]):
+        self._to_publish.extend(rows)
+        if not self._listening:
+            self._listening = True
+            event.listen(self.db, "after_commit", self._after_commit)
+            event.listen(self.db, "after_soft_rollback", self._after_rollback)
+
+    def _after_commit(self, session):
+        rows, self._to_publish = self._to_publish, []
+        if rows:
+            publish_notifications(rows)
+
+    def _after_rollback(self, session, previous_transaction):
+        self._to_publish = []
+
+
+def _ws_message(row: dict) -> dict:
+    return {
+        "type": "notification",
+        "notif_type": row["notif_type"],
+        "title": row["title"],
+        "message": row["message"],
+        "link_url": row["link_url"],
+        "recipient_role": row["recipient_role"],
+        "created_at": row["created_at"].isoformat(),
+    }
+
+
+async def _send(rows: List[dict]):
+    from websocket_manager import get_chat_manager, get_logistics_manager
+
+    chat_manager = get_chat_manager()
+    pool_manager = get_logistics_manager()
+    for row in rows:
+        try:
+            if row["recipient_user_id"] is not None:
+                # Socket per utente (stesso canale della chat)
+                await chat_manager.send_to_user(row["recipient_user_id"], _ws_message(row))
+            else:
+                # Notifiche per ruolo: pool globale, il client filtra per recipient_role
+                await pool_manager.broadcast("notifications", _ws_message(row))
+        except Exception as e:
+            print(f"[WS ERROR] Pubblicazione notifica fallita: {e}")
+
+
+def publish_notifications(rows: List[dict]):
+    """Pubblica le notifiche ai client connessi, dall'event loop o da un thread."""
+    schedule(_send(rows))
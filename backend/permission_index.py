@@ -0,0 +1,143 @@
+"""
+SL Enterprise - Permission Index
+Indice in memoria permesso -> utenti attivi (+ subscription push per utente),
+per risolvere i destinatari delle notifiche con un lookup invece di
+scansionare ruoli e permessi JSON a ogni richiesta.
+
+L'indice viene costruito al primo utilizzo e ricostruito al successivo
+dopo invalidate_permission_index(), da chiamare quando cambiano ruoli,
+utenti o subscription push. Con più worker l'invalidazione viaggia sul
+canale "permissions" del broker WebSocket.
+"""
+import threading
+from typing import Dict, Iterable, List, Optional, Set
+from sqlalchemy.orm import Session, joinedload
+
+from models.core import User
+from models.chat import PushSubscription
+
+
+class PermissionIndex:
+    """Snapshot permessi/ruoli/subscription degli utenti attivi."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = 0          # Incrementata a ogni invalidazione
+        self._built_version = -1   # Versione dell'ultimo snapshot costruito
+
+        self._perm_users: Dict[str, Set[int]] = {}
+        self._wildcard_users: Set[int] = set()   # Permesso '*'
+        self._role_users: Dict[str, Set[int]] = {}  # Ruolo legacy (User.role) e Role.name
+        self._subscriptions: Dict[int, List[dict]] = {}
+        self._subscribed = False
+
+    def invalidate(self):
+        with self._lock:
+            self._version += 1
+
+    def on_broker_event(self, payload: dict):
+        """Handler del canale "permissions": invalidazioni di questo e degli altri worker."""
+        self.invalidate()
+
+    def _subscribe(self):
+        from ws_broker import get_ws_broker
+        self._subscribed = True
+        get_ws_broker().subscribe("permissions", self.on_broker_event)
+
+    def _ensure_built(self, db: Session):
+        if not self._subscribed:
+            with self._lock:
+                if not self._subscribed:
+                    self._subscribe()
+        with self._lock:
+            if self._built_version == self._version:
+                return
+            version = self._version
+
+            users = db.query(User).options(joinedload(User.role_obj)).filter(
+                User.is_active == True
+            ).all()
+
+            perm_users: Dict[str, Set[int]] = {}
+            wildcard_users: Set[int] = set()
+            role_users: Dict[str, Set[int]] = {}
+            for u in users:
+                # User.permissions gestisce anche il fallback sui ruoli legacy
+                perms = u.permissions or []
+                if "*" in perms:
+                    wildcard_users.add(u.id)
+                for perm in perms:
+                    perm_users.setdefault(perm, set()).add(u.id)
+                if u.role:
+                    role_users.setdefault(u.role, set()).add(u.id)
+                if u.role_obj and u.role_obj.name != u.role:
+                    role_users.setdefault(u.role_obj.name, set()).add(u.id)
+
+            subscriptions: Dict[int, List[dict]] = {}
+            for sub in db.query(PushSubscription).all():
+                subscriptions.setdefault(sub.user_id, []).append({
+                    "endpoint": sub.endpoint,
+                    "keys": {"p256dh": sub.p256dh_key, "auth": sub.auth_key}
+                })
+
+            self._perm_users = perm_users
+            self._wildcard_users = wildcard_users
+            self._role_users = role_users
+            self._subscriptions = subscriptions
+            self._built_version = version
+
+    def resolve_user_ids(
+        self,
+        db: Session,
+        permissions: Iterable[str] = (),
+        roles: Iterable[str] = (),
+        include_wildcard: bool = True
+    ) -> Set[int]:
+        """
+        ID utenti attivi che hanno ALMENO UNO dei permessi (o '*', se include_wildcard)
+        oppure uno dei ruoli indicati (legacy User.role o Role.name).
+        """
+        self._ensure_built(db)
+        result = set(self._wildcard_users) if include_wildcard else set()
+        for perm in permissions:
+            result |= self._perm_users.get(perm, set())
+        for role in roles:
+            result |= self._role_users.get(role, set())
+        return result
+
+    def get_subscriptions(self, db: Session, user_ids: Iterable[int]) -> List[dict]:
+        """subscription_info (endpoint + keys) di tutti i device degli utenti indicati."""
+        self._ensure_built(db)
+        subs = []
+        for uid in user_ids:
+            subs.extend(self._subscriptions.get(uid, []))
+        return subs
+
+
+_index = PermissionIndex()
+
+
+def get_permission_index() -> PermissionIndex:
+    return _index
+
+
+def invalidate_permission_index():
+    """Da chiamare dopo modifiche a ruoli, utenti o subscription push."""
+    _index.invalidate()
+    try:
+        from ws_broker import get_ws_broker
+        get_ws_broker().publish("permissions", {})
+    except Exception as e:
+        print(f"[PERMISSIONS] Invalidazione non pubblicata: {e}")
+
+
+def resolve_push_targets(
+    db: Session,
+    permissions: Iterable[str] = (),
+    roles: Iterable[str] = (),
+    exclude_user_id: Optional[int] = None
+) -> List[dict]:
+    """Subscription push degli utenti con i permessi/ruoli indicati (escluso eventualmente il mittente)."""
+    user_ids = _index.resolve_user_ids(db, permissions, roles)
+    user_ids.discard(exclude_user_id)
+    return _index.get_subscriptions(db, user_ids)
@@ -0,0 +1,207 @@
+"""
+SL Enterprise - Presence Tracker
+Stato online e posizione GPS in memoria (write-behind).
+
+Heartbeat e aggiornamenti GPS aggiornano solo il dizionario in memoria;
+il job flush_presence() dello scheduler scrive su users.last_seen /
+last_lat / last_lon in un unico batch ogni PRESENCE_FLUSH_SECONDS,
+invece di un UPDATE + commit per ogni chiamata.
+
+Con più worker (broker WebSocket "sqlite") ogni worker pubblica sul canale
+"presence" le voci scritte a ogni flush (un evento ogni PRESENCE_FLUSH_SECONDS,
+non uno per heartbeat) e subito le rimozioni (disattivazione, eliminazione):
+/users/online vede gli heartbeat arrivati agli altri worker con al più un
+intervallo di flush di ritardo.
+"""
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List
+from sqlalchemy import bindparam, update
+
+from models.core import User
+
+PRESENCE_FLUSH_SECONDS = int(os.getenv("PRESENCE_FLUSH_SECONDS", "15"))
+ONLINE_THRESHOLD_MINUTES = 2
+
+
+class PresenceStore:
+    """user_id -> ultimo stato noto (presenza + posizione + dati per /users/online)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[int, dict] = {}
+        self._dirty: Dict[int, dict] = {}  # Modifiche non ancora scritte su DB
+        self._seeded = False
+
+    def _entry(self, user: User) -> dict:
+        entry = self._entries.get(user.id)
+        if entry is None:
+            entry = {
+                "id": user.id,
+                "lastSeen": user.last_seen,
+                "lat": user.last_lat,
+                "lon": user.last_lon,
+                "lastUpdate": user.last_location_update,
+            }
+            self._entries[user.id] = entry
+        entry.update(username=user.username, fullName=user.full_name, role=user.role)
+        return entry
+
+    def touch(self, user: User):
+        """Heartbeat: l'utente è online adesso."""
+        now = datetime.utcnow()
+        with self._lock:
+            entry = self._entry(user)
+            entry["lastSeen"] = now
+            self._dirty.setdefault(user.id, {})["last_seen"] = now
+
+    def update_location(self, user: User, lat: float, lon: float):
+        """Nuova posizione GPS (aggiorna anche la presenza)."""
+        now = datetime.utcnow()
+        with self._lock:
+            entry = self._entry(user)
+            entry.update(lat=lat, lon=lon, lastUpdate=now, lastSeen=now)
+            self._dirty.setdefault(user.id, {}).update(
+                last_seen=now, last_lat=lat, last_lon=lon, last_location_update=now
+            )
+
+    def forget(self, user_id: int):
+        """Rimuove l'utente dagli online (es. disattivazione) su tutti i worker. Le modifiche pendenti restano da scrivere."""
+        with self._lock:
+            self._entries.pop(user_id, None)
+        _publish({"forget": [user_id]})
+
+    def snapshot(self, user_ids) -> List[dict]:
+        """Copie delle voci indicate (per la pubblicazione dopo il flush)."""
+        with self._lock:
+            return [dict(self._entries[uid]) for uid in user_ids if uid in self._entries]
+
+    def on_broker_event(self, payload: dict):
+        """Handler del canale "presence": voci e rimozioni di questo e degli altri worker."""
+        with self._lock:
+            for uid in payload.get("forget", ()):
+                self._entries.pop(uid, None)
+            for incoming in payload.get("entries", ()):
+                incoming = {key: _as_datetime(value) if key in ("lastSeen", "lastUpdate") else value
+                            for key, value in incoming.items()}
+                entry = self._entries.get(incoming["id"])
+                if entry is None:
+                    self._entries[incoming["id"]] = incoming
+                elif incoming["lastSeen"] and (not entry["lastSeen"] or incoming["lastSeen"] > entry["lastSeen"]):
+                    entry.update(incoming)
+
+    def seed(self, db):
+        """Carica una volta dal DB gli utenti visti di recente (es. dopo un riavvio)."""
+        with self._lock:
+            if self._seeded:
+                return
+            self._seeded = True
+        threshold = datetime.utcnow() - timedelta(minutes=ONLINE_THRESHOLD_MINUTES)
+        users = db.query(User).filter(User.last_seen >= threshold, User.is_active == True).all()
+        with self._lock:
+            for u in users:
+                self._entry(u)
+
+    def online(self, minutes: int = ONLINE_THRESHOLD_MINUTES) -> List[dict]:
+        """Utenti con presenza negli ultimi `minutes` minuti."""
+        threshold = datetime.utcnow() - timedelta(minutes=minutes)
+        with self._lock:
+            return [
+                dict(entry) for entry in self._entries.values()
+                if entry["lastSeen"] and entry["lastSeen"] >= threshold
+            ]
+
+    def take_dirty(self) -> Dict[int, dict]:
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+            return dirty
+
+    def restore_dirty(self, dirty: Dict[int, dict]):
+        """Rimette in coda un batch non scritto (senza sovrascrivere valori più recenti)."""
+        with self._lock:
+            for uid, values in dirty.items():
+                merged = dict(values)
+                merged.update(self._dirty.get(uid, {}))
+                self._dirty[uid] = merged
+
+
+def _as_datetime(value):
+    # Dal relay SQLite le date arrivano come stringa (json default=str)
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _publish(payload: dict):
+    try:
+        from ws_broker import get_ws_broker
+        get_ws_broker().publish("presence", payload)
+    except Exception as e:
+        print(f"[PRESENCE] Evento non pubblicato: {e}")
+
+
+presence_store = PresenceStore()
+_subscribed = False
+_subscribe_lock = threading.Lock()
+
+
+def get_presence_store() -> PresenceStore:
+    """Store del processo, iscritto al canale "presence" del broker WebSocket."""
+    global _subscribed
+    if not _subscribed:
+        with _subscribe_lock:
+            if not _subscribed:
+                from ws_broker import get_ws_broker
+                get_ws_broker().subscribe("presence", presence_store.on_broker_event)
+                _subscribed = True
+    return presence_store
+
+
+def flush_presence(db) -> int:
+    """
+    Scrive le presenze pendenti su users in un'unica transazione:
+    un UPDATE executemany per le sole presenze e uno per le posizioni GPS.
+
+    Returns:
+        Numero di utenti aggiornati
+    """
+    dirty = presence_store.take_dirty()
+    if not dirty:
+        return 0
+
+    seen_rows = []
+    location_rows = []
+    for uid, values in dirty.items():
+        if "last_lat" in values:
+            location_rows.append({"b_id": uid, **values})
+        else:
+            seen_rows.append({"b_id": uid, **values})
+
+    try:
+        conn = db.connection()
+        if seen_rows:
+            conn.execute(
+                update(User.__table__)
+                .where(User.__table__.c.id == bindparam("b_id"))
+                .values(last_seen=bindparam("last_seen")),
+                seen_rows
+            )
+        if location_rows:
+            conn.execute(
+                update(User.__table__)
+                .where(User.__table__.c.id == bindparam("b_id"))
+                .values(
+                    last_seen=bindparam("last_seen"),
+                    last_lat=bindparam("last_lat"),
+                    last_lon=bindparam("last_lon"),
+                    last_location_update=bindparam("last_location_update")
+                ),
+                location_rows
+            )
+        db.commit()
+    except Exception:
+        db.rollback()
+        presence_store.restore_dirty(dirty)
+        raise
+
+    _publish({"entries": presence_store.snapshot(dirty)})
+    return len(dirty)
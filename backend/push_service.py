@@ -1,11 +1,21 @@
 """
 SL Enterprise - Web Push Notifications Service
 Gestione notifiche push per chat.
+
+Gli invii passano da una coda in-process servita da thread worker:
+gli handler async accodano e ritornano subito, webpush() (bloccante)
+non gira mai sull'event loop.
 """
 import os
 import json
+import time
+import heapq
+import itertools
+import threading
 from datetime import datetime
-from typing import Optional
+from typing import Callable, Dict, List, Optional, Set
+from urllib.parse import urlparse
+import requests
 from pywebpush import webpush, WebPushException
 from dotenv import load_dotenv
 
@@ -31,6 +41,72 @@ def get_vapid_public_key() -> str:
     return VAPID_PUBLIC_KEY
 
 
+# ============================================================
+# CONFIGURAZIONE DISPATCH (coda + worker)
+# ============================================================
+
+PUSH_WORKERS = int(os.getenv("PUSH_WORKERS", "4"))
+PUSH_MAX_PER_HOST = int(os.getenv("PUSH_MAX_PER_HOST", "2"))    # Invii concorrenti per push service (FCM, Mozilla...)
+PUSH_QUEUE_SIZE = int(os.getenv("PUSH_QUEUE_SIZE", "1000"))
+PUSH_MAX_RETRIES = int(os.getenv("PUSH_MAX_RETRIES", "3"))
+PUSH_RETRY_BASE_SECONDS = float(os.getenv("PUSH_RETRY_BASE_SECONDS", "2"))
+PUSH_TIMEOUT_SECONDS = float(os.getenv("PUSH_TIMEOUT_SECONDS", "10"))
+PUSH_CLEANUP_INTERVAL_SECONDS = float(os.getenv("PUSH_CLEANUP_INTERVAL_SECONDS", "30"))
+
+# Esiti di un singolo invio
+PUSH_OK = "ok"
+PUSH_GONE = "gone"      # 404/410: subscription non più valida -> da eliminare
+PUSH_RETRY = "retry"    # 429/5xx/rete: ritenta con backoff
+PUSH_FAILED = "failed"  # Errore definitivo (payload, chiavi, 4xx)
+
+
+def build_payload(title: str, body: str, icon: str = "/logo192.png", url: str = "/chat", tag: str = None) -> str:
+    """Costruisce il payload JSON della notifica."""
+    return json.dumps({
+        "title": title,
+        "body": body,
+        "icon": icon,
+        "url": url,
+        "tag": tag or f"chat-{datetime.now().timestamp()}",
+        "timestamp": datetime.now().isoformat()
+    })
+
+
+def deliver_push(subscription_info: dict, payload: str) -> str:
+    """
+    Invio bloccante di UN payload a UNA subscription (eseguito dai worker).
+
+    Returns:
+        Uno tra PUSH_OK, PUSH_GONE, PUSH_RETRY, PUSH_FAILED
+    """
+    try:
+        webpush(
+            subscription_info=subscription_info,
+            data=payload,
+            vapid_private_key=VAPID_PRIVATE_KEY,
+            # Copia: webpush() scrive 'aud' nei claims, che dipende dal push service dell'endpoint
+            vapid_claims=dict(VAPID_CLAIMS),
+            timeout=PUSH_TIMEOUT_SECONDS
+        )
+        return PUSH_OK
+
+    except WebPushException as ex:
+        status_code = ex.response.status_code if ex.response is not None else None
+        if status_code in (404, 410):
+            return PUSH_GONE
+        if status_code is None or status_code == 429 or status_code >= 500:
+            print(f"[PUSH] Errore temporaneo ({status_code}): {ex}")
+            return PUSH_RETRY
+        print(f"[PUSH] Errore invio: {ex}")
+        return PUSH_FAILED
+    except requests.RequestException as ex:
+        print(f"[PUSH] Errore di rete: {ex}")
+        return PUSH_RETRY
+    except Exception as ex:
+        print(f"[PUSH] Errore generico: {ex}")
+        return PUSH_FAILED
+
+
 def send_push_notification(
     subscription_info: dict,
     title: str,
@@ -40,7 +116,7 @@ def send_push_notification(
     tag: str = None
 ) -> bool:
     """
-    Invia una notifica push a un device.
+    Accoda una notifica push per un device (ritorna subito, invio nei worker).
     
     Args:
         subscription_info: Dict con endpoint, p256dh e auth keys
@@ -51,39 +127,14 @@ def send_push_notification(
         tag: Tag per raggruppare notifiche (stesso tag = sostituisce)
     
     Returns:
-        True se inviata con successo, False altrimenti
+        True se accodata, False se push disabilitate o coda piena.
+        Le subscription non più valide (404/410) vengono eliminate dal dispatcher.
     """
     if not VAPID_PRIVATE_KEY or not VAPID_PUBLIC_KEY:
         print("[PUSH] Chiavi VAPID non configurate")
         return False
     
-    try:
-        payload = json.dumps({
-            "title": title,
-            "body": body,
-            "icon": icon,
-            "url": url,
-            "tag": tag or f"chat-{datetime.now().timestamp()}",
-            "timestamp": datetime.now().isoformat()
-        })
-        
-        webpush(
-            subscription_info=subscription_info,
-            data=payload,
-            vapid_private_key=VAPID_PRIVATE_KEY,
-            vapid_claims=VAPID_CLAIMS
-        )
-        return True
-        
-    except WebPushException as ex:
-        print(f"[PUSH] Errore invio: {ex}")
-        # Se subscription non valida (410 Gone), ritorna False per cleanup
-        if ex.response and ex.response.status_code in [404, 410]:
-            return False
-        return False
-    except Exception as ex:
-        print(f"[PUSH] Errore generico: {ex}")
-        return False
+    return get_push_dispatcher().enqueue(subscription_info, build_payload(title, body, icon, url, tag))
 
 
 def send_chat_notification(
@@ -135,6 +186,237 @@ def send_logistics_push(
     )
 
 
+# ============================================================
+# DISPATCHER (coda in-process + pool di worker)
+# ============================================================
+
+class _PushJob:
+    """Singolo invio in coda."""
+    __slots__ = ("subscription_info", "payload", "attempt")
+
+    def __init__(self, subscription_info: dict, payload: str):
+        self.subscription_info = subscription_info
+        self.payload = payload
+        self.attempt = 0
+
+
+class PushDispatcher:
+    """
+    Coda limitata di notifiche push servita da un pool di thread.
+
+    - enqueue() non blocca mai il chiamante (event loop incluso)
+    - al massimo max_per_host invii concorrenti verso lo stesso push service
+    - 429/5xx/errori di rete: retry con backoff esponenziale
+    - 404/410: endpoint raccolti ed eliminati con UNA DELETE periodica
+    """
+
+    def __init__(
+        self,
+        deliver: Callable[[dict, str], str] = deliver_push,
+        workers: int = PUSH_WORKERS,
+        max_per_host: int = PUSH_MAX_PER_HOST,
+        max_queue: int = PUSH_QUEUE_SIZE,
+        max_retries: int = PUSH_MAX_RETRIES,
+        retry_base_seconds: float = PUSH_RETRY_BASE_SECONDS,
+        cleanup_interval: float = PUSH_CLEANUP_INTERVAL_SECONDS
+    ):
+        self.deliver = deliver
+        self.workers = workers
+        self.max_per_host = max_per_host
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.retry_base_seconds = retry_base_seconds
+        self.cleanup_interval = cleanup_interval
+
+        # Heap (due_time, seq, job): i retry restano in coda fino alla scadenza del backoff
+        self._heap: List[tuple] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._in_flight = 0
+
+        self._host_slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._host_lock = threading.Lock()
+
+        self._dead_endpoints: Set[str] = set()
+        self._dead_lock = threading.Lock()
+
+        self._threads: List[threading.Thread] = []
+        self._running = False
+        self._stop_event = threading.Event()
+
+        self.stats = {"queued": 0, "sent": 0, "retried": 0, "failed": 0, "dropped": 0, "dead_removed": 0}
+
+    # --- lifecycle ---
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._stop_event.clear()
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker_loop, name=f"push-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        t = threading.Thread(target=self._cleanup_loop, name="push-cleanup", daemon=True)
+        t.start()
+        self._threads.append(t)
+        print(f"[PUSH] Dispatcher avviato ({self.workers} worker, max {self.max_per_host}/host)")
+
+    def stop(self, timeout: float = 5.0):
+        """Ferma i worker ed esegue l'ultima pulizia subscription."""
+        if not self._running:
+            return
+        self._running = False
+        self._stop_event.set()
+        with self._cond:
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+        self.flush_dead_subscriptions()
+
+    # --- coda ---
+
+    def enqueue(self, subscription_info: dict, payload: str) -> bool:
+        """Accoda un invio. Ritorna False (senza bloccare) se la coda è piena."""
+        with self._cond:
+            if len(self._heap) >= self.max_queue:
+                self.stats["dropped"] += 1
+                print("[PUSH] Coda piena, notifica scartata")
+                return False
+            heapq.heappush(self._heap, (time.monotonic(), next(self._seq), _PushJob(subscription_info, payload)))
+            self.stats["queued"] += 1
+            self._cond.notify()
+        return True
+
+    def pending(self) -> int:
+        """Invii ancora in coda o in corso."""
+        with self._cond:
+            return len(self._heap) + self._in_flight
+
+    def wait_idle(self, timeout: float = 10.0) -> bool:
+        """Attende che coda e invii in corso siano vuoti (utile per script/test)."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.pending() == 0:
+                return True
+            time.sleep(0.01)
+        return False
+
+    def _next_job(self) -> Optional[_PushJob]:
+        with self._cond:
+            while self._running:
+                if self._heap:
+                    due = self._heap[0][0]
+                    wait = due - time.monotonic()
+                    if wait <= 0:
+                        _, _, job = heapq.heappop(self._heap)
+                        self._in_flight += 1
+                        return job
+                    self._cond.wait(wait)
+                else:
+                    self._cond.wait()
+        return None
+
+    def _host_slot(self, endpoint: str) -> threading.BoundedSemaphore:
+        host = urlparse(endpoint).netloc
+        with self._host_lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = threading.BoundedSemaphore(self.max_per_host)
+                self._host_slots[host] = slot
+            return slot
+
+    def _worker_loop(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            try:
+                self._process(job)
+            finally:
+                with self._cond:
+                    self._in_flight -= 1
+
+    def _process(self, job: _PushJob):
+        endpoint = job.subscription_info.get("endpoint", "")
+        with self._host_slot(endpoint):
+            outcome = self.deliver(job.subscription_info, job.payload)
+
+        if outcome == PUSH_OK:
+            self.stats["sent"] += 1
+        elif outcome == PUSH_GONE:
+            with self._dead_lock:
+                self._dead_endpoints.add(endpoint)
+        elif outcome == PUSH_RETRY and job.attempt < self.max_retries:
+            job.attempt += 1
+            self.stats["retried"] += 1
+            delay = self.retry_base_seconds * (2 ** (job.attempt - 1))
+            with self._cond:
+                heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), job))
+                self._cond.notify()
+        else:
+            self.stats["failed"] += 1
+
+    # --- pulizia subscription ---
+
+    def _cleanup_loop(self):
+        while not self._stop_event.wait(self.cleanup_interval):
+            self.flush_dead_subscriptions()
+
+    def flush_dead_subscriptions(self) -> int:
+        """Elimina in UNA DELETE tutte le subscription risultate 404/410."""
+        with self._dead_lock:
+            endpoints = list(self._dead_endpoints)
+            self._dead_endpoints.clear()
+        if not endpoints:
+            return 0
+
+        from database import SessionLocal
+        from models.chat import PushSubscription
+
+        db = SessionLocal()
+        try:
+            deleted = db.query(PushSubscription).filter(
+                PushSubscription.endpoint.in_(endpoints)
+            ).delete(synchronize_session=False)
+            db.commit()
+            self.stats["dead_removed"] += deleted
+            if deleted:
+                from permission_index import invalidate_permission_index
+                invalidate_permission_index()
+            print(f"[PUSH] Cleaned {deleted} dead subscriptions")
+            return deleted
+        except Exception as e:
+            db.rollback()
+            print(f"[PUSH ERROR] Pulizia subscription fallita: {e}")
+            with self._dead_lock:
+                self._dead_endpoints.update(endpoints)
+            return 0
+        finally:
+            db.close()
+
+
+_dispatcher: Optional[PushDispatcher] = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_push_dispatcher() -> PushDispatcher:
+    """Dispatcher singleton (avviato al primo utilizzo)."""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = PushDispatcher()
+        _dispatcher.start()
+        return _dispatcher
+
+
+def shutdown_push_dispatcher():
+    """Ferma il dispatcher (shutdown applicazione)."""
+    if _dispatcher is not None:
+        _dispatcher.stop()
+
+
 # Script per generare chiavi VAPID (esegui una volta)
 if __name__ == "__main__":
     try:
@@ -1,14 +1,18 @@
 import sqlite3
 import os
+import sys
 import shutil
 from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
 
+from db_backup import resolve_backup_file, BackupError
+
 # 1. SETUP PATHS
 # We will look for the specific backup file found in the directory
+# Accepts a legacy .db copy or a new snapshot (.json / .db.gz / .delta.gz): python recover_from_backup.py <file>
 BACKUP_DIR = "backups"
-BACKUP_FILENAME = "sl_enterprise_2026-01-09_21-43.db" 
-BACKUP_PATH = os.path.join(BACKUP_DIR, BACKUP_FILENAME)
+BACKUP_FILENAME = sys.argv[1] if len(sys.argv) > 1 else "sl_enterprise_2026-01-09_21-43.db"
+BACKUP_PATH = BACKUP_FILENAME if os.path.dirname(BACKUP_FILENAME) else os.path.join(BACKUP_DIR, BACKUP_FILENAME)
 
 # Active DB (Assuming Docker environment uses sqlite or mysql, but we use the SQL Alchemy URL)
 # For this script to work inside the container effectively, we need to know the target.
@@ -20,11 +24,18 @@ def recover_data():
         print(f"❌ Backup file not found: {BACKUP_PATH}")
         return
 
+    # New-format snapshots are rebuilt (and checksum-verified) into a temp .db first
+    try:
+        source_path = resolve_backup_file(BACKUP_PATH)
+    except BackupError as e:
+        print(f"❌ Invalid backup snapshot: {e}")
+        return
+
     print(f"📂 Connecting to Backup: {BACKUP_PATH}")
     
     # Connect to Backup (Source) - READ ONLY
     try:
-        src_conn = sqlite3.connect(BACKUP_PATH)
+        src_conn = sqlite3.connect(f"file:{source_path}?mode=ro", uri=True)
         src_conn.row_factory = sqlite3.Row
         src_cursor = src_conn.cursor()
     except Exception as e:
@@ -136,6 +147,8 @@ def recover_data():
 
     src_conn.close()
     dest_session.close()
+    if source_path != BACKUP_PATH:
+        os.remove(source_path)
 
     print(f"\n🏁 RECOVERY COMPLETE.")
     print(f"📊 Total Rows Restored: {total_imported}")
@@ -0,0 +1,412 @@
+"""
+SL Enterprise - Report Jobs
+Export PDF/Excel generati fuori dall'event loop, con cache degli artefatti.
+
+- Ogni export è registrato con @report(nome, params, tables): funzione
+  render(db, params) -> ReportFile, modello pydantic dei parametri e tabelle lette.
+- La generazione (reportlab / openpyxl) gira in un ProcessPoolExecutor
+  (REPORT_WORKERS), così l'event loop resta libero. I worker partono da un
+  forkserver, non con fork() dal processo dell'API: niente lock, thread o
+  connessioni ereditati a metà (scheduler, broker, pool DB).
+- Cache su disco indirizzata per contenuto: chiave = sha256(report, parametri
+  normalizzati, versioni delle tabelle lette (data_versions), ARTIFACT_FORMAT).
+  Stessa richiesta e dati invariati -> file servito dal disco, senza rigenerarlo.
+  Richieste identiche in contemporanea condividono la stessa generazione.
+- I renderer Excel scrivono in streaming su un file della cache
+  (xlsx_stream, scratch_path): l'artefatto non passa mai dalla memoria.
+- Gli endpoint storici (GET .../pdf, .../excel) restituiscono ancora il file
+  (report_response); POST /reports/jobs crea invece un job in background con
+  stato via polling (GET /reports/jobs/{id}) o messaggio "report_job" sul
+  canale WebSocket /ws/badges del richiedente.
+
+I report si registrano all'import dei router che li definiscono (main.py).
+"""
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from typing import Callable, Dict, NamedTuple, Optional, Tuple, Type
+
+from fastapi import HTTPException
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import FileResponse
+from pydantic import BaseModel, ValidationError
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, ReportJob
+from data_versions import DATA_VERSION_TABLES, get_versions
+
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "2"))
+REPORT_CACHE_DIR = os.getenv(
+    "REPORT_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "report_cache")
+)
+# Durata massima di un artefatto: limita anche l'effetto di scritture fuori dall'ORM
+REPORT_CACHE_MAX_AGE_HOURS = float(os.getenv("REPORT_CACHE_MAX_AGE_HOURS", "24"))
+# Job ancora pending/running dopo questo tempo (es. riavvio del server) -> mostrati come falliti
+REPORT_JOB_TIMEOUT_SECONDS = int(os.getenv("REPORT_JOB_TIMEOUT_SECONDS", "600"))
+REPORT_JOB_RETENTION_DAYS = 30
+
+# Incrementare quando cambia il layout di un report: invalida tutta la cache
+ARTIFACT_FORMAT = 2
+
+JOB_PENDING, JOB_RUNNING, JOB_DONE, JOB_FAILED = "pending", "running", "done", "failed"
+
+
+class ReportFile(NamedTuple):
+    """File generato da un renderer: in memoria (content) o già scritto su disco (path, vedi scratch_path)."""
+    content: Optional[bytes]
+    filename: str
+    media_type: str
+    path: Optional[str] = None
+
+    def read(self) -> bytes:
+        if self.path is None:
+            return self.content
+        with open(self.path, "rb") as f:
+            return f.read()
+
+
+class ReportSpec(NamedTuple):
+    name: str
+    render: Callable            # render(db, params) -> ReportFile (top-level: gira nel process pool)
+    params: Type[BaseModel]
+    tables: Tuple[str, ...]     # tabelle lette: le loro versioni entrano nella chiave di cache
+    authorize: Optional[Callable]  # authorize(user, params): solleva HTTPException se non permesso
+
+
+REPORTS: Dict[str, ReportSpec] = {}
+
+
+def report(name: str, params: Type[BaseModel], tables, authorize: Optional[Callable] = None):
+    """Registra un renderer di report."""
+    unknown = set(tables) - DATA_VERSION_TABLES
+    if unknown:
+        raise ValueError(f"Report '{name}': tabelle non versionate {sorted(unknown)} (aggiungerle a DATA_VERSION_TABLES)")
+
+    def decorator(render):
+        REPORTS[name] = ReportSpec(name, render, params, tuple(sorted(set(tables))), authorize)
+        return render
+    return decorator
+
+
+def prepare(name: str, raw_params: dict, user=None) -> Tuple[ReportSpec, dict]:
+    """Report richiesto + parametri validati e normalizzati (JSON). Controlla i permessi."""
+    spec = REPORTS.get(name)
+    if spec is None:
+        raise HTTPException(404, f"Report '{name}' non disponibile")
+    try:
+        params = spec.params.model_validate(raw_params or {})
+    except ValidationError as e:
+        raise RequestValidationError(e.errors(include_url=False, include_context=False))
+    if spec.authorize:
+        spec.authorize(user, params)
+    return spec, params.model_dump(mode="json", by_alias=True)
+
+
+# ============================================================
+# CACHE ARTEFATTI
+# ============================================================
+
+def cache_key(db: Session, spec: ReportSpec, params: dict) -> str:
+    """sha256 di report, parametri, versioni delle tabelle lette e formato artefatti."""
+    payload = {
+        "report": spec.name,
+        "params": params,
+        "versions": get_versions(db, spec.tables),
+        "format": ARTIFACT_FORMAT,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+def _key_for(spec: ReportSpec, params: dict) -> str:
+    db = SessionLocal()
+    try:
+        return cache_key(db, spec, params)
+    finally:
+        db.close()
+
+
+def cached_artifact(key: str) -> Optional[dict]:
+    """Meta dell'artefatto ({file, filename, media_type, size, path}) se presente e non scaduto."""
+    try:
+        with open(os.path.join(REPORT_CACHE_DIR, f"{key}.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        path = os.path.join(REPORT_CACHE_DIR, meta["file"])
+        age = time.time() - os.path.getmtime(path)
+    except (OSError, ValueError, KeyError):
+        return None
+    if age > REPORT_CACHE_MAX_AGE_HOURS * 3600:
+        return None
+    return {**meta, "path": path}
+
+
+def scratch_path(suffix: str) -> str:
+    """File temporaneo nella cache per i renderer che scrivono su disco (spostato con os.replace, niente copia)."""
+    os.makedirs(REPORT_CACHE_DIR, exist_ok=True)
+    return os.path.join(REPORT_CACHE_DIR, f"{uuid.uuid4().hex}{suffix}.part")
+
+
+def _write_atomic(path: str, data: bytes):
+    tmp = f"{path}.{uuid.uuid4().hex}.part"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _render_artifact(render: Callable, params_model: Type[BaseModel], params: dict, key: str, cache_dir: str) -> dict:
+    """
+    Genera il report e lo salva in cache (file + meta JSON, scritture atomiche).
+    Funzione top-level per poter essere eseguita nel process pool; legge dal DB principale.
+    Gli HTTPException del renderer (404, 400) tornano come {"error", "status_code"}.
+    """
+    db = SessionLocal()
+    try:
+        result = render(db, params_model.model_validate(params))
+    except HTTPException as e:
+        return {"error": e.detail, "status_code": e.status_code}
+    finally:
+        db.close()
+
+    os.makedirs(cache_dir, exist_ok=True)
+    file = key + os.path.splitext(result.filename)[1]
+    if result.path:
+        os.replace(result.path, os.path.join(cache_dir, file))
+    else:
+        _write_atomic(os.path.join(cache_dir, file), result.content)
+    meta = {"file": file, "filename": result.filename, "media_type": result.media_type,
+            "size": os.path.getsize(os.path.join(cache_dir, file))}
+    # Il meta per ultimo: finché manca, l'artefatto non è visibile
+    _write_atomic(os.path.join(cache_dir, f"{key}.json"), json.dumps(meta).encode())
+    return meta
+
+
+def prune_report_cache() -> int:
+    """Rimuove artefatti scaduti, file parziali orfani e job più vecchi di REPORT_JOB_RETENTION_DAYS."""
+    removed = 0
+    if os.path.isdir(REPORT_CACHE_DIR):
+        threshold = time.time() - REPORT_CACHE_MAX_AGE_HOURS * 3600
+        for entry in os.scandir(REPORT_CACHE_DIR):
+            try:
+                if entry.is_file() and entry.stat().st_mtime < threshold:
+                    os.remove(entry.path)
+                    removed += 1
+            except OSError:
+                pass
+
+    db = SessionLocal()
+    try:
+        db.query(ReportJob).filter(
+            ReportJob.created_at < datetime.utcnow() - timedelta(days=REPORT_JOB_RETENTION_DAYS)
+        ).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+    return removed
+
+
+# ============================================================
+# PROCESS POOL
+# ============================================================
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _init_worker():
+    # Il processo figlio non deve riusare le connessioni ereditate dal padre
+    from database import engine, read_engine
+    engine.dispose(close=False)
+    read_engine.dispose(close=False)
+
+
+def get_report_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=REPORT_WORKERS,
+                mp_context=multiprocessing.get_context("forkserver"),
+                initializer=_init_worker
+            )
+        return _pool
+
+
+def shutdown_report_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
+            print("[REPORTS] Process pool fermato")
+
+
+async def run_in_report_pool(func, *args):
+    """Esegue func(*args) nel process pool; se il pool è rotto (worker crashato) lo ricrea una volta."""
+    global _pool
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(get_report_pool(), func, *args)
+    except BrokenProcessPool:
+        with _pool_lock:
+            _pool = None
+        return await loop.run_in_executor(get_report_pool(), func, *args)
+
+
+# ============================================================
+# GENERAZIONE
+# ============================================================
+
+# cache_key -> generazione in corso (richieste identiche la condividono)
+_inflight: Dict[str, asyncio.Future] = {}
+# Job in background (riferimento forte finché non terminano)
+_job_tasks = set()
+
+
+async def render_cached(spec: ReportSpec, params: dict, key: str) -> dict:
+    """Artefatto dalla cache o generato nel process pool. Solleva HTTPException per gli errori del renderer."""
+    meta = cached_artifact(key)
+    if meta:
+        return meta
+    future = _inflight.get(key)
+    if future is None:
+        future = asyncio.ensure_future(
+            run_in_report_pool(_render_artifact, spec.render, spec.params, params, key, REPORT_CACHE_DIR)
+        )
+        _inflight[key] = future
+        future.add_done_callback(lambda _: _inflight.pop(key, None))
+    # shield: se il client si disconnette la generazione condivisa continua
+    meta = await asyncio.shield(future)
+    if "error" in meta:
+        raise HTTPException(meta["status_code"], meta["error"])
+    return {**meta, "path": os.path.join(REPORT_CACHE_DIR, meta["file"])}
+
+
+def file_response(meta: dict) -> FileResponse:
+    return FileResponse(
+        meta["path"],
+        media_type=meta["media_type"],
+        headers={"Content-Disposition": f"attachment; filename={meta['filename']}"}
+    )
+
+
+async def report_response(name: str, raw_params: dict, user=None) -> FileResponse:
+    """Risposta sincrona di un endpoint di export: file dalla cache o generato ora nel process pool."""
+    spec, params = prepare(name, raw_params, user)
+    meta = await render_cached(spec, params, _key_for(spec, params))
+    return file_response(meta)
+
+
+# ============================================================
+# JOB IN BACKGROUND
+# ============================================================
+
+def job_status(job: ReportJob) -> Tuple[str, Optional[str]]:
+    """Stato effettivo del job: pending/running scaduti (riavvio, worker bloccato) valgono come falliti."""
+    if job.status in (JOB_PENDING, JOB_RUNNING) and job.created_at and \
+            job.created_at < datetime.utcnow() - timedelta(seconds=REPORT_JOB_TIMEOUT_SECONDS):
+        return JOB_FAILED, "Generazione interrotta: riprovare"
+    return job.status, job.error
+
+
+def job_to_dict(job: ReportJob) -> dict:
+    status, error = job_status(job)
+    return {
+        "id": job.id,
+        "report_type": job.report_type,
+        "params": json.loads(job.params),
+        "status": status,
+        "filename": job.filename,
+        "error": error,
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+        "download_url": f"/reports/jobs/{job.id}/download" if status == JOB_DONE else None,
+    }
+
+
+def _update_job(job_id: str, **fields) -> Optional[ReportJob]:
+    db = SessionLocal()
+    try:
+        job = db.get(ReportJob, job_id)
+        if job is None:
+            return None
+        for field, value in fields.items():
+            setattr(job, field, value)
+        db.commit()
+        db.refresh(job)
+        db.expunge(job)
+        return job
+    finally:
+        db.close()
+
+
+async def _run_job(job_id: str, spec: ReportSpec, params: dict, key: str, user_id: int):
+    _update_job(job_id, status=JOB_RUNNING)
+    try:
+        meta = await render_cached(spec, params, key)
+        fields = {"status": JOB_DONE, "filename": meta["filename"], "media_type": meta["media_type"]}
+    except HTTPException as e:
+        fields = {"status": JOB_FAILED, "error": str(e.detail)}
+    except Exception as e:
+        print(f"[REPORTS] Errore job {job_id} ({spec.name}): {e}")
+        fields = {"status": JOB_FAILED, "error": "Errore durante la generazione del report"}
+    job = _update_job(job_id, finished_at=datetime.utcnow(), **fields)
+    if job is None:
+        return
+
+    from websocket_manager import get_badge_manager
+    data = job_to_dict(job)
+    await get_badge_manager().notify_users([user_id], {
+        "type": "report_job",
+        "job_id": job_id,
+        "status": data["status"],
+        "report_type": spec.name,
+        "filename": data["filename"],
+        "error": data["error"],
+        "download_url": data["download_url"],
+    })
+
+
+async def submit_job(db: Session, name: str, raw_params: dict, user) -> ReportJob:
+    """Crea il job; se l'artefatto è già in cache è subito "done", altrimenti parte in background."""
+    spec, params = prepare(name, raw_params, user)
+    key = cache_key(db, spec, params)
+    job = ReportJob(
+        id=uuid.uuid4().hex,
+        report_type=name,
+        params=json.dumps(params, sort_keys=True),
+        cache_key=key,
+        status=JOB_PENDING,
+        requested_by=user.id,
+    )
+    cached = cached_artifact(key)
+    if cached:
+        job.status = JOB_DONE
+        job.filename, job.media_type = cached["filename"], cached["media_type"]
+        job.finished_at = datetime.utcnow()
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+
+    if not cached:
+        task = asyncio.ensure_future(_run_job(job.id, spec, params, key, user.id))
+        _job_tasks.add(task)
+        task.add_done_callback(_job_tasks.discard)
+    return job
+
+
+def job_artifact(job: ReportJob) -> dict:
+    """Artefatto di un job completato (410 se scaduto e rimosso dalla cache)."""
+    status, error = job_status(job)
+    if status != JOB_DONE:
+        raise HTTPException(409, error or "Report non ancora pronto")
+    meta = cached_artifact(job.cache_key)
+    if meta is None:
+        raise HTTPException(410, "Report scaduto: generarlo di nuovo")
+    return meta
@@ -1,5 +1,6 @@
 import pandas as pd
 import os
+import sys
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from database import Base, Employee, User
@@ -159,7 +160,27 @@ def restore_employees(banchina_map):
     print(f"   ✅ Employees Processed: {count_new} created, {count_updated} updated.")
 
 
+def restore_from_snapshot(snapshot):
+    """Restores the whole SQLite file from a backup snapshot (db_backup format). Stop the app first!"""
+    from db_backup import restore_snapshot, get_sqlite_path, BackupError
+    target = get_sqlite_path()
+    print(f"🗄️  Restoring {target} from snapshot {snapshot}...")
+    try:
+        restore_snapshot(snapshot, target)
+    except BackupError as e:
+        print(f"   ❌ Restore failed: {e}")
+        return False
+    print("   ✅ Database file restored (previous file kept as *.pre_restore_*).")
+    return True
+
+
 if __name__ == "__main__":
+    # python restore_full_db.py --from-backup <snapshot>  -> restore full DB file from a backup snapshot
+    if len(sys.argv) > 2 and sys.argv[1] == "--from-backup":
+        db.close()
+        ok = restore_from_snapshot(sys.argv[2])
+        sys.exit(0 if ok else 1)
+
     print("🚀 STARTING FULL RESTORE...")
     b_map = restore_structure()
     restore_employees(b_map)
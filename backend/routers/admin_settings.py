@@ -10,6 +10,7 @@ from pydantic import BaseModel
 
 from database import get_db, Department, Employee, Banchina, AuditLog
 from security import get_current_admin
+from logistics_pool import invalidate_live_pool
 
 router = APIRouter(prefix="/admin", tags=["Admin Settings"])
 
@@ -338,6 +339,8 @@ async def update_banchina(
     log_audit(db, current_user.id, "UPDATE_BANCHINA", f"Modificata banchina {banchina_id}: {data.code}")
     db.commit()
     db.refresh(banchina)
+    # Codice/nome banchina delle richieste attive nel pool logistica
+    invalidate_live_pool()
     return banchina
 
 
@@ -459,6 +462,7 @@ async def update_workstation(
         req.requires_kpi = data.requires_kpi
     
     log_audit(db, current_user.id, "UPDATE_WORKSTATION", f"Modificata postazione {ws_id}: {req.role_name}")
+    bump_version(db, STAFFING)
     db.commit()
     
     return {
@@ -488,6 +492,7 @@ async def delete_workstation(
     name = req.role_name
     db.delete(req)
     log_audit(db, current_user.id, "DELETE_WORKSTATION", f"Eliminata postazione: {name}")
+    bump_version(db, STAFFING)
     db.commit()
     return None
 
@@ -498,6 +503,7 @@ async def delete_workstation(
 from models.hr import MedicalExamType, TrainingType, EventType
 from models.production import DowntimeReason
 from pydantic import BaseModel
+from settings_cache import get_lookup, bump_version, LOOKUPS, SYSTEM, STAFFING
 
 # Pydantic Models for Config
 class ConfigBase(BaseModel):
@@ -528,12 +534,13 @@ class EventTypeCreate(BaseModel):
 # --- Downtime Reasons ---
 @router.get("/config/downtime-reasons", summary="Lista Causali Fermo")
 async def get_downtime_reasons(db: Session = Depends(get_db)):
-    return db.query(DowntimeReason).filter(DowntimeReason.is_active == True).all()
+    return [r for r in get_lookup(db, "downtime_reasons") if r["is_active"]]
 
 @router.post("/config/downtime-reasons", summary="Crea Causale Fermo")
 async def create_downtime_reason(data: DowntimeReasonCreate, db: Session = Depends(get_db), u=Depends(get_current_admin)):
     obj = DowntimeReason(**data.dict())
     db.add(obj)
+    bump_version(db, LOOKUPS)
     db.commit()
     db.refresh(obj)
     log_audit(db, u.id, "CREATE_DOWNTIME_REASON", f"Creata causale: {obj.label}")
@@ -543,6 +550,7 @@ async def create_downtime_reason(data: DowntimeReasonCreate, db: Session = Depen
 async def delete_downtime_reason(id: int, db: Session = Depends(get_db), u=Depends(get_current_admin)):
     try:
         db.query(DowntimeReason).filter(DowntimeReason.id == id).delete()
+        bump_version(db, LOOKUPS)
         db.commit()
         log_audit(db, u.id, "DELETE_DOWNTIME_REASON", f"Eliminata causale ID: {id}")
         return {"ok": True}
@@ -557,6 +565,7 @@ async def update_downtime_reason(id: int, data: DowntimeReasonCreate, db: Sessio
         raise HTTPException(status_code=404, detail="Elemento non trovato")
     for key, value in data.dict().items():
         setattr(obj, key, value)
+    bump_version(db, LOOKUPS)
     db.commit()
     log_audit(db, u.id, "UPDATE_DOWNTIME_REASON", f"Modificata causale {id}")
     return obj
@@ -564,12 +573,13 @@ async def update_downtime_reason(id: int, data: DowntimeReasonCreate, db: Sessio
 # --- Medical Exam Types ---
 @router.get("/config/exam-types", summary="Lista Tipi Visite")
 async def get_exam_types(db: Session = Depends(get_db)):
-    return db.query(MedicalExamType).all()
+    return get_lookup(db, "exam_types")
 
 @router.post("/config/exam-types", summary="Crea Tipo Visita")
 async def create_exam_type(data: ExamTypeCreate, db: Session = Depends(get_db), u=Depends(get_current_admin)):
     obj = MedicalExamType(**data.dict())
     db.add(obj)
+    bump_version(db, LOOKUPS)
     db.commit()
     db.refresh(obj)
     log_audit(db, u.id, "CREATE_EXAM_TYPE", f"Creato tipo visita: {obj.name}")
@@ -582,6 +592,7 @@ async def update_exam_type(id: int, data: ExamTypeCreate, db: Session = Depends(
         raise HTTPException(status_code=404, detail="Elemento non trovato")
     for key, value in data.dict().items():
         setattr(obj, key, value)
+    bump_version(db, LOOKUPS)
     db.commit()
     log_audit(db, u.id, "UPDATE_EXAM_TYPE", f"Modificato tipo visita {id}")
     return obj
@@ -590,18 +601,20 @@ async def update_exam_type(id: int, data: ExamTypeCreate, db: Session = Depends(
 async def delete_exam_type(id: int, db: Session = Depends(get_db), u=Depends(get_current_admin)):
     db.query(MedicalExamType).filter(MedicalExamType.id == id).delete()
     log_audit(db, u.id, "DELETE_EXAM_TYPE", f"Eliminato tipo visita ID: {id}")
+    bump_version(db, LOOKUPS)
     db.commit()
     return {"ok": True}
 
 # --- Training Types ---
 @router.get("/config/training-types", summary="Lista Tipi Corsi")
 async def get_training_types(db: Session = Depends(get_db)):
-    return db.query(TrainingType).all()
+    return get_lookup(db, "training_types")
 
 @router.post("/config/training-types", summary="Crea Tipo Corso")
 async def create_training_type(data: TrainingTypeCreate, db: Session = Depends(get_db), u=Depends(get_current_admin)):
     obj = TrainingType(**data.dict())
     db.add(obj)
+    bump_version(db, LOOKUPS)
     db.commit()
     db.refresh(obj)
     log_audit(db, u.id, "CREATE_TRAINING_TYPE", f"Creato tipo corso: {obj.name}")
@@ -614,6 +627,7 @@ async def update_training_type(id: int, data: TrainingTypeCreate, db: Session =
         raise HTTPException(status_code=404, detail="Elemento non trovato")
     for key, value in data.dict().items():
         setattr(obj, key, value)
+    bump_version(db, LOOKUPS)
     db.commit()
     log_audit(db, u.id, "UPDATE_TRAINING_TYPE", f"Modificato tipo corso {id}")
     return obj
@@ -622,18 +636,20 @@ async def update_training_type(id: int, data: TrainingTypeCreate, db: Session =
 async def delete_training_type(id: int, db: Session = Depends(get_db), u=Depends(get_current_admin)):
     db.query(TrainingType).filter(TrainingType.id == id).delete()
     log_audit(db, u.id, "DELETE_TRAINING_TYPE", f"Eliminato tipo corso ID: {id}")
+    bump_version(db, LOOKUPS)
     db.commit()
     return {"ok": True}
 
 # --- Event Types ---
 @router.get("/config/event-types", summary="Lista Tipi Eventi")
 async def get_event_types(db: Session = Depends(get_db)):
-    return db.query(EventType).all()
+    return get_lookup(db, "event_types")
 
 @router.post("/config/event-types", summary="Crea Tipo Evento")
 async def create_event_type(data: EventTypeCreate, db: Session = Depends(get_db), u=Depends(get_current_admin)):
     obj = EventType(**data.dict())
     db.add(obj)
+    bump_version(db, LOOKUPS)
     db.commit()
     db.refresh(obj)
     log_audit(db, u.id, "CREATE_EVENT_TYPE", f"Creato tipo evento: {obj.label}")
@@ -646,6 +662,7 @@ async def update_event_type(id: int, data: EventTypeCreate, db: Session = Depend
         raise HTTPException(status_code=404, detail="Elemento non trovato")
     for key, value in data.dict().items():
         setattr(obj, key, value)
+    bump_version(db, LOOKUPS)
     db.commit()
     log_audit(db, u.id, "UPDATE_EVENT_TYPE", f"Modificato tipo evento {id}")
     return obj
@@ -654,6 +671,7 @@ async def update_event_type(id: int, data: EventTypeCreate, db: Session = Depend
 async def delete_event_type(id: int, db: Session = Depends(get_db), u=Depends(get_current_admin)):
     db.query(EventType).filter(EventType.id == id).delete()
     log_audit(db, u.id, "DELETE_EVENT_TYPE", f"Eliminato tipo evento ID: {id}")
+    bump_version(db, LOOKUPS)
     db.commit()
     return {"ok": True}
 
@@ -683,6 +701,7 @@ async def get_system_settings(db: Session = Depends(get_db)):
             description="Ore di permesso annuali predefinite per nuovi dipendenti"
         )
         db.add(default_hours)
+        bump_version(db, SYSTEM)
         db.commit()
         db.refresh(default_hours)
         
@@ -716,6 +735,7 @@ async def update_system_setting(
         except ValueError:
             pass # Should be handled by frontend validation usually
 
+    bump_version(db, SYSTEM)
     db.commit()
     db.refresh(setting)
     return setting
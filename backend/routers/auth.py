@@ -15,8 +15,10 @@ from security import (
     get_password_hash, 
     create_access_token,
     ACCESS_TOKEN_EXPIRE_MINUTES,
-    get_current_user
+    get_current_user,
+    invalidate_user_cache
 )
+from permission_index import invalidate_permission_index
 
 router = APIRouter(prefix="/auth", tags=["Autenticazione"])
 
@@ -123,6 +125,7 @@ async def setup_pin(
     )
     db.add(log)
     db.commit()
+    invalidate_user_cache(user.username)
     
     return {"message": "PIN configurato con successo!", "success": True}
 
@@ -219,6 +222,7 @@ async def register_first_admin(
     db.add(new_user)
     db.commit()
     db.refresh(new_user)
+    invalidate_permission_index()
     
     return new_user
 
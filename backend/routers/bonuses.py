@@ -4,17 +4,17 @@ Handles bonus registration, auto-population from positive events, and PDF export
 """
 
 from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import and_, extract
 from typing import List, Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
 import io
 
 from database import get_db, Employee, EmployeeEvent, EventType, User
 from models.hr import Bonus
 from security import get_current_user
+from report_jobs import report, report_response, ReportFile
 
 router = APIRouter(prefix="/bonuses", tags=["Bonuses"])
 
@@ -321,17 +321,31 @@ async def get_monthly_summary(
     }
 
 
+class BonusesPdfParams(BaseModel):
+    month: int = Field(..., ge=1, le=12)
+    year: int = Field(..., ge=2020, le=2100)
+
+
+def _require_super_admin(user: User, params=None):
+    if user is None or user.role != 'super_admin':
+        raise HTTPException(status_code=403, detail="Accesso non autorizzato")
+
+
 @router.get("/export/pdf", summary="Esporta PDF bonus mensili")
 async def export_bonuses_pdf(
     month: int = Query(..., ge=1, le=12),
     year: int = Query(..., ge=2020, le=2100),
-    db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Genera PDF del riepilogo bonus mensile con supporto multi-pagina."""
-    
-    if current_user.role != 'super_admin':
-        raise HTTPException(status_code=403, detail="Accesso non autorizzato")
+    """Genera PDF del riepilogo bonus mensile (dalla cache export se i dati non sono cambiati)."""
+    return await report_response("bonuses_pdf", {"month": month, "year": year}, current_user)
+
+
+@report("bonuses_pdf", BonusesPdfParams, tables=("bonuses", "employees", "employee_events", "users"),
+        authorize=_require_super_admin)
+def render_bonuses_pdf(db: Session, params: BonusesPdfParams) -> ReportFile:
+    """PDF del riepilogo bonus mensile con supporto multi-pagina."""
+    month, year = params.month, params.year
     
     from reportlab.lib import colors
     from reportlab.lib.pagesizes import A4
@@ -595,11 +609,5 @@ async def export_bonuses_pdf(
     # Build PDF with automatic pagination
     doc.build(story, onFirstPage=draw_header_footer, onLaterPages=draw_header_footer)
     
-    buffer.seek(0)
     filename = f"Bonus_{months_names[month]}_{year}.pdf"
-    
-    return StreamingResponse(
-        buffer,
-        media_type="application/pdf",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
-    )
+    return ReportFile(buffer.getvalue(), filename, "application/pdf")
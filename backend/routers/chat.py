@@ -12,6 +12,11 @@ from pydantic import BaseModel
 from database import get_db, User
 from models.chat import Conversation, ConversationMember, Message, PushSubscription
 from security import get_current_user
+from permission_index import invalidate_permission_index
+from chat_summary import (
+    get_conversation_summaries, get_unread_total,
+    on_message_sent, on_message_deleted, mark_read
+)
 
 router = APIRouter(prefix="/chat", tags=["Chat"])
 
@@ -29,9 +34,12 @@ class ConversationCreate(BaseModel):
 
 
 from fastapi import File, UploadFile
-import shutil
 import os
 import uuid
+from image_pipeline import (
+    save_upload_to_disk, make_thumbnail, thumbnail_url,
+    UploadTooLarge, THUMBNAIL_MIMES
+)
 
 UPLOAD_DIR = "uploads/chat"
 
@@ -50,37 +58,44 @@ async def upload_attachment(
     current_user: User = Depends(get_current_user)
 ):
     """Carica un file o immagine per la chat."""
-    # 1. Validate Size (Max 10MB)
+    # Ensure dir exists (redundant check but safe)
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+    # Create unique filename
+    ext = os.path.splitext(file.filename)[1]
+    filename = f"{uuid.uuid4()}{ext}"
+    file_path = os.path.join(UPLOAD_DIR, filename)
+    tmp_path = os.path.join(UPLOAD_DIR, f".{filename}.part")
+
+    # 1. Stream su disco a blocchi con limite dimensione (Max 10MB)
     MAX_SIZE = 10 * 1024 * 1024
-    size = await file.read()
-    if len(size) > MAX_SIZE:
+    try:
+        await save_upload_to_disk(file, tmp_path, max_bytes=MAX_SIZE)
+    except UploadTooLarge:
         raise HTTPException(status_code=413, detail="File troppo grande (Max 10MB)")
-    await file.seek(0)
 
     # 2. Validate Type (Magic Bytes)
     import filetype
-    kind = filetype.guess(size[:2048])
+    with open(tmp_path, "rb") as f:
+        kind = filetype.guess(f.read(2048))
     ALLOWED_MIMES = ['image/jpeg', 'image/png', 'image/gif', 'application/pdf', 'application/msword', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document']
     
     if not kind or kind.mime not in ALLOWED_MIMES:
          # Fallback for text files or standard extensions if magic bytes fail (optional, but safer to block)
+         os.remove(tmp_path)
          raise HTTPException(status_code=400, detail="Tipo file non supportato")
-    
-    # Create unique filename
-    ext = os.path.splitext(file.filename)[1]
-    filename = f"{uuid.uuid4()}{ext}"
-    file_path = os.path.join(UPLOAD_DIR, filename)
-    
-    # Ensure dir exists (redundant check but safe)
-    os.makedirs(UPLOAD_DIR, exist_ok=True)
-    
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+
+    os.replace(tmp_path, file_path)
+
+    # 3. Miniatura per le immagini (process pool, l'originale resta invariato)
+    thumb_url = None
+    if kind.mime in THUMBNAIL_MIMES and await make_thumbnail(file_path):
+        thumb_url = thumbnail_url(f"/uploads/chat/{filename}")
         
     # Return URL (relative to static mount)
     # Assumiamo che /static/chat/ o simile sia montato. 
     # In main.py: app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
-    return {"url": f"/uploads/chat/{filename}", "filename": file.filename}
+    return {"url": f"/uploads/chat/{filename}", "filename": file.filename, "thumbnail_url": thumb_url}
 
 
 class MessageResponse(BaseModel):
@@ -125,89 +140,14 @@ class MemberInfo(BaseModel):
 # CONVERSATIONS
 # ============================================================
 
-def _get_unread_count(db: Session, conv_id: int, user_id: int, last_read_at: datetime) -> int:
-    """Helper condiviso per contare messaggi non letti."""
-    if not last_read_at:
-        return 0
-        
-    count = db.query(Message).filter(
-        Message.conversation_id == conv_id,
-        Message.created_at > last_read_at,
-        Message.sender_id != user_id,
-        Message.deleted_at == None
-    ).count()
-    
-    return count
-
 @router.get("/conversations", summary="Lista Conversazioni")
 async def get_conversations(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """Ottieni lista conversazioni dell'utente corrente."""
-    # Trova tutte le conversazioni dove l'utente è membro
-    memberships = db.query(ConversationMember).filter(
-        ConversationMember.user_id == current_user.id
-    ).all()
-    
-    conv_ids = [m.conversation_id for m in memberships]
-    membership_map = {m.conversation_id: m for m in memberships}
-    
-    if not conv_ids:
-        return []
-    
-    conversations = db.query(Conversation).filter(
-        Conversation.id.in_(conv_ids)
-    ).all()
-    
-    result = []
-    for conv in conversations:
-        # Ultimo messaggio
-        last_msg = db.query(Message).filter(
-            Message.conversation_id == conv.id,
-            Message.deleted_at == None
-        ).order_by(desc(Message.created_at)).first()
-        
-        # Conteggio non letti
-        membership = membership_map.get(conv.id)
-        unread = 0
-        if membership:
-             unread = _get_unread_count(db, conv.id, current_user.id, membership.last_read_at)
-        
-        # Membri
-        members = db.query(ConversationMember).filter(
-            ConversationMember.conversation_id == conv.id
-        ).all()
-        
-        member_list = []
-        display_name = conv.name
-        for m in members:
-            user = db.query(User).filter(User.id == m.user_id).first()
-            if user:
-                member_list.append({
-                    "user_id": user.id,
-                    "username": user.username,
-                    "full_name": user.full_name,
-                    "role": m.role
-                })
-                # Per chat dirette, usa il nome dell'altro utente
-                if conv.type == "direct" and user.id != current_user.id:
-                    display_name = user.full_name or user.username
-        
-        result.append({
-            "id": conv.id,
-            "type": conv.type,
-            "name": display_name,
-            "created_at": conv.created_at,
-            "last_message": last_msg.content[:50] if last_msg else None,
-            "last_message_at": last_msg.created_at if last_msg else None,
-            "unread_count": unread,
-            "members": member_list
-        })
-    
-    # Ordina per ultimo messaggio
-    result.sort(key=lambda x: x["last_message_at"] or x["created_at"], reverse=True)
-    return result
+    # Riepilogo set-based: numero fisso di query, indipendente da quante chat ha l'utente
+    return get_conversation_summaries(db, current_user.id)
 
 
 @router.post("/conversations", summary="Nuova Conversazione")
@@ -299,8 +239,8 @@ async def get_messages(
     
     messages = query.order_by(desc(Message.created_at)).limit(limit).all()
     
-    # Aggiorna last_read_at
-    membership.last_read_at = datetime.utcnow()
+    # Aggiorna last_read_at e azzera contatore non letti
+    mark_read(membership)
     db.commit()
     
     result = []
@@ -363,9 +303,10 @@ async def send_message(
         reply_to_id=data.reply_to_id
     )
     db.add(message)
+    db.flush()  # Per ottenere l'ID
     
-    # Aggiorna last_read_at del mittente
-    membership.last_read_at = datetime.utcnow()
+    # Contatori non letti + puntatore ultimo messaggio (anche last_read_at del mittente)
+    on_message_sent(db, message)
     
     db.commit()
     db.refresh(message)
@@ -407,7 +348,9 @@ async def delete_message(
         if not message.can_delete:
             raise HTTPException(status_code=400, detail="Tempo scaduto per la cancellazione (max 2 minuti)")
     
-    message.deleted_at = datetime.utcnow()
+    if not message.deleted_at:
+        message.deleted_at = datetime.utcnow()
+        on_message_deleted(db, message)
     db.commit()
     
     # Notifica via WebSocket che il messaggio è cancellato
@@ -483,6 +426,10 @@ async def delete_conversation(
             {"reply_to_id": None}, 
             synchronize_session=False
         )
+        db.query(ConversationMember).filter(ConversationMember.conversation_id == conv_id).update(
+            {"last_message_id": None},
+            synchronize_session=False
+        )
         db.flush() # Applica update in transazione
 
         # 2. Cancella messaggi
@@ -517,7 +464,7 @@ async def mark_as_read(
     if not membership:
         raise HTTPException(status_code=403, detail="Non sei membro di questa conversazione")
     
-    membership.last_read_at = datetime.utcnow()
+    mark_read(membership)
     db.commit()
     
     return {"message": "Conversazione marcata come letta"}
@@ -559,22 +506,7 @@ async def get_unread_count(
     current_user: User = Depends(get_current_user)
 ):
     """Conteggio totale messaggi non letti per badge."""
-    memberships = db.query(ConversationMember).filter(
-        ConversationMember.user_id == current_user.id
-    ).all()
-    
-    total = 0
-    for m in memberships:
-        if m.last_read_at:
-            count = db.query(Message).filter(
-                Message.conversation_id == m.conversation_id,
-                Message.created_at > m.last_read_at,
-                Message.sender_id != current_user.id,
-                Message.deleted_at == None
-            ).count()
-            total += count
-    
-    return {"unread": total}
+    return {"unread": get_unread_total(db, current_user.id)}
 
 
 # ============================================================
@@ -720,6 +652,7 @@ async def subscribe_push(
         db.add(sub)
     
     db.commit()
+    invalidate_permission_index()
     return {"message": "Subscription registrata"}
 
 
@@ -738,6 +671,7 @@ async def unsubscribe_push(
     if sub:
         db.delete(sub)
         db.commit()
+        invalidate_permission_index()
     
     return {"message": "Subscription rimossa"}
 
@@ -752,65 +686,30 @@ async def get_chat_notifications_summary(
     Usato per badge sidebar e campanella notifiche.
     """
     try:
-        # LOGICA COPIATA DA get_conversations (Proclamata Funzionante)
-        
-        # 1. Ottieni membership
-        memberships = db.query(ConversationMember).filter(
-            ConversationMember.user_id == current_user.id
-        ).all()
-        
-        if not memberships:
-             return {"total_unread": 0, "conversations": []}
+        summaries = get_conversation_summaries(db, current_user.id)
 
-        membership_map = {m.conversation_id: m for m in memberships}
-        conv_ids = [m.conversation_id for m in memberships]
-        
-        # 2. Ottieni conversazioni
-        conversations = db.query(Conversation).filter(
-            Conversation.id.in_(conv_ids)
-        ).all()
-        
         total_unread = 0
         conversations_summary = []
-        
-        for conv in conversations:
-            member = membership_map.get(conv.id)
-            if not member:
-                continue
-                
-            # 3. USA HELPER CONDIVISO
-            unread_count = _get_unread_count(db, conv.id, current_user.id, member.last_read_at)
-            
+
+        for conv in summaries:
+            unread_count = conv["unread_count"]
             if unread_count > 0:
                 total_unread += unread_count
-                
-                # Determina nome 
-                display_name = conv.name or "Chat"
-                is_group = (conv.type == 'group')
-                
-                if not is_group:
-                    other_member_q = db.query(ConversationMember).filter(
-                        ConversationMember.conversation_id == conv.id,
-                        ConversationMember.user_id != current_user.id
-                    ).first()
-                    
-                    if other_member_q:
-                        other_user = db.query(User).filter(User.id == other_member_q.user_id).first()
-                        if other_user:
-                            display_name = other_user.full_name or other_user.username
-                        else:
-                            display_name = "Utente sconosciuto"
-                    else:
-                        display_name = "Utente rimosso"
-                        
+                is_group = (conv["type"] == 'group')
+
+                display_name = conv["name"] or "Chat"
+                if not is_group and len(conv["members"]) < 2:
+                    display_name = "Utente rimosso"
+
+                last_message_at = conv["last_message_at"] or conv["created_at"]
                 conversations_summary.append({
-                    "conversation_id": conv.id,
+                    "conversation_id": conv["id"],
                     "name": display_name,
                     "unread_count": unread_count,
                     "is_group": is_group,
-                    "last_message_at": conv.created_at.isoformat() if conv.created_at else None
+                    "last_message_at": last_message_at.isoformat() if last_message_at else None
                 })
-        
+
         return {
             "total_unread": total_unread,
             "conversations": conversations_summary
@@ -822,12 +721,11 @@ async def get_chat_notifications_summary(
 
 # Helper per invio push a utente
 async def send_push_to_user(db: Session, user_id: int, sender_name: str, message_preview: str, conv_id: int):
-    """Invia notifica push a tutte le subscription dell'utente."""
+    """Accoda notifica push per tutte le subscription dell'utente (pulizia 404/410 nel dispatcher)."""
     subs = db.query(PushSubscription).filter(
         PushSubscription.user_id == user_id
     ).all()
     
-    dead_subs = []
     for sub in subs:
         subscription_info = {
             "endpoint": sub.endpoint,
@@ -836,20 +734,12 @@ async def send_push_to_user(db: Session, user_id: int, sender_name: str, message
                 "auth": sub.auth_key
             }
         }
-        success = send_chat_notification(
+        send_chat_notification(
             subscription_info=subscription_info,
             sender_name=sender_name,
             message_preview=message_preview,
             conversation_id=conv_id
         )
-        if not success:
-            dead_subs.append(sub)
-    
-    # Cleanup subscription non valide
-    for sub in dead_subs:
-        db.delete(sub)
-    if dead_subs:
-        db.commit()
 
 # ============================================================
 # MODERATION (ADMIN POWERS)
@@ -930,7 +820,9 @@ async def delete_message(
         
     # Time limit check for non-admins (e.g. 2 mins) - Optional, skipping for now based on request
     
-    msg.deleted_at = datetime.utcnow()
+    if not msg.deleted_at:
+        msg.deleted_at = datetime.utcnow()
+        on_message_deleted(db, msg)
     db.commit()
     
     # Notify via WebSocket (broadcast deletion)
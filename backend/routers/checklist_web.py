@@ -3,9 +3,8 @@ CheckList Web — Router per il controllo giornaliero clienti coordinatori.
 Gestisce CRUD delle righe checklist + esportazione PDF.
 """
 from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional
 from datetime import date, datetime
 import io
@@ -14,6 +13,7 @@ from database import get_db
 from models.core import User
 from models.checklist_web import ChecklistWebEntry
 from security import get_current_user
+from report_jobs import report, report_response, ReportFile
 
 
 router = APIRouter(prefix="/api/checklist-web", tags=["CheckList Web"])
@@ -230,15 +230,24 @@ async def delete_note(
     return _serialize_entry(entry)
 
 
+class ChecklistPdfParams(BaseModel):
+    data: date = Field(..., alias="date")
+
+
 @router.get("/pdf", summary="Esporta PDF checklist")
 async def export_pdf(
     data: date = Query(..., alias="date", description="Data nel formato YYYY-MM-DD"),
-    db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    """Genera un PDF A4 della checklist per la data specificata."""
-    _require_checklist_permission(current_user)
+    """Genera un PDF A4 della checklist per la data specificata (dalla cache export se invariata)."""
+    return await report_response("checklist_pdf", {"date": data}, current_user)
+
 
+@report("checklist_pdf", ChecklistPdfParams, tables=("checklist_web", "users"),
+        authorize=lambda user, params: _require_checklist_permission(user))
+def render_checklist_pdf(db: Session, params: ChecklistPdfParams) -> ReportFile:
+    """PDF A4 della checklist di un giorno (404 se non ci sono righe)."""
+    data = params.data
     entries = (
         db.query(ChecklistWebEntry)
         .filter(ChecklistWebEntry.data == data)
@@ -252,11 +261,7 @@ async def export_pdf(
     buffer = _generate_checklist_pdf(data, entries)
 
     filename = f"checklist_web_{data.isoformat()}.pdf"
-    return StreamingResponse(
-        buffer,
-        media_type="application/pdf",
-        headers={"Content-Disposition": f"attachment; filename={filename}"},
-    )
+    return ReportFile(buffer.getvalue(), filename, "application/pdf")
 
 
 # ── PDF Generation ──
@@ -208,6 +208,11 @@ async def delete_employee(
 
     db.delete(employee)
     db.commit()
+    if employee.user_id:
+        from permission_index import invalidate_permission_index
+        from security import invalidate_user_cache
+        invalidate_permission_index()
+        invalidate_user_cache()
     return None
     
     db.delete(employee)
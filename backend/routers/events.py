@@ -568,6 +568,8 @@ async def get_event_types(db: Session = Depends(get_db)):
             new_t = EventType(**t)
             db.add(new_t)
             params.append(new_t)
+        from settings_cache import bump_version, LOOKUPS
+        bump_version(db, LOOKUPS)
         db.commit()
         types = params
 
@@ -1,6 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func
 from typing import List, Optional
 from datetime import datetime
 from pydantic import BaseModel
@@ -8,6 +7,8 @@ from pydantic import BaseModel
 from database import get_db, ShiftRequirement, Employee, ShiftAssignment, Banchina
 from models.core import Department
 from security import get_current_user, User
+from date_ranges import between_days
+from settings_cache import bump_version, STAFFING
 
 router = APIRouter(prefix="/factory", tags=["Factory"])
 
@@ -81,6 +82,7 @@ async def update_kpi(
         raise HTTPException(status_code=404, detail="Requisito non trovato")
     
     req.kpi_target = kpi.kpi_target
+    bump_version(db, STAFFING)
     db.commit()
     return {"status": "updated", "id": id, "new_target": req.kpi_target}
 
@@ -103,8 +105,7 @@ async def get_costs_report(
         
     # Query Shifts
     shifts = db.query(ShiftAssignment).filter(
-        ShiftAssignment.work_date >= s_date,
-        ShiftAssignment.work_date <= e_date,
+        between_days(ShiftAssignment.work_date, s_date, e_date),
         ShiftAssignment.shift_type.in_(['morning', 'afternoon', 'night', 'manual'])
     ).options(joinedload(ShiftAssignment.employee).joinedload(Employee.department)).all()
     
@@ -2,10 +2,9 @@
 SL Enterprise - Fleet Router
 Gestione parco mezzi e ticket manutenzione.
 """
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func
-from datetime import datetime, timedelta
+from datetime import datetime, date, timedelta
 from zoneinfo import ZoneInfo
 
 IT_TZ = ZoneInfo("Europe/Rome")
@@ -13,17 +12,9 @@ from typing import List, Optional
 from pydantic import BaseModel
 import os
 import shutil
-import uuid
 import os
 import json
 from datetime import datetime
-from io import BytesIO
-from PIL import Image
-try:
-    from pillow_heif import register_heif_opener
-    register_heif_opener()
-except ImportError:
-    print("[WARN] pillow-heif non installato — HEIC non supportato")
 from fastapi import Form, Request
 
 class VehicleUpdate(BaseModel):
@@ -38,6 +29,8 @@ class VehicleUpdate(BaseModel):
 
 from database import get_db, Banchina, FleetVehicle, MaintenanceTicket, User
 from security import get_current_user, get_hr_or_admin
+from image_pipeline import ingest_image, thumbnail_url
+from date_ranges import on_day
 
 router = APIRouter(prefix="/fleet", tags=["Parco Mezzi"])
 
@@ -664,51 +657,9 @@ async def create_checklist(
                 print(f"DEBUG: upload_file has no content_type: {type(upload_file)}")
                 return None
             
-            ext = ".jpg"
-            save_format = "JPEG"
-            ct = (upload_file.content_type or "").lower()
-            fn = (upload_file.filename or "").lower()
-            if ct == "image/png" or fn.endswith(".png"):
-                ext = ".png"
-                save_format = "PNG"
-            # HEIC/HEIF → always convert to JPEG
-            elif ct in ("image/heic", "image/heif") or fn.endswith((".heic", ".heif")):
-                ext = ".jpg"
-                save_format = "JPEG"
-            
-            filename = f"{prefix}{uuid.uuid4()}{ext}"
-            file_path = os.path.join(dest_dir, filename)
-            
-            contents = await upload_file.read()
-            
-            # Guard: empty file
-            if not contents or len(contents) < 100:
-                print(f"DEBUG: File vuoto o troppo piccolo ({len(contents) if contents else 0} bytes)")
-                return None
-            
-            try:
-                img = Image.open(BytesIO(contents))
-                img.verify()  # Verifica integrità
-                # Re-open dopo verify (verify chiude il file)
-                img = Image.open(BytesIO(contents))
-            except Exception as img_err:
-                print(f"DEBUG: Impossibile leggere immagine: {img_err}, content_type={upload_file.content_type}, filename={upload_file.filename}, size={len(contents)}")
-                return None
-            
-            # Max dimensions
-            max_width = 1280
-            if img.width > max_width:
-                ratio = max_width / img.width
-                new_height = int(img.height * ratio)
-                img = img.resize((max_width, new_height), Image.Resampling.LANCZOS)
-            
-            if save_format == "JPEG":
-                if img.mode != 'RGB': img = img.convert('RGB')
-                img.save(file_path, "JPEG", quality=70, optimize=True)
-            else:
-                img.save(file_path, "PNG", optimize=True)
-                
-            return filename
+            # Upload su disco a blocchi + verify/resize/encode/miniatura nel process pool
+            result = await ingest_image(upload_file, dest_dir, prefix=prefix)
+            return result["filename"] if result else None
 
         # 3. Save Tablet Photo
         # Mandatory per user requirement
@@ -738,6 +689,7 @@ async def create_checklist(
             if isinstance(val, dict):
                 temp_id = val.get("photo_temp_id")
                 photo_url = None
+                photo_thumb_url = None
                 
                 # Look for file with key "issue_photo_{key}" or just "issue_photo_{temp_id}"
                 # Frontend should send key as `issue_photo_${key}`
@@ -747,11 +699,13 @@ async def create_checklist(
                      issue_filename = await process_and_save_image(issue_file, ISSUES_DIR, prefix="issue_")
                      if issue_filename:
                         photo_url = f"/uploads/checklists/issues/{issue_filename}"
+                        photo_thumb_url = thumbnail_url(photo_url)
                 
                 new_checks_data[key] = {
                     "status": val.get("status"),
                     "note": val.get("note"),
-                    "photo_url": photo_url
+                    "photo_url": photo_url,
+                    "photo_thumb_url": photo_thumb_url
                 }
             else:
                 # Legacy/Simple boolean
@@ -829,11 +783,20 @@ async def create_checklist(
         raise HTTPException(500, f"Critical Error: {str(e)}")
 
 
+def _existing_thumbnail_url(url: Optional[str]) -> Optional[str]:
+    """Miniatura della foto, solo se generata (le checklist precedenti alla pipeline non ce l'hanno)."""
+    thumb = thumbnail_url(url)
+    if not thumb:
+        return None
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return thumb if os.path.exists(os.path.join(base_dir, thumb.lstrip("/"))) else None
+
+
 @router.get("/checklists", summary="Storico Checklist")
 async def list_checklists(
     vehicle_id: int = None,
     operator_id: int = None,
-    date: str = None,
+    day: Optional[date] = Query(None, alias="date", description="Data nel formato YYYY-MM-DD"),
     limit: int = 50,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -846,8 +809,8 @@ async def list_checklists(
             query = query.filter(FleetChecklist.vehicle_id == vehicle_id)
         if operator_id:
             query = query.filter(FleetChecklist.operator_id == operator_id)
-        if date:
-            query = query.filter(func.date(FleetChecklist.timestamp) == date)
+        if day:
+            query = query.filter(on_day(FleetChecklist.timestamp, day))
         
         results = query.order_by(FleetChecklist.timestamp.desc()).limit(limit).all()
         
@@ -874,6 +837,7 @@ async def list_checklists(
                 "resolver": res_info,
                 "tablet_status": c.tablet_status or "ok",
                 "tablet_photo_url": c.tablet_photo_url,
+                "tablet_photo_thumb_url": _existing_thumbnail_url(c.tablet_photo_url),
             })
         return out
     except Exception as e:
@@ -2,14 +2,16 @@
 KPI Configurator Router
 Gestione configurazione KPI e registrazione giornaliera.
 """
-from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func, and_
+from sqlalchemy import func
 from pydantic import BaseModel
 from typing import Optional, List
-from datetime import datetime, date, timedelta
+from datetime import datetime, date
 import io
 import os
+import numpy as np
+import pandas as pd
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4, landscape
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
@@ -17,6 +19,7 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import mm
 from database import (
     SessionLocal, 
+    get_read_db,
     KpiConfig, 
     KpiEntry, 
     ShiftRequirement, 
@@ -25,6 +28,11 @@ from database import (
     User
 )
 from security import get_current_user
+from date_ranges import on_day
+from kpi_rollups import daily_series, sector_totals, shift_rows, ShiftRow
+from analytics import kpi_entries_frame, kpi_daily_report, kpi_shift_table, efficiency, records
+from settings_cache import get_staffing, bump_version, STAFFING
+from report_jobs import report, report_response, ReportFile
 
 router = APIRouter(prefix="/kpi", tags=["KPI"])
 
@@ -126,13 +134,12 @@ def get_kpi_configs(
         query = query.filter(KpiConfig.is_active == True)
     
     configs = query.order_by(KpiConfig.display_order).all()
+    staffing = get_staffing(db)
     
     result = []
     for cfg in configs:
-        # Calcola operatori richiesti da ShiftRequirement
-        ops_required = db.query(func.sum(ShiftRequirement.quantity)).filter(
-            ShiftRequirement.kpi_sector == cfg.sector_name
-        ).scalar() or 0
+        # Operatori richiesti da ShiftRequirement (snapshot fabbisogni)
+        ops_required = staffing.operators_required.get(cfg.sector_name, 0)
         
         result.append(KpiConfigResponse(
             id=cfg.id,
@@ -235,6 +242,7 @@ def delete_kpi_config(config_id: int, db: Session = Depends(get_db)):
     # Bisogna pulire anche quelli se matchano il nome settore.
     
     db.query(ShiftRequirement).filter(ShiftRequirement.kpi_sector == config.sector_name).delete()
+    bump_version(db, STAFFING)
     
     db.delete(config)
     db.commit()
@@ -250,16 +258,14 @@ def calculate_staffing(db: Session, sector_name: str, work_date: date, shift_typ
     Calcola operatori presenti vs richiesti per un settore/data/turno.
     Considera assenze e permessi approvati.
     """
-    # 1. Trova tutti i ShiftRequirement per questo settore
-    requirements = db.query(ShiftRequirement).filter(
-        ShiftRequirement.kpi_sector == sector_name
-    ).all()
+    # 1. ShiftRequirement del settore (snapshot fabbisogni)
+    staffing = get_staffing(db)
+    req_ids = staffing.requirement_ids.get(sector_name)
     
-    if not requirements:
+    if not req_ids:
         return None, None, None, None
     
-    req_ids = [r.id for r in requirements]
-    operators_required = sum(r.quantity or 0 for r in requirements)
+    operators_required = staffing.operators_required[sector_name]
     
     # 2. Conta turni assegnati per questi requirements
     work_datetime = datetime.combine(work_date, datetime.min.time())
@@ -270,14 +276,12 @@ def calculate_staffing(db: Session, sector_name: str, work_date: date, shift_typ
         target_shifts.append('manual')
         
     from models.hr import Employee
-    assignments = db.query(ShiftAssignment).join(Employee).filter(
+    assigned_employee_ids = [employee_id for (employee_id,) in db.query(ShiftAssignment.employee_id).join(Employee).filter(
         ShiftAssignment.requirement_id.in_(req_ids),
-        func.date(ShiftAssignment.work_date) == work_date,
+        on_day(ShiftAssignment.work_date, work_date),
         ShiftAssignment.shift_type.in_(target_shifts)
-    ).all()
-    
-    assigned_employee_ids = [a.employee_id for a in assignments]
-    operators_assigned = len(assignments)
+    )]
+    operators_assigned = len(assigned_employee_ids)
     
     # 3. Sottrai assenze/permessi approvati per quel giorno
     absences = 0
@@ -331,7 +335,7 @@ def create_kpi_entry(
     # Check se esiste gia entry per questo settore/data/turno
     existing = db.query(KpiEntry).filter(
         KpiEntry.kpi_config_id == data.kpi_config_id,
-        func.date(KpiEntry.work_date) == data.work_date,
+        on_day(KpiEntry.work_date, data.work_date),
         KpiEntry.shift_type == data.shift_type
     ).first()
     
@@ -400,13 +404,13 @@ def create_kpi_entry(
 def get_kpi_entries(
     work_date: date,
     config_id: Optional[int] = None,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Lista entries per una data specifica."""
     query = db.query(KpiEntry).options(
         joinedload(KpiEntry.kpi_config)
     ).filter(
-        func.date(KpiEntry.work_date) == work_date
+        on_day(KpiEntry.work_date, work_date)
     )
     
     if config_id:
@@ -466,52 +470,46 @@ def get_panoramica(
         KpiConfig.is_active == True
     ).order_by(KpiConfig.display_order).all()
     
-    # 1. Carica KPI Entries (per pallini stato)
-    entries = db.query(KpiEntry).filter(
-        func.date(KpiEntry.work_date) == work_date
-    ).all()
-    
+    # 1. Carica KPI Entries (per pallini stato): solo le colonne usate
     entries_map = {}
-    for e in entries:
-        entries_map[(e.kpi_config_id, e.shift_type)] = e
+    for config_id, shift_type, quantity, downtime in db.query(
+        KpiEntry.kpi_config_id, KpiEntry.shift_type, KpiEntry.quantity_produced, KpiEntry.hours_downtime
+    ).filter(
+        on_day(KpiEntry.work_date, work_date)
+    ):
+        entries_map[(config_id, shift_type)] = (quantity, downtime)
         
-    # 2. Carica Assunzioni (Shift Assignments) per conteggio operatori
-    #    Mappa: sector_name -> shift_type -> count
-    
-    # a. Mappa requirement_id -> kpi_sector (sector_name)
-    all_requirements = db.query(ShiftRequirement).all()
-    req_map = {r.id: r.kpi_sector for r in all_requirements if r.kpi_sector}
+    # 2. Conteggio operatori per settore/turno
+    #    a. Mappa requirement_id -> kpi_sector e operatori richiesti (snapshot fabbisogni)
+    staffing = get_staffing(db)
     
-    # b. Query assignments
-    assignments = db.query(ShiftAssignment).filter(
-        func.date(ShiftAssignment.work_date) == work_date
-    ).all()
-    
-    # c. Conta operatori per settore/turno
+    #    b. Assegnazioni del giorno già contate per requisito/turno
     #    structure: ops_count[sector_name][shift_type] = int
     ops_count = {}
     
-    for assign in assignments:
-        sector_name = req_map.get(assign.requirement_id)
+    for requirement_id, st, assigned in db.query(
+        ShiftAssignment.requirement_id, ShiftAssignment.shift_type, func.count(ShiftAssignment.id)
+    ).filter(
+        on_day(ShiftAssignment.work_date, work_date),
+        ShiftAssignment.requirement_id.isnot(None)
+    ).group_by(ShiftAssignment.requirement_id, ShiftAssignment.shift_type):
+        sector_name = staffing.sector_of.get(requirement_id)
         if not sector_name:
             continue
             
         if sector_name not in ops_count:
             ops_count[sector_name] = {'morning': 0, 'afternoon': 0, 'night': 0, 'custom': 0}
             
-        st = assign.shift_type
         if st in ops_count[sector_name]:
-            ops_count[sector_name][st] += 1
+            ops_count[sector_name][st] += assigned
         elif st == 'custom' or st == 'manual': 
-             ops_count[sector_name]['custom'] += 1
+             ops_count[sector_name]['custom'] += assigned
 
     
     result = []
     for cfg in configs:
-        # Calcola operatori richiesti (totale generico, non per turno specifico)
-        ops_required = db.query(func.sum(ShiftRequirement.quantity)).filter(
-            ShiftRequirement.kpi_sector == cfg.sector_name
-        ).scalar() or 0
+        # Operatori richiesti (totale generico, non per turno specifico)
+        ops_required = staffing.operators_required.get(cfg.sector_name, 0)
         
         # Recupera conteggi staffing
         sector_ops = ops_count.get(cfg.sector_name, {})
@@ -520,11 +518,12 @@ def get_panoramica(
             entry = entries_map.get((cfg.id, shift))
             if not entry:
                 return "empty"
+            quantity, downtime = entry
             # Se esiste ma non ha produzione né fermi, lo consideriamo "empty" (evita "falsi attivi" da mobile)
-            if entry.quantity_produced == 0 and entry.hours_downtime == 0:
+            if quantity == 0 and downtime == 0:
                 return "empty"
             
-            if entry.quantity_produced > 0:
+            if quantity > 0:
                 return "complete"
             return "partial"
         
@@ -558,16 +557,12 @@ def get_operators_for_sector(
     """
     from database import Employee
     
-    # 1. Trova tutti i ShiftRequirement per questo settore
-    requirements = db.query(ShiftRequirement).filter(
-        ShiftRequirement.kpi_sector == sector_name
-    ).all()
+    # 1. ShiftRequirement del settore (snapshot fabbisogni)
+    req_ids = get_staffing(db).requirement_ids.get(sector_name)
     
-    if not requirements:
+    if not req_ids:
         return []
     
-    req_ids = [r.id for r in requirements]
-    
     # 2. Trova turni assegnati per questi requirements
     target_shifts = [shift_type]
     if shift_type == 'custom':
@@ -577,7 +572,7 @@ def get_operators_for_sector(
         joinedload(ShiftAssignment.employee)
     ).filter(
         ShiftAssignment.requirement_id.in_(req_ids),
-        func.date(ShiftAssignment.work_date) == work_date,
+        on_day(ShiftAssignment.work_date, work_date),
         ShiftAssignment.shift_type.in_(target_shifts)
     ).all()
     
@@ -613,66 +608,44 @@ def get_operators_for_sector(
 @router.get("/report/daily")
 def get_daily_report(
     work_date: date,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Report giornaliero con aggregati per tutti i settori."""
-    entries = db.query(KpiEntry).options(
-        joinedload(KpiEntry.kpi_config)
-    ).filter(
-        func.date(KpiEntry.work_date) == work_date
-    ).all()
-    
-    # Raggruppa per settore
-    by_sector = {}
-    for e in entries:
-        sector = e.kpi_config.sector_name
-        if sector not in by_sector:
-            by_sector[sector] = {
-                "sector_name": sector,
-                "kpi_target_8h": e.kpi_config.kpi_target_8h,
-                "shifts": {},
-                "total_hours": 0,
-                "total_downtime": 0,
-                "total_quantity": 0
-            }
-        
-        by_sector[sector]["shifts"][e.shift_type] = {
-            "hours_total": e.hours_total,
-            "hours_downtime": e.hours_downtime,
-            "hours_net": e.hours_net,
-            "quantity": e.quantity_produced,
-            "efficiency": e.efficiency_percent,
-            "staffing_status": e.staffing_status,
-            "staffing_delta": e.staffing_delta
-        }
-        by_sector[sector]["total_hours"] += e.hours_total
-        by_sector[sector]["total_downtime"] += e.hours_downtime
-        by_sector[sector]["total_quantity"] += e.quantity_produced
-    
-    # Calcola totali
-    for sector in by_sector.values():
-        hours_net = sector["total_hours"] - sector["total_downtime"]
-        sector["total_hours_net"] = hours_net
-        sector["total_qty_per_hour"] = sector["total_quantity"] / hours_net if hours_net > 0 else 0
+    # Raggruppa per settore (colonne in un DataFrame, somme vettoriali)
+    entries = kpi_entries_frame(db, work_date)
     
     return {
         "date": str(work_date),
-        "sectors": list(by_sector.values())
+        "sectors": kpi_daily_report(entries)
     }
 
 
+class KpiDailyPdfParams(BaseModel):
+    work_date: date
+
+
+class KpiAdvancedPdfParams(BaseModel):
+    start_date: date
+    end_date: date
+    sector_name: Optional[str] = None
+
+
 @router.get("/report/daily/pdf")
-def get_daily_pdf_report(
-    work_date: date,
-    db: Session = Depends(get_db)
-):
-    """Genera PDF report giornaliero KPI."""
+async def get_daily_pdf_report(work_date: date):
+    """Genera PDF report giornaliero KPI (dalla cache export se i dati non sono cambiati)."""
+    return await report_response("kpi_daily_pdf", {"work_date": work_date})
+
+
+@report("kpi_daily_pdf", KpiDailyPdfParams, tables=("kpi_entries", "kpi_configs"))
+def render_daily_pdf(db: Session, params: KpiDailyPdfParams) -> ReportFile:
+    """PDF report giornaliero KPI."""
+    work_date = params.work_date
     
     # 1. Recupera Dati (logica uguale a daily report)
     entries = db.query(KpiEntry).options(
         joinedload(KpiEntry.kpi_config)
     ).filter(
-        func.date(KpiEntry.work_date) == work_date
+        on_day(KpiEntry.work_date, work_date)
     ).all()
     
     by_sector = {}
@@ -799,12 +772,7 @@ def get_daily_pdf_report(
     # Build
     doc.build(elements)
     
-    buffer.seek(0)
-    return Response(
-        content=buffer.getvalue(),
-        media_type="application/pdf",
-        headers={"Content-Disposition": f"attachment; filename=report_kpi_{work_date}.pdf"}
-    )
+    return ReportFile(buffer.getvalue(), f"report_kpi_{work_date}.pdf", "application/pdf")
 
 
 
@@ -814,101 +782,36 @@ def get_kpi_trend(
     end_date: date,
     exclude_weekends: bool = False,
     sector_name: Optional[str] = None,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
-    """Restituisce dati aggregati per grafico trend e riepilogo periodo."""
-    
-    query = db.query(KpiEntry).options(
-        joinedload(KpiEntry.kpi_config)
-    ).filter(
-        and_(
-            KpiEntry.work_date >= start_date,
-            KpiEntry.work_date < end_date + timedelta(days=1)
-        )
-    )
-    
-    if sector_name:
-         # Join is handled by relationship, but we need to filter on KpiConfig based on sector name.
-         # KpiEntry.kpi_config is relationship.
-         # We need to join KpiConfig explicitly for filtering?
-         # Or access it via relationship? SQLAlchemy filter on relationship is cleaner with join.
-         query = query.join(KpiConfig).filter(KpiConfig.sector_name == sector_name)
-
-    entries = query.order_by(KpiEntry.work_date).all()
-    
-    # Strutture dati
-    daily_stats = {} # { "2024-01-01": { qty: 1000, hours: 20, target: 800 } }
-    sector_stats = {} # { "Dolphin": { qty: 5000, hours: 100, target_acc: 4000 } }
-    
-    for e in entries:
-        # Filtro Weekend (0=Lun, 6=Dom) -> 5=Sab, 6=Dom
-        if exclude_weekends and e.work_date.weekday() >= 5:
-            continue
-            
-        d_str = str(e.work_date)
-        sector_name = e.kpi_config.sector_name
-        
-        # 1. Aggregazione Giornaliera (per Grafico)
-        if d_str not in daily_stats:
-            daily_stats[d_str] = { "date": d_str, "quantity": 0, "target_total": 0, "hours_net": 0 }
-            
-        daily_stats[d_str]["quantity"] += e.quantity_produced
-        daily_stats[d_str]["hours_net"] += e.hours_net
-        
-        # Stima target per questo entry: target_8h * (ore_nette / 8)
-        entry_target = 0
-        if e.hours_net > 0:
-            entry_target = e.kpi_config.kpi_target_8h * (e.hours_net / 8)
-        daily_stats[d_str]["target_total"] += entry_target
-
-        # 2. Aggregazione Settore (per Tabella Totale)
-        if sector_name not in sector_stats:
-            sector_stats[sector_name] = { 
-                "sector_name": sector_name, 
-                "kpi_target_8h": e.kpi_config.kpi_target_8h, # Prendo l'ultimo configurato
-                "total_quantity": 0, 
-                "total_hours": 0, 
-                "total_downtime": 0,
-                "total_hours_net": 0,
-                "target_accumulated": 0
-            }
-            
-        s = sector_stats[sector_name]
-        s["total_quantity"] += e.quantity_produced
-        s["total_hours"] += e.hours_total
-        s["total_downtime"] += e.hours_downtime
-        s["total_hours_net"] += e.hours_net
-        s["target_accumulated"] += entry_target
-
-    # Calcoli finali giornalieri
-    trend_data = []
-    for d in sorted(daily_stats.keys()):
-        day = daily_stats[d]
-        eff = 0
-        if day["target_total"] > 0:
-            eff = round((day["quantity"] / day["target_total"]) * 100)
-        
-        trend_data.append({
-            "date": d,
-            "quantity": day["quantity"],
-            "efficiency": eff
-        })
-        
-    # Calcoli finali settori
-    sector_data = []
-    for s in sector_stats.values():
-        eff = 0
-        if s["target_accumulated"] > 0:
-            eff = round((s["total_quantity"] / s["target_accumulated"]) * 100)
+    """Restituisce dati aggregati per grafico trend e riepilogo periodo (dai rollup KPI)."""
+    # Aggregazione Giornaliera (per Grafico): una riga per giorno
+    days = pd.DataFrame(daily_series(db, start_date, end_date, sector_name, exclude_weekends),
+                        columns=["day", "quantity", "hours_net", "target_total"])
+    trend_data = records(pd.DataFrame({
+        "date": pd.to_datetime(days["day"]).dt.strftime("%Y-%m-%d %H:%M:%S"),
+        "quantity": days["quantity"],
+        "efficiency": efficiency(days["quantity"], days["target_total"])
+    }))
         
+    # Aggregazione Settore (per Tabella Totale): mesi interi dal rollup mensile
+    sectors = pd.DataFrame(sector_totals(db, start_date, end_date, sector_name, exclude_weekends),
+                           columns=["sector_name", "kpi_target_8h", "quantity_produced", "hours_total",
+                                    "hours_downtime", "hours_net", "target_accumulated"])
+    with np.errstate(divide="ignore", invalid="ignore"):
         # Qnt/h media del periodo
-        qnt_h = 0
-        if s["total_hours_net"] > 0:
-            qnt_h = s["total_quantity"] / s["total_hours_net"]
-            
-        s["efficiency"] = eff
-        s["total_qty_per_hour"] = qnt_h
-        sector_data.append(s)
+        qty_per_hour = np.where(sectors["hours_net"] > 0, sectors["quantity_produced"] / sectors["hours_net"], 0)
+    sector_data = records(pd.DataFrame({
+        "sector_name": sectors["sector_name"],
+        "kpi_target_8h": sectors["kpi_target_8h"],
+        "total_quantity": sectors["quantity_produced"],
+        "total_hours": sectors["hours_total"],
+        "total_downtime": sectors["hours_downtime"],
+        "total_hours_net": sectors["hours_net"],
+        "target_accumulated": sectors["target_accumulated"],
+        "efficiency": efficiency(sectors["quantity_produced"], sectors["target_accumulated"]),
+        "total_qty_per_hour": qty_per_hour
+    }))
         
     return {
         "trend": trend_data,
@@ -917,30 +820,25 @@ def get_kpi_trend(
 
 
 @router.get("/report/advanced/pdf")
-def get_advanced_pdf_report(
+async def get_advanced_pdf_report(
     start_date: date, 
     end_date: date, 
-    sector_name: Optional[str] = None,
-    db: Session = Depends(get_db)
+    sector_name: Optional[str] = None
 ):
-    """Genera Report PDF Avanzato con filtri e dettaglio."""
-    
-    # 1. Recupera Dati
-    query = db.query(KpiEntry).options(
-        joinedload(KpiEntry.kpi_config)
-    ).filter(
-        and_(
-            KpiEntry.work_date >= start_date,
-            KpiEntry.work_date < end_date + timedelta(days=1)
-        )
-    )
+    """Genera Report PDF Avanzato con filtri e dettaglio (dalla cache export se i dati non sono cambiati)."""
+    return await report_response("kpi_advanced_pdf", {
+        "start_date": start_date, "end_date": end_date, "sector_name": sector_name
+    })
+
+
+@report("kpi_advanced_pdf", KpiAdvancedPdfParams, tables=("kpi_entries", "kpi_configs", "kpi_daily_rollups"))
+def render_advanced_pdf(db: Session, params: KpiAdvancedPdfParams) -> ReportFile:
+    """Report PDF Avanzato: dettaglio per giorno/reparto/turno con subtotali."""
+    start_date, end_date, sector_name = params.start_date, params.end_date, params.sector_name
     
-    if sector_name:
-        query = query.join(KpiConfig).filter(KpiConfig.sector_name == sector_name)
-    else:
-        query = query.join(KpiConfig)
-        
-    entries = query.order_by(KpiEntry.work_date, KpiConfig.sector_name, KpiEntry.shift_type).all()
+    # 1. Recupera Dati: una riga per giorno/reparto/turno dai rollup KPI,
+    # note di fermo solo dalle entry che le hanno
+    entries = shift_rows(db, start_date, end_date, sector_name)
     
     # 2. Genera PDF
     buffer = io.BytesIO()
@@ -1004,114 +902,48 @@ def get_advanced_pdf_report(
     headers = ["Data", "Reparto", "Turno", "Pz Prod.", "KPI (8h)", "Pz Manc.", "Pz Extra", "Fermo (h)", "Eff. %", "Note"]
     data = [headers]
     
-    total_qty = 0
-    total_target_all = 0
-    total_downtime_all = 0
-    
-    # Raggruppamento per Data e Reparto
-    # Poiché sorted per Data -> Reparto -> Turno, possiamo iterare e raggruppare
-    from itertools import groupby
-    
-    def get_group_key(entry):
-        return (entry.work_date, entry.kpi_config.sector_name)
-        
-    for key, group in groupby(entries, key=get_group_key):
-        date_val, sector_val = key
-        group_list = list(group)
-        
-        # Totali del gruppo (Subtotale Reparto)
-        sub_qty = 0
-        sub_target_net = 0
-        sub_downtime = 0
-        
-        for e in group_list:
-            # --- Logica Riga Singola ---
-            hours_net = e.hours_net or 0
-            target_8h = e.kpi_config.kpi_target_8h or 0
-            
-            target_real_net = 0
-            if hours_net > 0 and target_8h > 0:
-                target_real_net = target_8h * (hours_net / 8.0)
-                
-            qty = e.quantity_produced
-            delta = qty - target_real_net
-            
-            missing_pcs = ""
-            extra_pcs = ""
-            
-            if delta < 0:
-                missing_pcs = f"{int(abs(delta))}"
-            elif delta > 0:
-                extra_pcs = f"{int(delta)}"
-                
-            eff = 0
-            if target_real_net > 0:
-                eff = round((qty / target_real_net) * 100)
-            
-            # Formattazione Riga
-            shift_map = {"morning": "Mattina", "afternoon": "Pom.", "night": "Notte"}
-            
-            row = [
-                e.work_date.strftime('%d/%m'),
-                e.kpi_config.sector_name[:25],
-                shift_map.get(e.shift_type, e.shift_type),
-                f"{qty}",
-                f"{target_8h}",
-                missing_pcs,
-                extra_pcs,
-                f"{e.hours_downtime:.2f}",
-                f"{eff}%",
-                (e.downtime_reason or "") + (" " + e.downtime_notes if e.downtime_notes else "")
-            ]
-            data.append(row)
-            
-            # --- Accumulo Subtotale ---
-            sub_qty += qty
-            sub_target_net += target_real_net
-            sub_downtime += e.hours_downtime
-            
-        # --- Totale Generale ---
-        total_qty += sub_qty
-        total_target_all += sub_target_net
-        total_downtime_all += sub_downtime
+    # Target netto, mancanti/extra, efficienza e subtotali per Data e Reparto
+    # calcolati in blocco (righe già ordinate per Data -> Reparto -> Turno)
+    table = kpi_shift_table(pd.DataFrame(entries, columns=ShiftRow._fields))
+    rows, groups = table["rows"], table["groups"]
+    shift_map = {"morning": "Mattina", "afternoon": "Pom.", "night": "Notte"}
+    row_cells = list(zip(
+        pd.to_datetime(rows["work_date"]).dt.strftime('%d/%m'),
+        rows["sector_name"].str[:25],
+        rows["shift_type"].map(lambda v: shift_map.get(v, v)),
+        rows["quantity_produced"].astype(str),
+        rows["kpi_target_8h"].astype(str),
+        rows["missing"],
+        rows["extra"],
+        rows["hours_downtime"].map("{:.2f}".format),
+        rows["efficiency"].astype(str) + "%",
+        rows["note"]
+    ))
+    
+    start = 0
+    for group in groups.itertuples():
+        data.extend(list(cells) for cells in row_cells[start:start + group.size])
+        start += group.size
         
-        # --- Riga Subtotale Reparto (Se ci sono più righe o per chiarezza sempre?) ---
+        # --- Riga Subtotale Reparto ---
         # L'utente vuole vedere il totale per quella giornata/reparto.
-        
-        sub_delta = sub_qty - sub_target_net
-        sub_missing = ""
-        sub_extra = ""
-        if sub_delta < 0:
-            sub_missing = f"{int(abs(sub_delta))}"
-        elif sub_delta > 0:
-            sub_extra = f"{int(sub_delta)}"
-            
-        sub_eff = 0
-        if sub_target_net > 0:
-            sub_eff = round((sub_qty / sub_target_net) * 100)
-            
-        sub_row = [
+        data.append([
             "",
             "TOTALE REPARTO", # Label
             "", 
-            f"{sub_qty}", 
+            f"{group.quantity_produced}", 
             "", # KPI 8h non ha senso sommarlo qui, è target netto che conta
-            sub_missing, 
-            sub_extra, 
-            f"{sub_downtime:.2f}", 
-            f"{sub_eff}%", 
+            group.missing, 
+            group.extra, 
+            f"{group.hours_downtime:.2f}", 
+            f"{group.efficiency}%", 
             "" 
-        ]
-        data.append(sub_row)
+        ])
 
     # Riga Totale Generale Finale
-    grand_eff = 0
-    if total_target_all > 0:
-        grand_eff = round((total_qty / total_target_all) * 100)
-        
     total_row = [
-        "TOTALE PERIODO", "", "", f"{total_qty}", "", "", "", 
-        f"{total_downtime_all:.2f}", f"{grand_eff}%", ""
+        "TOTALE PERIODO", "", "", f"{table['total_quantity']}", "", "", "", 
+        f"{table['total_downtime']:.2f}", f"{table['total_efficiency']}%", ""
     ]
     data.append(total_row)
     
@@ -1142,8 +974,7 @@ def get_advanced_pdf_report(
     
     # Bisogna scorrere data per applicare stili riga per riga
     current_row_idx = 1
-    for key, group in groupby(entries, key=get_group_key):
-        group_len = len(list(group))
+    for group_len in groups["size"].tolist():
         
         # Righe Dati (Standard)
         for _ in range(group_len):
@@ -1192,15 +1023,9 @@ def get_advanced_pdf_report(
     
     # Build con callback onFirstPage/onLaterPages per Header/Footer
     doc.build([t], onFirstPage=header_footer, onLaterPages=header_footer)
-    buffer.seek(0)
     
     filename = f"report_avanzato_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}.pdf"
-    
-    return Response(
-        content=buffer.getvalue(),
-        media_type="application/pdf",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
-    )
+    return ReportFile(buffer.getvalue(), filename, "application/pdf")
 
 
 # ============================================================
@@ -1250,6 +1075,7 @@ def update_requirement(req_id: int, data: ShiftRequirementUpdate, db: Session =
     if data.note is not None:
         req.note = data.note
         
+    bump_version(db, STAFFING)
     db.commit()
     return {"status": "updated", "id": req_id}
 
@@ -1277,6 +1103,7 @@ def create_requirement(config_id: int, data: ShiftRequirementCreate, db: Session
         note=data.note
     )
     db.add(new_req)
+    bump_version(db, STAFFING)
     db.commit()
     db.refresh(new_req)
     return new_req
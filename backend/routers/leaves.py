@@ -12,6 +12,7 @@ from schemas import (
     LeaveRequestCreate, LeaveRequestResponse, LeaveReviewRequest, LeaveRequestUpdate, MessageResponse
 )
 from security import get_current_user, get_hr_or_admin
+from date_ranges import overlaps_days
 
 router = APIRouter(prefix="/leaves", tags=["Ferie e Permessi"])
 
@@ -41,13 +42,9 @@ async def list_leave_requests(
         query = query.filter(LeaveRequest.employee_id == employee_id)
 
     if start_date and end_date:
-        # Overlap logic using DATE-only comparison (ignores time component)
-        # This ensures hourly permits (e.g. 14:00-16:00) are caught when filtering by day
-        from sqlalchemy import func as sa_func
-        query = query.filter(
-            sa_func.date(LeaveRequest.start_date) <= sa_func.date(end_date),
-            sa_func.date(LeaveRequest.end_date) >= sa_func.date(start_date)
-        )
+        # Overlap per giorni interi (ignora l'orario): i permessi orari (es. 14:00-16:00)
+        # vengono inclusi quando si filtra per giorno
+        query = query.filter(overlaps_days(LeaveRequest.start_date, LeaveRequest.end_date, start_date, end_date))
     
     from sqlalchemy.orm import joinedload
     requests = query.options(
@@ -252,9 +249,8 @@ async def get_employee_leave_hours(
             ore_usate += days * 8
     
     # Get system default hours
-    from models.config import SystemSetting
-    default_setting = db.query(SystemSetting).filter(SystemSetting.key == "annual_leave_hours").first()
-    system_default = int(default_setting.value) if default_setting and default_setting.value.isdigit() else 256
+    from settings_cache import get_int, SYSTEM
+    system_default = get_int(db, SYSTEM, "annual_leave_hours", 256)
 
     ore_totali = employee.annual_leave_hours or system_default
     ore_rimanenti = ore_totali - ore_usate
@@ -296,9 +292,8 @@ async def get_all_employees_hours(
     end_of_year = datetime(year, 12, 31, 23, 59, 59)
     
     # Get system default hours (once for the loop)
-    from models.config import SystemSetting
-    default_setting = db.query(SystemSetting).filter(SystemSetting.key == "annual_leave_hours").first()
-    system_default = int(default_setting.value) if default_setting and default_setting.value.isdigit() else 256
+    from settings_cache import get_int, SYSTEM
+    system_default = get_int(db, SYSTEM, "annual_leave_hours", 256)
 
     summary = []
     for emp in employees:
@@ -3,12 +3,13 @@ SL Enterprise - Logistics Router
 API per il sistema Richiesta Materiale (Uber-style)
 """
 from fastapi import APIRouter, Depends, HTTPException, Query, Body
+from fastapi.encoders import jsonable_encoder
 from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import func, and_, or_
 from typing import List, Optional
 from datetime import datetime, timedelta
 
-from database import get_db
+from database import get_db, get_read_db
 from security import get_current_user
 from models.core import User
 from models.factory import Banchina
@@ -28,6 +29,10 @@ from schemas_logistics import (
     LogisticsConfigResponse, LogisticsConfigBulk
 )
 from websocket_manager import get_logistics_manager
+from logistics_escalation import track_request, untrack_requests
+from logistics_pool import get_live_pool, invalidate_live_pool, ACTIVE_STATUSES
+from settings_cache import get_setting, get_int, bump_version, LOGISTICS
+from logistics_stats import record_completion, rebuild_performance, reaction_summary
 
 router = APIRouter(prefix="/logistics", tags=["Logistics"])
 
@@ -37,14 +42,13 @@ router = APIRouter(prefix="/logistics", tags=["Logistics"])
 # ============================================================
 
 def get_config_value(db: Session, key: str, default: str = "0") -> str:
-    """Ottieni valore configurazione."""
-    config = db.query(LogisticsConfig).filter(LogisticsConfig.config_key == key).first()
-    return config.config_value if config else default
+    """Ottieni valore configurazione (dalla cache impostazioni, senza query)."""
+    return get_setting(db, LOGISTICS, key, default)
 
 
-def get_or_create_performance(db: Session, employee_id: int) -> LogisticsPerformance:
+def get_or_create_performance(db: Session, employee_id: int, now: Optional[datetime] = None) -> LogisticsPerformance:
     """Ottieni o crea record performance mensile."""
-    now = datetime.utcnow()
+    now = now or datetime.utcnow()
     perf = db.query(LogisticsPerformance).filter(
         LogisticsPerformance.employee_id == employee_id,
         LogisticsPerformance.month == now.month,
@@ -151,6 +155,80 @@ def enrich_request_response(request: LogisticsRequest) -> dict:
     return data
 
 
+def with_auto_urgent(request: LogisticsRequest, now: datetime, threshold_sla: int) -> dict:
+    """Richiesta arricchita + flag 'is_auto_urgent' (in pool da più di threshold_sla minuti)."""
+    item = enrich_request_response(request)
+    if request.status in ('pending', 'prepared'):
+        base_time = request.prepared_at if request.status == 'prepared' and request.prepared_at else request.created_at
+        item['is_auto_urgent'] = (now - base_time).total_seconds() > (threshold_sla * 60)
+    else:
+        item['is_auto_urgent'] = False
+    return item
+
+
+def get_pool_counters(db: Session) -> dict:
+    """Contatori del pool (pending+prepared, urgenti attivi) in UNA query raggruppata."""
+    rows = db.query(
+        LogisticsRequest.status, LogisticsRequest.is_urgent, func.count(LogisticsRequest.id)
+    ).filter(
+        LogisticsRequest.status.in_(["pending", "prepared", "processing"])
+    ).group_by(LogisticsRequest.status, LogisticsRequest.is_urgent).all()
+
+    pending_count = sum(n for status, _, n in rows if status in ("pending", "prepared"))
+    urgent_count = sum(n for status, urgent, n in rows if urgent and status in ("pending", "processing"))
+    return {"pending_count": pending_count, "urgent_count": urgent_count}
+
+
+async def broadcast_request_event(db: Session, event_type: str, request_ids: List[int]):
+    """
+    Evento WebSocket "delta" sul pool logistica: la richiesta arricchita (come in
+    GET /requests) + i contatori del pool. I client aggiornano la lista in locale
+    invece di rileggere GET /requests a ogni cambio di stato.
+    Richieste non più esistenti (eliminate) -> solo request_id + contatori.
+
+    È anche il punto unico di aggiornamento del pool in memoria (logistics_pool):
+    l'evento viene applicato qui, prima di calcolare i contatori, e dagli altri
+    worker quando lo ricevono dal broker ("version" = LogisticsRequest.version:
+    il pool scarta gli eventi più vecchi di quello già applicato).
+    """
+    pool = get_live_pool()
+    try:
+        requests = db.query(LogisticsRequest).options(
+            joinedload(LogisticsRequest.material_type),
+            joinedload(LogisticsRequest.banchina),
+            joinedload(LogisticsRequest.requester),
+            joinedload(LogisticsRequest.assigned_to),
+            joinedload(LogisticsRequest.prepared_by)
+        ).filter(LogisticsRequest.id.in_(request_ids)).all()
+        by_id = {r.id: r for r in requests}
+        threshold_sla = get_int(db, LOGISTICS, "threshold_sla_warning_minutes", 3)
+        now = datetime.utcnow()
+
+        events = []
+        for request_id in request_ids:
+            event = {"type": event_type, "request_id": request_id}
+            request = by_id.get(request_id)
+            if request is not None:
+                event["status"] = request.status
+                event["version"] = request.version
+                event["request"] = jsonable_encoder(with_auto_urgent(request, now, threshold_sla))
+            pool.apply_event(event)
+            events.append(event)
+        counters = pool.counters()
+    except Exception as e:
+        # Stato in memoria non più affidabile: la prossima lettura ricarica dal DB
+        pool.invalidate()
+        print(f"[LIVE POOL ERROR] Aggiornamento {event_type} fallito: {e}")
+        return
+
+    try:
+        lm = get_logistics_manager()
+        for event in events:
+            await lm.broadcast("logistics", {**event, **counters})
+    except Exception as e:
+        print(f"[WS ERROR] Broadcast {event_type} fallito: {e}")
+
+
 # ============================================================
 # MATERIAL TYPES (Admin CRUD)
 # ============================================================
@@ -205,6 +283,8 @@ async def update_material_type(
     
     db.commit()
     db.refresh(material)
+    # Etichetta/icona/unità delle richieste attive nel pool
+    invalidate_live_pool()
     return material
 
 
@@ -294,79 +374,42 @@ async def create_request(
     db.add(request)
     db.commit()
     db.refresh(request)
+    track_request(request)
     
     # WebSocket Broadcast
-    try:
-        lm = get_logistics_manager()
-        await lm.broadcast("logistics", {"type": "new_request", "request_id": request.id})
-    except Exception as e:
-        print(f"[WS ERROR] Broadcast fallito: {e}")
+    await broadcast_request_event(db, "new_request", [request.id])
     
     # ── Web Push Notifications ──────────────────────────────────
     try:
-        from models.chat import PushSubscription
         from push_service import send_logistics_push
+        from permission_index import resolve_push_targets
+
+        # Utenti target: manage_logistics_pool OR supervise_logistics OR super_admin (indice in memoria)
+        subs = resolve_push_targets(
+            db,
+            permissions=("manage_logistics_pool", "supervise_logistics"),
+            roles=("super_admin",),
+            exclude_user_id=current_user.id  # Escludi il richiedente stesso
+        )
 
-        # Trova utenti target: manage_logistics_pool OR supervise_logistics OR super_admin
-        target_user_ids = set()
-
-        # 1. Super admin (role field legacy)
-        super_admins = db.query(User.id).filter(User.role == "super_admin", User.is_active == True).all()
-        target_user_ids.update(uid for (uid,) in super_admins)
-
-        # 2. Utenti con permessi logistics tramite Role JSON
-        from models.core import Role
-        all_roles = db.query(Role).all()
-        target_role_ids = []
-        for r in all_roles:
-            perms = r.permissions or []
-            if "*" in perms or "manage_logistics_pool" in perms or "supervise_logistics" in perms:
-                target_role_ids.append(r.id)
-
-        if target_role_ids:
-            users_with_roles = db.query(User.id).filter(
-                User.role_id.in_(target_role_ids),
-                User.is_active == True
-            ).all()
-            target_user_ids.update(uid for (uid,) in users_with_roles)
-
-        # Escludi il richiedente stesso
-        target_user_ids.discard(current_user.id)
-
-        if target_user_ids:
-            # Recupera subscriptions
-            subs = db.query(PushSubscription).filter(
-                PushSubscription.user_id.in_(list(target_user_ids))
-            ).all()
-
-            dead_subs = []
+        if subs:
+            queued = 0
             mat_label = material.label if material else "Materiale"
             ban_code = request.banchina.code if request.banchina else "?"
             req_name = current_user.full_name or current_user.username
 
-            for sub in subs:
-                subscription_info = {
-                    "endpoint": sub.endpoint,
-                    "keys": {"p256dh": sub.p256dh_key, "auth": sub.auth_key}
-                }
-                success = send_logistics_push(
+            for subscription_info in subs:
+                # Solo accodamento: invio e pulizia subscription scadute nel dispatcher
+                if send_logistics_push(
                     subscription_info=subscription_info,
                     material_label=mat_label,
                     banchina_code=ban_code,
                     requester_name=req_name,
                     is_urgent=False
-                )
-                if not success:
-                    dead_subs.append(sub)
+                ):
+                    queued += 1
 
-            # Cleanup subscription scadute
-            for sub in dead_subs:
-                db.delete(sub)
-            if dead_subs:
-                db.commit()
-                print(f"[PUSH] Cleaned {len(dead_subs)} dead subscriptions")
-
-            print(f"[PUSH] Logistics push inviati a {len(subs) - len(dead_subs)}/{len(subs)} subscriptions")
+            print(f"[PUSH] Logistics push accodati {queued}/{len(subs)} subscriptions")
 
     except Exception as e:
         print(f"[PUSH ERROR] Invio push logistics fallito: {e}")
@@ -405,13 +448,10 @@ async def cancel_request(
     request.cancellation_reason = reason or f"Annullata da {current_user.full_name or current_user.username}"
     
     db.commit()
+    untrack_requests([request.id])
     
     # WS Broadcast per aggiornare le dashboard
-    try:
-        lm = get_logistics_manager()
-        await lm.broadcast("logistics", {"type": "request_updated", "request_id": request.id})
-    except Exception as e:
-        print(f"[WS ERROR] Broadcast cancel fallito: {e}")
+    await broadcast_request_event(db, "request_updated", [request.id])
     
     return {"message": "Richiesta annullata"}
 
@@ -432,6 +472,7 @@ async def delete_request(
         raise HTTPException(404, "Richiesta non trovata")
 
     # Rollback punti/penalità sull'operatore se la richiesta è stata completata
+    rebuild_for = None
     if request.status == "completed" and request.assigned_to and request.assigned_to.employee:
         employee_id = request.assigned_to.employee.id
         now = request.completed_at or datetime.utcnow()
@@ -443,20 +484,19 @@ async def delete_request(
         if perf:
             perf.total_points = max(0, perf.total_points - (request.points_awarded or 0))
             perf.penalties_received = max(0, perf.penalties_received - (request.penalty_applied or 0))
-            perf.missions_completed = max(0, perf.missions_completed - 1)
-            if request.is_urgent:
-                perf.missions_urgent = max(0, perf.missions_urgent - 1)
+            # Missioni e tempi di reazione: ricalcolati sotto dalle richieste rimaste
+            rebuild_for = (now.year, now.month, employee_id)
 
     # Cancella messaggi collegati (cascade) e poi la richiesta
     db.delete(request)
+    if rebuild_for:
+        db.flush()
+        rebuild_performance(db, *rebuild_for)
     db.commit()
+    untrack_requests([request_id])
 
     # WebSocket Broadcast
-    try:
-        lm = get_logistics_manager()
-        await lm.broadcast("logistics", {"type": "request_deleted", "request_id": request_id})
-    except Exception as e:
-        print(f"[WS ERROR] Broadcast delete fallito: {e}")
+    await broadcast_request_event(db, "request_deleted", [request_id])
 
     return {"message": "Richiesta eliminata definitivamente"}
 
@@ -505,11 +545,7 @@ async def edit_request_points(
     db.commit()
 
     # WebSocket Broadcast
-    try:
-        lm = get_logistics_manager()
-        await lm.broadcast("logistics", {"type": "request_updated", "request_id": request_id})
-    except Exception as e:
-        print(f"[WS ERROR] Broadcast edit-points fallito: {e}")
+    await broadcast_request_event(db, "request_updated", [request_id])
 
     return {"message": "Punteggi aggiornati", "points_awarded": new_points, "penalty_applied": new_penalty}
 
@@ -544,14 +580,10 @@ async def take_requests_batch(
         taken_count += 1
     
     db.commit()
+    untrack_requests([req.id for req in requests])
     
-    # WebSocket Broadcast for each taken request
-    try:
-        lm = get_logistics_manager()
-        for req in requests:
-            await lm.broadcast("logistics", {"type": "request_updated", "request_id": req.id, "status": "processing"})
-    except Exception as e:
-        print(f"[WS ERROR] Broadcast fallito per take-batch: {e}")
+    # WebSocket Broadcast for each taken request (una sola lettura per tutto il blocco)
+    await broadcast_request_event(db, "request_updated", [req.id for req in requests])
     
     return {"message": f"{taken_count} richieste prese in carico", "count": taken_count}
 
@@ -564,10 +596,24 @@ async def list_requests(
     my_requests: bool = False,
     my_assigned: bool = False,
     limit: int = 50,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """Lista richieste con filtri."""
+    # Pool attivo (pending/active/stati in corso): dallo stato in memoria, senza DB
+    if status in ("pending", "active") + ACTIVE_STATUSES:
+        pool = get_live_pool()
+        if pool.ensure_loaded():
+            items, counters = pool.query(
+                status,
+                banchina_id=banchina_id,
+                requester_id=current_user.id if my_requests else None,
+                assignee_id=current_user.id if my_assigned else None,
+                limit=limit,
+                threshold_sla=get_int(db, LOGISTICS, "threshold_sla_warning_minutes", 3)
+            )
+            return {"items": items, "total": len(items), **counters}
+
     query = db.query(LogisticsRequest).options(
         joinedload(LogisticsRequest.material_type),
         joinedload(LogisticsRequest.banchina),
@@ -605,37 +651,15 @@ async def list_requests(
     
     # Auto-Priority Logic (On Read)
     # Se una richiesta è pending da > X min, segnarla come "Late" (visivamente) o scalarla
-    # Qui aggiungiamo solo un flag 'is_late_auto' nella risposta arricchita, senza scrivere su DB per performance
+    # Qui aggiungiamo solo un flag 'is_auto_urgent' nella risposta arricchita, senza scrivere su DB per performance
     now = datetime.utcnow()
-    enriched_items = []
-    
     threshold_sla = int(get_config_value(db, "threshold_sla_warning_minutes", "3"))
-
-    for r in requests:
-        item = enrich_request_response(r)
-        # Calcola se è "late" (automatico)
-        if r.status in ('pending', 'prepared'):
-            base_time = r.prepared_at if r.status == 'prepared' and r.prepared_at else r.created_at
-            if (now - base_time).total_seconds() > (threshold_sla * 60):
-                item['is_auto_urgent'] = True
-            else:
-                item['is_auto_urgent'] = False
-        else:
-            item['is_auto_urgent'] = False
-        enriched_items.append(item)
-    
-    # Conta per stats
-    pending_count = db.query(LogisticsRequest).filter(LogisticsRequest.status.in_(["pending", "prepared"])).count()
-    urgent_count = db.query(LogisticsRequest).filter(
-        LogisticsRequest.is_urgent == True,
-        LogisticsRequest.status.in_(["pending", "processing"])
-    ).count()
+    enriched_items = [with_auto_urgent(r, now, threshold_sla) for r in requests]
     
     return {
         "items": enriched_items,
         "total": len(requests),
-        "pending_count": pending_count,
-        "urgent_count": urgent_count
+        **get_pool_counters(db)
     }
 
 
@@ -691,13 +715,10 @@ async def take_request(
     request.promised_eta_minutes = data.promised_eta_minutes
     
     db.commit()
+    untrack_requests([request_id])
     
     # WebSocket Broadcast
-    try:
-        lm = get_logistics_manager()
-        await lm.broadcast("logistics", {"type": "request_updated", "request_id": request_id, "status": request.status})
-    except Exception as e:
-        print(f"[WS ERROR] Broadcast fallito per take_request: {e}")
+    await broadcast_request_event(db, "request_updated", [request_id])
     
     return {"message": "Richiesta presa in carico", "eta_minutes": data.promised_eta_minutes, "mode": mode}
 
@@ -732,11 +753,7 @@ async def mark_prepared(
     db.commit()
     
     # WebSocket Broadcast
-    try:
-        lm = get_logistics_manager()
-        await lm.broadcast("logistics", {"type": "request_prepared", "request_id": request_id})
-    except Exception as e:
-        print(f"[WS ERROR] Broadcast fallito per mark_prepared: {e}")
+    await broadcast_request_event(db, "request_prepared", [request_id])
     
     return {"message": "Materiale preparato! Torna in piscina per il ritiro."}
 
@@ -780,36 +797,23 @@ async def complete_request(
     request.points_awarded = points
     request.penalty_applied = penalty
     
-    # Aggiorna performance mensile
-    if current_user.employee:
-        perf = get_or_create_performance(db, current_user.employee.id)
+    # Aggiorna performance mensile dell'operatore assegnato (come rollback ed edit-points)
+    operator = request.assigned_to or current_user
+    if operator.employee:
+        perf = get_or_create_performance(db, operator.employee.id, request.completed_at)
         perf.missions_completed += 1
         if request.is_urgent:
             perf.missions_urgent += 1
         perf.total_points += points
         perf.penalties_received += penalty
         
-        # Aggiorna media reazione
-        if request.wait_time_seconds:
-            reaction = int(request.wait_time_seconds)
-            if perf.avg_reaction_seconds:
-                # Media mobile
-                perf.avg_reaction_seconds = int((perf.avg_reaction_seconds + reaction) / 2)
-            else:
-                perf.avg_reaction_seconds = reaction
-            
-            # Record personale
-            if not perf.fastest_reaction_seconds or reaction < perf.fastest_reaction_seconds:
-                perf.fastest_reaction_seconds = reaction
+        # Tempo di reazione ed ETA: aggregati incrementali (media, record, percentili)
+        record_completion(perf, request)
     
     db.commit()
     
     # WebSocket Broadcast
-    try:
-        lm = get_logistics_manager()
-        await lm.broadcast("logistics", {"type": "request_completed", "request_id": request_id})
-    except Exception as e:
-        print(f"[WS ERROR] Broadcast fallito per complete_request: {e}")
+    await broadcast_request_event(db, "request_completed", [request_id])
     
     # TODO: Notifica al richiedente
     
@@ -860,6 +864,11 @@ async def release_request(
         perf.penalties_received += penalty
     
     db.commit()
+    if request.status == "pending":
+        track_request(request)
+    
+    # WebSocket Broadcast (torna nel pool)
+    await broadcast_request_event(db, "request_updated", [request_id])
     
     return {"message": "Richiesta rilasciata", "penalty_applied": penalty}
 
@@ -899,6 +908,9 @@ async def mark_urgent(
     
     db.commit()
     
+    # WebSocket Broadcast (urgenti in cima, contatore urgenti)
+    await broadcast_request_event(db, "request_updated", [request_id])
+    
     # TODO: Notifica al magazziniere e al coordinatore
     
     return {"message": "Richiesta marcata come urgente"}
@@ -1153,7 +1165,8 @@ async def my_performance(
         "fastest_reaction_seconds": perf.fastest_reaction_seconds,
         "eta_accuracy_percent": perf.eta_accuracy_percent,
         "urgency_requests_received": perf.urgency_requests_received,
-        "net_points": perf.total_points - perf.penalties_received
+        "net_points": perf.total_points - perf.penalties_received,
+        **reaction_summary(perf)
     }
 
 
@@ -1185,7 +1198,8 @@ async def get_employee_performance(
         "fastest_reaction_seconds": perf.fastest_reaction_seconds,
         "eta_accuracy_percent": perf.eta_accuracy_percent,
         "urgency_requests_received": perf.urgency_requests_received,
-        "net_points": perf.total_points - perf.penalties_received
+        "net_points": perf.total_points - perf.penalties_received,
+        **reaction_summary(perf)
     }
 
 
@@ -1193,7 +1207,7 @@ async def get_employee_performance(
 async def leaderboard(
     month: Optional[int] = None,
     year: Optional[int] = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """Classifica mensile magazzinieri."""
@@ -1207,7 +1221,10 @@ async def leaderboard(
         LogisticsPerformance.month == target_month,
         LogisticsPerformance.year == target_year
     ).order_by(
-        (LogisticsPerformance.total_points - LogisticsPerformance.penalties_received).desc()
+        (LogisticsPerformance.total_points - LogisticsPerformance.penalties_received).desc(),
+        # A parità di punti: reazione media più rapida (chi non ha missioni in fondo)
+        LogisticsPerformance.avg_reaction_seconds.is_(None),
+        LogisticsPerformance.avg_reaction_seconds.asc()
     ).all()
     
     entries = []
@@ -1220,7 +1237,10 @@ async def leaderboard(
             "total_points": p.total_points,
             "penalties_received": p.penalties_received,
             "net_points": p.total_points - p.penalties_received,
-            "avg_reaction_seconds": p.avg_reaction_seconds
+            "avg_reaction_seconds": p.avg_reaction_seconds,
+            "fastest_reaction_seconds": p.fastest_reaction_seconds,
+            "eta_accuracy_percent": p.eta_accuracy_percent,
+            **reaction_summary(p)
         })
     
     return {
@@ -1264,5 +1284,9 @@ async def update_config(
         config = LogisticsConfig(config_key=key, config_value=value)
         db.add(config)
     
+    bump_version(db, LOGISTICS)
     db.commit()
+    if key.startswith("escalation_"):
+        from logistics_escalation import get_escalation_engine
+        get_escalation_engine().reload()
     return {"message": f"Configurazione {key} aggiornata"}
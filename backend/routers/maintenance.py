@@ -85,7 +85,7 @@ def report_maintenance_issue(
     
     # --- CREATE NOTIFICATIONS ---
     # Notify Admin and Maintenance roles
-    from models.core import Notification
+    from notification_service import NotificationService
     
     # Resolve machine name for the message
     # new_request.machine might not be loaded yet in session, so we use logic or reload
@@ -98,27 +98,16 @@ def report_maintenance_issue(
     title = f"{prio_emoji} GUASTO: {machine_name}"
     message = f"Segnalato guasto {report.priority.upper()} da operatore. Tipo: {report.problem_type}"
     
-    # 1. Notify Admin
-    notif_admin = Notification(
-        recipient_role="admin",
+    # Notify Admin + Maintenance Role (if exists)
+    NotificationService(db).notify(
+        roles=("admin", "maintenance"),
         notif_type="priority" if report.priority == 'high' else "alert",
         title=title,
         message=message,
         link_url="/factory/maintenance",
-        created_at=datetime.now()
-    )
-    db.add(notif_admin)
-    
-    # 2. Notify Maintenance Role (if exists)
-    notif_maint = Notification(
-        recipient_role="maintenance", # Assuming 'maintenance' role exists
-        notif_type="priority" if report.priority == 'high' else "alert",
-        title=title,
-        message=message,
-        link_url="/factory/maintenance",
-        created_at=datetime.now()
+        created_at=datetime.now(),
+        dedupe=False  # Ogni segnalazione è un guasto distinto
     )
-    db.add(notif_maint)
     
     db.commit()
     
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func, desc, or_
+from sqlalchemy import desc, or_
 from typing import List, Optional
 from datetime import datetime, time, timedelta
 import json
@@ -15,6 +15,7 @@ from models.production import ProductionSession, SessionOperator
 from models.factory import Banchina, Machine
 from models.production import ProductionEntry, MachineDowntime, KpiEntry, KpiConfig, DowntimeReason
 from security import get_current_user
+from date_ranges import on_day
 
 router = APIRouter(prefix="/mobile", tags=["Mobile Operator"])
 
@@ -38,7 +39,7 @@ def aggregate_kpi_production(db: Session, assignment: ShiftAssignment, qty: int,
     
     entry = db.query(KpiEntry).filter(
         KpiEntry.kpi_config_id == config.id,
-        func.date(KpiEntry.work_date) == today.date(),
+        on_day(KpiEntry.work_date, today.date()),
         KpiEntry.shift_type == shift
     ).first()
     
@@ -80,7 +81,7 @@ def aggregate_kpi_downtime(db: Session, assignment: ShiftAssignment, minutes: in
     
     entry = db.query(KpiEntry).filter(
         KpiEntry.kpi_config_id == config.id,
-        func.date(KpiEntry.work_date) == today.date(),
+        on_day(KpiEntry.work_date, today.date()),
         KpiEntry.shift_type == shift
     ).first()
     
@@ -129,7 +130,7 @@ async def update_production(
         joinedload(ShiftAssignment.requirement)
     ).filter(
         ShiftAssignment.employee_id == employee.id,
-        func.date(ShiftAssignment.work_date) == today.date(),
+        on_day(ShiftAssignment.work_date, today.date()),
         ShiftAssignment.shift_type == current_shift
     ).first()
     
@@ -179,7 +180,7 @@ async def start_downtime(
     
     assignment = db.query(ShiftAssignment).filter(
         ShiftAssignment.employee_id == employee.id,
-        func.date(ShiftAssignment.work_date) == today.date(),
+        on_day(ShiftAssignment.work_date, today.date()),
         ShiftAssignment.shift_type == current_shift
     ).first()
     
@@ -239,7 +240,7 @@ async def stop_downtime(
         joinedload(ShiftAssignment.requirement)
     ).filter(
         ShiftAssignment.employee_id == employee.id,
-        func.date(ShiftAssignment.work_date) == today.date(),
+        on_day(ShiftAssignment.work_date, today.date()),
         ShiftAssignment.shift_type == current_shift
     ).first()
     
@@ -291,7 +292,7 @@ async def get_mobile_status(
     
     assignment = db.query(ShiftAssignment).filter(
         ShiftAssignment.employee_id == employee.id,
-        func.date(ShiftAssignment.work_date) == today.date(),
+        on_day(ShiftAssignment.work_date, today.date()),
         ShiftAssignment.shift_type == current_shift
     ).first()
     
@@ -326,15 +327,12 @@ async def get_downtime_reasons(
     current_user: User = Depends(get_current_user)
 ):
     """Ritorna lista causali fermo pre-configurate per selezione mobile."""
-    reasons = db.query(DowntimeReason).filter(
-        DowntimeReason.is_active == True
-    ).all()
-    
+    from settings_cache import get_lookup
     return [{
-        "id": r.id,
-        "label": r.label,
-        "category": r.category
-    } for r in reasons]
+        "id": r["id"],
+        "label": r["label"],
+        "category": r["category"]
+    } for r in get_lookup(db, "downtime_reasons") if r["is_active"]]
 
 
 class CrewConfirmRequest(BaseModel):
@@ -365,7 +363,7 @@ async def confirm_crew(
             # Mark ALL assignments for this requirement/date/shift_type as checked in
             db.query(ShiftAssignment).filter(
                 ShiftAssignment.requirement_id == shift.requirement_id,
-                func.date(ShiftAssignment.work_date) == today,
+                on_day(ShiftAssignment.work_date, today),
                 ShiftAssignment.shift_type == shift.shift_type
             ).update({"checked_in_at": datetime.now()})
             db.commit()
@@ -404,7 +402,7 @@ async def close_shift(
     if shift.requirement_id:
         db.query(ShiftAssignment).filter(
             ShiftAssignment.requirement_id == shift.requirement_id,
-            func.date(ShiftAssignment.work_date) == today,
+            on_day(ShiftAssignment.work_date, today),
             ShiftAssignment.shift_type == shift.shift_type
         ).update({
             "is_closed": True,
@@ -443,7 +441,7 @@ async def get_kpi_downtimes(
         ShiftRequirement, ShiftAssignment.requirement_id == ShiftRequirement.id
     ).filter(
         ShiftRequirement.kpi_sector == config.sector_name,
-        func.date(ShiftAssignment.work_date) == target_date,
+        on_day(ShiftAssignment.work_date, target_date),
         ShiftAssignment.shift_type == shift_type,
         MachineDowntime.ended_at.isnot(None)  # Only closed downtimes
     ).all()
@@ -505,7 +503,7 @@ async def get_my_assignment(
         joinedload(ShiftAssignment.requirement)
     ).filter(
         ShiftAssignment.employee_id == employee.id,
-        func.date(ShiftAssignment.work_date) == today,
+        on_day(ShiftAssignment.work_date, today),
         ShiftAssignment.shift_type == current_shift
     ).first()
     
@@ -515,7 +513,7 @@ async def get_my_assignment(
             joinedload(ShiftAssignment.requirement)
         ).filter(
             ShiftAssignment.employee_id == employee.id,
-            func.date(ShiftAssignment.work_date) == today,
+            on_day(ShiftAssignment.work_date, today),
             ShiftAssignment.shift_type == "manual"
         ).first()
     
@@ -565,7 +563,7 @@ async def get_my_assignment(
     actual_shift_type = explicit_assign.shift_type
     crew_members = db.query(Employee).join(ShiftAssignment).filter(
         ShiftAssignment.requirement_id == requirement.id,
-        func.date(ShiftAssignment.work_date) == today,
+        on_day(ShiftAssignment.work_date, today),
         ShiftAssignment.shift_type == actual_shift_type,
         Employee.id != employee.id
     ).all()
@@ -620,7 +618,7 @@ async def mobile_check_in(
     # 1. Crea/Aggiorna assignment per il LEADER
     leader_assign = db.query(ShiftAssignment).filter(
         ShiftAssignment.employee_id == employee.id,
-        func.date(ShiftAssignment.work_date) == today.date(),
+        on_day(ShiftAssignment.work_date, today.date()),
         ShiftAssignment.shift_type == current_shift
     ).first()
     
@@ -665,7 +663,7 @@ async def mobile_check_in(
             
         member_assign = db.query(ShiftAssignment).filter(
             ShiftAssignment.employee_id == member_id,
-            func.date(ShiftAssignment.work_date) == today.date(),
+            on_day(ShiftAssignment.work_date, today.date()),
             ShiftAssignment.shift_type == current_shift
         ).first()
         
@@ -3,6 +3,7 @@ SL Enterprise - Notifications Router
 Centro notifiche.
 """
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from typing import List
 from datetime import datetime
@@ -10,10 +11,32 @@ from datetime import datetime
 from database import get_db, Notification, User
 from schemas import NotificationResponse, MessageResponse
 from security import get_current_user
+from websocket_manager import visible_notification_roles
+from badges import queue_notification_delta
 
 router = APIRouter(prefix="/notifications", tags=["Notifiche"])
 
 
+def _recipient_filter(current_user: User):
+    """Notifiche dell'utente + notifiche per ruolo visibili (super_admin/admin vedono anche altri ruoli)."""
+    return (Notification.recipient_user_id == current_user.id) | \
+        Notification.recipient_role.in_(visible_notification_roles(current_user.role))
+
+
+def _queue_unread_removal(db: Session, *criteria):
+    """
+    Delta badge per UPDATE/DELETE in blocco (non passano dal flush ORM):
+    conta le non lette coinvolte per destinatario PRIMA della modifica.
+    """
+    rows = db.query(
+        Notification.recipient_user_id, Notification.recipient_role, func.count(Notification.id)
+    ).filter(*criteria, Notification.is_read == False).group_by(
+        Notification.recipient_user_id, Notification.recipient_role
+    ).all()
+    for user_id, role, count in rows:
+        queue_notification_delta(db, user_id, role, -count)
+
+
 @router.get("/", response_model=List[NotificationResponse], summary="Le Mie Notifiche")
 async def get_my_notifications(
     unread_only: bool = False,
@@ -22,30 +45,8 @@ async def get_my_notifications(
     current_user: User = Depends(get_current_user)
 ):
     """Lista notifiche per utente corrente."""
-    # Build role-based filter: admins can see hr_manager notifications
-    user_role = current_user.role
-    role_filter = (Notification.recipient_role == user_role)
-    
-    # Super admins see EVERYTHING
-    if user_role == 'super_admin':
-        from sqlalchemy import or_
-        role_filter = or_(
-            Notification.recipient_role == 'super_admin',
-            Notification.recipient_role == 'admin',
-            Notification.recipient_role == 'hr_manager',
-            Notification.recipient_role == 'maintenance',
-            Notification.recipient_role == 'production_manager'
-        )
-    elif user_role == 'admin':
-        from sqlalchemy import or_
-        role_filter = or_(
-            Notification.recipient_role == 'admin',
-            Notification.recipient_role == 'hr_manager',
-            Notification.recipient_role == 'maintenance'
-        )
-    
     query = db.query(Notification).filter(
-        (Notification.recipient_user_id == current_user.id) | role_filter
+        _recipient_filter(current_user)
     )
     
     if unread_only:
@@ -61,28 +62,8 @@ async def get_unread_count(
     current_user: User = Depends(get_current_user)
 ):
     """Conteggio notifiche non lette."""
-    from sqlalchemy import or_
-    
-    user_role = current_user.role
-    role_filter = (Notification.recipient_role == user_role)
-    
-    if user_role == 'super_admin':
-        role_filter = or_(
-            Notification.recipient_role == 'super_admin',
-            Notification.recipient_role == 'admin',
-            Notification.recipient_role == 'hr_manager',
-            Notification.recipient_role == 'maintenance',
-            Notification.recipient_role == 'production_manager'
-        )
-    elif user_role == 'admin':
-        role_filter = or_(
-            Notification.recipient_role == 'admin',
-            Notification.recipient_role == 'hr_manager',
-            Notification.recipient_role == 'maintenance'
-        )
-    
     count = db.query(Notification).filter(
-        (Notification.recipient_user_id == current_user.id) | role_filter,
+        _recipient_filter(current_user),
         Notification.is_read == False
     ).count()
     
@@ -113,28 +94,9 @@ async def mark_all_as_read(
     current_user: User = Depends(get_current_user)
 ):
     """Segna tutte le notifiche come lette."""
-    from sqlalchemy import or_
-    
-    user_role = current_user.role
-    role_filter = (Notification.recipient_role == user_role)
-    
-    if user_role == 'super_admin':
-        role_filter = or_(
-            Notification.recipient_role == 'super_admin',
-            Notification.recipient_role == 'admin',
-            Notification.recipient_role == 'hr_manager',
-            Notification.recipient_role == 'maintenance',
-            Notification.recipient_role == 'production_manager'
-        )
-    elif user_role == 'admin':
-        role_filter = or_(
-            Notification.recipient_role == 'admin',
-            Notification.recipient_role == 'hr_manager',
-            Notification.recipient_role == 'maintenance'
-        )
-    
+    _queue_unread_removal(db, _recipient_filter(current_user))
     db.query(Notification).filter(
-        (Notification.recipient_user_id == current_user.id) | role_filter,
+        _recipient_filter(current_user),
         Notification.is_read == False
     ).update({"is_read": True, "read_at": datetime.now()}, synchronize_session=False)
     
@@ -149,28 +111,8 @@ async def clear_read_notifications(
     current_user: User = Depends(get_current_user)
 ):
     """Elimina definitivamente tutte le notifiche lette dell'utente."""
-    from sqlalchemy import or_
-    
-    user_role = current_user.role
-    role_filter = (Notification.recipient_role == user_role)
-    
-    if user_role == 'super_admin':
-        role_filter = or_(
-            Notification.recipient_role == 'super_admin',
-            Notification.recipient_role == 'admin',
-            Notification.recipient_role == 'hr_manager',
-            Notification.recipient_role == 'maintenance',
-            Notification.recipient_role == 'production_manager'
-        )
-    elif user_role == 'admin':
-        role_filter = or_(
-            Notification.recipient_role == 'admin',
-            Notification.recipient_role == 'hr_manager',
-            Notification.recipient_role == 'maintenance'
-        )
-    
     deleted = db.query(Notification).filter(
-        (Notification.recipient_user_id == current_user.id) | role_filter,
+        _recipient_filter(current_user),
         Notification.is_read == True
     ).delete(synchronize_session=False)
     
@@ -188,28 +130,9 @@ async def delete_all_notifications(
     Elimina TUTTE le notifiche dell'utente (sia lette che non lette).
     ATTENZIONE: Azione distruttiva.
     """
-    from sqlalchemy import or_
-    
-    user_role = current_user.role
-    role_filter = (Notification.recipient_role == user_role)
-    
-    if user_role == 'super_admin':
-        role_filter = or_(
-            Notification.recipient_role == 'super_admin',
-            Notification.recipient_role == 'admin',
-            Notification.recipient_role == 'hr_manager',
-            Notification.recipient_role == 'maintenance',
-            Notification.recipient_role == 'production_manager'
-        )
-    elif user_role == 'admin':
-        role_filter = or_(
-            Notification.recipient_role == 'admin',
-            Notification.recipient_role == 'hr_manager',
-            Notification.recipient_role == 'maintenance'
-        )
-    
+    _queue_unread_removal(db, _recipient_filter(current_user))
     deleted = db.query(Notification).filter(
-        (Notification.recipient_user_id == current_user.id) | role_filter
+        _recipient_filter(current_user)
     ).delete(synchronize_session=False)
     
     db.commit()
@@ -245,6 +168,7 @@ async def cleanup_old_notifications(
     ).delete(synchronize_session=False)
     
     # Delete very old unread notifications
+    _queue_unread_removal(db, Notification.created_at < cutoff_unread)
     deleted_unread = db.query(Notification).filter(
         Notification.is_read == False,
         Notification.created_at < cutoff_unread
@@ -8,7 +8,7 @@ from pydantic import BaseModel
 from typing import Optional, List
 from datetime import datetime
 
-from database import get_db, Notification
+from database import get_db
 from models.core import User
 from models.production import OvenItem, OVEN_MAX_MINUTES
 from security import get_current_user
@@ -112,30 +112,22 @@ async def insert_item(
 
     # Invio notifica ai Coordinatori + Super Admin
     try:
-        from sqlalchemy import or_
-        from database import Role
+        from permission_index import get_permission_index
+        from notification_service import NotificationService
         
-        # Query TUTTI i coordinatori (per ruolo) + super admin
-        targets = db.query(User).filter(
-            User.is_active == True
-        ).outerjoin(Role, User.role_id == Role.id).filter(
-            or_(
-                Role.name == "coordinator",
-                Role.name == "super_admin",
-                User.role == "coordinator",
-                User.role == "super_admin",
-            )
-        ).all()
+        # TUTTI i coordinatori (per ruolo) + super admin, dall'indice in memoria
+        targets = get_permission_index().resolve_user_ids(
+            db, roles=("coordinator", "super_admin"), include_wildcard=False
+        )
         
-        for target in targets:
-            notif = Notification(
-                recipient_user_id=target.id,
-                notif_type="info",
-                title="🔥 Nuovo inserimento Forno",
-                message=f"{current_user.full_name} ha inserito: {item.reference} ({item.quantity} pz).",
-                link_url="/production/oven"
-            )
-            db.add(notif)
+        NotificationService(db).notify(
+            targets,
+            notif_type="info",
+            title="🔥 Nuovo inserimento Forno",
+            message=f"{current_user.full_name} ha inserito: {item.reference} ({item.quantity} pz).",
+            link_url="/production/oven",
+            dedupe=False  # Ogni inserimento è un evento distinto
+        )
         db.commit()
     except Exception as e:
         print(f"ERROR: Fallita notifica inserimento forno: {e}")
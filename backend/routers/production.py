@@ -3,17 +3,17 @@ SL Enterprise - Production Router
 Gestione Picking List (Live Production)
 """
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import FileResponse
+from fastapi.encoders import jsonable_encoder
 from sqlalchemy.orm import Session, joinedload
 from typing import List, Optional
+from pydantic import BaseModel
 from datetime import datetime, timedelta
-import pandas as pd
-import io
 
 from database import get_db, User
 from models.production import ProductionMaterial, BlockRequest
-from models.chat import PushSubscription  # <-- Push Subscriptions
 from push_service import send_production_notification  # <-- Push Service
+from permission_index import resolve_push_targets  # <-- Destinatari push (cache permessi)
 from models.core import AuditLog  # <-- Audit Log
 from schemas import (
     ProductionMaterialResponse, ProductionMaterialCreate, ProductionMaterialUpdate,
@@ -21,6 +21,9 @@ from schemas import (
 )
 from security import get_current_user
 from websocket_manager import get_logistics_manager
+from analytics import block_requests_frame, production_report
+from report_jobs import report, report_response, scratch_path, ReportFile
+from xlsx_stream import write_xlsx, XlsxSheet, XLSX_MEDIA_TYPE
 
 router = APIRouter(prefix="/production", tags=["Production"])
 
@@ -38,6 +41,85 @@ def log_audit(db: Session, user_id: int, action: str, details: str):
     except Exception as e:
         print(f"AUDIT LOG ERROR: {e}")
 
+
+def block_request_response(req: BlockRequest) -> BlockRequestResponse:
+    """Richiesta blocco con le etichette calcolate (lista e eventi WebSocket)."""
+    return BlockRequestResponse(
+        id=req.id,
+        request_type=req.request_type,
+        target_sector=req.target_sector,
+        material_id=req.material_id,
+        density_id=req.density_id,
+        color_id=req.color_id,
+        supplier_id=req.supplier_id,
+        dimensions=req.dimensions,
+        custom_height=req.custom_height,
+        is_trimmed=req.is_trimmed,
+        quantity=req.quantity,
+        client_ref=req.client_ref,
+        notes=req.notes,
+        status=req.status,
+        is_urgent=req.is_urgent if hasattr(req, 'is_urgent') else False,
+        created_by_id=req.created_by_id,
+        created_at=req.created_at,
+        processed_by_id=req.processed_by_id,
+        processed_at=req.processed_at,
+        delivered_at=req.delivered_at,
+        # Computed fields
+        material_label=req.material.label if req.material else None,
+        density_label=req.density.label if req.density else None,
+        color_label=req.color.label if req.color else None,
+        supplier_label=req.supplier.label if req.supplier else None,
+        creator_name=req.created_by.full_name if req.created_by else None,
+        processor_name=req.processed_by.full_name if req.processed_by else None
+    )
+
+
+def get_block_counters(db: Session) -> dict:
+    """Contatori live (pending, processing, urgenti attivi) in UNA query raggruppata."""
+    from sqlalchemy import func
+
+    rows = db.query(
+        BlockRequest.status, BlockRequest.is_urgent, func.count(BlockRequest.id)
+    ).filter(
+        BlockRequest.status.in_(['pending', 'processing'])
+    ).group_by(BlockRequest.status, BlockRequest.is_urgent).all()
+
+    return {
+        "pending_count": sum(n for status, _, n in rows if status == 'pending'),
+        "processing_count": sum(n for status, _, n in rows if status == 'processing'),
+        "urgent_count": sum(n for _, urgent, n in rows if urgent),
+    }
+
+
+async def broadcast_block_event(db: Session, event: dict, block_ids: List[int]):
+    """
+    Evento WebSocket "delta" su production_blocks: oltre ai campi storici
+    (event, con block_id) porta la richiesta completa ("block") e i contatori
+    live, così le dashboard aggiornano la lista senza rileggere GET /requests.
+    """
+    try:
+        blocks = db.query(BlockRequest).options(
+            joinedload(BlockRequest.material),
+            joinedload(BlockRequest.density),
+            joinedload(BlockRequest.color),
+            joinedload(BlockRequest.supplier),
+            joinedload(BlockRequest.created_by),
+            joinedload(BlockRequest.processed_by)
+        ).filter(BlockRequest.id.in_(block_ids)).all()
+        counters = get_block_counters(db)
+
+        lm = get_logistics_manager()
+        for block in blocks:
+            await lm.broadcast("production_blocks", {
+                **event,
+                "block_id": block.id,
+                "block": jsonable_encoder(block_request_response(block)),
+                **counters
+            })
+    except Exception as e:
+        print(f"[WS BROADCAST ERROR] Error broadcasting {event.get('type')}: {e}")
+
 # ============================================================
 # CONFIGURATION (Materiali / Colori)
 # ============================================================
@@ -143,53 +225,35 @@ async def create_block_request(
         db.commit()
 
         # WebSocket Broadcast
-        try:
-            lm = get_logistics_manager()
-            await lm.broadcast("production_blocks", {"type": "new_block", "block_id": new_req.id})
-        except Exception as e:
-            print(f"[WS BROADCAST ERROR] Error broadcasting new block: {e}")
+        await broadcast_block_event(db, {"type": "new_block"}, [new_req.id])
 
         # --- NOTIFICHE PUSH ---
         try:
-            # 1. Trova tutti gli utenti che devono ricevere la notifica (Magazzinieri / Supply)
-            # Cerchiamo utenti con permesso 'manage_production_supply' o ruolo 'supply'/'super_admin'
-            # Per efficienza, prendiamo tutte le subscription e filtriamo in Python (o join complessa)
-            subs = db.query(PushSubscription).join(PushSubscription.user).all()
+            # Destinatari (Magazzinieri / Supply): permesso 'manage_production_supply'
+            # o ruolo 'super_admin'/'supply'/'logistics', dall'indice permessi in memoria
+            subs = resolve_push_targets(
+                db,
+                permissions=("manage_production_supply",),
+                roles=("super_admin", "supply", "logistics")
+            )
+            
+            # Prepara testo
+            title = f"Nuova Richiesta #{new_req.id}"
+            body = f"📦 {new_req.quantity}x "
+            if new_req.request_type == 'memory' and new_req.material:
+                body += new_req.material.label
+            elif new_req.density and new_req.color:
+                body += f"{new_req.density.label} {new_req.color.label}"
+            else:
+                body += "Blocco Generico"
             
             notified_count = 0
-            for sub in subs:
-                user = sub.user
-                # Verifica permessi: ha permesso supply o è super admin?
-                # Nota: has_permission potrebbe non essere disponibile se user non è caricato come oggetto completo Pydantic/User, 
-                # ma qui è un modello ORM. Assumiamo che il metodo o la logica esista o controlliamo il ruolo.
-                # Se `has_permission` è un metodo del modello SQLAlchemy User:
-                if (hasattr(user, 'has_permission') and user.has_permission("manage_production_supply")) or \
-                   user.role in ['super_admin', 'supply', 'logistics']:
-                    
-                    # Prepara testo
-                    title = f"Nuova Richiesta #{new_req.id}"
-                    body = f"📦 {new_req.quantity}x "
-                    if new_req.request_type == 'memory' and new_req.material:
-                        body += new_req.material.label
-                    elif new_req.density and new_req.color:
-                        body += f"{new_req.density.label} {new_req.color.label}"
-                    else:
-                        body += "Blocco Generico"
-                        
-                    # Dati subscription
-                    sub_info = {
-                        "endpoint": sub.endpoint,
-                        "keys": {
-                            "p256dh": sub.p256dh_key,
-                            "auth": sub.auth_key
-                        }
-                    }
-                    
-                    # Invia
-                    send_production_notification(sub_info, title, body, new_req.id)
+            for sub_info in subs:
+                # Accoda (invio nei worker del dispatcher)
+                if send_production_notification(sub_info, title, body, new_req.id):
                     notified_count += 1
             
-            print(f"[PUSH] Notifiche produzione inviate a {notified_count} dispositivi.")
+            print(f"[PUSH] Notifiche produzione accodate per {notified_count} dispositivi.")
 
         except Exception as e:
             print(f"[PUSH ERROR] Errore invio notifiche produzione: {e}")
@@ -251,39 +315,7 @@ async def list_block_requests(
         query = query.limit(limit)
     results = query.all()
     
-    response_list = []
-    for req in results:
-        response_list.append(BlockRequestResponse(
-            id=req.id,
-            request_type=req.request_type,
-            target_sector=req.target_sector,
-            material_id=req.material_id,
-            density_id=req.density_id,
-            color_id=req.color_id,
-            supplier_id=req.supplier_id,
-            dimensions=req.dimensions,
-            custom_height=req.custom_height,
-            is_trimmed=req.is_trimmed,
-            quantity=req.quantity,
-            client_ref=req.client_ref,
-            notes=req.notes,
-            status=req.status,
-            is_urgent=req.is_urgent if hasattr(req, 'is_urgent') else False,
-            created_by_id=req.created_by_id,
-            created_at=req.created_at,
-            processed_by_id=req.processed_by_id,
-            processed_at=req.processed_at,
-            delivered_at=req.delivered_at,
-            # Computed fields
-            material_label=req.material.label if req.material else None,
-            density_label=req.density.label if req.density else None,
-            color_label=req.color.label if req.color else None,
-            supplier_label=req.supplier.label if req.supplier else None,
-            creator_name=req.created_by.full_name if req.created_by else None,
-            processor_name=req.processed_by.full_name if req.processed_by else None
-        ))
-        
-    return response_list
+    return [block_request_response(req) for req in results]
 
 @router.patch("/requests/{req_id}/status", response_model=BlockRequestResponse, summary="Aggiorna Stato Richiesta")
 async def update_request_status(
@@ -353,11 +385,7 @@ async def update_request_status(
     db.refresh(req)
     
     # WebSocket Broadcast
-    try:
-        lm = get_logistics_manager()
-        await lm.broadcast("production_blocks", {"type": "status_update", "block_id": req.id, "new_status": req.status})
-    except Exception as e:
-        print(f"[WS BROADCAST ERROR] Error broadcasting status update for block {req.id}: {e}")
+    await broadcast_block_event(db, {"type": "status_update", "new_status": req.status}, [req.id])
 
     if log_action:
         log_audit(db, current_user.id, log_action, f"Order {req.id} status changed to {new_status}")
@@ -388,11 +416,7 @@ async def acknowledge_cancellation(
     db.commit()
     
     # WebSocket Broadcast
-    try:
-        lm = get_logistics_manager()
-        await lm.broadcast("production_blocks", {"type": "block_resolved", "block_id": req_id})
-    except Exception as e:
-        print(f"[WS BROADCAST ERROR] Error broadcasting block resolved for block {req_id}: {e}")
+    await broadcast_block_event(db, {"type": "block_resolved"}, [req_id])
     
     return {"message": "Cancellazione confermata", "status": "cancelled_acked"}
 
@@ -425,15 +449,7 @@ async def toggle_urgency(
     db.commit()
     
     # WebSocket Broadcast
-    try:
-        lm = get_logistics_manager()
-        await lm.broadcast("production_blocks", {
-            "type": "urgency_update", 
-            "block_id": req.id, 
-            "is_urgent": req.is_urgent
-        })
-    except Exception as e:
-        print(f"[WS BROADCAST ERROR] Error broadcasting urgency for block {req_id}: {e}")
+    await broadcast_block_event(db, {"type": "urgency_update", "is_urgent": req.is_urgent}, [req.id])
     
     log_audit(db, current_user.id, "PRODUCTION_ORDER_URGENCY", f"Order {req.id} urgency set to {req.is_urgent}")
     db.commit()
@@ -472,6 +488,9 @@ async def batch_update_status(
     log_audit(db, current_user.id, "PRODUCTION_BATCH_UPDATE", f"Batch update {len(request_ids)} orders to {new_status}")
     db.commit()
     
+    # WebSocket Broadcast (stesso evento dell'aggiornamento singolo, per ogni ordine)
+    await broadcast_block_event(db, {"type": "status_update", "new_status": new_status}, request_ids)
+    
     return {"message": f"Aggiornati {updated} ordini", "count": updated}
 
 
@@ -528,6 +547,32 @@ async def get_realtime_stats(
 # REPORTING & STATS (Excel Export)
 # ============================================================
 
+class ProductionReportParams(BaseModel):
+    start_date: datetime
+    end_date: datetime
+    shift_type: Optional[str] = "all"
+    target_sector: Optional[str] = None
+
+
+def _require_report_access(user: User, params=None):
+    if user is None or user.role not in ['super_admin', 'admin', 'factory_controller']:
+        raise HTTPException(403, "Permesso negato")
+
+
+def _production_stats(db: Session, params: ProductionReportParams):
+    # Adjust end_date to include the full day (23:59:59)
+    # When frontend sends "2026-01-20", we want to include all records until end of that day
+    end_date_adjusted = params.end_date.replace(hour=23, minute=59, second=59)
+
+    # 1. Dati del periodo: una SELECT di colonne (etichette e utenti in join)
+    requests = block_requests_frame(db, params.start_date, end_date_adjusted)
+
+    # 2. Shift Logic Application + 3. Data Aggregation
+    # If "shift_type" is passed along with generic day dates, we assume we want that shift for EVERY day in range.
+    # Turno, settore, raggruppamenti e tempi medi sono calcolati per colonne in analytics.production_report
+    return production_report(requests, params.shift_type, params.target_sector)
+
+
 @router.get("/reports", summary="Report Produzione (Excel)")
 async def get_production_reports(
     start_date: datetime,
@@ -544,192 +589,31 @@ async def get_production_reports(
     - Morning: 06:00 - 14:00
     - Afternoon: 14:00 - 22:00
     - Night: 22:00 - 06:00
+    Il file Excel è generato nel process pool dei report (cache export se i dati non sono cambiati).
     """
     # Permission Check
-    if current_user.role not in ['super_admin', 'admin', 'factory_controller']:
-        raise HTTPException(403, "Permesso negato")
+    _require_report_access(current_user)
+    params = {"start_date": start_date, "end_date": end_date, "shift_type": shift_type, "target_sector": target_sector}
 
-    # Adjust end_date to include the full day (23:59:59)
-    # When frontend sends "2026-01-20", we want to include all records until end of that day
-    end_date_adjusted = end_date.replace(hour=23, minute=59, second=59)
+    if format == 'json':
+        stats, _ = _production_stats(db, ProductionReportParams(**params))
+        return stats
 
-    # 1. Base Query
-    query = db.query(BlockRequest).options(
-        joinedload(BlockRequest.material),
-        joinedload(BlockRequest.density),
-        joinedload(BlockRequest.color),
-        joinedload(BlockRequest.supplier),
-        joinedload(BlockRequest.created_by),
-        joinedload(BlockRequest.processed_by)
-    ).filter(
-        BlockRequest.created_at >= start_date,
-        BlockRequest.created_at <= end_date_adjusted
-    )
+    return await report_response("production_excel", params, current_user)
 
-    # 2. Shift Logic Application
-    # Note: Shift filtering is complex in SQL if dynamic. 
-    # For now, we fetch data in range and filter in Python or trust the passed start/end_date matching the shift.
-    # The UI should send specific start/end timestamps for "today morning".
-    # However, if "shift_type" is passed along with generic day dates, we assume we want that shift for EVERY day in range.
-    # Implementing "Time of Day" filtering.
-    
-    requests = query.all()
-    filtered_requests = []
-    
-    if shift_type in ['morning', 'afternoon', 'night']:
-        for req in requests:
-            hour = req.created_at.hour
-            # Morning: 6 <= h < 14
-            if shift_type == 'morning' and 6 <= hour < 14:
-                filtered_requests.append(req)
-            # Afternoon: 14 <= h < 22
-            elif shift_type == 'afternoon' and 14 <= hour < 22:
-                filtered_requests.append(req)
-            # Night: 22 <= h or h < 6
-            elif shift_type == 'night' and (hour >= 22 or hour < 6):
-                filtered_requests.append(req)
-    else:
-        filtered_requests = requests
-
-    # Filtro per settore (pantografo / giostra)
-    if target_sector:
-        filtered_requests = [r for r in filtered_requests if r.target_sector == target_sector]
-
-    # 3. Data Aggregation
-    data_rows = []
-    
-    # KPIs
-    total_blocks = sum(req.quantity for req in filtered_requests)
-    by_type = {}
-    by_dims = {}
-    user_perf = {} # {username: count}
-    supply_perf = {} # {username: count}
-    
-    # NEW: Memory vs Spugna and Trimmed stats
-    memory_count = 0
-    sponge_count = 0
-    trimmed_count = 0
-    cancelled_count = 0  # NEW: Cancellation tracking
-    urgent_count = 0     # NEW: Urgent blocks tracking
-    by_sector = {}       # Aggregazione per settore
-    
-    time_created_processing = [] # minutes
-    time_processing_delivered = [] # minutes
-
-    for req in filtered_requests:
-        # Resolve labels
-        mat_label = "N/A"
-        if req.request_type == 'memory':
-            mat_label = f"Memory {req.material.label if req.material else '?'}"
-            memory_count += req.quantity
-        else:
-            mat_label = f"Spugna {req.density.label if req.density else '?'} {req.color.label if req.color else '?'}"
-            sponge_count += req.quantity
-        
-        # Trimmed count
-        if req.is_trimmed:
-            trimmed_count += req.quantity
-        
-        # NEW: Count cancelled requests
-        if req.status in ['cancelled', 'cancelled_acked']:
-            cancelled_count += req.quantity
-        
-        # NEW: Count urgent requests
-        if hasattr(req, 'is_urgent') and req.is_urgent:
-            urgent_count += req.quantity
-
-        # Aggregazione per settore con breakdown memory/spugna
-        sector_key = (req.target_sector or 'non_specificato').lower()
-        if sector_key not in by_sector:
-            by_sector[sector_key] = {"memory": 0, "sponge": 0, "total": 0}
-        by_sector[sector_key]["total"] += req.quantity
-        if req.request_type == 'memory':
-            by_sector[sector_key]["memory"] += req.quantity
-        else:
-            by_sector[sector_key]["sponge"] += req.quantity
-        # Count Type
-        by_type[mat_label] = by_type.get(mat_label, 0) + req.quantity
-        
-        # Count Dimensions
-        dims = req.dimensions
-        if req.is_trimmed:
-            dims += " (Rifilato)"
-        by_dims[dims] = by_dims.get(dims, 0) + req.quantity
-        
-        # User Stats
-        creator = req.created_by.full_name if req.created_by else "Unknown"
-        user_perf[creator] = user_perf.get(creator, 0) + req.quantity
-        
-        if req.processed_by:
-            processor = req.processed_by.full_name
-            supply_perf[processor] = supply_perf.get(processor, 0) + req.quantity
-            
-        # Timings
-        if req.created_at and req.processed_at:
-            delta = (req.processed_at - req.created_at).total_seconds() / 60
-            time_created_processing.append(delta)
-            
-        if req.processed_at and req.delivered_at:
-            delta = (req.delivered_at - req.processed_at).total_seconds() / 60
-            time_processing_delivered.append(delta)
-
-        # Sector label for Excel
-        sector_labels = {'pantografo': 'Pantografo', 'giostra': 'Giostra', 'altro': 'Altro'}
-        sector_display = sector_labels.get(req.target_sector.lower(), '') if req.target_sector else ''
-
-        # Row for Excel
-        data_rows.append({
-            "ID": req.id,
-            "Data": req.created_at.strftime("%Y-%m-%d %H:%M"),
-            "Utente Ordine": creator,
-            "Settore": sector_display,
-            "Tipo": req.request_type,
-            "Materiale": mat_label,
-            "Misure": req.dimensions,
-            "Rifilato": "SI" if req.is_trimmed else "NO",
-            "Fornitore": req.supplier.label if req.supplier else "",
-            "Quantità": req.quantity,
-            "Stato": req.status,
-            "Supply User": req.processed_by.full_name if req.processed_by else "",
-            "Note": req.notes or "",
-            "Attesa Presa in Carico (min)": round((req.processed_at - req.created_at).total_seconds()/60, 1) if req.processed_at else "",
-            "Tempo Lavorazione (min)": round((req.delivered_at - req.processed_at).total_seconds()/60, 1) if req.processed_at and req.delivered_at else ""
-        })
-
-    # Averages
-    avg_wait = sum(time_created_processing) / len(time_created_processing) if time_created_processing else 0
-    avg_work = sum(time_processing_delivered) / len(time_processing_delivered) if time_processing_delivered else 0
-
-    stats = {
-        "total_blocks": total_blocks,
-        "by_type": by_type,
-        "by_dims": by_dims,
-        "user_perf": user_perf,
-        "supply_perf": supply_perf,
-        "avg_wait_min": round(avg_wait, 1),
-        "avg_work_min": round(avg_work, 1),
-        # NEW: Memory vs Spugna and Trimmed stats
-        "memory_count": memory_count,
-        "sponge_count": sponge_count,
-        "trimmed_count": trimmed_count,
-        "trimmed_percentage": round((trimmed_count / total_blocks * 100) if total_blocks > 0 else 0, 1),
-        # NEW: Cancellation stats
-        "cancelled_count": cancelled_count,
-        "cancelled_percentage": round((cancelled_count / total_blocks * 100) if total_blocks > 0 else 0, 1),
-        # NEW: Urgent stats
-        "urgent_count": urgent_count,
-        "urgent_percentage": round((urgent_count / total_blocks * 100) if total_blocks > 0 else 0, 1),
-        # Aggregazione per settore
-        "by_sector": by_sector
-    }
 
-    if format == 'json':
-        return stats
+@report("production_excel", ProductionReportParams, tables=("block_requests", "production_materials", "users"),
+        authorize=_require_report_access)
+def render_production_excel(db: Session, params: ProductionReportParams) -> ReportFile:
+    """Excel report produzione: foglio riepilogo e dettaglio ordini."""
+    stats, df_logs = _production_stats(db, params)
+    total_blocks = stats["total_blocks"]
+    by_type, user_perf, supply_perf = stats["by_type"], stats["user_perf"], stats["supply_perf"]
+    memory_count, sponge_count = stats["memory_count"], stats["sponge_count"]
+    trimmed_count, cancelled_count = stats["trimmed_count"], stats["cancelled_count"]
+    avg_wait, avg_work = stats["avg_wait_min"], stats["avg_work_min"]
 
-    # 4. Excel Generation
-    # Create Pandas DataFrames
-    df_logs = pd.DataFrame(data_rows)
-    
+    # 4. Excel Generation (df_logs: righe dettaglio già in DataFrame)
     # Summary Sheet Data
     summary_data = [
         {"Metrica": "Totale Blocchi", "Valore": total_blocks},
@@ -762,25 +646,13 @@ async def get_production_reports(
     for k, v in supply_perf.items():
         summary_data.append({"Metrica": k, "Valore": v})
 
-    df_summary = pd.DataFrame(summary_data)
+    # Export in streaming (fogli write-only): dettaglio riga per riga dal DataFrame,
+    # larghezze colonne dal campione iniziale invece che da tutte le celle
+    path = scratch_path(".xlsx")
+    write_xlsx(path, [
+        XlsxSheet("Riepilogo", ["Metrica", "Valore"], ((row["Metrica"], row["Valore"]) for row in summary_data)),
+        XlsxSheet("Dettaglio Ordini", list(df_logs.columns), df_logs.itertuples(index=False, name=None)),
+    ])
 
-    # Export to BytesIO
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df_summary.to_excel(writer, sheet_name='Riepilogo', index=False)
-        df_logs.to_excel(writer, sheet_name='Dettaglio Ordini', index=False)
-        
-        # Auto-adjust column widths (basic)
-        for worksheet in writer.sheets.values():
-            for column_cells in worksheet.columns:
-                length = max(len(str(cell.value)) for cell in column_cells)
-                worksheet.column_dimensions[column_cells[0].column_letter].width = length + 2
-
-    output.seek(0)
-    
-    filename = f"Report_Produzione_{start_date.strftime('%Y%m%d')}_{shift_type}.xlsx"
-    return StreamingResponse(
-        output,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
-    )
+    filename = f"Report_Produzione_{params.start_date.strftime('%Y%m%d')}_{params.shift_type}.xlsx"
+    return ReportFile(None, filename, XLSX_MEDIA_TYPE, path=path)
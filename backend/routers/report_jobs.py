@@ -0,0 +1,69 @@
+"""
+Report Jobs Router
+Export PDF/Excel in background: creazione job, stato e download dell'artefatto.
+"""
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from pydantic import BaseModel
+from typing import Optional
+
+from database import get_db, User, ReportJob
+from security import get_current_user
+from report_jobs import REPORTS, submit_job, job_to_dict, job_artifact, file_response
+
+router = APIRouter(prefix="/reports/jobs", tags=["Reports"])
+
+
+# --- SCHEMAS ---
+
+class ReportJobCreate(BaseModel):
+    report_type: str  # kpi_daily_pdf, kpi_advanced_pdf, shifts_pdf, bonuses_pdf, checklist_pdf, production_excel, absences_excel
+    params: Optional[dict] = None
+
+
+def _get_own_job(job_id: str, db: Session, current_user: User) -> ReportJob:
+    job = db.get(ReportJob, job_id)
+    if not job or (job.requested_by != current_user.id and current_user.role != 'super_admin'):
+        raise HTTPException(status_code=404, detail="Job non trovato")
+    return job
+
+
+# --- ENDPOINTS ---
+
+@router.get("/types", summary="Report disponibili")
+async def list_report_types(current_user: User = Depends(get_current_user)):
+    """Elenco dei report esportabili in background."""
+    return [{"report_type": name, "tables": list(spec.tables)} for name, spec in sorted(REPORTS.items())]
+
+
+@router.post("", summary="Richiedi un report in background")
+async def create_report_job(
+    data: ReportJobCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Crea un job di generazione. Se lo stesso report con gli stessi dati è già
+    in cache il job è subito "done"; altrimenti viene generato in background e
+    il richiedente riceve {"type": "report_job", ...} su /ws/badges.
+    """
+    job = await submit_job(db, data.report_type, data.params, current_user)
+    return job_to_dict(job)
+
+
+@router.get("/{job_id}", summary="Stato di un job")
+async def get_report_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    return job_to_dict(_get_own_job(job_id, db, current_user))
+
+
+@router.get("/{job_id}/download", summary="Scarica il report generato")
+async def download_report_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    return file_response(job_artifact(_get_own_job(job_id, db, current_user)))
@@ -4,16 +4,17 @@ Generates comprehensive absence reports with Bradford Factor and Pattern Detecti
 """
 
 from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi.responses import Response, StreamingResponse
+from fastapi.responses import Response
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, extract
+from sqlalchemy import func, and_, extract, select
 from typing import List, Optional
 from datetime import datetime, timedelta
 from pydantic import BaseModel
-import io
 
 from database import get_db, Employee, LeaveRequest, Department, User
 from security import get_current_user
+from report_jobs import report, report_response, scratch_path, ReportFile
+from xlsx_stream import write_xlsx, XlsxSheet, Styled, XLSX_MEDIA_TYPE
 
 router = APIRouter(prefix="/reports", tags=["Reports"])
 
@@ -108,6 +109,11 @@ async def generate_absence_report(
     if current_user.role != 'super_admin':
         raise HTTPException(status_code=403, detail="Accesso non autorizzato ai report")
     
+    return build_absence_report(request, db)
+
+
+def build_absence_report(request: AbsenceReportRequest, db: Session) -> AbsenceReportResponse:
+    """Calcolo del report assenze (condiviso da endpoint JSON ed export Excel)."""
     # Parse dates
     try:
         s_date = datetime.strptime(request.start_date, "%Y-%m-%d")
@@ -297,51 +303,69 @@ async def generate_absence_report(
     )
 
 
+def _require_super_admin(user: User, params=None):
+    if user is None or user.role != 'super_admin':
+        raise HTTPException(status_code=403, detail="Accesso non autorizzato")
+
+
 @router.post("/absences/export/excel", summary="Export Absence Report to Excel")
 async def export_absence_report_excel(
     request: AbsenceReportRequest,
-    db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Export detailed absence report as Excel file"""
-    from openpyxl import Workbook
+    """Export detailed absence report as Excel file (dalla cache export se i dati non sono cambiati)."""
+    return await report_response("absences_excel", request.model_dump(), current_user)
+
+
+LEAVE_TYPE_LABELS = {'VACATION': 'FERIE', 'SICK': 'MALATTIA', 'PERMIT': 'PERMESSO'}
+
+
+def _absence_detail_rows(db: Session, request: AbsenceReportRequest, s_date: datetime, e_date: datetime):
+    """Righe del foglio dettaglio lette a blocchi dal cursore (yield_per), senza caricare oggetti ORM."""
+    query = select(
+        Employee.last_name, Employee.first_name, Department.name, LeaveRequest.leave_type,
+        LeaveRequest.start_date, LeaveRequest.end_date, LeaveRequest.reason
+    ).join(Employee, Employee.id == LeaveRequest.employee_id
+    ).outerjoin(Department, Department.id == Employee.department_id
+    ).where(
+        Employee.is_active == True,
+        LeaveRequest.status == 'approved',
+        LeaveRequest.start_date <= e_date,
+        LeaveRequest.end_date >= s_date
+    )
+    if request.employee_ids:
+        query = query.where(Employee.id.in_(request.employee_ids))
+    if request.department_id:
+        query = query.where(Employee.department_id == request.department_id)
+    query = query.order_by(LeaveRequest.start_date, LeaveRequest.id).execution_options(yield_per=1000)
+
+    for last_name, first_name, department_name, leave_type, start, end, reason in db.execute(query):
+        leave_type = leave_type.upper()
+        actual_start = max(start, s_date)
+        actual_end = min(end, e_date)
+        yield (
+            f"{last_name} {first_name}",
+            department_name or "N/D",
+            LEAVE_TYPE_LABELS.get(leave_type, leave_type),
+            actual_start.strftime("%d/%m/%Y"),
+            actual_end.strftime("%d/%m/%Y"),
+            (actual_end - actual_start).days + 1,
+            reason or "-",
+        )
+
+
+@report("absences_excel", AbsenceReportRequest, tables=("employees", "departments", "leave_requests"),
+        authorize=_require_super_admin)
+def render_absences_excel(db: Session, request: AbsenceReportRequest) -> ReportFile:
+    """Excel report assenze: dettaglio, riepilogo dipendenti/reparti e info Bradford Factor."""
     from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-    from openpyxl.utils import get_column_letter
-    
-    # Access Control
-    if current_user.role != 'super_admin':
-        raise HTTPException(status_code=403, detail="Accesso non autorizzato")
     
     # Get report data (reuse logic)
-    report_data = await generate_absence_report(request, db, current_user)
+    report_data = build_absence_report(request, db)
     
-    # Get detailed leaves for Excel
     s_date = datetime.strptime(request.start_date, "%Y-%m-%d")
     e_date = datetime.strptime(request.end_date, "%Y-%m-%d")
     
-    emp_query = db.query(Employee).filter(Employee.is_active == True)
-    if request.employee_ids:
-        emp_query = emp_query.filter(Employee.id.in_(request.employee_ids))
-    if request.department_id:
-        emp_query = emp_query.filter(Employee.department_id == request.department_id)
-    employees = emp_query.all()
-    employee_ids = [e.id for e in employees]
-    emp_map = {e.id: e for e in employees}
-    
-    leaves = db.query(LeaveRequest).filter(
-        LeaveRequest.employee_id.in_(employee_ids),
-        LeaveRequest.status == 'approved',
-        LeaveRequest.start_date <= e_date,
-        LeaveRequest.end_date >= s_date
-    ).order_by(LeaveRequest.start_date).all()
-    
-    # Create Workbook
-    wb = Workbook()
-    
-    # --- SHEET 1: Dettaglio Assenze ---
-    ws1 = wb.active
-    ws1.title = "Dettaglio Assenze"
-    
     # Header styling
     header_fill = PatternFill(start_color="0F172A", end_color="0F172A", fill_type="solid")  # Slate 900
     header_font = Font(bold=True, color="FFFFFF")
@@ -351,114 +375,54 @@ async def export_absence_report_excel(
         top=Side(style='thin'),
         bottom=Side(style='thin')
     )
-    
-    headers1 = ["Dipendente", "Reparto", "Tipo", "Data Inizio", "Data Fine", "Giorni", "Motivo"]
-    for col, header in enumerate(headers1, 1):
-        cell = ws1.cell(row=1, column=col, value=header)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = Alignment(horizontal='center')
-        cell.border = border
-    
-    # Data rows
-    row = 2
-    for leave in leaves:
-        emp = emp_map.get(leave.employee_id)
-        if not emp:
-            continue
-        
-        leave_type = leave.leave_type.upper()
-        if leave_type == 'VACATION': leave_type = 'FERIE'
-        elif leave_type == 'SICK': leave_type = 'MALATTIA'
-        elif leave_type == 'PERMIT': leave_type = 'PERMESSO'
-        
-        actual_start = max(leave.start_date, s_date)
-        actual_end = min(leave.end_date, e_date)
-        days = (actual_end - actual_start).days + 1
-        
-        ws1.cell(row=row, column=1, value=f"{emp.last_name} {emp.first_name}")
-        ws1.cell(row=row, column=2, value=emp.department.name if emp.department else "N/D")
-        ws1.cell(row=row, column=3, value=leave_type)
-        ws1.cell(row=row, column=4, value=actual_start.strftime("%d/%m/%Y"))
-        ws1.cell(row=row, column=5, value=actual_end.strftime("%d/%m/%Y"))
-        ws1.cell(row=row, column=6, value=days)
-        ws1.cell(row=row, column=7, value=leave.reason or "-")
-        row += 1
-    
-    # Auto-width columns
-    for col in range(1, 8):
-        ws1.column_dimensions[get_column_letter(col)].width = 18
+    header_style = {"fill": header_fill, "font": header_font}
+    centered = Alignment(horizontal='center')
     
     # --- SHEET 2: Riepilogo Dipendenti ---
-    ws2 = wb.create_sheet("Riepilogo Dipendenti")
-    
-    headers2 = ["Dipendente", "Reparto", "Giorni Totali", "N. Episodi", "Bradford Factor", "Lun/Ven %"]
-    for col, header in enumerate(headers2, 1):
-        cell = ws2.cell(row=1, column=col, value=header)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = Alignment(horizontal='center')
-    
-    row = 2
-    for emp in report_data.employees:
-        ws2.cell(row=row, column=1, value=emp.employee_name)
-        ws2.cell(row=row, column=2, value=emp.department_name)
-        ws2.cell(row=row, column=3, value=emp.total_days)
-        ws2.cell(row=row, column=4, value=emp.absence_count)
-        ws2.cell(row=row, column=5, value=emp.bradford_factor)
-        mon_fri_pct = round((emp.monday_friday_count / emp.absence_count * 100), 0) if emp.absence_count > 0 else 0
-        ws2.cell(row=row, column=6, value=f"{mon_fri_pct}%")
-        row += 1
-    
-    for col in range(1, 7):
-        ws2.column_dimensions[get_column_letter(col)].width = 18
-    
-    # --- SHEET 3: Riepilogo Reparti ---
-    ws3 = wb.create_sheet("Riepilogo Reparti")
-    
-    headers3 = ["Reparto", "Giorni Totali", "Dipendenti", "Media GG/Dip"]
-    for col, header in enumerate(headers3, 1):
-        cell = ws3.cell(row=1, column=col, value=header)
-        cell.fill = header_fill
-        cell.font = header_font
-    
-    row = 2
-    for dept in report_data.departments:
-        ws3.cell(row=row, column=1, value=dept.department_name)
-        ws3.cell(row=row, column=2, value=dept.total_days)
-        ws3.cell(row=row, column=3, value=dept.employee_count)
-        ws3.cell(row=row, column=4, value=dept.avg_days_per_employee)
-        row += 1
-    
-    for col in range(1, 5):
-        ws3.column_dimensions[get_column_letter(col)].width = 20
+    def employee_rows():
+        for emp in report_data.employees:
+            mon_fri_pct = round((emp.monday_friday_count / emp.absence_count * 100), 0) if emp.absence_count > 0 else 0
+            yield (emp.employee_name, emp.department_name, emp.total_days, emp.absence_count,
+                   emp.bradford_factor, f"{mon_fri_pct}%")
     
     # --- SHEET 4: Bradford Factor Info ---
-    ws4 = wb.create_sheet("Info Bradford Factor")
-    ws4.cell(row=1, column=1, value="COS'È IL BRADFORD FACTOR?").font = Font(bold=True, size=14)
-    ws4.cell(row=3, column=1, value="Formula: Bradford = S² × D")
-    ws4.cell(row=4, column=1, value="S = Numero di episodi di assenza")
-    ws4.cell(row=5, column=1, value="D = Giorni totali di assenza")
-    ws4.cell(row=7, column=1, value="PERCHÉ È UTILE?").font = Font(bold=True)
-    ws4.cell(row=8, column=1, value="Le assenze brevi e frequenti causano più disagi di una lunga.")
-    ws4.cell(row=9, column=1, value="Chi si assenta 10 volte per 1 giorno ha Bradford 1000.")
-    ws4.cell(row=10, column=1, value="Chi si assenta 1 volta per 10 giorni ha Bradford 10.")
-    ws4.cell(row=12, column=1, value="SOGLIE DI ATTENZIONE:").font = Font(bold=True)
-    ws4.cell(row=13, column=1, value="0-49: Normale")
-    ws4.cell(row=14, column=1, value="50-124: Da monitorare")
-    ws4.cell(row=15, column=1, value="125-399: Richiede azione")
-    ws4.cell(row=16, column=1, value="400+: Critico")
-    ws4.column_dimensions['A'].width = 60
-    
-    # Save to buffer
-    buffer = io.BytesIO()
-    wb.save(buffer)
-    buffer.seek(0)
+    bold = Font(bold=True)
+    bradford_info = [
+        [Styled("COS'È IL BRADFORD FACTOR?", font=Font(bold=True, size=14))],
+        [],
+        ["Formula: Bradford = S² × D"],
+        ["S = Numero di episodi di assenza"],
+        ["D = Giorni totali di assenza"],
+        [],
+        [Styled("PERCHÉ È UTILE?", font=bold)],
+        ["Le assenze brevi e frequenti causano più disagi di una lunga."],
+        ["Chi si assenta 10 volte per 1 giorno ha Bradford 1000."],
+        ["Chi si assenta 1 volta per 10 giorni ha Bradford 10."],
+        [],
+        [Styled("SOGLIE DI ATTENZIONE:", font=bold)],
+        ["0-49: Normale"],
+        ["50-124: Da monitorare"],
+        ["125-399: Richiede azione"],
+        ["400+: Critico"],
+    ]
+    
+    # Fogli write-only: il dettaglio (potenzialmente molte righe) passa dal cursore al file
+    path = scratch_path(".xlsx")
+    write_xlsx(path, [
+        XlsxSheet("Dettaglio Assenze",
+                  ["Dipendente", "Reparto", "Tipo", "Data Inizio", "Data Fine", "Giorni", "Motivo"],
+                  _absence_detail_rows(db, request, s_date, e_date),
+                  widths=[18] * 7, header_style={**header_style, "alignment": centered, "border": border}),
+        XlsxSheet("Riepilogo Dipendenti",
+                  ["Dipendente", "Reparto", "Giorni Totali", "N. Episodi", "Bradford Factor", "Lun/Ven %"],
+                  employee_rows(), widths=[18] * 6, header_style={**header_style, "alignment": centered}),
+        XlsxSheet("Riepilogo Reparti",
+                  ["Reparto", "Giorni Totali", "Dipendenti", "Media GG/Dip"],
+                  ((d.department_name, d.total_days, d.employee_count, d.avg_days_per_employee)
+                   for d in report_data.departments),
+                  widths=[20] * 4, header_style=header_style),
+        XlsxSheet("Info Bradford Factor", [], bradford_info, widths=[60]),
+    ])
     
     filename = f"Report_Assenze_{request.start_date}_{request.end_date}.xlsx"
-    
-    return StreamingResponse(
-        buffer,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
-    )
+    return ReportFile(None, filename, XLSX_MEDIA_TYPE, path=path)
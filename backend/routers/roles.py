@@ -4,7 +4,8 @@ from typing import List, Optional
 from pydantic import BaseModel
 
 from database import get_db, Role, User, AuditLog
-from security import get_current_user, get_current_admin
+from security import get_current_user, get_current_admin, invalidate_user_cache
+from permission_index import invalidate_permission_index
 
 router = APIRouter(prefix="/roles", tags=["Ruoli & Permessi"])
 
@@ -65,6 +66,8 @@ async def create_role(
     db.add(new_role)
     db.commit()
     db.refresh(new_role)
+    invalidate_permission_index()
+    invalidate_user_cache()  # Permessi cambiati per tutti gli utenti del ruolo
     
     # Log
     log = AuditLog(user_id=current_user.id, action="CREATE_ROLE", details=f"Created role {new_role.label}")
@@ -99,6 +102,8 @@ async def update_role(
     
     db.commit()
     db.refresh(role)
+    invalidate_permission_index()
+    invalidate_user_cache()  # Permessi cambiati per tutti gli utenti del ruolo
     
     log = AuditLog(user_id=current_user.id, action="UPDATE_ROLE", details=f"Updated permissions for {role.label}")
     db.add(log)
@@ -126,6 +131,8 @@ async def delete_role(
         
     db.delete(role)
     db.commit()
+    invalidate_permission_index()
+    invalidate_user_cache()  # Permessi cambiati per tutti gli utenti del ruolo
     
     return {"message": "Ruolo eliminato"}
 
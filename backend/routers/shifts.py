@@ -7,6 +7,8 @@ from pydantic import BaseModel
 
 from database import get_db, Employee, User, ShiftAssignment, Department, ShiftRequirement, LeaveRequest
 from security import get_current_user
+from date_ranges import between_days, overlaps_days
+from report_jobs import report, report_response, ReportFile
 
 router = APIRouter(prefix="/shifts", tags=["Turni"])
 
@@ -181,8 +183,7 @@ async def get_shifts(
         joinedload(ShiftAssignment.requirement).joinedload(ShiftRequirement.banchina),
         joinedload(ShiftAssignment.employee)
     ).filter(
-        ShiftAssignment.work_date >= s_date,
-        ShiftAssignment.work_date <= e_date
+        between_days(ShiftAssignment.work_date, s_date, e_date)
     ).all()
 
     return [
@@ -265,8 +266,7 @@ async def copy_previous_week(
     
     # Recupera turni settimana precedente
     source_shifts = db.query(ShiftAssignment).filter(
-        ShiftAssignment.work_date >= prev_start,
-        ShiftAssignment.work_date <= prev_end
+        between_days(ShiftAssignment.work_date, prev_start, prev_end)
     ).all()
     
     if not source_shifts:
@@ -325,8 +325,7 @@ async def export_shifts(
     e_date = datetime.strptime(end_date, "%Y-%m-%d").replace(hour=23, minute=59)
     
     shifts = db.query(ShiftAssignment).filter(
-        ShiftAssignment.work_date >= s_date,
-        ShiftAssignment.work_date <= e_date
+        between_days(ShiftAssignment.work_date, s_date, e_date)
     ).all()
     
     # Mappa per accesso rapido
@@ -353,18 +352,35 @@ async def export_shifts(
         date_str = s.work_date.strftime("%Y-%m-%d")
         data_map[eid]["shifts"][date_str] = label
         
+class ShiftsPdfParams(BaseModel):
+    start_date: str  # YYYY-MM-DD
+    end_date: str  # YYYY-MM-DD
+    department_id: Optional[int] = None
+    coordinator_id: Optional[int] = None
+
+
 @router.get("/export/pdf", summary="Export PDF Shift Sheet")
 async def export_shifts_pdf(
     start_date: str,
     end_date: str,
     department_id: Optional[int] = None,
     coordinator_id: Optional[int] = None,  # NEW: Filter by coordinator's team
-    db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Genera file PDF con la turnazione."""
-    from fastapi.responses import Response
+    """Genera file PDF con la turnazione (dalla cache export se i dati non sono cambiati)."""
+    return await report_response("shifts_pdf", {
+        "start_date": start_date, "end_date": end_date,
+        "department_id": department_id, "coordinator_id": coordinator_id
+    }, current_user)
+
+
+@report("shifts_pdf", ShiftsPdfParams,
+        tables=("employees", "departments", "banchine", "shift_assignments", "leave_requests"))
+def render_shifts_pdf(db: Session, params: ShiftsPdfParams) -> ReportFile:
+    """PDF della turnazione per periodo, reparto o team di un coordinatore."""
     from utils_pdf import generate_shift_pdf, get_italian_holidays
+    start_date, end_date = params.start_date, params.end_date
+    department_id, coordinator_id = params.department_id, params.coordinator_id
     
     # 1. Date e Periodo
     try:
@@ -406,8 +422,7 @@ async def export_shifts_pdf(
     
     # 3a. Turni
     shifts = db.query(ShiftAssignment).filter(
-        ShiftAssignment.work_date >= s_date,
-        ShiftAssignment.work_date <= e_date
+        between_days(ShiftAssignment.work_date, s_date, e_date)
     ).all()
     
     for s in shifts:
@@ -431,11 +446,9 @@ async def export_shifts_pdf(
     # Get employee IDs from the filtered list
     filtered_emp_ids = [emp.id for emp in employees]
     
-    from sqlalchemy import func as sa_func
     leaves = db.query(LeaveRequest).filter(
         LeaveRequest.status == 'approved',
-        sa_func.date(LeaveRequest.start_date) <= sa_func.date(e_date),
-        sa_func.date(LeaveRequest.end_date) >= sa_func.date(s_date),
+        overlaps_days(LeaveRequest.start_date, LeaveRequest.end_date, s_date, e_date),
         LeaveRequest.employee_id.in_(filtered_emp_ids)  # Filter by team!
     ).all()
     
@@ -529,12 +542,7 @@ async def export_shifts_pdf(
     )
     
     filename = f"Turni_{s_date.strftime('%Y%m%d')}_{dept_name.replace(' ', '_')}.pdf"
-    
-    return Response(
-        content=pdf_buffer.getvalue(),
-        media_type="application/pdf",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
-    )
+    return ReportFile(pdf_buffer.getvalue(), filename, "application/pdf")
 
 @router.get("/holidays", summary="Get holidays for a period")
 async def get_holidays_endpoint(
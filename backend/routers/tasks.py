@@ -4,15 +4,16 @@ from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import desc
 from typing import List, Optional
 from datetime import datetime
-import shutil
 import os
 
-from database import SessionLocal, Task, User, Notification, TaskComment, TaskAttachment
+from database import SessionLocal, Task, User, TaskComment, TaskAttachment
 from schemas import (
     TaskCreate, TaskUpdate, TaskResponse, UserRole, 
     TaskCommentCreate, TaskCommentResponse, TaskAttachmentResponse
 )
 from security import get_current_user
+from image_pipeline import save_upload_to_disk, make_thumbnail, thumbnail_name, THUMBNAIL_MIMES
+from notification_service import NotificationService
 
 UPLOAD_DIR = "uploads/tasks"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
@@ -31,14 +32,14 @@ def get_db():
 
 # --- HELPER: NOTIFY ---
 def create_notification(db: Session, user_id: int, title: str, message: str, link: str = "/hr/tasks", type: str = "info"):
-    notif = Notification(
-        recipient_user_id=user_id,
+    NotificationService(db).notify(
+        [user_id],
         notif_type=type,
         title=title,
         message=message,
-        link_url=link
+        link_url=link,
+        dedupe=False  # Ogni evento del task va notificato (riassegnazioni, riaperture)
     )
-    db.add(notif)
     # Commit handled by caller
 
 # --- ENDPOINTS ---
@@ -113,6 +114,7 @@ def get_tasks(
         for a in t.attachments:
             a.uploader_name = a.uploader.full_name if a.uploader else "Sistema"
             a.download_url = f"/tasks/attachments/{a.id}/download"
+            a.thumbnail_url = _attachment_thumbnail_url(a)
         
     return tasks
 
@@ -353,6 +355,7 @@ def get_task(task_id: int, current_user: User = Depends(get_current_user), db: S
     for a in task.attachments:
         a.uploader_name = a.uploader.full_name if a.uploader else "Sistema"
         a.download_url = f"/tasks/attachments/{a.id}/download"
+        a.thumbnail_url = _attachment_thumbnail_url(a)
         
     return task
 
@@ -391,10 +394,10 @@ async def upload_attachment(task_id: int, file: UploadFile = File(...), current_
     safe_filename = f"{task_id}_{int(datetime.utcnow().timestamp())}_{file.filename}"
     file_path = os.path.join(UPLOAD_DIR, safe_filename)
     
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-        
-    file_size = os.path.getsize(file_path)
+    # Upload su disco a blocchi; per le immagini miniatura generata nel process pool
+    file_size = await save_upload_to_disk(file, file_path, max_bytes=None)
+    if (file.content_type or "").lower() in THUMBNAIL_MIMES:
+        await make_thumbnail(file_path)
     
     new_att = TaskAttachment(
         task_id=task.id,
@@ -410,8 +413,18 @@ async def upload_attachment(task_id: int, file: UploadFile = File(...), current_
     
     new_att.uploader_name = current_user.full_name
     new_att.download_url = f"/tasks/attachments/{new_att.id}/download"
+    new_att.thumbnail_url = _attachment_thumbnail_url(new_att)
     return new_att
 
+def _thumbnail_path(att: TaskAttachment) -> str:
+    return os.path.join(os.path.dirname(att.file_path), thumbnail_name(att.file_path))
+
+def _attachment_thumbnail_url(att: TaskAttachment) -> Optional[str]:
+    # Allegati caricati prima delle miniature (o miniatura fallita): niente URL, il client usa l'originale
+    if (att.file_type or "").lower() not in THUMBNAIL_MIMES or not os.path.exists(_thumbnail_path(att)):
+        return None
+    return f"/tasks/attachments/{att.id}/thumbnail"
+
 @router.delete("/attachments/{attachment_id}")
 def delete_attachment(attachment_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     att = db.query(TaskAttachment).filter(TaskAttachment.id == attachment_id).first()
@@ -421,8 +434,9 @@ def delete_attachment(attachment_id: int, current_user: User = Depends(get_curre
     if att.uploaded_by != current_user.id and not is_manager:
         raise HTTPException(status_code=403, detail="Not authorized")
         
-    if os.path.exists(att.file_path):
-        os.remove(att.file_path)
+    for path in (att.file_path, _thumbnail_path(att)):
+        if os.path.exists(path):
+            os.remove(path)
         
     db.delete(att)
     db.commit()
@@ -437,3 +451,14 @@ def download_attachment(attachment_id: int, db: Session = Depends(get_db)):
          raise HTTPException(status_code=404, detail="File lost on disk")
          
     return FileResponse(att.file_path, filename=att.filename)
+
+@router.get("/attachments/{attachment_id}/thumbnail")
+def download_attachment_thumbnail(attachment_id: int, db: Session = Depends(get_db)):
+    att = db.query(TaskAttachment).filter(TaskAttachment.id == attachment_id).first()
+    if not att: raise HTTPException(status_code=404, detail="Attachment not found")
+
+    thumb_path = _thumbnail_path(att)
+    if not os.path.exists(thumb_path):
+         raise HTTPException(status_code=404, detail="Thumbnail not available")
+
+    return FileResponse(thumb_path, media_type="image/jpeg")
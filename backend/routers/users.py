@@ -12,8 +12,12 @@ from schemas import UserCreate, UserUpdate, UserResponse, MessageResponse, Locat
 from security import (
     get_current_user, 
     get_current_admin,
-    get_password_hash
+    get_password_hash,
+    invalidate_user_cache
 )
+from permission_index import invalidate_permission_index
+from presence import get_presence_store
+from logistics_pool import invalidate_live_pool
 
 router = APIRouter(prefix="/users", tags=["Utenti"])
 
@@ -28,9 +32,9 @@ async def heartbeat(
 ):
     """
     Endpoint chiamato periodicamente dal frontend per segnalare presenza.
+    Solo in memoria: scritto su DB in batch dallo scheduler (presence.flush_presence).
     """
-    current_user.last_seen = datetime.utcnow()
-    db.commit()
+    get_presence_store().touch(current_user)
     return {"status": "alive"}
 
 
@@ -40,28 +44,11 @@ async def get_online_users(
     current_user: User = Depends(get_current_user)
 ):
     """
-    Ritorna la lista utenti attivi negli ultimi 2 minuti.
+    Ritorna la lista utenti attivi negli ultimi 2 minuti (dal presence store in memoria).
     """
-    threshold = datetime.utcnow() - timedelta(minutes=2)
-    
-    online_users = db.query(User).filter(
-        User.last_seen >= threshold,
-        User.is_active == True
-    ).all()
-    
-    return [
-        {
-            "id": u.id,
-            "username": u.username,
-            "fullName": u.full_name,
-            "role": u.role,
-            "lastSeen": u.last_seen,
-            "lat": u.last_lat,
-            "lon": u.last_lon,
-            "lastUpdate": u.last_location_update
-        } 
-        for u in online_users
-    ]
+    store = get_presence_store()
+    store.seed(db)  # Solo alla prima chiamata dopo l'avvio
+    return store.online(minutes=2)
 
 
 @router.patch("/me/location", summary="Aggiorna Posizione GPS")
@@ -72,14 +59,9 @@ async def update_location(
 ):
     """
     Riceve le coordinate GPS dall'app client e aggiorna l'ultima posizione nota.
+    Aggiorna anche last_seen; scrittura su DB in batch come per l'heartbeat.
     """
-    current_user.last_lat = location.latitude
-    current_user.last_lon = location.longitude
-    current_user.last_location_update = datetime.utcnow()
-    # Aggiorna anche last_seen per mantenerlo online
-    current_user.last_seen = datetime.utcnow()
-    
-    db.commit()
+    get_presence_store().update_location(current_user, location.latitude, location.longitude)
     return {"status": "ok", "lat": location.latitude, "lon": location.longitude}
 
 
@@ -192,6 +174,7 @@ async def create_user(
     
     db.commit()
     db.refresh(new_user)
+    invalidate_permission_index()
     
     return new_user
 
@@ -214,6 +197,8 @@ async def update_user(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Utente non trovato"
         )
+    old_username = user.username
+    old_full_name = user.full_name
 
     # Verifica unicità username se cambiato
     if user_data.username and user_data.username != user.username:
@@ -266,6 +251,11 @@ async def update_user(
 
     db.commit()
     db.refresh(user)
+    invalidate_permission_index()
+    invalidate_user_cache(old_username)
+    if user.full_name != old_full_name:
+        # Nomi richiedente/magazziniere nelle richieste del pool logistica
+        invalidate_live_pool()
 
     log = AuditLog(
         user_id=current_user.id,
@@ -313,6 +303,9 @@ async def deactivate_user(
     db.add(log)
     
     db.commit()
+    invalidate_permission_index()
+    invalidate_user_cache(user.username)
+    get_presence_store().forget(user.id)
     
     return {"message": f"Utente {user.username} disattivato", "success": True}
 
@@ -346,6 +339,8 @@ async def activate_user(
     db.add(log)
     
     db.commit()
+    invalidate_permission_index()
+    invalidate_user_cache(user.username)
     
     return {"message": f"Utente {user.username} riattivato", "success": True}
 
@@ -422,6 +417,9 @@ async def delete_user(
         # --- C. DELETE USER ---
         db.delete(user)
         db.commit()
+        invalidate_permission_index()
+        invalidate_user_cache(username)
+        get_presence_store().forget(user_id)
         
         # Log by Current Admin
         log = AuditLog(
@@ -474,6 +472,7 @@ async def reset_user_pin(
     )
     db.add(log)
     db.commit()
+    invalidate_user_cache(user.username)
     
     return {"message": f"PIN di {user.username} resettato. Dovrà reimpostarlo al prossimo accesso.", "success": True}
 
@@ -517,5 +516,6 @@ async def set_user_pin(
     )
     db.add(log)
     db.commit()
+    invalidate_user_cache(user.username)
     
     return {"message": f"PIN impostato per {user.username}.", "success": True}
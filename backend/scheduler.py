@@ -7,12 +7,12 @@ from apscheduler.triggers.interval import IntervalTrigger
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 import logging
-import shutil
 import os
-import glob
 from pathlib import Path
 
 from database import SessionLocal, Notification
+from db_backup import run_scheduled_backup
+from notification_service import NotificationService
 
 # Configurazione Logger
 logging.basicConfig(level=logging.INFO)
@@ -70,7 +70,7 @@ def auto_cleanup_notifications():
         db.close()
 
 
-from models.chat import Message
+from models.chat import Message, ConversationMember
 
 def auto_cleanup_chats():
     """
@@ -84,10 +84,15 @@ def auto_cleanup_chats():
         # Elimina messaggi vecchi
         # Nota: per sicurezza facciamo in 2 step (FK reply_to)
         
-        # 1. Nullifica reply_to
+        # 1. Nullifica reply_to e puntatori last_message_id verso messaggi da eliminare
         db.query(Message).filter(Message.created_at < cutoff_date).update(
             {"reply_to_id": None}, synchronize_session=False
         )
+        db.query(ConversationMember).filter(
+            ConversationMember.last_message_id.in_(
+                db.query(Message.id).filter(Message.created_at < cutoff_date)
+            )
+        ).update({"last_message_id": None}, synchronize_session=False)
         db.flush()
         
         # 2. Cancella
@@ -105,50 +110,61 @@ def auto_cleanup_chats():
     finally:
         db.close()
 
+def reconcile_chat_counters():
+    """
+    Job pianificato: ripara la deriva dei contatori chat denormalizzati
+    (conversation_members.unread_count / last_message_id).
+    """
+    from chat_summary import reconcile_counters
+    db = SessionLocal()
+    try:
+        fixed = reconcile_counters(db)
+        if fixed > 0:
+            logger.info(f"Riconciliazione chat: corrette {fixed} membership.")
+    except Exception as e:
+        logger.error(f"Errore riconciliazione contatori chat: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+def flush_presence_job():
+    """Job pianificato: scrive in batch heartbeat e posizioni GPS accumulati in memoria."""
+    from presence import flush_presence
+    db = SessionLocal()
+    try:
+        flush_presence(db)
+    except Exception as e:
+        logger.error(f"Errore flush presenze: {e}")
+    finally:
+        db.close()
+
 def auto_backup_db():
     """
     Job pianificato: Backup orario del database.
-    Mantiene ultime 24 versioni.
+    Backup online (backup API SQLite) compresso e verificato: FULL ogni
+    BACKUP_FULL_INTERVAL_HOURS, incrementali (solo pagine cambiate) nelle altre ore.
     """
     logger.info("Avvio procedura di backup automatico DB...")
     try:
-        # Percorsi
-        BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-        DB_PATH = os.path.join(BASE_DIR, "sl_enterprise.db")
-        BACKUP_DIR = os.path.join(BASE_DIR, "backups")
-        
-        # Assicurati che cartella backup esista
-        os.makedirs(BACKUP_DIR, exist_ok=True)
-        
-        # Nome file con timestamp
-        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M")
-        backup_filename = f"sl_enterprise_{timestamp}.db"
-        backup_path = os.path.join(BACKUP_DIR, backup_filename)
-        
-        # 1. Esegui Backup (Copia file)
-        if os.path.exists(DB_PATH):
-            shutil.copy2(DB_PATH, backup_path)
-            logger.info(f"✅ Backup creato con successo: {backup_filename}")
-        else:
-            logger.error("❌ Errore Backup: File database non trovato!")
-            return
-
-        # 2. Pulizia vecchi backup (Mantieni ultimi 24)
-        list_of_files = glob.glob(os.path.join(BACKUP_DIR, "sl_enterprise_*.db"))
-        list_of_files.sort(key=os.path.getmtime, reverse=True) # Ordina per data (più recenti primi)
-        
-        if len(list_of_files) > 24:
-            files_to_delete = list_of_files[24:]
-            for f in files_to_delete:
-                try:
-                    os.remove(f)
-                    logger.info(f"🗑️ Eliminato backup vecchio: {os.path.basename(f)}")
-                except Exception as e:
-                    logger.error(f"Errore eliminazione vecchio backup {f}: {e}")
-                    
+        manifest = run_scheduled_backup()
+        if manifest:
+            logger.info(
+                f"✅ Backup {manifest['kind']} creato e verificato: {manifest['name']} "
+                f"({manifest['changed_pages']}/{manifest['page_count']} pagine, {manifest['stored_size'] // 1024} KB)"
+            )
     except Exception as e:
         logger.error(f"❌ CRITICAL ERROR BACKUP: {e}")
 
+def cleanup_report_cache():
+    """Job pianificato: rimuove gli export in cache scaduti e i job vecchi."""
+    from report_jobs import prune_report_cache
+    try:
+        removed = prune_report_cache()
+        if removed:
+            logger.info(f"Cache report: rimossi {removed} file scaduti")
+    except Exception as e:
+        logger.error(f"Errore pulizia cache report: {e}")
+
 def start_scheduler():
     """Avvia lo scheduler e aggiunge i job."""
     if not scheduler.running:
@@ -170,6 +186,26 @@ def start_scheduler():
             replace_existing=True
         )
 
+        # Riconciliazione contatori non letti chat (ogni ora + subito all'avvio)
+        scheduler.add_job(
+            reconcile_chat_counters,
+            trigger=IntervalTrigger(hours=1),
+            id='reconcile_chat_counters',
+            name='Riconciliazione contatori chat',
+            replace_existing=True
+        )
+        scheduler.add_job(reconcile_chat_counters, trigger='date', run_date=datetime.now() + timedelta(seconds=5))
+
+        # Flush presenze (heartbeat / GPS) ogni PRESENCE_FLUSH_SECONDS
+        from presence import PRESENCE_FLUSH_SECONDS
+        scheduler.add_job(
+            flush_presence_job,
+            trigger=IntervalTrigger(seconds=PRESENCE_FLUSH_SECONDS),
+            id='flush_presence',
+            name='Flush presenze utenti',
+            replace_existing=True
+        )
+
         # 3. Backup Orario Database (NOVITÀ SAFE MODE)
         scheduler.add_job(
             auto_backup_db,
@@ -181,12 +217,33 @@ def start_scheduler():
         # Avvia subito un backup all'avvio per sicurezza
         scheduler.add_job(auto_backup_db, trigger='date', run_date=datetime.now() + timedelta(seconds=10))
         
-        # 4. Logistics Escalation Check (Ogni 1 minuto)
+        # 4. Logistics Escalation: motore a scadenze (avvio + resync periodico)
+        from logistics_escalation import get_escalation_engine, ESCALATION_RESYNC_MINUTES
+        get_escalation_engine()
         scheduler.add_job(
-            check_logistics_escalations,
-            trigger=IntervalTrigger(minutes=1),
+            resync_logistics_escalations,
+            trigger=IntervalTrigger(minutes=ESCALATION_RESYNC_MINUTES),
             id='logistics_escalation',
-            name='Logistics Escalation Matrix',
+            name='Logistics Escalation Resync',
+            replace_existing=True
+        )
+
+        # 4b. Pool logistica in memoria: resync periodico dal DB
+        from logistics_pool import LIVE_POOL_RESYNC_MINUTES
+        scheduler.add_job(
+            resync_logistics_live_pool,
+            trigger=IntervalTrigger(minutes=LIVE_POOL_RESYNC_MINUTES),
+            id='logistics_live_pool',
+            name='Logistics Live Pool Resync',
+            replace_existing=True
+        )
+
+        # 4c. Cache export PDF/Excel: pulizia artefatti scaduti (ogni ora)
+        scheduler.add_job(
+            cleanup_report_cache,
+            trigger=IntervalTrigger(hours=1),
+            id='cleanup_report_cache',
+            name='Pulizia cache report',
             replace_existing=True
         )
 
@@ -227,38 +284,34 @@ def check_oven_stagnation():
             OvenItem.notified_overdue == False
         ).all()
         
+        entries = []
+        targets = None
         for item in overdue_items:
             elapsed_minutes = (now - item.inserted_at).total_seconds() / 60.0
             
             if elapsed_minutes > item.expected_minutes:
-                # Target: Coordinatori + Super Admin (per ruolo, non per nome)
-                from sqlalchemy import or_
-                from database import Role
-                targets = db.query(User).filter(
-                    User.is_active == True
-                ).outerjoin(Role, User.role_id == Role.id).filter(
-                    or_(
-                        Role.name == "coordinator",
-                        Role.name == "super_admin",
-                        User.role == "coordinator",
-                        User.role == "super_admin",
+                # Target: Coordinatori + Super Admin (per ruolo, non per nome), risolti una volta
+                if targets is None:
+                    from permission_index import get_permission_index
+                    targets = get_permission_index().resolve_user_ids(
+                        db, roles=("coordinator", "super_admin"), include_wildcard=False
                     )
-                ).all()
                 
-                for t in targets:
-                    n = Notification(
-                        recipient_user_id=t.id,
-                        notif_type="urgent",
-                        title="🚨 ATTENZIONE: Materiale scaduto nel forno!",
-                        message=f"Il materiale '{item.reference}' è nel forno da {int(elapsed_minutes)} minuti! Tempo massimo previsto: {item.expected_minutes} min. Verificare immediatamente.",
-                        link_url="/production/oven"
-                    )
-                    db.add(n)
+                entries.append((targets, (), {
+                    "notif_type": "urgent",
+                    "title": "🚨 ATTENZIONE: Materiale scaduto nel forno!",
+                    "message": f"Il materiale '{item.reference}' è nel forno da {int(elapsed_minutes)} minuti! Tempo massimo previsto: {item.expected_minutes} min. Verificare immediatamente.",
+                    "link_url": "/production/oven",
+                }))
                 
                 # Segna come notificato
                 item.notified_overdue = True
-                db.commit()
                 logger.info(f"Notifica stagnazione inviata per item {item.id} ({item.reference})")
+        
+        if entries:
+            # Tutti gli item scaduti: un solo INSERT di notifiche e un solo commit
+            NotificationService(db).notify_batch(entries)
+            db.commit()
                 
     except Exception as e:
         logger.error(f"Errore check stagnazione forno: {e}")
@@ -270,80 +323,31 @@ def check_oven_stagnation():
 # ============================================================
 # ESCALATION LOGIC
 # ============================================================
-from models.logistics import LogisticsRequest
-from models.core import User
 
-def check_logistics_escalations():
+def resync_logistics_escalations():
     """
-    Controlla ritardi logistica e invia notifiche scalari.
-    Level 1 (> 3 min): Coordinatori (Iasevoli, Acone, Piccirillo, Marino)
-    Level 2 (> 7 min): Factory Controller (Esposito) + Admin (Sasy)
-    Level 3 (> 10 min): Direttori (Diodasto, Brescia)
+    Rete di sicurezza del motore di escalation (logistics_escalation):
+    riallinea lo heap delle scadenze alle richieste pending sul DB, per le
+    modifiche fatte fuori dagli endpoint (script, altri processi).
     """
-    db = SessionLocal()
+    from logistics_escalation import get_escalation_engine
     try:
-        now = datetime.utcnow()
-        pending_requests = db.query(LogisticsRequest).filter(
-            LogisticsRequest.status == 'pending'
-        ).all()
-        
-        for req in pending_requests:
-            minutes_waiting = (now - req.created_at).total_seconds() / 60.0
-            new_level = req.escalation_level or 0
-            
-            # Target Users Cache (To avoid repeat queries inside loop, ideally move outside but for safety keep here)
-            # Level 1 Targets
-            coord_names = ["Iasevoli", "Acone", "Piccirillo", "Marino"]
-            # Level 2 Targets
-            controller_names = ["Esposito Antonio", "Sasy"] 
-            # Level 3 Targets
-            director_names = ["Diodasto", "Brescia"]
-
-            if minutes_waiting > 10 and new_level < 3:
-                # Level 3
-                notify_users_by_partial_name(db, director_names, req, "DA 10 MINUTI", "critical")
-                new_level = 3
-                
-            elif minutes_waiting > 7 and new_level < 2:
-                # Level 2
-                notify_users_by_partial_name(db, controller_names, req, "DA 7 MINUTI", "urgent")
-                new_level = 2
-                
-            elif minutes_waiting > 3 and new_level < 1:
-                # Level 1
-                notify_users_by_partial_name(db, coord_names, req, "DA 3 MINUTI", "alert")
-                new_level = 1
-            
-            if new_level != req.escalation_level:
-                req.escalation_level = new_level
-                db.commit()
-                
+        get_escalation_engine().reload()
     except Exception as e:
-        logger.error(f"Errore logistics escalation: {e}")
-        db.rollback()
-    finally:
-        db.close()
+        logger.error(f"Errore resync escalation logistica: {e}")
 
-def notify_users_by_partial_name(db, names, req, delay_str, type_notif):
-    """Cerca utenti per nome parziale e crea notifica."""
-    target_ids = set()
-    for name in names:
-        users = db.query(User).filter(User.full_name.ilike(f"%{name}%")).all()
-        for u in users:
-            target_ids.add(u.id)
-            
-    for uid in target_ids:
-        # Avoid duplicate unread notifications for same request? 
-        # For simplicity, we send. The user will see pile of alerts.
-        n = Notification(
-            recipient_user_id=uid,
-            notif_type=type_notif,
-            title=f"⚠️ RITARDO RITIRO {delay_str}",
-            message=f"Banchina {req.banchina.code if req.banchina else '?'} aspetta da {int((datetime.utcnow() - req.created_at).total_seconds()/60)} min. Materiale: {req.material_type.label if req.material_type else '?'}.",
-            link_url="/logistics/pool"
-        )
-        db.add(n)
-    db.commit()
+
+def resync_logistics_live_pool():
+    """
+    Rete di sicurezza del pool logistica in memoria (logistics_pool):
+    lo ricostruisce dalle richieste attive sul DB, per le modifiche fatte
+    fuori dagli endpoint o gli eventi persi tra i worker.
+    """
+    from logistics_pool import get_live_pool
+    try:
+        get_live_pool().reload()
+    except Exception as e:
+        logger.error(f"Errore resync pool logistica: {e}")
 
 
 def shutdown_scheduler():
@@ -351,3 +355,7 @@ def shutdown_scheduler():
     if scheduler.running:
         scheduler.shutdown()
         logger.info("Scheduler spento.")
+    from logistics_escalation import shutdown_escalation_engine
+    shutdown_escalation_engine()
+    # Ultime presenze in memoria su DB
+    flush_presence_job()
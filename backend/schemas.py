@@ -695,6 +695,7 @@ class TaskAttachmentResponse(BaseModel):
     # Extra
     uploader_name: Optional[str] = None
     download_url: Optional[str] = None
+    thumbnail_url: Optional[str] = None
     
     class Config:
         from_attributes = True
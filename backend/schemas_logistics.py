@@ -243,6 +243,10 @@ class LogisticsPerformanceResponse(BaseModel):
     
     # Computed
     net_points: Optional[int] = None  # total_points - penalties_received
+    reaction_count: int = 0
+    reaction_p50_seconds: Optional[int] = None  # Stima da sketch (errore <= 2%)
+    reaction_p95_seconds: Optional[int] = None
+    slowest_reaction_seconds: Optional[int] = None
 
     class Config:
         from_attributes = True
@@ -258,6 +262,12 @@ class LogisticsLeaderboardEntry(BaseModel):
     penalties_received: int
     net_points: int
     avg_reaction_seconds: Optional[int] = None
+    fastest_reaction_seconds: Optional[int] = None
+    eta_accuracy_percent: Optional[float] = None
+    reaction_count: int = 0
+    reaction_p50_seconds: Optional[int] = None
+    reaction_p95_seconds: Optional[int] = None
+    slowest_reaction_seconds: Optional[int] = None
 
 
 class LogisticsLeaderboardResponse(BaseModel):
@@ -0,0 +1,447 @@
+"""
+Benchmark del motore di aggregazione colonnare (analytics) su DB temporaneo.
+
+Con ~100k KpiEntry e ~100k BlockRequest confronta, per risultato e tempo,
+i vecchi cicli Python su oggetti ORM con le versioni pandas/NumPy:
+- /production/reports: statistiche JSON e righe del foglio Excel
+- /kpi/report/advanced/pdf: righe, subtotali giorno/reparto, totale periodo
+- /kpi/report/daily: settori della giornata
+- kpi_rollups.rebuild_kpi_rollups: ricostruzione completa dei rollup
+
+Uso:
+    python scripts/bench_analytics.py [numero_righe]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from itertools import groupby
+
+_tmp_dir = tempfile.mkdtemp(prefix="sl_analytics_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'analytics.db')}"
+
+# Add parent directory to path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import joinedload
+
+from database import SessionLocal, create_tables, User, KpiConfig, KpiEntry, BlockRequest, ProductionMaterial
+from models.production import KpiDailyRollup, KpiMonthlyRollup
+from date_ranges import on_day
+from kpi_rollups import rebuild_kpi_rollups, ShiftRow
+from analytics import (
+    kpi_entries_frame, block_requests_frame, kpi_daily_report, kpi_shift_table, production_report
+)
+
+N_ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+N_SECTORS = 20
+SHIFTS = ("morning", "afternoon", "night")
+N_DAYS = N_ROWS // (N_SECTORS * len(SHIFTS)) + 1
+FIRST_DAY = date.today() - timedelta(days=N_DAYS)
+RANGE_START = datetime.combine(FIRST_DAY, datetime.min.time())
+RANGE_END = datetime.combine(date.today(), datetime.max.time())
+
+
+def seed():
+    create_tables()
+    rnd = random.Random(22)
+    db = SessionLocal()
+    for uid in range(1, 31):
+        db.add(User(id=uid, username=f"user{uid}", password_hash="x", full_name=f"Utente {uid}",
+                    role="super_admin", is_active=True))
+    for cid in range(1, N_SECTORS + 1):
+        target = rnd.choice((250, 320, 400, 600))
+        db.add(KpiConfig(id=cid, sector_name=f"Reparto {cid:02d}", kpi_target_8h=target,
+                         kpi_target_hourly=target / 8, display_order=cid))
+    categories = ["memory"] * 6 + ["sponge_density"] * 6 + ["sponge_color"] * 6 + ["supplier"] * 4
+    for mid, category in enumerate(categories, start=1):
+        db.add(ProductionMaterial(id=mid, category=category, label=f"{category[:6].upper()} {mid}"))
+    db.commit()
+
+    entries = []
+    for offset in range(N_DAYS):
+        day = datetime.combine(FIRST_DAY + timedelta(days=offset), datetime.min.time())
+        for cid in range(1, N_SECTORS + 1):
+            for shift in SHIFTS:
+                if len(entries) >= N_ROWS:
+                    break
+                hours_total = rnd.choice((8.0, 8.0, 7.5, 6.0))
+                downtime = rnd.choice((0.0, 0.0, 0.25, 0.5, 1.0, 8.0 if hours_total == 8.0 else 0.0))
+                entries.append({
+                    "kpi_config_id": cid, "work_date": day, "shift_type": shift,
+                    "hours_total": hours_total, "hours_downtime": downtime, "hours_net": hours_total - downtime,
+                    "quantity_produced": rnd.randint(0, 600), "efficiency_percent": rnd.uniform(40, 130),
+                    "staffing_status": rnd.choice(("pieno", "sottoorganico", "surplus", None)),
+                    "staffing_delta": rnd.randint(-2, 2), "recorded_by": 1,
+                })
+    db.execute(insert(KpiEntry), entries)
+
+    blocks = []
+    span = int((RANGE_END - RANGE_START).total_seconds())
+    for _ in range(N_ROWS):
+        created = RANGE_START + timedelta(seconds=rnd.randint(0, span - 7200))
+        processed = created + timedelta(seconds=rnd.randint(30, 5400)) if rnd.random() < 0.8 else None
+        delivered = processed + timedelta(seconds=rnd.randint(60, 3600)) if processed and rnd.random() < 0.8 else None
+        is_memory = rnd.random() < 0.45
+        blocks.append({
+            "request_type": "memory" if is_memory else "sponge",
+            "target_sector": rnd.choice(("pantografo", "giostra", "altro", "Giostra", None)),
+            "material_id": rnd.choice((1, 2, 3, 4, 5, 6, None)) if is_memory else None,
+            "density_id": None if is_memory else rnd.choice((7, 8, 9, 10, 11, 12, None)),
+            "color_id": None if is_memory else rnd.choice((13, 14, 15, 16, 17, 18)),
+            "supplier_id": rnd.choice((19, 20, 21, 22, None)),
+            "dimensions": rnd.choice(("160x190", "80x190", "90x200", "180x200")),
+            "is_trimmed": rnd.random() < 0.3, "quantity": rnd.randint(1, 6),
+            "status": rnd.choice(("pending", "processing", "delivered", "completed", "cancelled", "cancelled_acked")),
+            "is_urgent": rnd.random() < 0.1, "notes": rnd.choice((None, "", "urgente reparto")),
+            "created_by_id": rnd.choice((*range(1, 31), None)), "created_at": created,
+            "processed_by_id": rnd.randint(1, 30) if processed else None, "processed_at": processed,
+            "delivered_at": delivered,
+        })
+    db.execute(insert(BlockRequest), blocks)
+    db.commit()
+    db.close()
+    return len(entries), len(blocks)
+
+
+# ============================================================
+# VECCHI CICLI (copia del codice precedente)
+# ============================================================
+
+def legacy_production_report(db, start_date, end_date, shift_type="all", target_sector=None):
+    requests = db.query(BlockRequest).options(
+        joinedload(BlockRequest.material),
+        joinedload(BlockRequest.density),
+        joinedload(BlockRequest.color),
+        joinedload(BlockRequest.supplier),
+        joinedload(BlockRequest.created_by),
+        joinedload(BlockRequest.processed_by)
+    ).filter(
+        BlockRequest.created_at >= start_date,
+        BlockRequest.created_at <= end_date
+    ).all()
+    filtered_requests = []
+    if shift_type in ['morning', 'afternoon', 'night']:
+        for req in requests:
+            hour = req.created_at.hour
+            if shift_type == 'morning' and 6 <= hour < 14:
+                filtered_requests.append(req)
+            elif shift_type == 'afternoon' and 14 <= hour < 22:
+                filtered_requests.append(req)
+            elif shift_type == 'night' and (hour >= 22 or hour < 6):
+                filtered_requests.append(req)
+    else:
+        filtered_requests = requests
+    if target_sector:
+        filtered_requests = [r for r in filtered_requests if r.target_sector == target_sector]
+
+    data_rows = []
+    total_blocks = sum(req.quantity for req in filtered_requests)
+    by_type, by_dims, user_perf, supply_perf, by_sector = {}, {}, {}, {}, {}
+    memory_count = sponge_count = trimmed_count = cancelled_count = urgent_count = 0
+    time_created_processing, time_processing_delivered = [], []
+    for req in filtered_requests:
+        if req.request_type == 'memory':
+            mat_label = f"Memory {req.material.label if req.material else '?'}"
+            memory_count += req.quantity
+        else:
+            mat_label = f"Spugna {req.density.label if req.density else '?'} {req.color.label if req.color else '?'}"
+            sponge_count += req.quantity
+        if req.is_trimmed:
+            trimmed_count += req.quantity
+        if req.status in ['cancelled', 'cancelled_acked']:
+            cancelled_count += req.quantity
+        if hasattr(req, 'is_urgent') and req.is_urgent:
+            urgent_count += req.quantity
+        sector_key = (req.target_sector or 'non_specificato').lower()
+        if sector_key not in by_sector:
+            by_sector[sector_key] = {"memory": 0, "sponge": 0, "total": 0}
+        by_sector[sector_key]["total"] += req.quantity
+        if req.request_type == 'memory':
+            by_sector[sector_key]["memory"] += req.quantity
+        else:
+            by_sector[sector_key]["sponge"] += req.quantity
+        by_type[mat_label] = by_type.get(mat_label, 0) + req.quantity
+        dims = req.dimensions
+        if req.is_trimmed:
+            dims += " (Rifilato)"
+        by_dims[dims] = by_dims.get(dims, 0) + req.quantity
+        creator = req.created_by.full_name if req.created_by else "Unknown"
+        user_perf[creator] = user_perf.get(creator, 0) + req.quantity
+        if req.processed_by:
+            processor = req.processed_by.full_name
+            supply_perf[processor] = supply_perf.get(processor, 0) + req.quantity
+        if req.created_at and req.processed_at:
+            time_created_processing.append((req.processed_at - req.created_at).total_seconds() / 60)
+        if req.processed_at and req.delivered_at:
+            time_processing_delivered.append((req.delivered_at - req.processed_at).total_seconds() / 60)
+        sector_labels = {'pantografo': 'Pantografo', 'giostra': 'Giostra', 'altro': 'Altro'}
+        sector_display = sector_labels.get(req.target_sector.lower(), '') if req.target_sector else ''
+        data_rows.append({
+            "ID": req.id,
+            "Data": req.created_at.strftime("%Y-%m-%d %H:%M"),
+            "Utente Ordine": creator,
+            "Settore": sector_display,
+            "Tipo": req.request_type,
+            "Materiale": mat_label,
+            "Misure": req.dimensions,
+            "Rifilato": "SI" if req.is_trimmed else "NO",
+            "Fornitore": req.supplier.label if req.supplier else "",
+            "Quantità": req.quantity,
+            "Stato": req.status,
+            "Supply User": req.processed_by.full_name if req.processed_by else "",
+            "Note": req.notes or "",
+            "Attesa Presa in Carico (min)": round((req.processed_at - req.created_at).total_seconds()/60, 1) if req.processed_at else "",
+            "Tempo Lavorazione (min)": round((req.delivered_at - req.processed_at).total_seconds()/60, 1) if req.processed_at and req.delivered_at else ""
+        })
+    avg_wait = sum(time_created_processing) / len(time_created_processing) if time_created_processing else 0
+    avg_work = sum(time_processing_delivered) / len(time_processing_delivered) if time_processing_delivered else 0
+    stats = {
+        "total_blocks": total_blocks,
+        "by_type": by_type,
+        "by_dims": by_dims,
+        "user_perf": user_perf,
+        "supply_perf": supply_perf,
+        "avg_wait_min": round(avg_wait, 1),
+        "avg_work_min": round(avg_work, 1),
+        "memory_count": memory_count,
+        "sponge_count": sponge_count,
+        "trimmed_count": trimmed_count,
+        "trimmed_percentage": round((trimmed_count / total_blocks * 100) if total_blocks > 0 else 0, 1),
+        "cancelled_count": cancelled_count,
+        "cancelled_percentage": round((cancelled_count / total_blocks * 100) if total_blocks > 0 else 0, 1),
+        "urgent_count": urgent_count,
+        "urgent_percentage": round((urgent_count / total_blocks * 100) if total_blocks > 0 else 0, 1),
+        "by_sector": by_sector
+    }
+    return stats, data_rows
+
+
+def legacy_shift_table(entries):
+    """Numeri del report avanzato: (target, eff, mancanti, extra) per riga e per giorno/reparto, totale."""
+    rows, groups = [], []
+    total_qty = total_target_all = total_downtime_all = 0
+    for _key, group in groupby(entries, key=lambda e: (e.work_date, e.sector_name)):
+        sub_qty = sub_target_net = sub_downtime = 0
+        group_list = list(group)
+        for e in group_list:
+            hours_net = e.hours_net or 0
+            target_8h = e.kpi_target_8h or 0
+            target_real_net = 0
+            if hours_net > 0 and target_8h > 0:
+                target_real_net = target_8h * (hours_net / 8.0)
+            qty = e.quantity_produced
+            delta = qty - target_real_net
+            missing_pcs = f"{int(abs(delta))}" if delta < 0 else ""
+            extra_pcs = f"{int(delta)}" if delta > 0 else ""
+            eff = round((qty / target_real_net) * 100) if target_real_net > 0 else 0
+            rows.append((eff, missing_pcs, extra_pcs))
+            sub_qty += qty
+            sub_target_net += target_real_net
+            sub_downtime += e.hours_downtime
+        total_qty += sub_qty
+        total_target_all += sub_target_net
+        total_downtime_all += sub_downtime
+        sub_delta = sub_qty - sub_target_net
+        sub_eff = round((sub_qty / sub_target_net) * 100) if sub_target_net > 0 else 0
+        groups.append((len(group_list), sub_qty, f"{sub_downtime:.2f}", sub_eff,
+                       f"{int(abs(sub_delta))}" if sub_delta < 0 else "",
+                       f"{int(sub_delta)}" if sub_delta > 0 else ""))
+    grand_eff = round((total_qty / total_target_all) * 100) if total_target_all > 0 else 0
+    return rows, groups, (total_qty, f"{total_downtime_all:.2f}", grand_eff)
+
+
+def legacy_daily_report(db, work_date):
+    entries = db.query(KpiEntry).options(
+        joinedload(KpiEntry.kpi_config)
+    ).filter(
+        on_day(KpiEntry.work_date, work_date)
+    ).all()
+    by_sector = {}
+    for e in entries:
+        sector = e.kpi_config.sector_name
+        if sector not in by_sector:
+            by_sector[sector] = {
+                "sector_name": sector,
+                "kpi_target_8h": e.kpi_config.kpi_target_8h,
+                "shifts": {},
+                "total_hours": 0,
+                "total_downtime": 0,
+                "total_quantity": 0
+            }
+        by_sector[sector]["shifts"][e.shift_type] = {
+            "hours_total": e.hours_total,
+            "hours_downtime": e.hours_downtime,
+            "hours_net": e.hours_net,
+            "quantity": e.quantity_produced,
+            "efficiency": e.efficiency_percent,
+            "staffing_status": e.staffing_status,
+            "staffing_delta": e.staffing_delta
+        }
+        by_sector[sector]["total_hours"] += e.hours_total
+        by_sector[sector]["total_downtime"] += e.hours_downtime
+        by_sector[sector]["total_quantity"] += e.quantity_produced
+    for sector in by_sector.values():
+        hours_net = sector["total_hours"] - sector["total_downtime"]
+        sector["total_hours_net"] = hours_net
+        sector["total_qty_per_hour"] = sector["total_quantity"] / hours_net if hours_net > 0 else 0
+    return list(by_sector.values())
+
+
+def legacy_rebuild(db):
+    """Ricostruzione rollup con il ciclo Python precedente (inserimento compreso): ritorna i totali."""
+    daily = {}
+    for work_date, config_id, shift, qty, hours_total, downtime, hours_net in db.execute(select(
+        KpiEntry.work_date, KpiEntry.kpi_config_id, KpiEntry.shift_type, KpiEntry.quantity_produced,
+        KpiEntry.hours_total, KpiEntry.hours_downtime, KpiEntry.hours_net
+    )).yield_per(5000):
+        t = daily.setdefault((work_date.date(), config_id, shift), [0, 0, 0.0, 0.0, 0.0, 0.0])
+        t[0] += 1
+        t[1] += qty or 0
+        t[2] += hours_total or 0.0
+        t[3] += downtime or 0.0
+        t[4] += hours_net or 0.0
+        if hours_net and hours_net > 0:
+            t[5] += hours_net
+    monthly = {}
+    for (day, config_id, _shift), totals in daily.items():
+        m = monthly.setdefault((day.year, day.month, config_id, day.weekday() >= 5), [0, 0, 0.0, 0.0, 0.0, 0.0])
+        for i, value in enumerate(totals):
+            m[i] += value
+    fields = ("entries_count", "quantity_produced", "hours_total", "hours_downtime", "hours_net", "hours_net_target")
+    db.execute(delete(KpiDailyRollup))
+    db.execute(delete(KpiMonthlyRollup))
+    db.execute(insert(KpiDailyRollup), [
+        {"work_day": day, "weekday": day.weekday(), "kpi_config_id": config_id, "shift_type": shift,
+         **dict(zip(fields, totals))}
+        for (day, config_id, shift), totals in daily.items()
+    ])
+    db.execute(insert(KpiMonthlyRollup), [
+        {"year": year, "month": month, "kpi_config_id": config_id, "is_weekend": is_weekend,
+         **dict(zip(fields, totals))}
+        for (year, month, config_id, is_weekend), totals in monthly.items()
+    ])
+    return daily, monthly
+
+
+# ============================================================
+# CONFRONTO
+# ============================================================
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - t0) * 1000
+
+
+def close(a, b) -> bool:
+    if isinstance(a, float) or isinstance(b, float):
+        return abs(a - b) < 1e-6
+    return a == b
+
+
+def main():
+    print(f"[SEED] {N_ROWS} righe per tabella su {N_DAYS} giorni...")
+    n_entries, n_blocks = seed()
+    print(f"[SEED] KpiEntry={n_entries} BlockRequest={n_blocks}")
+    failures = []
+    timings = []
+
+    def check(label, good):
+        print(f"{'OK' if good else 'KO'}  {label}")
+        if not good:
+            failures.append(label)
+
+    db = SessionLocal()
+    try:
+        # --- /production/reports ---
+        for shift_type, sector in (("all", None), ("night", None), ("morning", "giostra")):
+            label = f"production report turno={shift_type} settore={sector or '-'}"
+            (old_stats, old_rows), t_old = timed(legacy_production_report, db, RANGE_START, RANGE_END,
+                                                 shift_type, sector)
+            db.expunge_all()
+
+            def vectorized():
+                return production_report(block_requests_frame(db, RANGE_START, RANGE_END), shift_type, sector)
+            (new_stats, new_detail), t_new = timed(vectorized)
+            check(f"{label}: statistiche JSON", new_stats == old_stats)
+            check(f"{label}: stesso ordine chiavi raggruppamenti",
+                  all(list(new_stats[k]) == list(old_stats[k]) for k in ("by_type", "by_dims", "user_perf",
+                                                                         "supply_perf", "by_sector")))
+            check(f"{label}: righe Excel ({len(old_rows)})",
+                  new_detail.to_dict("records") == old_rows and
+                  list(new_detail.columns) == list(pd.DataFrame(old_rows).columns))
+            timings.append((label, t_old, t_new))
+
+        # --- /kpi/report/advanced/pdf (raggruppamento su tutte le righe) ---
+        entries = kpi_entries_frame(db).sort_values(["work_date", "sector_name", "shift_type"], kind="stable")
+        shift_entries = [
+            ShiftRow(r.work_date, r.sector_name, r.shift_type, r.quantity_produced, r.hours_downtime,
+                     r.hours_net, r.kpi_target_8h, "")
+            for r in entries.itertuples()
+        ]
+        (old_rows, old_groups, old_total), t_old = timed(legacy_shift_table, shift_entries)
+        table, t_new = timed(lambda: kpi_shift_table(pd.DataFrame(shift_entries, columns=ShiftRow._fields)))
+        rows, groups = table["rows"], table["groups"]
+        check("report avanzato: efficienza/mancanti/extra per riga",
+              list(zip(rows["efficiency"].tolist(), rows["missing"].tolist(), rows["extra"].tolist())) == old_rows)
+        check("report avanzato: subtotali giorno/reparto", list(zip(
+            groups["size"].tolist(), groups["quantity_produced"].tolist(),
+            [f"{v:.2f}" for v in groups["hours_downtime"]], groups["efficiency"].tolist(),
+            groups["missing"].tolist(), groups["extra"].tolist())) == old_groups)
+        check("report avanzato: totale periodo",
+              (table["total_quantity"], f"{table['total_downtime']:.2f}", table["total_efficiency"]) == old_total)
+        timings.append((f"report avanzato ({len(shift_entries)} righe)", t_old, t_new))
+
+        # --- /kpi/report/daily ---
+        work_date = FIRST_DAY + timedelta(days=N_DAYS // 2)
+        old_daily, t_old = timed(legacy_daily_report, db, work_date)
+        db.expunge_all()
+        new_daily, t_new = timed(lambda: kpi_daily_report(kpi_entries_frame(db, work_date)))
+        check("report giornaliero", len(new_daily) == len(old_daily) and all(
+            n["shifts"] == o["shifts"] and all(close(n[k], o[k]) for k in o if k != "shifts")
+            for n, o in zip(new_daily, old_daily)))
+        timings.append(("report giornaliero (1 giorno)", t_old, t_new))
+
+        # --- rebuild_kpi_rollups ---
+        (old_daily_rollup, old_monthly_rollup), t_old = timed(legacy_rebuild, db)
+        _, t_new = timed(rebuild_kpi_rollups, db)
+        db.flush()
+        fields = ("entries_count", "quantity_produced", "hours_total", "hours_downtime", "hours_net",
+                  "hours_net_target")
+        new_daily_rollup = {
+            (r.work_day, r.kpi_config_id, r.shift_type): [getattr(r, f) for f in fields]
+            for r in db.query(KpiDailyRollup)
+        }
+        new_monthly_rollup = {
+            (r.year, r.month, r.kpi_config_id, r.is_weekend): [getattr(r, f) for f in fields]
+            for r in db.query(KpiMonthlyRollup)
+        }
+
+        def same_rollup(new, old):
+            return new.keys() == old.keys() and all(
+                all(close(float(a), float(b)) for a, b in zip(new[k], old[k])) for k in old)
+        check(f"rollup giornalieri ({len(old_daily_rollup)})", same_rollup(new_daily_rollup, old_daily_rollup))
+        check(f"rollup mensili ({len(old_monthly_rollup)})", same_rollup(new_monthly_rollup, old_monthly_rollup))
+        timings.append(("ricostruzione rollup KPI", t_old, t_new))
+        db.rollback()
+    finally:
+        db.close()
+
+    print()
+    print(f"{'operazione':<52} {'cicli (ms)':>11} {'pandas (ms)':>12} {'x':>6}")
+    for label, t_old, t_new in timings:
+        print(f"{label:<52} {t_old:>11.0f} {t_new:>12.0f} {t_old / t_new:>6.1f}")
+    print()
+    if failures:
+        print(f"ERRORE: {len(failures)} verifiche fallite")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Benchmark riepilogo chat (/chat/conversations, /chat/unread-count).
+
+Crea un DB SQLite temporaneo con N conversazioni e M messaggi (default 500 x 10k),
+poi conta le query SQL eseguite dal riepilogo set-based al crescere delle
+conversazioni dell'utente: il numero di query deve restare COSTANTE.
+
+Uso:
+    python scripts/bench_chat_conversations.py [--conversations 500] [--messages 10000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# DB temporaneo PRIMA di importare database.py (engine creato all'import)
+_tmp_dir = tempfile.mkdtemp(prefix="sl_bench_chat_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'bench.db')}"
+
+# Add parent directory to path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+from database import engine, SessionLocal, create_tables
+from models.core import User
+from models.chat import Conversation, ConversationMember, Message
+from chat_summary import get_conversation_summaries, get_unread_total, reconcile_counters
+
+
+class QueryCounter:
+    """Conta gli statement SQL eseguiti sull'engine."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+    def __enter__(self):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(engine, "before_cursor_execute", self)
+
+
+def seed(n_conversations: int, n_messages: int, n_users: int = 50):
+    """Popola il DB: l'utente 1 è membro di tutte le conversazioni."""
+    db = SessionLocal()
+    try:
+        db.bulk_insert_mappings(User, [
+            {"id": i, "username": f"user{i}", "password_hash": "x", "full_name": f"Utente {i}"}
+            for i in range(1, n_users + 1)
+        ])
+
+        now = datetime.utcnow()
+        db.bulk_insert_mappings(Conversation, [
+            {"id": c, "type": "group" if c % 3 else "direct", "name": f"Gruppo {c}",
+             "created_by": 1, "created_at": now - timedelta(days=3)}
+            for c in range(1, n_conversations + 1)
+        ])
+
+        members = []
+        for c in range(1, n_conversations + 1):
+            others = random.sample(range(2, n_users + 1), 1 if c % 3 == 0 else 5)
+            members.append({"conversation_id": c, "user_id": 1, "role": "admin",
+                            "last_read_at": now - timedelta(days=1)})
+            members.extend({"conversation_id": c, "user_id": u, "role": "member",
+                            "last_read_at": now - timedelta(days=1)} for u in others)
+        db.bulk_insert_mappings(ConversationMember, members)
+
+        db.bulk_insert_mappings(Message, [
+            {"conversation_id": random.randint(1, n_conversations),
+             "sender_id": random.randint(1, n_users),
+             "content": f"Messaggio {m}",
+             "created_at": now - timedelta(minutes=random.randint(0, 2 * 24 * 60))}
+            for m in range(n_messages)
+        ])
+        db.commit()
+
+        # Popola contatori denormalizzati (come il job di riconciliazione)
+        reconcile_counters(db)
+    finally:
+        db.close()
+
+
+def limit_memberships(user_id: int, keep: int):
+    """Simula un utente membro di sole `keep` conversazioni."""
+    db = SessionLocal()
+    try:
+        db.query(ConversationMember).filter(
+            ConversationMember.user_id == user_id,
+            ConversationMember.conversation_id > keep
+        ).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def run(user_id: int):
+    db = SessionLocal()
+    try:
+        with QueryCounter() as qc:
+            start = time.perf_counter()
+            summaries = get_conversation_summaries(db, user_id)
+            elapsed = (time.perf_counter() - start) * 1000
+        conv_queries = qc.count
+
+        with QueryCounter() as qc:
+            get_unread_total(db, user_id)
+        badge_queries = qc.count
+
+        return len(summaries), conv_queries, badge_queries, elapsed
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--conversations", type=int, default=500)
+    parser.add_argument("--messages", type=int, default=10000)
+    args = parser.parse_args()
+
+    random.seed(42)
+    create_tables()
+    print(f"Seed: {args.conversations} conversazioni, {args.messages} messaggi ({_tmp_dir})")
+    seed(args.conversations, args.messages)
+
+    print(f"{'conversazioni':>14} | {'query lista':>11} | {'query badge':>11} | {'tempo ms':>9}")
+    counts = set()
+    for keep in sorted({args.conversations, args.conversations // 10, 40, 1}, reverse=True):
+        limit_memberships(1, keep)
+        n, conv_q, badge_q, ms = run(1)
+        counts.add((conv_q, badge_q))
+        print(f"{n:>14} | {conv_q:>11} | {badge_q:>11} | {ms:>9.1f}")
+
+    if len(counts) == 1:
+        print("OK: numero di query costante al variare delle conversazioni.")
+    else:
+        print("ERRORE: il numero di query dipende dal numero di conversazioni!")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Benchmark concorrenza SQLite: profilo PRIMA (rollback journal, nessun PRAGMA,
+un solo pool) vs DOPO (db_profile: WAL + PRAGMA + pool di sola lettura).
+
+Traffico misto per BENCH_SECONDS secondi sullo stesso DB di partenza:
+- heartbeat:   UPDATE users.last_seen + commit              (8 thread)
+- logistics:   INSERT richiesta + presa in carico + commit  (4 thread)
+- pool:        lista richieste attive con join + contatori  (8 thread)
+- kpi:         aggregato mensile su kpi_entries             (4 thread)
+
+Per ogni categoria: operazioni completate, latenza p50/p95, errori "database is locked".
+
+Uso:
+    python scripts/bench_db_concurrency.py [secondi]
+"""
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+_tmp_dir = tempfile.mkdtemp(prefix="sl_dbbench_")
+TEMPLATE = os.path.join(_tmp_dir, "template.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{TEMPLATE}"
+
+# Add parent directory to path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+import db_profile
+from database import Base, User, Banchina, KpiConfig, KpiEntry
+from models.logistics import LogisticsMaterialType, LogisticsRequest
+
+BENCH_SECONDS = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+N_USERS = 200
+N_REQUESTS = 20_000
+N_KPI = 20_000
+WORKERS = {"heartbeat": 8, "logistics": 4, "pool": 8, "kpi": 4}
+
+
+def seed_template():
+    engine = create_engine(f"sqlite:///{TEMPLATE}")
+    Base.metadata.create_all(engine)
+    rnd = random.Random(42)
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(insert(User.__table__), [
+            {"id": i, "username": f"user{i}", "password_hash": "x", "full_name": f"Utente {i}", "role": "warehouse_operator", "is_active": True}
+            for i in range(1, N_USERS + 1)
+        ])
+        conn.execute(insert(Banchina.__table__), [{"id": i, "code": f"B{i}", "name": f"Banchina {i}"} for i in range(1, 16)])
+        conn.execute(insert(LogisticsMaterialType.__table__), [{"id": i, "label": f"Materiale {i}"} for i in range(1, 11)])
+        conn.execute(insert(LogisticsRequest.__table__), [
+            {
+                "material_type_id": rnd.randint(1, 10), "banchina_id": rnd.randint(1, 15),
+                "requester_id": rnd.randint(1, N_USERS), "quantity": 1,
+                "status": rnd.choice(["completed"] * 8 + ["pending", "processing"]),
+                "is_urgent": rnd.random() < 0.1, "escalation_level": 0,
+                "created_at": now - timedelta(minutes=rnd.randint(0, 60 * 24 * 90)),
+            }
+            for _ in range(N_REQUESTS)
+        ])
+        conn.execute(insert(KpiConfig.__table__), [
+            {"id": i, "sector_name": f"Settore {i}", "kpi_target_8h": 400} for i in range(1, 21)
+        ])
+        conn.execute(insert(KpiEntry.__table__), [
+            {
+                "kpi_config_id": rnd.randint(1, 20), "shift_type": rnd.choice(["morning", "afternoon", "night"]),
+                "work_date": now - timedelta(days=rnd.randint(0, 365)),
+                "hours_total": 8.0, "hours_downtime": rnd.choice([0, 0.25, 0.5]),
+                "quantity_produced": rnd.randint(100, 500), "efficiency_percent": rnd.uniform(50, 120),
+                "recorded_by": rnd.randint(1, N_USERS),
+            }
+            for _ in range(N_KPI)
+        ])
+    engine.dispose()
+
+
+def make_engines(path: str, tuned: bool):
+    url = f"sqlite:///{path}"
+    if not tuned:
+        # Configurazione originale di database.py
+        engine = create_engine(
+            url, connect_args={"check_same_thread": False},
+            pool_size=20, max_overflow=30, pool_timeout=10, pool_pre_ping=True, pool_recycle=300
+        )
+        return engine, engine
+    write = db_profile.apply_profile(create_engine(url, **db_profile.engine_options(url)))
+    read = db_profile.apply_profile(create_engine(url, **db_profile.engine_options(url, read_only=True)), read_only=True)
+    return write, read
+
+
+def run(tuned: bool) -> dict:
+    path = os.path.join(_tmp_dir, "after.db" if tuned else "before.db")
+    shutil.copy(TEMPLATE, path)
+    write_engine, read_engine = make_engines(path, tuned)
+    WriteSession = sessionmaker(bind=write_engine)
+    ReadSession = sessionmaker(bind=read_engine)
+
+    def heartbeat(db, rnd):
+        db.execute(text("UPDATE users SET last_seen = :ts WHERE id = :id"),
+                   {"ts": datetime.utcnow(), "id": rnd.randint(1, N_USERS)})
+        db.commit()
+
+    def logistics(db, rnd):
+        db.execute(text(
+            "INSERT INTO logistics_requests (material_type_id, banchina_id, requester_id, quantity, status, is_urgent, escalation_level, created_at) "
+            "VALUES (:m, :b, :u, 1, 'pending', 0, 0, :ts)"
+        ), {"m": rnd.randint(1, 10), "b": rnd.randint(1, 15), "u": rnd.randint(1, N_USERS), "ts": datetime.utcnow()})
+        db.execute(text(
+            "UPDATE logistics_requests SET status = 'processing', assigned_to_id = :u, taken_at = :ts "
+            "WHERE id = (SELECT id FROM logistics_requests WHERE status = 'pending' ORDER BY created_at LIMIT 1)"
+        ), {"u": rnd.randint(1, N_USERS), "ts": datetime.utcnow()})
+        db.commit()
+
+    def pool(db, rnd):
+        db.execute(text(
+            "SELECT r.id, r.status, m.label, b.code, u.full_name FROM logistics_requests r "
+            "JOIN logistics_material_types m ON m.id = r.material_type_id "
+            "JOIN banchine b ON b.id = r.banchina_id JOIN users u ON u.id = r.requester_id "
+            "WHERE r.status IN ('pending', 'prepared', 'processing') ORDER BY r.is_urgent DESC, r.created_at LIMIT 50"
+        )).fetchall()
+        db.execute(text("SELECT COUNT(*) FROM logistics_requests WHERE status IN ('pending', 'prepared')")).scalar()
+        db.rollback()
+
+    def kpi(db, rnd):
+        start = datetime.utcnow() - timedelta(days=rnd.randint(30, 365))
+        db.execute(text(
+            "SELECT kpi_config_id, shift_type, SUM(quantity_produced), AVG(efficiency_percent) FROM kpi_entries "
+            "WHERE work_date >= :s AND work_date < :e GROUP BY kpi_config_id, shift_type"
+        ), {"s": start, "e": start + timedelta(days=30)}).fetchall()
+        db.rollback()
+
+    ops = {"heartbeat": (heartbeat, WriteSession), "logistics": (logistics, WriteSession),
+           "pool": (pool, ReadSession), "kpi": (kpi, ReadSession)}
+    latencies = {k: [] for k in ops}
+    errors = {k: 0 for k in ops}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + BENCH_SECONDS
+
+    def worker(kind, seed):
+        fn, Session = ops[kind]
+        rnd = random.Random(seed)
+        local = []
+        local_errors = 0
+        while time.perf_counter() < deadline:
+            db = Session()
+            t0 = time.perf_counter()
+            try:
+                fn(db, rnd)
+                local.append(time.perf_counter() - t0)
+            except OperationalError:
+                db.rollback()
+                local_errors += 1
+            finally:
+                db.close()
+        with lock:
+            latencies[kind].extend(local)
+            errors[kind] += local_errors
+
+    threads = [
+        threading.Thread(target=worker, args=(kind, i))
+        for kind, n in WORKERS.items() for i in range(n)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    info = db_profile.describe(write_engine)
+    write_engine.dispose()
+    read_engine.dispose()
+
+    result = {"journal_mode": info["journal_mode"]}
+    for kind, values in latencies.items():
+        values.sort()
+        result[kind] = {
+            "ops": len(values),
+            "p50_ms": values[len(values) // 2] * 1000 if values else 0.0,
+            "p95_ms": values[int(len(values) * 0.95)] * 1000 if values else 0.0,
+            "errors": errors[kind],
+        }
+    return result
+
+
+def main():
+    seed_template()
+    print(f"DB: {N_USERS} utenti, {N_REQUESTS} richieste logistica, {N_KPI} KPI entries; {BENCH_SECONDS:.0f} s per profilo\n")
+    results = {"PRIMA": run(tuned=False), "DOPO": run(tuned=True)}
+
+    print(f"{'profilo':<8} {'categoria':<10} {'ops':>7} {'ops/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'errori':>7}")
+    for label, res in results.items():
+        for kind in WORKERS:
+            r = res[kind]
+            print(f"{label:<8} {kind:<10} {r['ops']:>7} {r['ops'] / BENCH_SECONDS:>8.0f} "
+                  f"{r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['errors']:>7}")
+        print(f"{'':<8} journal_mode={res['journal_mode']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Micro-benchmark fan-out notifiche: 10.000 notifiche su DB SQLite temporaneo.
+
+- PRIMA: un db.add(Notification(...)) per destinatario + commit (come i vecchi loop)
+- PRIMA (commit per item): stesso loop con commit ogni 10 destinatari (job forno/escalation)
+- DOPO:  NotificationService.notify_batch() -> un INSERT multiplo + commit
+- DEDUPE: ripetendo lo stesso fan-out non viene scritta nessuna notifica nuova
+
+Uso:
+    python scripts/bench_notifications.py [numero_notifiche]
+"""
+import os
+import sys
+import tempfile
+import time
+
+_tmp_dir = tempfile.mkdtemp(prefix="sl_notif_bench_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'notif.db')}"
+
+# Add parent directory to path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert
+
+from database import engine, Base, SessionLocal, User, Notification
+from notification_service import NotificationService
+
+N_NOTIFICATIONS = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+N_USERS = 1_000
+PER_ITEM = 10   # destinatari per "evento"
+
+
+def seed():
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User.__table__), [
+            {"id": i, "username": f"user{i}", "password_hash": "x", "full_name": f"Utente {i}", "role": "coordinator", "is_active": True}
+            for i in range(1, N_USERS + 1)
+        ])
+
+
+def events(tag: str):
+    """N_NOTIFICATIONS / PER_ITEM eventi, ognuno a PER_ITEM destinatari."""
+    for e in range(N_NOTIFICATIONS // PER_ITEM):
+        user_ids = [(e * PER_ITEM + k) % N_USERS + 1 for k in range(PER_ITEM)]
+        yield user_ids, {
+            "notif_type": "alert",
+            "title": f"{tag} evento {e}",
+            "message": f"Messaggio dell'evento {e}",
+            "link_url": "/logistics/pool",
+        }
+
+
+def clear():
+    with engine.begin() as conn:
+        conn.execute(Notification.__table__.delete())
+
+
+def timed(label: str, fn):
+    clear()
+    t0 = time.perf_counter()
+    written = fn()
+    elapsed = time.perf_counter() - t0
+    print(f"{label:<34} {written:>7} righe {elapsed * 1000:>9.1f} ms {written / elapsed if elapsed else 0:>10.0f} righe/s")
+    return elapsed, written
+
+
+def legacy(commit_every_item: bool):
+    def run():
+        db = SessionLocal()
+        written = 0
+        try:
+            for user_ids, payload in events("legacy"):
+                for uid in user_ids:
+                    db.add(Notification(recipient_user_id=uid, **payload))
+                    written += 1
+                if commit_every_item:
+                    db.commit()
+            db.commit()
+        finally:
+            db.close()
+        return written
+    return run
+
+
+def service():
+    db = SessionLocal()
+    try:
+        written = NotificationService(db, publish=False).notify_batch(
+            [(user_ids, (), payload) for user_ids, payload in events("bulk")]
+        )
+        db.commit()
+        return written
+    finally:
+        db.close()
+
+
+def main():
+    seed()
+    print(f"{N_NOTIFICATIONS} notifiche, {PER_ITEM} destinatari per evento\n")
+    t_legacy, _ = timed("PRIMA db.add + commit finale", legacy(commit_every_item=False))
+    t_item, _ = timed("PRIMA db.add + commit per evento", legacy(commit_every_item=True))
+    t_bulk, written = timed("DOPO NotificationService", service)
+
+    # Dedupe: stesso fan-out ripetuto senza svuotare la tabella
+    db = SessionLocal()
+    t0 = time.perf_counter()
+    duplicated = NotificationService(db, publish=False).notify_batch(
+        [(user_ids, (), payload) for user_ids, payload in events("bulk")]
+    )
+    db.commit()
+    db.close()
+    print(f"{'DEDUPE ripetizione identica':<34} {duplicated:>7} righe {(time.perf_counter() - t0) * 1000:>9.1f} ms")
+
+    print(f"\nspeedup vs commit finale: {t_legacy / t_bulk:.1f}x, vs commit per evento: {t_item / t_bulk:.1f}x")
+    ok = written == N_NOTIFICATIONS and duplicated == 0 and t_bulk < t_legacy
+    print("OK" if ok else "ERRORE: fan-out notifiche non conforme")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
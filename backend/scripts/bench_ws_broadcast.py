@@ -0,0 +1,133 @@
+"""
+Micro-benchmark broadcast WebSocket con un client bloccato.
+
+Client simulati (stessa interfaccia di starlette WebSocket: accept/send_text/close):
+- N client "veloci" (invio ~1 ms, Wi-Fi buono)
+- 1 client "bloccato" che non completa mai l'invio (tablet fuori copertura)
+
+- PRIMA: await ws.send_json() in sequenza su ogni socket (vecchio broadcast)
+- DOPO:  LogisticsConnectionManager.broadcast() -> serializzazione unica,
+         code di uscita per socket, invii concorrenti, client lento scartato
+
+Uso:
+    python scripts/bench_ws_broadcast.py [numero_client]
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+
+os.environ.setdefault("WS_SEND_TIMEOUT", "0.5")
+os.environ.setdefault("WS_SEND_QUEUE_SIZE", "64")
+
+# Add parent directory to path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from websocket_manager import LogisticsConnectionManager, WS_SEND_TIMEOUT
+
+N_CLIENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+N_MESSAGES = 30
+SEND_DELAY = 0.001
+
+
+class SimulatedClient:
+    def __init__(self, stalled: bool = False):
+        self.stalled = stalled
+        self.received = 0
+        self.closed_code = None
+        self.serializations = 0
+
+    async def accept(self):
+        pass
+
+    async def send_json(self, message):
+        self.serializations += 1
+        await self.send_text(json.dumps(message, separators=(",", ":"), ensure_ascii=False))
+
+    async def send_text(self, text: str):
+        if self.stalled:
+            await asyncio.sleep(3600)
+        await asyncio.sleep(SEND_DELAY)
+        self.received += 1
+
+    async def close(self, code: int = 1000):
+        self.closed_code = code
+
+
+def make_clients():
+    return [SimulatedClient() for _ in range(N_CLIENTS)] + [SimulatedClient(stalled=True)]
+
+
+def message(i: int) -> dict:
+    return {"type": "request_updated", "request_id": i, "status": "processing"}
+
+
+async def legacy(clients, deadline: float) -> float:
+    """Vecchio broadcast: sequenziale, il client bloccato ferma tutti (interrotto a deadline)."""
+    t0 = time.perf_counter()
+
+    async def run():
+        for i in range(N_MESSAGES):
+            for ws in clients:
+                await ws.send_json(message(i))
+
+    try:
+        await asyncio.wait_for(run(), deadline)
+    except asyncio.TimeoutError:
+        pass
+    return time.perf_counter() - t0
+
+
+async def concurrent(clients) -> float:
+    manager = LogisticsConnectionManager()
+    for ws in clients:
+        await manager.connect(ws, "logistics")
+    fast = clients[:-1]
+    t0 = time.perf_counter()
+    for i in range(N_MESSAGES):
+        await manager.broadcast("logistics", message(i))
+    deadline = t0 + 5.0
+    while sum(ws.received for ws in fast) < N_MESSAGES * len(fast) and time.perf_counter() < deadline:
+        await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - t0
+    await asyncio.sleep(WS_SEND_TIMEOUT + 0.1)   # lascia scattare il timeout del client bloccato
+    concurrent.stats = manager.fanout.stats()
+    concurrent.remaining = len(manager.pools["logistics"])
+    return elapsed
+
+
+async def main():
+    print(f"{N_CLIENTS} client veloci + 1 bloccato, {N_MESSAGES} messaggi\n")
+
+    old_clients = make_clients()
+    t_old = await legacy(old_clients, deadline=5.0)
+    old_delivered = sum(ws.received for ws in old_clients)
+    print(f"{'PRIMA send_json sequenziale':<30} {old_delivered:>6} consegnati in {t_old * 1000:>8.1f} ms (bloccato)")
+
+    new_clients = make_clients()
+    t_new = await concurrent(new_clients)
+    new_delivered = sum(ws.received for ws in new_clients)
+    stats = concurrent.stats
+    print(f"{'DOPO code per socket':<30} {new_delivered:>6} consegnati in {t_new * 1000:>8.1f} ms")
+    print(f"      metriche: {stats}")
+
+    expected = N_CLIENTS * N_MESSAGES
+    checks = [
+        ("tutti i client veloci serviti", new_delivered == expected),
+        ("client bloccato scartato (1013)", new_clients[-1].closed_code == 1013 and stats["dropped_sockets"] == 1),
+        ("client bloccato rimosso dal pool", concurrent.remaining == N_CLIENTS),
+        ("una serializzazione per messaggio", stats["messages"] == N_MESSAGES
+         and all(ws.serializations == 0 for ws in new_clients)),
+        ("più veloce del broadcast sequenziale", t_new < t_old and new_delivered > old_delivered),
+    ]
+    ok = True
+    for label, good in checks:
+        ok = ok and good
+        print(f"{'OK ' if good else 'KO '} {label}")
+    print("OK" if ok else "ERRORE: broadcast WebSocket non conforme")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,332 @@
+"""
+Benchmark degli export Excel in streaming (xlsx_stream) su DB temporaneo.
+
+Con 200k BlockRequest e 200k LeaveRequest confronta la generazione precedente
+(pandas.ExcelWriter / Workbook in memoria + larghezze calcolate rileggendo
+tutte le celle) con i fogli write-only di openpyxl:
+- /production/reports?format=excel  (render_production_excel)
+- /reports/absences/export/excel    (render_absences_excel)
+
+Ogni variante gira in un processo separato: tempo e picco di memoria (RSS)
+sono misurati senza interferenze. Alla fine i file vengono confrontati cella
+per cella.
+
+Uso:
+    python scripts/bench_xlsx_export.py [numero_righe]
+"""
+import io
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+if "--run" not in sys.argv:
+    _tmp_dir = tempfile.mkdtemp(prefix="sl_xlsx_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'xlsx.db')}"
+    os.environ["REPORT_CACHE_DIR"] = os.path.join(_tmp_dir, "cache")
+
+# Add parent directory to path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openpyxl import load_workbook
+from sqlalchemy import insert
+
+from database import (
+    SessionLocal, create_tables, User, Employee, Department, LeaveRequest, BlockRequest, ProductionMaterial
+)
+
+N_ROWS = int(sys.argv[1]) if len(sys.argv) > 1 and sys.argv[1].isdigit() else 200_000
+N_EMPLOYEES = 2_000
+RANGE_START = datetime(2025, 1, 1)
+RANGE_END = datetime(2025, 12, 31)
+PRODUCTION_PARAMS = {"start_date": "2025-01-01", "end_date": "2025-12-31"}
+ABSENCE_PARAMS = {"start_date": "2025-01-01", "end_date": "2025-12-31"}
+VARIANTS = ("production_legacy", "production_stream", "absences_legacy", "absences_stream")
+
+
+def seed():
+    create_tables()
+    rnd = random.Random(25)
+    db = SessionLocal()
+    for uid in range(1, 31):
+        db.add(User(id=uid, username=f"user{uid}", password_hash="x", full_name=f"Utente {uid}",
+                    role="super_admin", is_active=True))
+    for did in range(1, 11):
+        db.add(Department(id=did, name=f"Reparto {did}"))
+    categories = ["memory"] * 6 + ["sponge_density"] * 6 + ["sponge_color"] * 6 + ["supplier"] * 4
+    for mid, category in enumerate(categories, start=1):
+        db.add(ProductionMaterial(id=mid, category=category, label=f"{category[:6].upper()} {mid}"))
+    db.commit()
+    db.execute(insert(Employee), [
+        {"id": i, "first_name": f"Nome{i}", "last_name": f"Cognome{i}", "department_id": rnd.randint(1, 10),
+         "is_active": True} for i in range(1, N_EMPLOYEES + 1)
+    ])
+
+    blocks = []
+    span = int((RANGE_END - RANGE_START).total_seconds())
+    for _ in range(N_ROWS):
+        created = RANGE_START + timedelta(seconds=rnd.randint(0, span - 7200))
+        processed = created + timedelta(seconds=rnd.randint(30, 5400)) if rnd.random() < 0.8 else None
+        delivered = processed + timedelta(seconds=rnd.randint(60, 3600)) if processed and rnd.random() < 0.8 else None
+        is_memory = rnd.random() < 0.45
+        blocks.append({
+            "request_type": "memory" if is_memory else "sponge",
+            "target_sector": rnd.choice(("pantografo", "giostra", "altro", None)),
+            "material_id": rnd.choice((1, 2, 3, 4, 5, 6, None)) if is_memory else None,
+            "density_id": None if is_memory else rnd.choice((7, 8, 9, 10, 11, 12, None)),
+            "color_id": None if is_memory else rnd.choice((13, 14, 15, 16, 17, 18)),
+            "supplier_id": rnd.choice((19, 20, 21, 22, None)),
+            "dimensions": rnd.choice(("160x190", "80x190", "90x200", "180x200")),
+            "is_trimmed": rnd.random() < 0.3, "quantity": rnd.randint(1, 6),
+            "status": rnd.choice(("pending", "processing", "delivered", "completed", "cancelled")),
+            "is_urgent": rnd.random() < 0.1, "notes": rnd.choice((None, "", "urgente reparto")),
+            "created_by_id": rnd.choice((*range(1, 31), None)), "created_at": created,
+            "processed_by_id": rnd.randint(1, 30) if processed else None, "processed_at": processed,
+            "delivered_at": delivered,
+        })
+    db.execute(insert(BlockRequest), blocks)
+
+    leaves = []
+    for _ in range(N_ROWS):
+        start = RANGE_START + timedelta(days=rnd.randint(-5, 364))
+        leaves.append({
+            "employee_id": rnd.randint(1, N_EMPLOYEES), "leave_type": rnd.choice(("vacation", "sick", "permit", "other")),
+            "status": "approved", "start_date": start, "end_date": start + timedelta(days=rnd.randint(0, 6)),
+            "reason": rnd.choice((None, "Visita medica", "Motivi familiari")),
+        })
+    db.execute(insert(LeaveRequest), leaves)
+    db.commit()
+    db.close()
+
+
+# ============================================================
+# GENERAZIONE PRECEDENTE (copia)
+# ============================================================
+
+def legacy_production_excel(db, params) -> bytes:
+    """render_production_excel con la scrittura precedente (pandas.ExcelWriter)."""
+    import pandas as pd
+    import routers.production as production
+
+    frames = {}
+    stats_fn = production._production_stats
+
+    def capture_stats(db, params):
+        stats, df_logs = stats_fn(db, params)
+        frames["Dettaglio Ordini"] = df_logs
+        return stats, df_logs
+
+    def pandas_writer(target, sheets):
+        output = io.BytesIO()
+        with pd.ExcelWriter(output, engine='openpyxl') as writer:
+            for sheet in sheets:
+                df = frames.get(sheet.title)
+                if df is None:
+                    df = pd.DataFrame(list(sheet.rows), columns=list(sheet.headers))
+                df.to_excel(writer, sheet_name=sheet.title, index=False)
+
+            # Auto-adjust column widths (basic)
+            for worksheet in writer.sheets.values():
+                for column_cells in worksheet.columns:
+                    length = max(len(str(cell.value)) for cell in column_cells)
+                    worksheet.column_dimensions[column_cells[0].column_letter].width = length + 2
+        with open(target, "wb") as f:
+            f.write(output.getvalue())
+
+    production._production_stats, production.write_xlsx = capture_stats, pandas_writer
+    result = production.render_production_excel(db, params)
+    return result.read()
+
+
+def legacy_absences_excel(db, request) -> bytes:
+    from openpyxl import Workbook
+    from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+    from openpyxl.utils import get_column_letter
+    from routers.reports import build_absence_report
+
+    report_data = build_absence_report(request, db)
+    s_date = datetime.strptime(request.start_date, "%Y-%m-%d")
+    e_date = datetime.strptime(request.end_date, "%Y-%m-%d")
+    employees = db.query(Employee).filter(Employee.is_active == True).all()
+    emp_map = {e.id: e for e in employees}
+    leaves = db.query(LeaveRequest).filter(
+        LeaveRequest.employee_id.in_(list(emp_map)),
+        LeaveRequest.status == 'approved',
+        LeaveRequest.start_date <= e_date,
+        LeaveRequest.end_date >= s_date
+    ).order_by(LeaveRequest.start_date).all()
+
+    wb = Workbook()
+    ws1 = wb.active
+    ws1.title = "Dettaglio Assenze"
+    header_fill = PatternFill(start_color="0F172A", end_color="0F172A", fill_type="solid")
+    header_font = Font(bold=True, color="FFFFFF")
+    border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'),
+                    bottom=Side(style='thin'))
+    for col, header in enumerate(["Dipendente", "Reparto", "Tipo", "Data Inizio", "Data Fine", "Giorni", "Motivo"], 1):
+        cell = ws1.cell(row=1, column=col, value=header)
+        cell.fill, cell.font, cell.alignment, cell.border = header_fill, header_font, Alignment(horizontal='center'), border
+    row = 2
+    for leave in leaves:
+        emp = emp_map.get(leave.employee_id)
+        leave_type = leave.leave_type.upper()
+        if leave_type == 'VACATION': leave_type = 'FERIE'
+        elif leave_type == 'SICK': leave_type = 'MALATTIA'
+        elif leave_type == 'PERMIT': leave_type = 'PERMESSO'
+        actual_start = max(leave.start_date, s_date)
+        actual_end = min(leave.end_date, e_date)
+        ws1.cell(row=row, column=1, value=f"{emp.last_name} {emp.first_name}")
+        ws1.cell(row=row, column=2, value=emp.department.name if emp.department else "N/D")
+        ws1.cell(row=row, column=3, value=leave_type)
+        ws1.cell(row=row, column=4, value=actual_start.strftime("%d/%m/%Y"))
+        ws1.cell(row=row, column=5, value=actual_end.strftime("%d/%m/%Y"))
+        ws1.cell(row=row, column=6, value=(actual_end - actual_start).days + 1)
+        ws1.cell(row=row, column=7, value=leave.reason or "-")
+        row += 1
+    for col in range(1, 8):
+        ws1.column_dimensions[get_column_letter(col)].width = 18
+
+    ws2 = wb.create_sheet("Riepilogo Dipendenti")
+    for col, header in enumerate(["Dipendente", "Reparto", "Giorni Totali", "N. Episodi", "Bradford Factor", "Lun/Ven %"], 1):
+        ws2.cell(row=1, column=col, value=header)
+    for row, emp in enumerate(report_data.employees, 2):
+        mon_fri_pct = round((emp.monday_friday_count / emp.absence_count * 100), 0) if emp.absence_count > 0 else 0
+        for col, value in enumerate((emp.employee_name, emp.department_name, emp.total_days, emp.absence_count,
+                                     emp.bradford_factor, f"{mon_fri_pct}%"), 1):
+            ws2.cell(row=row, column=col, value=value)
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+# ============================================================
+# ESECUZIONE DI UNA VARIANTE (processo separato)
+# ============================================================
+
+def run_variant(variant: str, out_path: str):
+    from report_jobs import REPORTS
+    import routers.production  # noqa: F401  (registra i report)
+    import routers.reports  # noqa: F401
+
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    db = SessionLocal()
+    t0 = time.perf_counter()
+    if variant.startswith("production"):
+        spec = REPORTS["production_excel"]
+        params = spec.params.model_validate(PRODUCTION_PARAMS)
+    else:
+        spec = REPORTS["absences_excel"]
+        params = spec.params.model_validate(ABSENCE_PARAMS)
+    if variant == "production_legacy":
+        content = legacy_production_excel(db, params)
+    elif variant == "absences_legacy":
+        content = legacy_absences_excel(db, params)
+    else:
+        result = spec.render(db, params)
+        os.replace(result.path, out_path)
+        content = None
+    if content is not None:
+        with open(out_path, "wb") as f:
+            f.write(content)
+    elapsed = time.perf_counter() - t0
+    db.close()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"seconds": elapsed, "peak_mb": peak / 1024, "delta_mb": (peak - baseline) / 1024,
+                      "size_kb": os.path.getsize(out_path) / 1024}))
+
+
+# ============================================================
+# CONFRONTO
+# ============================================================
+
+def sheet_rows(path: str, title: str, sort: bool = False):
+    wb = load_workbook(path, read_only=True)
+    rows = [tuple(None if v == "" else v for v in row) for row in wb[title].iter_rows(values_only=True)]
+    wb.close()
+    if sort:
+        # A parità di data inizio l'ordine delle righe non è definito nella versione precedente
+        rows = rows[:1] + sorted(rows[1:], key=repr)
+    return rows
+
+
+def column_widths(path: str, title: str):
+    wb = load_workbook(path)
+    ws = wb[title]
+    widths = [ws.column_dimensions[letter].width for letter in "ABCDEFGHIJKLMNO"]
+    wb.close()
+    return widths
+
+
+def main():
+    print(f"Seed {N_ROWS} BlockRequest + {N_ROWS} LeaveRequest...")
+    t0 = time.perf_counter()
+    seed()
+    print(f"Seed completato in {time.perf_counter() - t0:.1f}s\n")
+
+    results = {}
+    outputs = {}
+    for variant in VARIANTS:
+        out_path = os.path.join(_tmp_dir, f"{variant}.xlsx")
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--run", variant, out_path],
+                              capture_output=True, text=True, env=os.environ.copy())
+        line = proc.stdout.strip().splitlines()[-1] if proc.stdout.strip() else ""
+        if proc.returncode != 0 or not line.startswith("{"):
+            # -9: processo terminato dall'OOM killer
+            print(f"KO  {variant}: terminato con codice {proc.returncode} {proc.stderr.strip()[-300:]}")
+            results[variant] = None
+            continue
+        results[variant] = json.loads(line)
+        outputs[variant] = out_path
+
+    ok = True
+
+    def check(label, good):
+        nonlocal ok
+        ok = ok and good
+        print(f"{'OK ' if good else 'KO '} {label}")
+
+    check("tutte le varianti completate", len(outputs) == len(VARIANTS))
+    if outputs.keys() >= {"production_legacy", "production_stream"}:
+        for title in ("Riepilogo", "Dettaglio Ordini"):
+            check(f"produzione, foglio '{title}' identico",
+                  sheet_rows(outputs["production_legacy"], title) == sheet_rows(outputs["production_stream"], title))
+    if outputs.keys() >= {"absences_legacy", "absences_stream"}:
+        check("assenze, foglio 'Dettaglio Assenze' identico (stesse righe)",
+              sheet_rows(outputs["absences_legacy"], "Dettaglio Assenze", sort=True)
+              == sheet_rows(outputs["absences_stream"], "Dettaglio Assenze", sort=True))
+        check("assenze, foglio 'Riepilogo Dipendenti' identico",
+              sheet_rows(outputs["absences_legacy"], "Riepilogo Dipendenti")
+              == sheet_rows(outputs["absences_stream"], "Riepilogo Dipendenti"))
+
+    print(f"\n{'variante':<20} {'tempo (s)':>10} {'picco RSS (MB)':>15} {'+RSS (MB)':>10} {'file (KB)':>10}")
+    for variant in VARIANTS:
+        r = results.get(variant)
+        if r is None:
+            print(f"{variant:<20} {'errore':>10}")
+            continue
+        print(f"{variant:<20} {r['seconds']:>10.2f} {r['peak_mb']:>15.0f} {r['delta_mb']:>10.0f} {r['size_kb']:>10.0f}")
+    for name in ("production", "absences"):
+        legacy, stream = results.get(f"{name}_legacy"), results.get(f"{name}_stream")
+        if legacy and stream:
+            print(f"{name}: {legacy['seconds'] / stream['seconds']:.1f}x più veloce, "
+                  f"memoria aggiuntiva {legacy['delta_mb']:.0f} MB -> {stream['delta_mb']:.0f} MB")
+    if outputs.keys() >= {"production_legacy", "production_stream"}:
+        legacy_w = column_widths(outputs["production_legacy"], "Dettaglio Ordini")
+        stream_w = column_widths(outputs["production_stream"], "Dettaglio Ordini")
+        print(f"larghezze colonne dettaglio (tutte le celle / campione): {legacy_w} / {stream_w}")
+
+    print("OK" if ok else "ERRORE: file diversi o variante fallita")
+    return ok
+
+
+if __name__ == "__main__":
+    if "--run" in sys.argv:
+        index = sys.argv.index("--run")
+        run_variant(sys.argv[index + 1], sys.argv[index + 2])
+    else:
+        sys.exit(0 if main() else 1)
@@ -0,0 +1,125 @@
+"""
+Verifica della cache utenti autenticati (security.AuthUserCache) su DB temporaneo.
+
+Con la cache calda (stesso token, richieste ripetute):
+- PIN: setup-pin seguito da verify-pin; reset-pin e set-pin dell'admin
+  valgono dalla richiesta successiva (il vecchio PIN non è più accettato)
+- PIN cambiato sul DB senza invalidazione: la rilettura di User nell'handler
+  vede comunque il valore aggiornato (lo snapshot non sostituisce il DB)
+- disattivazione / riattivazione: 403 / 200 dalla richiesta successiva
+- cambio ruolo: nuovo ruolo e permessi dalla richiesta successiva
+
+Uso:
+    python scripts/check_auth_cache.py
+"""
+import os
+import sys
+import tempfile
+
+_tmp_dir = tempfile.mkdtemp(prefix="sl_auth_cache_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'auth.db')}"
+os.environ["REPORT_CACHE_DIR"] = os.path.join(_tmp_dir, "cache")
+
+# Add parent directory to path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+
+from database import SessionLocal, create_tables, User, Role
+from security import create_access_token, get_password_hash, get_user_cache_stats
+import main
+
+
+def seed():
+    create_tables()
+    db = SessionLocal()
+    db.add_all([
+        Role(id=1, name="super_admin", label="Super Admin", permissions=["*"]),
+        Role(id=2, name="coordinator", label="Coordinatore", permissions=["view_dash"]),
+        Role(id=3, name="record_user", label="Operatore", permissions=[]),
+    ])
+    db.add(User(id=1, username="admin", password_hash="x", full_name="Admin", role="super_admin",
+                role_id=1, is_active=True))
+    db.add(User(id=2, username="mario", password_hash="x", full_name="Mario Rossi", role="coordinator",
+                role_id=2, is_active=True))
+    db.commit()
+    db.close()
+
+
+def set_pin_without_invalidation(pin: str):
+    db = SessionLocal()
+    db.query(User).filter(User.id == 2).update({"pin_hash": get_password_hash(pin)})
+    db.commit()
+    db.close()
+
+
+def main_check():
+    seed()
+    ok = True
+
+    def check(label, good):
+        nonlocal ok
+        ok = ok and good
+        print(f"{'OK ' if good else 'KO '} {label}")
+
+    admin = {"Authorization": f"Bearer {create_access_token({'sub': 'admin', 'role': 'super_admin'})}"}
+    user = {"Authorization": f"Bearer {create_access_token({'sub': 'mario', 'role': 'coordinator'})}"}
+
+    with TestClient(main.app) as client:
+        client.get("/users/me", headers=admin)
+        client.get("/users/me", headers=user)
+        hits = get_user_cache_stats()["hits"]
+        check("cache calda (GET /users/me servito dalla cache)",
+              client.get("/users/me", headers=user).status_code == 200 and get_user_cache_stats()["hits"] > hits)
+
+        # --- PIN ---
+        r = client.post("/auth/setup-pin", json={"pin": "1234"}, headers=user)
+        check("setup-pin 200", r.status_code == 200)
+        r = client.post("/auth/verify-pin", json={"pin": "1234"}, headers=user)
+        check(f"verify-pin subito dopo setup-pin: 200 (got {r.status_code})", r.status_code == 200)
+
+        client.patch("/users/2/reset-pin", headers=admin)
+        r = client.post("/auth/verify-pin", json={"pin": "1234"}, headers=user)
+        check(f"dopo reset-pin il vecchio PIN non vale: 400 (got {r.status_code})", r.status_code == 400)
+
+        client.patch("/users/2/set-pin", json={"pin": "5678"}, headers=admin)
+        r_new = client.post("/auth/verify-pin", json={"pin": "5678"}, headers=user)
+        r_old = client.post("/auth/verify-pin", json={"pin": "1234"}, headers=user)
+        check(f"set-pin admin: nuovo PIN 200, vecchio 401 (got {r_new.status_code}, {r_old.status_code})",
+              r_new.status_code == 200 and r_old.status_code == 401)
+
+        client.get("/users/me", headers=user)
+        set_pin_without_invalidation("4321")
+        hits = get_user_cache_stats()["hits"]
+        r_new = client.post("/auth/verify-pin", json={"pin": "4321"}, headers=user)
+        r_old = client.post("/auth/verify-pin", json={"pin": "5678"}, headers=user)
+        check(f"PIN cambiato sul DB: l'handler rilegge User anche da cache (got {r_new.status_code}, {r_old.status_code})",
+              r_new.status_code == 200 and r_old.status_code == 401 and get_user_cache_stats()["hits"] > hits)
+
+        # --- DISATTIVAZIONE ---
+        client.get("/users/me", headers=user)
+        client.patch("/users/2/deactivate", headers=admin)
+        r = client.get("/users/me", headers=user)
+        check(f"utente disattivato: 403 (got {r.status_code})", r.status_code == 403)
+        client.patch("/users/2/activate", headers=admin)
+        r = client.get("/users/me", headers=user)
+        check(f"utente riattivato: 200 (got {r.status_code})", r.status_code == 200)
+
+        # --- CAMBIO RUOLO ---
+        check("coordinator: lista utenti 200", client.get("/users/", headers=user).status_code == 200)
+        client.patch("/users/2", json={"role": "record_user"}, headers=admin)
+        me = client.get("/users/me", headers=user).json()
+        r = client.get("/users/", headers=user)
+        check(f"ruolo record_user: /users/me aggiornato, lista utenti 403 (got {me.get('role')}, {r.status_code})",
+              me.get("role") == "record_user" and r.status_code == 403)
+        client.patch("/users/2", json={"role": "coordinator"}, headers=admin)
+        r = client.get("/users/", headers=user)
+        check(f"ruolo ripristinato: lista utenti 200 (got {r.status_code})", r.status_code == 200)
+
+    print(f"\nstatistiche cache: {get_user_cache_stats()}")
+    print("OK" if ok else "ERRORE: cache utenti non conforme")
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main_check() else 1)
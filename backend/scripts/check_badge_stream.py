@@ -0,0 +1,165 @@
+"""
+Verifica del canale badge (/ws/badges) su DB SQLite temporaneo.
+
+- token non valido: connessione chiusa (4401)
+- all'apertura: snapshot completo dei contatori
+- notifiche (utente e per ruolo), messaggi chat, lettura, ferie pending:
+  il client riceve solo il delta, e solo se interessato
+- transazione annullata: nessun delta
+- lo snapshot finale ("refresh") coincide con snapshot iniziale + delta ricevuti
+
+Uso:
+    python scripts/check_badge_stream.py
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+_tmp_dir = tempfile.mkdtemp(prefix="sl_badges_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'badges.db')}"
+
+# Add parent directory to path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from database import SessionLocal, create_tables, User, Notification
+from models.hr import Employee, LeaveRequest
+from models.chat import Conversation, ConversationMember
+from notification_service import NotificationService
+from security import create_access_token, get_current_user
+import main
+
+USERS = [
+    (1, "hr", "super_admin"),
+    (2, "coord", "coordinator"),
+    (3, "other", "coordinator"),
+]
+CURRENT = {"id": 1}
+
+
+def seed():
+    create_tables()
+    db = SessionLocal()
+    for uid, username, role in USERS:
+        db.add(User(id=uid, username=username, password_hash="x", full_name=username.title(), role=role, is_active=True))
+    db.add(Employee(id=1, first_name="Mario", last_name="Rossi"))
+    db.add(Conversation(id=1, type="direct", created_by=1))
+    db.add_all([ConversationMember(conversation_id=1, user_id=uid) for uid in (1, 2)])
+    db.commit()
+    db.close()
+
+
+def current_user():
+    db = SessionLocal()
+    return db.get(User, CURRENT["id"])
+
+
+def in_session(fn):
+    """Esegue fn(db) e committa, come un job in un thread."""
+    db = SessionLocal()
+    try:
+        fn(db)
+        db.commit()
+    finally:
+        db.close()
+
+
+def drain(ws):
+    """Delta ricevuti fino al prossimo snapshot (richiesto con "refresh")."""
+    ws.send_text("refresh")
+    deltas = []
+    while True:
+        msg = ws.receive_json()
+        if msg["type"] == "badges":
+            return deltas, msg
+        deltas.append((msg["counter"], msg["delta"], msg.get("conversation_id")))
+
+
+def main_check():
+    seed()
+    main.app.dependency_overrides[get_current_user] = current_user
+    ok = True
+
+    def check(label, good):
+        nonlocal ok
+        ok = ok and good
+        print(f"{'OK ' if good else 'KO '} {label}")
+
+    with TestClient(main.app) as client:
+        try:
+            with client.websocket_connect("/ws/badges?token=invalid") as ws:
+                ws.receive_json()
+            check("token non valido rifiutato", False)
+        except WebSocketDisconnect as e:
+            check("token non valido rifiutato", e.code == 4401)
+
+        tokens = {uid: create_access_token({"sub": username, "role": role}) for uid, username, role in USERS}
+        with client.websocket_connect(f"/ws/badges?token={tokens[1]}") as hr_ws, \
+                client.websocket_connect(f"/ws/badges?token={tokens[2]}") as coord_ws:
+            hr_start = hr_ws.receive_json()
+            coord_start = coord_ws.receive_json()
+            check("snapshot iniziale", hr_start["type"] == "badges" and hr_start["counters"]["notifications"] == 0)
+
+            # Notifiche in blocco: utente 2 + ruolo admin (visibile al super_admin), utente 3 non connesso
+            in_session(lambda db: NotificationService(db, publish=False).notify(
+                [2, 3], ["admin"], notif_type="info", title="Test", message="Badge"))
+            hr_deltas, _ = drain(hr_ws)
+            coord_deltas, _ = drain(coord_ws)
+            check("notifica per ruolo al super_admin", hr_deltas == [("notifications", 1, None)])
+            check("notifica per utente", coord_deltas == [("notifications", 1, None)])
+
+            # Transazione annullata: nessun delta
+            db = SessionLocal()
+            db.add(Notification(recipient_user_id=2, notif_type="info", title="X", message="Y"))
+            db.flush()
+            db.rollback()
+            db.close()
+            coord_deltas, _ = drain(coord_ws)
+            check("rollback senza delta", coord_deltas == [])
+
+            # Chat: messaggio dell'utente 1 -> +1 all'utente 2, lettura -> -1
+            CURRENT["id"] = 1
+            client.post("/chat/conversations/1/messages", json={"content": "Ciao"}).raise_for_status()
+            coord_deltas, _ = drain(coord_ws)
+            check("messaggio chat +1", coord_deltas == [("chat", 1, 1)])
+            CURRENT["id"] = 2
+            client.patch("/chat/conversations/1/read").raise_for_status()
+            coord_deltas, _ = drain(coord_ws)
+            check("lettura chat -1", coord_deltas == [("chat", -1, 1)])
+
+            # Ferie: pending -> +1 solo per HR, approvata -> -1
+            leave = {}
+
+            def add_leave(db):
+                req = LeaveRequest(employee_id=1, leave_type="vacation",
+                                   start_date=datetime(2026, 1, 5), end_date=datetime(2026, 1, 6))
+                db.add(req)
+                db.flush()
+                leave["id"] = req.id
+            in_session(add_leave)
+            hr_deltas, _ = drain(hr_ws)
+            coord_deltas, _ = drain(coord_ws)
+            check("ferie pending +1 (solo HR)", hr_deltas == [("pending_leaves", 1, None)] and coord_deltas == [])
+            in_session(lambda db: setattr(db.get(LeaveRequest, leave["id"]), "status", "approved"))
+            hr_deltas, _ = drain(hr_ws)
+            check("ferie approvate -1", hr_deltas == [("pending_leaves", -1, None)])
+
+            # Segna tutte lette (UPDATE in blocco)
+            client.patch("/notifications/read-all").raise_for_status()
+            coord_deltas, coord_end = drain(coord_ws)
+            check("segna tutte lette -1", coord_deltas == [("notifications", -1, None)])
+
+            hr_deltas, hr_end = drain(hr_ws)
+            check("snapshot finale coerente",
+                  hr_end["counters"] == {**hr_start["counters"], "notifications": 1}
+                  and coord_end["counters"] == coord_start["counters"])
+
+    print("OK" if ok else "ERRORE: canale badge non conforme")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main_check()
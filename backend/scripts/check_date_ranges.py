@@ -0,0 +1,137 @@
+"""
+Verifica dei filtri per giorno/periodo di date_ranges (on_day, between_days, overlaps_days).
+
+1. Correttezza: righe con orario, a mezzanotte, al limite del giorno successivo e
+   salvate come data pura 'YYYY-MM-DD' vengono selezionate come con func.date().
+2. Piano di esecuzione: i filtri su turni e KPI usano gli indici compositi
+   (SEARCH ... USING INDEX) invece della scansione completa.
+
+Uso:
+    python scripts/check_date_ranges.py
+"""
+import os
+import sys
+import tempfile
+from datetime import date, datetime
+
+_tmp_dir = tempfile.mkdtemp(prefix="sl_dates_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'dates.db')}"
+
+# Add parent directory to path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select, func, event, text
+
+from database import engine, Base
+from date_ranges import on_day, between_days, overlaps_days
+from models.shifts import ShiftAssignment
+from models.production import KpiEntry
+from models.hr import LeaveRequest
+
+DAY = date(2026, 3, 2)
+
+
+def seed(conn):
+    rows = [
+        (1, "2026-03-01 23:59:59.999999"),   # giorno prima
+        (2, "2026-03-02 00:00:00.000000"),   # mezzanotte
+        (3, "2026-03-02 14:30:00.000000"),   # con orario
+        (4, "2026-03-02"),                   # data pura inserita da script
+        (5, "2026-03-03 00:00:00.000000"),   # giorno dopo
+        (6, "2026-03-04 08:00:00.000000"),
+    ]
+    for shift_id, work_date in rows:
+        conn.execute(text(
+            "INSERT INTO shift_assignments (id, employee_id, work_date, shift_type, assigned_by) VALUES (:id, 1, :d, 'morning', 1)"
+        ), {"id": shift_id, "d": work_date})
+    leaves = [
+        (1, "2026-02-20 00:00:00.000000", "2026-03-01 18:00:00.000000"),   # finisce prima
+        (2, "2026-02-25 00:00:00.000000", "2026-03-02 00:00:00.000000"),   # finisce il primo giorno
+        (3, "2026-03-03 14:00:00.000000", "2026-03-03 16:00:00.000000"),   # permesso orario
+        (4, "2026-03-04 09:00:00.000000", "2026-03-10 00:00:00.000000"),   # inizia l'ultimo giorno
+        (5, "2026-03-05 00:00:00.000000", "2026-03-06 00:00:00.000000"),   # inizia dopo
+    ]
+    for leave_id, start, end in leaves:
+        conn.execute(text(
+            "INSERT INTO leave_requests (id, employee_id, leave_type, start_date, end_date, status) "
+            "VALUES (:id, 1, 'vacation', :s, :e, 'approved')"
+        ), {"id": leave_id, "s": start, "e": end})
+
+
+def ids(conn, stmt):
+    return sorted(conn.execute(stmt).scalars().all())
+
+
+def explain(conn, stmt) -> str:
+    """Esegue lo statement con il prefisso EXPLAIN QUERY PLAN."""
+    def add_explain(conn, cursor, statement, parameters, context, executemany):
+        return "EXPLAIN QUERY PLAN " + statement, parameters
+
+    event.listen(engine, "before_cursor_execute", add_explain, retval=True)
+    try:
+        rows = conn.execute(stmt).fetchall()
+    finally:
+        event.remove(engine, "before_cursor_execute", add_explain)
+    return "\n".join(row[-1] for row in rows)
+
+
+def main():
+    Base.metadata.create_all(bind=engine)
+    ok = True
+
+    with engine.begin() as conn:
+        seed(conn)
+
+    with engine.connect() as conn:
+        shift_ids = select(ShiftAssignment.id)
+        leave_ids = select(LeaveRequest.id)
+        checks = [
+            ("on_day(date)", ids(conn, shift_ids.where(on_day(ShiftAssignment.work_date, DAY))),
+             ids(conn, shift_ids.where(func.date(ShiftAssignment.work_date) == DAY.isoformat()))),
+            ("on_day('YYYY-MM-DD')", ids(conn, shift_ids.where(on_day(ShiftAssignment.work_date, "2026-03-02"))),
+             [2, 3, 4]),
+            ("on_day(datetime con orario)",
+             ids(conn, shift_ids.where(on_day(ShiftAssignment.work_date, datetime(2026, 3, 2, 23, 59, 59)))),
+             [2, 3, 4]),
+            ("between_days", ids(conn, shift_ids.where(between_days(ShiftAssignment.work_date, DAY, date(2026, 3, 3)))),
+             ids(conn, shift_ids.where(func.date(ShiftAssignment.work_date).between("2026-03-02", "2026-03-03")))),
+            ("overlaps_days",
+             ids(conn, leave_ids.where(overlaps_days(LeaveRequest.start_date, LeaveRequest.end_date, DAY, date(2026, 3, 4)))),
+             ids(conn, leave_ids.where(func.date(LeaveRequest.start_date) <= "2026-03-04",
+                                       func.date(LeaveRequest.end_date) >= "2026-03-02"))),
+        ]
+        for label, got, expected in checks:
+            match = got == expected
+            ok = ok and match
+            print(f"{'OK ' if match else 'KO '} {label}: {got} (atteso {expected})")
+
+        plans = [
+            ("turno del giorno (mobile)",
+             select(ShiftAssignment).where(ShiftAssignment.employee_id == 1, on_day(ShiftAssignment.work_date, DAY)),
+             "ix_shift_assignments_employee_date"),
+            ("turni del dipendente nella settimana",
+             select(ShiftAssignment).where(ShiftAssignment.employee_id == 1,
+                                           between_days(ShiftAssignment.work_date, DAY, date(2026, 3, 8))),
+             "ix_shift_assignments_employee_date"),
+            ("kpi per settore/giorno/turno",
+             select(KpiEntry).where(KpiEntry.kpi_config_id == 1, on_day(KpiEntry.work_date, DAY),
+                                    KpiEntry.shift_type == "morning"),
+             "ix_kpi_entries_config_date_shift"),
+            ("kpi di un settore nel mese",
+             select(KpiEntry).where(KpiEntry.kpi_config_id == 1, between_days(KpiEntry.work_date, DAY, date(2026, 3, 31))),
+             "ix_kpi_entries_config_date_shift"),
+        ]
+        for label, stmt, expected in plans:
+            plan = explain(conn, stmt)
+            used = f"INDEX {expected}" in plan
+            ok = ok and used
+            print(f"{'OK ' if used else 'KO '} {label}")
+            for line in plan.splitlines():
+                print(f"      {line}")
+
+    print("OK" if ok else "ERRORE: filtri per data non equivalenti o senza indice")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
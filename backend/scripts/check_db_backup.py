@@ -0,0 +1,112 @@
+"""
+Verifica del motore di backup (db_backup.py) su un database SQLite temporaneo.
+
+- backup FULL mentre un thread continua a scrivere (WAL attivo)
+- backup INCREMENTALE dopo alcune modifiche: deve salvare solo una parte delle pagine
+- verifica in sola lettura di ogni snapshot
+- snapshot con checksum alterato -> verifica fallita
+- restore dell'incrementale: contenuto identico al DB al momento del backup
+
+Uso:
+    python scripts/check_db_backup.py
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+_tmp_dir = tempfile.mkdtemp(prefix="sl_backup_")
+DB_PATH = os.path.join(_tmp_dir, "live.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+os.environ["BACKUP_DIR"] = os.path.join(_tmp_dir, "backups")
+
+# Add parent directory to path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db_backup
+
+
+def seed(rows: int):
+    conn = sqlite3.connect(DB_PATH)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT, qty INTEGER)")
+    conn.executemany(
+        "INSERT INTO items (name, qty) VALUES (?, ?)",
+        ((f"articolo {i} " + "x" * 80, i) for i in range(rows))
+    )
+    conn.commit()
+    conn.close()
+
+
+def writer(stop: threading.Event, counter: list):
+    """Scrittore concorrente: piccole transazioni continue durante il backup."""
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    while not stop.is_set():
+        conn.execute("INSERT INTO items (name, qty) VALUES ('concorrente', 1)")
+        conn.commit()
+        counter[0] += 1
+        time.sleep(0.001)
+    conn.close()
+
+
+def dump(path: str):
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    rows = conn.execute("SELECT id, name, qty FROM items ORDER BY id").fetchall()
+    conn.close()
+    return rows
+
+
+def main():
+    seed(50_000)
+    os.makedirs(db_backup.BACKUP_DIR, exist_ok=True)
+
+    stop, counter = threading.Event(), [0]
+    t = threading.Thread(target=writer, args=(stop, counter))
+    t.start()
+    start = time.perf_counter()
+    full = db_backup.verify_snapshot(db_backup.create_full_snapshot())
+    full_s = time.perf_counter() - start
+    stop.set()
+    t.join()
+
+    # Modifiche limitate -> incrementale piccolo
+    conn = sqlite3.connect(DB_PATH)
+    conn.execute("UPDATE items SET qty = qty + 1000 WHERE id BETWEEN 100 AND 200")
+    conn.execute("INSERT INTO items (name, qty) VALUES ('nuovo', 7)")
+    conn.commit()
+    conn.close()
+    expected = dump(DB_PATH)
+
+    incr = db_backup.verify_snapshot(db_backup.create_incremental_snapshot())
+
+    restored = os.path.join(_tmp_dir, "restored.db")
+    db_backup.restore_snapshot(incr["name"], restored)
+    restored_ok = dump(restored) == expected
+
+    # Snapshot alterato: la verifica deve fallire
+    with open(os.path.join(db_backup.BACKUP_DIR, incr["file"]), "r+b") as f:
+        f.seek(20)
+        f.write(b"\x00\xff\x00\xff")
+    tampered = db_backup.verify_snapshot(incr["name"])
+
+    print(f"FULL: {full['page_count']} pagine, {full['db_size'] // 1024} KB -> {full['stored_size'] // 1024} KB gzip, "
+          f"{full_s:.2f} s con {counter[0]} commit concorrenti, verifica={full['integrity']}")
+    print(f"INCREMENTALE: {incr['changed_pages']}/{incr['page_count']} pagine, {incr['stored_size'] // 1024} KB, "
+          f"verifica={incr['integrity']}")
+    print(f"Restore incrementale identico al DB: {restored_ok}")
+    print(f"Snapshot alterato -> verificato={tampered['verified']} ({tampered['integrity']})")
+
+    ok = (
+        full["verified"] and incr["verified"] and restored_ok
+        and counter[0] > 0
+        and incr["changed_pages"] < incr["page_count"] // 10
+        and not tampered["verified"]
+    )
+    print("OK" if ok else "ERRORE: risultati inattesi")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""
+Verifica dei rollup KPI (kpi_rollups) su DB temporaneo.
+
+- storico di KpiEntry su più di un anno, rollup vuoti: backfill all'avvio
+- scritture via /kpi/entries (nuova, aggiornamento, eliminazione), entry
+  spostata di giorno via ORM, transazione annullata: i rollup restano uguali
+  alla ricostruzione completa
+- /kpi/report/trend identico all'aggregazione Python precedente (stesse
+  righe giornaliere, stessi totali per settore) su vari periodi e filtri
+- righe del report avanzato PDF identiche a quelle lette dalle KpiEntry
+- righe lette dal DB e tempo: KpiEntry (prima) contro rollup (dopo)
+
+Uso:
+    python scripts/check_kpi_rollups.py [giorni_storico]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+# I worker del pool report (forkserver) rimportano questo file: ereditano l'ambiente del padre
+if __name__ == "__main__":
+    _tmp_dir = tempfile.mkdtemp(prefix="sl_kpi_rollups_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'kpi.db')}"
+    os.environ["REPORT_CACHE_DIR"] = os.path.join(_tmp_dir, "cache")
+
+# Add parent directory to path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+from sqlalchemy import insert, select
+from sqlalchemy.orm import joinedload
+
+from database import engine, SessionLocal, create_tables, User, KpiConfig, KpiEntry
+from models.production import KpiDailyRollup, KpiMonthlyRollup
+from date_ranges import between_days
+from kpi_rollups import rebuild_kpi_rollups, shift_rows, daily_series, sector_totals
+from security import get_current_user
+import main
+
+N_DAYS = int(sys.argv[1]) if len(sys.argv) > 1 else 420
+SECTORS = {1: ("Bordatura", 400), 2: ("Dolphin", 250), 3: ("Imbottitura", 320), 4: ("Taglio", 600)}
+SHIFTS = ("morning", "afternoon", "night")
+TODAY = date.today()
+FIRST_DAY = TODAY - timedelta(days=N_DAYS)
+_session = SessionLocal()
+_users = {}
+
+
+def seed():
+    create_tables()
+    db = SessionLocal()
+    db.add(User(id=1, username="admin", password_hash="x", full_name="Admin", role="super_admin", is_active=True))
+    for cid, (name, target) in SECTORS.items():
+        db.add(KpiConfig(id=cid, sector_name=name, kpi_target_8h=target, kpi_target_hourly=target / 8,
+                         display_order=len(SECTORS) - cid))
+    db.commit()
+    rows = []
+    for offset in range(N_DAYS):
+        day = FIRST_DAY + timedelta(days=offset)
+        for cid, (_name, target) in SECTORS.items():
+            for shift in SHIFTS:
+                if random.random() < 0.25 or (day.weekday() >= 5 and random.random() < 0.7):
+                    continue
+                hours_total = random.choice((8.0, 8.0, 7.5, 6.0))
+                hours_downtime = random.choice((0.0, 0.0, 0.25, 0.5, 1.75, 8.0))
+                hours_net = hours_total - hours_downtime
+                reason = random.choice((None, None, None, "setup", "manutenzione"))
+                rows.append({
+                    "kpi_config_id": cid, "work_date": datetime.combine(day, datetime.min.time()), "shift_type": shift,
+                    "hours_total": hours_total, "hours_downtime": hours_downtime, "hours_net": hours_net,
+                    "quantity_produced": int(target * max(hours_net, 0) / 8 * random.uniform(0.6, 1.3)),
+                    "downtime_reason": reason, "downtime_notes": "pressa ferma" if reason == "manutenzione" else None,
+                    "recorded_by": 1,
+                })
+    # Inserimento in blocco (come un import): niente ORM, rollup ricostruiti all'avvio
+    with engine.begin() as conn:
+        conn.execute(insert(KpiEntry.__table__), rows)
+    db.close()
+    return len(rows)
+
+
+def current_user():
+    if 1 not in _users:
+        _users[1] = _session.get(User, 1)
+    return _users[1]
+
+
+def legacy_trend(db, start_date, end_date, exclude_weekends=False, sector_name=None):
+    """Aggregazione Python precedente di /kpi/report/trend (KpiEntry + joinedload)."""
+    query = db.query(KpiEntry).options(joinedload(KpiEntry.kpi_config)).filter(
+        between_days(KpiEntry.work_date, start_date, end_date))
+    if sector_name:
+        query = query.join(KpiConfig).filter(KpiConfig.sector_name == sector_name)
+    entries = query.order_by(KpiEntry.work_date).all()
+    daily_stats, sector_stats = {}, {}
+    for e in entries:
+        if exclude_weekends and e.work_date.weekday() >= 5:
+            continue
+        d_str = str(e.work_date)
+        name = e.kpi_config.sector_name
+        day = daily_stats.setdefault(d_str, {"quantity": 0, "target_total": 0, "hours_net": 0})
+        day["quantity"] += e.quantity_produced
+        day["hours_net"] += e.hours_net
+        entry_target = e.kpi_config.kpi_target_8h * (e.hours_net / 8) if e.hours_net > 0 else 0
+        day["target_total"] += entry_target
+        s = sector_stats.setdefault(name, {
+            "sector_name": name, "kpi_target_8h": e.kpi_config.kpi_target_8h, "total_quantity": 0,
+            "total_hours": 0, "total_downtime": 0, "total_hours_net": 0, "target_accumulated": 0})
+        s["total_quantity"] += e.quantity_produced
+        s["total_hours"] += e.hours_total
+        s["total_downtime"] += e.hours_downtime
+        s["total_hours_net"] += e.hours_net
+        s["target_accumulated"] += entry_target
+    trend = [{"date": d, "quantity": v["quantity"],
+              "efficiency": round(v["quantity"] / v["target_total"] * 100) if v["target_total"] > 0 else 0}
+             for d, v in sorted(daily_stats.items())]
+    for s in sector_stats.values():
+        s["efficiency"] = round(s["total_quantity"] / s["target_accumulated"] * 100) if s["target_accumulated"] > 0 else 0
+        s["total_qty_per_hour"] = s["total_quantity"] / s["total_hours_net"] if s["total_hours_net"] > 0 else 0
+    return {"trend": trend, "sectors": list(sector_stats.values())}, len(entries)
+
+
+def same_report(new, old) -> bool:
+    if new["trend"] != old["trend"]:
+        return False
+    by_name = {s["sector_name"]: s for s in old["sectors"]}
+    if {s["sector_name"] for s in new["sectors"]} != by_name.keys():
+        return False
+    for s in new["sectors"]:
+        o = by_name[s["sector_name"]]
+        for key, value in s.items():
+            if isinstance(value, float) or isinstance(o[key], float):
+                if abs(value - o[key]) > 1e-6 * max(1.0, abs(o[key])):
+                    return False
+            elif value != o[key]:
+                return False
+    return True
+
+
+def legacy_shift_rows(db, start_date, end_date, sector_name=None):
+    query = db.query(KpiEntry).options(joinedload(KpiEntry.kpi_config)).filter(
+        between_days(KpiEntry.work_date, start_date, end_date)).join(KpiConfig)
+    if sector_name:
+        query = query.filter(KpiConfig.sector_name == sector_name)
+    return [
+        (e.work_date, e.kpi_config.sector_name, e.shift_type, e.quantity_produced, e.hours_downtime,
+         e.hours_net or 0, e.kpi_config.kpi_target_8h,
+         (e.downtime_reason or "") + (" " + e.downtime_notes if e.downtime_notes else ""))
+        for e in query.order_by(KpiEntry.work_date, KpiConfig.sector_name, KpiEntry.shift_type).all()
+    ]
+
+
+def rollup_snapshot(db):
+    daily = sorted(tuple(r) for r in db.execute(select(
+        KpiDailyRollup.work_day, KpiDailyRollup.kpi_config_id, KpiDailyRollup.shift_type, KpiDailyRollup.entries_count,
+        KpiDailyRollup.quantity_produced, KpiDailyRollup.hours_total, KpiDailyRollup.hours_downtime,
+        KpiDailyRollup.hours_net, KpiDailyRollup.hours_net_target)).all())
+    monthly = sorted(tuple(r) for r in db.execute(select(
+        KpiMonthlyRollup.year, KpiMonthlyRollup.month, KpiMonthlyRollup.kpi_config_id, KpiMonthlyRollup.is_weekend,
+        KpiMonthlyRollup.entries_count, KpiMonthlyRollup.quantity_produced, KpiMonthlyRollup.hours_total,
+        KpiMonthlyRollup.hours_downtime, KpiMonthlyRollup.hours_net, KpiMonthlyRollup.hours_net_target)).all())
+    return daily, monthly
+
+
+def main_check():
+    random.seed(5)
+    n_entries = seed()
+    main.app.dependency_overrides[get_current_user] = current_user
+    ok = True
+
+    def check(label, good):
+        nonlocal ok
+        ok = ok and good
+        print(f"{'OK ' if good else 'KO '} {label}")
+
+    with TestClient(main.app) as client:
+        db = SessionLocal()
+        daily, monthly = rollup_snapshot(db)
+        check(f"backfill all'avvio: {n_entries} entry -> {len(daily)} righe giornaliere, {len(monthly)} mensili",
+              sum(r[3] for r in daily) == n_entries and sum(r[4] for r in monthly) == n_entries)
+
+        # Scritture via endpoint e via ORM
+        day = TODAY - timedelta(days=3)
+        payload = {"kpi_config_id": 2, "work_date": str(day), "shift_type": "morning",
+                   "hours_total": 8, "hours_downtime": 0.5, "quantity_produced": 222}
+        created = client.post("/kpi/entries", json=payload).json()
+        client.post("/kpi/entries", json={**payload, "quantity_produced": 260, "downtime_reason": "setup"}).raise_for_status()
+        new_entry = client.post("/kpi/entries", json={**payload, "kpi_config_id": 3, "shift_type": "night"}).json()
+        client.delete(f"/kpi/entries/{new_entry['id']}").raise_for_status()
+        moved = db.query(KpiEntry).filter(KpiEntry.kpi_config_id == 1).order_by(KpiEntry.id).first()
+        moved.work_date = moved.work_date + timedelta(days=40)
+        moved.quantity_produced += 5
+        db.commit()
+        before = rollup_snapshot(db)
+        db.add(KpiEntry(kpi_config_id=4, work_date=datetime.combine(day, datetime.min.time()), shift_type="night",
+                        hours_total=8, hours_downtime=0, hours_net=8, quantity_produced=999, recorded_by=1))
+        db.flush()
+        db.rollback()
+        check("transazione annullata: rollup invariati", rollup_snapshot(db) == before)
+        incremental = rollup_snapshot(db)
+        rebuild_kpi_rollups(db)
+        rebuilt = rollup_snapshot(db)
+        db.rollback()
+        same = incremental[0] == rebuilt[0] and len(incremental[1]) == len(rebuilt[1]) and all(
+            a[:5] == b[:5] and all(abs(x - y) < 1e-9 for x, y in zip(a[5:], b[5:]))
+            for a, b in zip(incremental[1], rebuilt[1]))
+        check(f"dopo nuova/aggiornamento/eliminazione/spostamento (entry {created['id']}): "
+              f"incrementale = ricostruzione", same)
+
+        # Parità con l'aggregazione Python precedente
+        month_start = date(TODAY.year, TODAY.month, 1)
+        periods = [
+            ({"start_date": FIRST_DAY, "end_date": TODAY}, "tutto lo storico"),
+            ({"start_date": TODAY - timedelta(days=365), "end_date": TODAY}, "ultimo anno"),
+            ({"start_date": FIRST_DAY + timedelta(days=17), "end_date": month_start - timedelta(days=3)}, "mesi parziali"),
+            ({"start_date": month_start, "end_date": TODAY}, "mese corrente"),
+            ({"start_date": TODAY - timedelta(days=200), "end_date": TODAY, "exclude_weekends": True}, "senza weekend"),
+            ({"start_date": TODAY - timedelta(days=120), "end_date": TODAY - timedelta(days=2),
+              "sector_name": "Dolphin"}, "un settore"),
+        ]
+        for params, label in periods:
+            new = client.get("/kpi/report/trend", params=params).json()
+            old, _ = legacy_trend(db, **params)
+            check(f"trend {label}: identico all'aggregazione precedente", same_report(new, old))
+
+        rows_new = [tuple(r) for r in shift_rows(db, TODAY - timedelta(days=90), TODAY)]
+        rows_old = legacy_shift_rows(db, TODAY - timedelta(days=90), TODAY)
+        check(f"report avanzato: {len(rows_new)} righe turno identiche alle KpiEntry", rows_new == rows_old)
+        pdf = client.get("/kpi/report/advanced/pdf",
+                         params={"start_date": str(TODAY - timedelta(days=30)), "end_date": str(TODAY)})
+        check("report avanzato PDF generato", pdf.status_code == 200 and pdf.content[:4] == b"%PDF")
+
+        # Costo: anno intero
+        params = {"start_date": TODAY - timedelta(days=365), "end_date": TODAY}
+        t0 = time.perf_counter()
+        _, entries_read = legacy_trend(db, **params)
+        t_old = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        for _ in range(5):
+            client.get("/kpi/report/trend", params=params)
+        t_new = (time.perf_counter() - t0) / 5
+        rollup_rows = len(daily_series(db, **params)) + len(sector_totals(db, **params))
+        print(f"      trend su un anno: prima {entries_read} KpiEntry {t_old * 1000:.0f} ms, "
+              f"dopo ~{rollup_rows} righe aggregate {t_new * 1000:.0f} ms (HTTP incluso)")
+        check("trend annuale più veloce", t_new < t_old)
+        db.close()
+
+    _session.close()
+    print("OK" if ok else "ERRORE: rollup KPI non conformi")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main_check()
@@ -0,0 +1,290 @@
+"""
+Verifica del pool logistica in memoria (logistics_pool) su DB temporaneo.
+
+- sequenza casuale di operazioni sugli endpoint (crea, prendi, prendi in
+  blocco, prepara, completa, rilascia, annulla, sollecita, elimina):
+  dopo ognuna check_consistency() = pool allineato al DB
+- GET /logistics/requests (pending/active, banchina, my_assigned,
+  my_requests, limit) identica alla stessa lista letta via SQL
+- un secondo pool iscritto al broker (come un altro worker) resta allineato
+- modifica fuori dagli endpoint: rilevata dal checker, sanata dal reload
+- evento del broker in ritardo (versione più vecchia), anche dopo
+  l'eliminazione: scartato da entrambi i pool
+- modifica di tipo materiale, banchina e nome utente: entrambi i pool
+  ricaricano le etichette alla lettura successiva
+- query SQL e tempo di lettura del pool: SQL contro memoria
+
+Uso:
+    python scripts/check_live_pool.py [richieste_attive] [operazioni]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+_tmp_dir = tempfile.mkdtemp(prefix="sl_live_pool_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'pool.db')}"
+# Soglia SLA dalla cache impostazioni: nessun controllo di versione durante la misura
+os.environ.setdefault("SETTINGS_VERSION_CHECK_SECONDS", "3600")
+
+# Add parent directory to path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.orm import joinedload
+
+from database import engine, read_engine, SessionLocal, create_tables, User, Banchina
+from models.logistics import LogisticsMaterialType, LogisticsRequest
+from logistics_pool import LivePool, get_live_pool, check_consistency, TIME_DERIVED_FIELDS
+from routers.logistics import with_auto_urgent, get_pool_counters
+from security import get_current_user
+from ws_broker import get_ws_broker
+import main
+
+N_ACTIVE = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+N_OPERATIONS = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+N_READS = 50
+USERS = (1, 2)
+BANCHINE = (1, 2, 3)
+MATERIALS = (1, 2, 3, 4, 5)
+CURRENT = {"id": 1}
+_session = SessionLocal()
+_users = {}
+
+
+def seed():
+    create_tables()
+    db = SessionLocal()
+    for uid in USERS:
+        db.add(User(id=uid, username=f"user{uid}", password_hash="x", full_name=f"Utente {uid}",
+                    role="super_admin", is_active=True))
+    for bid in BANCHINE:
+        db.add(Banchina(id=bid, code=f"B{bid}", name=f"Banchina {bid}"))
+    for mid in MATERIALS:
+        db.add(LogisticsMaterialType(id=mid, label=f"Materiale {mid}", icon="📦"))
+    start = datetime.utcnow() - timedelta(hours=2)
+    for i in range(N_ACTIVE):
+        status = random.choice(["pending", "pending", "preparing", "prepared", "processing"])
+        taken = status in ("preparing", "processing")
+        db.add(LogisticsRequest(
+            material_type_id=random.choice(MATERIALS), banchina_id=random.choice(BANCHINE),
+            requester_id=random.choice(USERS), quantity=1 + i % 4, status=status,
+            is_urgent=random.random() < 0.2, created_at=start + timedelta(seconds=i * 7),
+            assigned_to_id=random.choice(USERS) if taken else None,
+            taken_at=start + timedelta(seconds=i * 7 + 60) if taken else None,
+            promised_eta_minutes=5 if taken else None,
+            prepared_by_id=1 if status == "prepared" else None,
+            prepared_at=start + timedelta(seconds=i * 7 + 30) if status == "prepared" else None,
+        ))
+    db.commit()
+    db.close()
+
+
+def current_user():
+    # Utente tenuto in memoria: nessuna query per richiesta (come la cache utenti di security)
+    if CURRENT["id"] not in _users:
+        _users[CURRENT["id"]] = _session.get(User, CURRENT["id"])
+    return _users[CURRENT["id"]]
+
+
+def sql_list(status, banchina_id=None, my_requests=False, my_assigned=False, limit=50):
+    """La stessa lista di list_requests letta dal DB (percorso precedente)."""
+    db = SessionLocal()
+    try:
+        query = db.query(LogisticsRequest).options(
+            joinedload(LogisticsRequest.material_type),
+            joinedload(LogisticsRequest.banchina),
+            joinedload(LogisticsRequest.requester),
+            joinedload(LogisticsRequest.assigned_to),
+            joinedload(LogisticsRequest.prepared_by)
+        )
+        statuses = ["pending", "prepared"] if status == "pending" else \
+            ["pending", "preparing", "prepared", "processing"]
+        query = query.filter(LogisticsRequest.status.in_(statuses))
+        if banchina_id:
+            query = query.filter(LogisticsRequest.banchina_id == banchina_id)
+        if my_requests:
+            query = query.filter(LogisticsRequest.requester_id == CURRENT["id"])
+        if my_assigned:
+            query = query.filter(LogisticsRequest.assigned_to_id == CURRENT["id"])
+        requests = query.order_by(
+            LogisticsRequest.is_urgent.desc(), LogisticsRequest.created_at.asc()
+        ).limit(limit).all()
+        now = datetime.utcnow()
+        items = [jsonable_encoder(with_auto_urgent(r, now, 3)) for r in requests]
+        return {"items": items, "total": len(items), **get_pool_counters(db)}
+    finally:
+        db.close()
+
+
+def stable(data):
+    return {**data, "items": [{k: v for k, v in item.items() if k not in TIME_DERIVED_FIELDS}
+                              for item in data["items"]]}
+
+
+class StatementCounter:
+    def __init__(self):
+        self.count = 0
+        for eng in {engine, read_engine}:
+            event.listen(eng, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+
+def random_operation(client, ids):
+    """Un'operazione casuale su una richiesta (o più): gli errori 4xx di stato sono attesi."""
+    CURRENT["id"] = random.choice(USERS)
+    rid = random.choice(ids)
+    action = random.choice(["create", "take", "take_preparing", "take_batch", "mark_prepared",
+                            "complete", "release", "cancel", "urgent", "delete"])
+    if action == "create":
+        resp = client.post("/logistics/requests", json={
+            "material_type_id": random.choice(MATERIALS), "banchina_id": random.choice(BANCHINE), "quantity": 2})
+        if resp.status_code == 200:
+            ids.append(resp.json()["id"])
+    elif action in ("take", "take_preparing"):
+        resp = client.patch(f"/logistics/requests/{rid}/take", json={
+            "promised_eta_minutes": 5, "mode": "preparing" if action == "take_preparing" else "delivering"})
+    elif action == "take_batch":
+        resp = client.patch("/logistics/requests/take-batch", params={"eta_minutes": 10},
+                            json=random.sample(ids, min(4, len(ids))))
+    elif action == "mark_prepared":
+        resp = client.patch(f"/logistics/requests/{rid}/mark-prepared")
+    elif action == "complete":
+        resp = client.patch(f"/logistics/requests/{rid}/complete", json={})
+    elif action == "delete":
+        resp = client.delete(f"/logistics/requests/{rid}")
+    else:
+        resp = client.patch(f"/logistics/requests/{rid}/{action}")
+    if resp.status_code >= 500:
+        raise RuntimeError(f"{action} {rid}: {resp.status_code} {resp.text}")
+    return action, resp.status_code
+
+
+def main_check():
+    random.seed(7)
+    seed()
+    main.app.dependency_overrides[get_current_user] = current_user
+    counter = StatementCounter()
+    ok = True
+
+    def check(label, good):
+        nonlocal ok
+        ok = ok and good
+        print(f"{'OK ' if good else 'KO '} {label}")
+
+    with TestClient(main.app) as client:
+        pool = get_live_pool()
+        check(f"pool caricato all'avvio ({pool.get_stats()['active']} richieste attive)",
+              pool.loaded and pool.get_stats()["active"] == N_ACTIVE)
+
+        # Secondo "worker": riceve solo gli eventi del broker
+        other_worker = LivePool()
+        other_worker.reload()
+        get_ws_broker().subscribe("pool", other_worker.on_broker_event)
+        get_ws_broker().subscribe("pool_state", other_worker.on_state_event)
+
+        db = SessionLocal()
+        ids = [rid for (rid,) in db.query(LogisticsRequest.id).all()]
+        applied, first_error = {}, None
+        for step in range(N_OPERATIONS):
+            action, code = random_operation(client, ids)
+            if code == 200:
+                applied[action] = applied.get(action, 0) + 1
+            db.expire_all()
+            differences = check_consistency(db)
+            if differences and first_error is None:
+                first_error = (step, action, differences[:3])
+        check(f"{N_OPERATIONS} operazioni, pool sempre allineato al DB "
+              f"(riuscite: {sum(applied.values())}, {len(applied)} tipi)", first_error is None)
+        if first_error:
+            print(f"      primo disallineamento: {first_error}")
+        check("secondo worker allineato tramite broker", check_consistency(db, other_worker) == [])
+
+        filters = [
+            {"status": "pending"}, {"status": "active"}, {"status": "active", "limit": 500},
+            {"status": "pending", "banchina_id": 2}, {"status": "active", "my_assigned": True},
+            {"status": "active", "my_requests": True, "banchina_id": 1}, {"status": "pending", "limit": 5},
+        ]
+        same = True
+        for params in filters:
+            for uid in USERS:
+                CURRENT["id"] = uid
+                from_memory = client.get("/logistics/requests", params=params).json()
+                if stable(from_memory) != stable(sql_list(**params)):
+                    same = False
+                    print(f"      differenza con {params} utente {uid}")
+        check("GET /requests dal pool = stessa lista via SQL (filtri, ordinamento, contatori)", same)
+
+        # Modifica fuori dagli endpoint (script, altro processo senza broker)
+        target = db.query(LogisticsRequest).filter(LogisticsRequest.status == "pending").first()
+        target.status = "cancelled"
+        db.commit()
+        differences = check_consistency(db)
+        check("modifica diretta sul DB rilevata dal checker", len(differences) > 0)
+        pool.reload()
+        check("reload (resync) riallinea il pool", check_consistency(db) == [])
+        other_worker.reload()
+
+        # Evento in ritardo dal relay: versione precedente all'ultima modifica
+        CURRENT["id"] = 1
+        target = db.query(LogisticsRequest).filter(
+            LogisticsRequest.status == "pending", LogisticsRequest.is_urgent == False
+        ).first()
+        stale = {"type": "request_updated", "request_id": target.id, "version": target.version,
+                 "status": target.status, "request": dict(pool._entries[target.id].item)}
+        client.patch(f"/logistics/requests/{target.id}/urgent")
+        discarded = pool.stats["stale"], other_worker.stats["stale"]
+        get_ws_broker().publish("pool", {"pool": "logistics", "message": stale})
+        db.expire_all()
+        check("evento in ritardo scartato (versione più vecchia)",
+              check_consistency(db) == [] and check_consistency(db, other_worker) == []
+              and pool.stats["stale"] > discarded[0] and other_worker.stats["stale"] > discarded[1])
+        client.delete(f"/logistics/requests/{stale['request_id']}")
+        get_ws_broker().publish("pool", {"pool": "logistics", "message": stale})
+        db.expire_all()
+        check("evento in ritardo dopo l'eliminazione: la richiesta non torna nel pool",
+              stale["request_id"] not in pool._entries and stale["request_id"] not in other_worker._entries
+              and check_consistency(db) == [] and check_consistency(db, other_worker) == [])
+
+        # Etichette arricchite cambiate fuori dalle richieste
+        client.patch("/logistics/materials/1", json={"label": "Materiale rinominato"})
+        client.patch("/admin/banchine/1", json={"code": "B1X", "name": "Banchina rinominata"})
+        client.patch("/users/2", json={"full_name": "Utente rinominato"})
+        client.get("/logistics/requests", params={"status": "active"})
+        other_worker.ensure_loaded()
+        db.expire_all()
+        check("etichette (materiale, banchina, nome utente) aggiornate su entrambi i pool",
+              check_consistency(db) == [] and check_consistency(db, other_worker) == [])
+
+        # Costo della lettura del pool
+        CURRENT["id"] = 1
+        start = counter.count
+        t0 = time.perf_counter()
+        for _ in range(N_READS):
+            sql_list("active")
+        t_sql = (time.perf_counter() - t0) / N_READS
+        sql_queries = (counter.count - start) / N_READS
+        start = counter.count
+        t0 = time.perf_counter()
+        for _ in range(N_READS):
+            client.get("/logistics/requests", params={"status": "active"})
+        t_memory = (time.perf_counter() - t0) / N_READS
+        memory_queries = (counter.count - start) / N_READS
+        print(f"      lettura pool ({pool.get_stats()['active']} attive): SQL {sql_queries:.0f} query "
+              f"{t_sql * 1000:.1f} ms, memoria {memory_queries:.0f} query {t_memory * 1000:.1f} ms (HTTP incluso)")
+        check("lettura del pool senza query SQL", memory_queries == 0)
+        db.close()
+
+    _session.close()
+    print("OK" if ok else "ERRORE: pool logistica in memoria non conforme")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main_check()
@@ -0,0 +1,207 @@
+"""
+Verifica del motore di escalation logistica (logistics_escalation.py) su DB temporaneo.
+
+- soglie ridotte (secondi) via LogisticsConfig, destinatari per ruolo
+- richieste pending: livello 1, 2 e 3 scattano entro pochi decimi di secondo dalla soglia
+- richiesta presa in carico (untrack) prima della soglia: nessuna notifica
+- richiesta creata "in ritardo" (avvio dopo un fermo): solo il livello più alto raggiunto
+- notifiche di ogni livello scritte con un solo INSERT multiplo
+- due worker (due motori) con la stessa richiesta scaduta: notifica solo chi
+  porta la riga al livello, anche se l'altro l'ha letta prima del commit
+
+Uso:
+    python scripts/check_logistics_escalation.py
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+_tmp_dir = tempfile.mkdtemp(prefix="sl_escalation_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'escalation.db')}"
+
+# Add parent directory to path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event, insert
+
+from database import engine, Base, SessionLocal, User, Banchina, Notification
+from models.logistics import LogisticsMaterialType, LogisticsRequest, LogisticsConfig
+from logistics_escalation import EscalationEngine
+
+# Soglie in minuti: 1 s, 2 s, 3 s
+LEVEL_SECONDS = {1: 1.0, 2: 2.0, 3: 3.0}
+USERS = [
+    (1, "Coordinatore Uno", "coordinator"),
+    (2, "Coordinatore Due", "coordinator"),
+    (3, "Responsabile Fabbrica", "factory_controller"),
+    (4, "Amministratore", "admin"),
+    (5, "Iasevoli Magazzino", "warehouse_operator"),   # cognome della vecchia lista, ruolo non coinvolto
+]
+EXPECTED_TARGETS = {1: {1, 2}, 2: {3}, 3: {4}}
+
+
+def seed():
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User.__table__), [
+            {"id": uid, "username": f"user{uid}", "password_hash": "x", "full_name": name, "role": role, "is_active": True}
+            for uid, name, role in USERS
+        ])
+        conn.execute(insert(Banchina.__table__), [{"id": 1, "code": "B1", "name": "Banchina 1"}])
+        conn.execute(insert(LogisticsMaterialType.__table__), [{"id": 1, "label": "Cartoni"}])
+        conn.execute(insert(LogisticsConfig.__table__), [
+            {"config_key": f"escalation_l{level}_minutes", "config_value": str(seconds / 60)}
+            for level, seconds in LEVEL_SECONDS.items()
+        ] + [
+            {"config_key": "escalation_l2_targets", "config_value": "role:factory_controller"},
+            {"config_key": "escalation_l3_targets", "config_value": "role:admin"},
+        ])
+
+
+def create_request(created_at: datetime) -> int:
+    db = SessionLocal()
+    try:
+        req = LogisticsRequest(material_type_id=1, banchina_id=1, requester_id=5, status="pending",
+                               created_at=created_at)
+        db.add(req)
+        db.commit()
+        return req.id
+    finally:
+        db.close()
+
+
+def notifications_for(request_ids):
+    db = SessionLocal()
+    try:
+        levels = {
+            r.id: r.escalation_level
+            for r in db.query(LogisticsRequest).filter(LogisticsRequest.id.in_(request_ids)).all()
+        }
+        notifs = db.query(Notification).order_by(Notification.id).all()
+        return levels, notifs
+    finally:
+        db.close()
+
+
+def check_two_workers() -> bool:
+    """Il worker B legge la richiesta, il worker A la scala e fa commit, poi B prova il claim."""
+    rid = create_request(datetime.utcnow() - timedelta(seconds=1.5))   # oltre L1, prima di L2
+    worker_a, worker_b = EscalationEngine(), EscalationEngine()
+    worker_a.reload()
+    worker_b.reload()
+    db = SessionLocal()
+    before = db.query(Notification).count()
+    db.close()
+
+    b_read, a_done = threading.Event(), threading.Event()
+    errors = []
+
+    def pause_b(conn, cursor, statement, *args):
+        if threading.current_thread().name == "worker-b" and statement.startswith("SELECT") \
+                and "logistics_requests" in statement and not b_read.is_set():
+            b_read.set()
+            a_done.wait(5)
+
+    def run_b():
+        try:
+            worker_b.process({rid: worker_b._tracked[rid]})
+        except Exception as e:
+            errors.append(e)
+
+    event.listen(engine, "after_cursor_execute", pause_b)
+    thread = threading.Thread(target=run_b, name="worker-b")
+    thread.start()
+    b_read.wait(5)
+    worker_a.process({rid: worker_a._tracked[rid]})
+    a_done.set()
+    thread.join(10)
+    event.remove(engine, "after_cursor_execute", pause_b)
+
+    db = SessionLocal()
+    added = db.query(Notification).count() - before
+    level = db.get(LogisticsRequest, rid).escalation_level
+    db.close()
+    good = (level == 1 and added == len(EXPECTED_TARGETS[1]) and not errors
+            and worker_a.stats["escalated"] == 1 and worker_b.stats["escalated"] == 0)
+    print(f"{'OK ' if good else 'KO '} due worker sulla stessa richiesta: {added} notifiche "
+          f"(attese {len(EXPECTED_TARGETS[1])}), escalated A={worker_a.stats['escalated']} "
+          f"B={worker_b.stats['escalated']}{f', errore B: {errors[0]}' if errors else ''}")
+    return good
+
+
+def main():
+    seed()
+    ok = True
+
+    statements = []
+    event.listen(engine, "before_cursor_execute",
+                 lambda conn, cursor, statement, *args: statements.append(statement))
+
+    now = datetime.utcnow()
+    late_id = create_request(now - timedelta(seconds=2.5))   # al riavvio ha già superato L1 e L2
+    esc = EscalationEngine()
+    esc.start()
+
+    t0 = time.monotonic()
+    on_time_id = create_request(datetime.utcnow())
+    taken_id = create_request(datetime.utcnow())
+    db = SessionLocal()
+    for rid in (on_time_id, taken_id):
+        req = db.get(LogisticsRequest, rid)
+        esc.track(req.id, req.created_at, 0)
+    db.close()
+
+    # Presa in carico prima della soglia L1
+    time.sleep(0.5)
+    esc.untrack(taken_id)
+
+    # Registra quando ogni livello della richiesta "puntuale" viene raggiunto
+    reached = {}
+    while time.monotonic() - t0 < 4.0 and len(reached) < 3:
+        levels, _ = notifications_for([on_time_id])
+        level = levels[on_time_id] or 0
+        for lvl in range(1, level + 1):
+            reached.setdefault(lvl, time.monotonic() - t0)
+        time.sleep(0.02)
+    esc.stop()
+
+    for lvl, seconds in LEVEL_SECONDS.items():
+        at = reached.get(lvl)
+        good = at is not None and seconds <= at + 0.05 and at - seconds < 0.5
+        ok = ok and good
+        print(f"{'OK ' if good else 'KO '} livello {lvl}: soglia {seconds:.1f} s, raggiunto a "
+              f"{'-' if at is None else f'{at:.2f} s'}")
+
+    levels, notifs = notifications_for([on_time_id, taken_id, late_id])
+    by_level = {}
+    for n in notifs:
+        key = {"alert": 1, "urgent": 2, "critical": 3}[n.notif_type]
+        by_level.setdefault(key, set()).add(n.recipient_user_id)
+
+    checks = [
+        ("richiesta presa in carico non scalata", levels[taken_id] == 0),
+        ("richiesta in ritardo all'avvio: livello più alto e poi L3", levels[late_id] == 3),
+        ("destinatari per ruolo", by_level == EXPECTED_TARGETS),
+        ("nessuna notifica all'omonimo del vecchio elenco", all(n.recipient_user_id != 5 for n in notifs)),
+        # on_time: L1 (2) + L2 (1) + L3 (1); late: L2 all'avvio (1) + L3 (1)
+        ("numero notifiche", len(notifs) == 6),
+        # Qui ogni blocco contiene un solo livello: un INSERT multiplo per blocco, anche con 2 destinatari
+        ("un solo INSERT notifiche per livello",
+         sum(st.startswith("INSERT INTO notifications") for st in statements) == esc.stats["batches"]),
+    ]
+    for label, good in checks:
+        ok = ok and good
+        print(f"{'OK ' if good else 'KO '} {label}")
+    print(f"      stats: {esc.stats}, notifiche per livello: {by_level}")
+
+    ok = check_two_workers() and ok
+
+    print("OK" if ok else "ERRORE: escalation logistica non conforme")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
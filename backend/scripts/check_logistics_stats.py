@@ -0,0 +1,213 @@
+"""
+Verifica degli aggregati performance logistica (logistics_stats) su DB temporaneo.
+
+- storico di richieste completate su più mesi, colonne aggregate tolte: la
+  migration all'avvio le aggiunge e fa il backfill; valori uguali al calcolo
+  esatto (media, minimo, massimo, % ETA) e p50/p95 entro l'errore dello sketch
+- missioni completate via endpoint: aggregati incrementali = ricostruzione
+  completa del mese (la vecchia "media" (vecchia + nuova) / 2 invece no)
+- eliminazione di una missione completata: aggregati ricalcolati
+- /performance/me e /leaderboard leggono gli aggregati
+
+Uso:
+    python scripts/check_logistics_stats.py [missioni_storiche]
+"""
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+_tmp_dir = tempfile.mkdtemp(prefix="sl_logistics_stats_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'stats.db')}"
+
+# Add parent directory to path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from database import engine, SessionLocal, create_tables, User, Banchina, Employee
+from models.logistics import LogisticsMaterialType, LogisticsRequest, LogisticsPerformance
+from logistics_stats import AGGREGATE_FIELDS, SKETCH_RELATIVE_ACCURACY, ReactionSketch, rebuild_performance
+from security import get_current_user
+import main
+
+N_HISTORY = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+OPERATORS = {1: 11, 2: 12}  # user_id -> employee_id
+NEW_COLUMNS = ("reaction_count", "reaction_total_seconds", "slowest_reaction_seconds",
+               "reaction_sketch", "eta_checked", "eta_respected_count")
+CURRENT = {"id": 1}
+_session = SessionLocal()
+_users = {}
+
+
+def seed():
+    """Storico: missioni completate negli ultimi 4 mesi con tempi di reazione log-normali."""
+    create_tables()
+    db = SessionLocal()
+    for uid, emp_id in OPERATORS.items():
+        db.add(User(id=uid, username=f"mag{uid}", password_hash="x", full_name=f"Magazziniere {uid}",
+                    role="super_admin", is_active=True))
+        db.add(Employee(id=emp_id, first_name="Mag", last_name=str(uid), user_id=uid))
+    db.add(Banchina(id=1, code="B1", name="Banchina 1"))
+    db.add(LogisticsMaterialType(id=1, label="Cartoni", icon="📦"))
+    now = datetime.utcnow()
+    for i in range(N_HISTORY):
+        created = now - timedelta(days=random.uniform(1, 120))
+        taken = created + timedelta(seconds=int(random.lognormvariate(4.5, 1.0)))
+        db.add(LogisticsRequest(
+            material_type_id=1, banchina_id=1, requester_id=1, quantity=1, status="completed",
+            is_urgent=random.random() < 0.15, created_at=created, taken_at=taken,
+            completed_at=taken + timedelta(minutes=random.randint(1, 20)),
+            assigned_to_id=random.choice(list(OPERATORS)), promised_eta_minutes=10,
+            eta_respected=random.random() < 0.8 if i % 10 else None,
+        ))
+    db.commit()
+    # Performance esistenti (solo punti): il backfill non deve toccarli
+    for emp_id in OPERATORS.values():
+        db.add(LogisticsPerformance(employee_id=emp_id, month=now.month, year=now.year,
+                                    total_points=100, penalties_received=7))
+    db.commit()
+    db.close()
+    # DB "vecchio": senza colonne aggregate, avg con la formula errata
+    with engine.begin() as conn:
+        for column in NEW_COLUMNS:
+            conn.execute(text(f"ALTER TABLE logistics_performance DROP COLUMN {column}"))
+        conn.execute(text("UPDATE logistics_performance SET avg_reaction_seconds = 999"))
+
+
+def current_user():
+    if CURRENT["id"] not in _users:
+        _users[CURRENT["id"]] = _session.get(User, CURRENT["id"])
+    return _users[CURRENT["id"]]
+
+
+def exact_stats(db):
+    """Statistiche esatte per (employee, anno, mese) calcolate in Python da tutte le richieste."""
+    groups = {}
+    for r in db.query(LogisticsRequest).filter(LogisticsRequest.status == "completed").all():
+        key = (OPERATORS[r.assigned_to_id], r.completed_at.year, r.completed_at.month)
+        g = groups.setdefault(key, {"reactions": [], "missions": 0, "urgent": 0, "eta": []})
+        g["missions"] += 1
+        g["urgent"] += int(bool(r.is_urgent))
+        g["reactions"].append(max(0, int((r.taken_at - r.created_at).total_seconds())))
+        if r.eta_respected is not None:
+            g["eta"].append(r.eta_respected)
+    return groups
+
+
+def matches_exact(perf, g) -> bool:
+    values = sorted(g["reactions"])
+    if (perf.missions_completed, perf.missions_urgent, perf.reaction_count) != (g["missions"], g["urgent"], len(values)):
+        return False
+    if perf.avg_reaction_seconds != round(sum(values) / len(values)) \
+            or (perf.fastest_reaction_seconds, perf.slowest_reaction_seconds) != (values[0], values[-1]):
+        return False
+    if perf.eta_accuracy_percent != (round(100 * sum(g["eta"]) / len(g["eta"]), 1) if g["eta"] else None):
+        return False
+    sketch = ReactionSketch.from_json(perf.reaction_sketch)
+    for q in (0.5, 0.95):
+        exact = values[int(q * (len(values) - 1))]
+        if abs(sketch.quantile(q) - exact) > max(1, exact * SKETCH_RELATIVE_ACCURACY):
+            return False
+    return True
+
+
+def snapshot(db):
+    db.expire_all()
+    return {(p.employee_id, p.year, p.month): {f: getattr(p, f) for f in AGGREGATE_FIELDS}
+            for p in db.query(LogisticsPerformance).all()}
+
+
+def complete_mission(client, operator, waited_seconds):
+    """Crea, "invecchia" di waited_seconds, prende in carico e completa una missione."""
+    CURRENT["id"] = operator
+    rid = client.post("/logistics/requests", json={"material_type_id": 1, "banchina_id": 1, "quantity": 1}).json()["id"]
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE logistics_requests SET created_at = :t WHERE id = :id"),
+                     {"t": datetime.utcnow() - timedelta(seconds=waited_seconds), "id": rid})
+    client.patch(f"/logistics/requests/{rid}/take", json={"promised_eta_minutes": 5}).raise_for_status()
+    client.patch(f"/logistics/requests/{rid}/complete", json={}).raise_for_status()
+    return rid
+
+
+def main_check():
+    random.seed(11)
+    seed()
+    main.app.dependency_overrides[get_current_user] = current_user
+    ok = True
+
+    def check(label, good):
+        nonlocal ok
+        ok = ok and good
+        print(f"{'OK ' if good else 'KO '} {label}")
+
+    with TestClient(main.app) as client:
+        db = SessionLocal()
+        groups = exact_stats(db)
+        perfs = {(p.employee_id, p.year, p.month): p for p in db.query(LogisticsPerformance).all()}
+        check(f"migration + backfill: {len(perfs)} mesi-dipendente da {N_HISTORY} missioni",
+              perfs.keys() == groups.keys())
+        check("backfill = calcolo esatto (media, min, max, % ETA, p50/p95 entro 2%)",
+              all(matches_exact(perfs[k], g) for k, g in groups.items()))
+        now = datetime.utcnow()
+        check("backfill: punti e penalità esistenti invariati",
+              all((perfs[(e, now.year, now.month)].total_points, perfs[(e, now.year, now.month)].penalties_received)
+                  == (100, 7) for e in OPERATORS.values()))
+
+        # Missioni via endpoint: aggregati incrementali
+        waits = [random.choice((20, 45, 90, 300, 1200)) for _ in range(30)]
+        old_formula = {}
+        completed = []
+        for i, waited in enumerate(waits):
+            operator = 1 + i % 2
+            completed.append(complete_mission(client, operator, waited))
+            previous = old_formula.get(operator)
+            old_formula[operator] = int((previous + waited) / 2) if previous else waited
+        incremental = snapshot(db)
+        rebuild_performance(db)
+        db.flush()
+        check("30 completamenti: incrementale = ricostruzione completa", snapshot(db) == incremental)
+        db.rollback()
+        groups = exact_stats(db)
+        key = (OPERATORS[1], now.year, now.month)
+        perf = db.query(LogisticsPerformance).filter_by(employee_id=key[0], year=key[1], month=key[2]).one()
+        check("incrementale = calcolo esatto", matches_exact(perf, groups[key]))
+        print(f"      media reazione operatore 1: esatta {round(sum(groups[key]['reactions']) / len(groups[key]['reactions']))}s, "
+              f"aggregati {perf.avg_reaction_seconds}s, vecchia formula (mese corrente) {old_formula[1]}s")
+
+        # Eliminazione: minimo e massimo ricalcolati
+        with engine.begin() as conn:
+            conn.execute(text("UPDATE logistics_requests SET created_at = :t WHERE id = :id"),
+                         {"t": datetime.utcnow() - timedelta(days=2), "id": completed[0]})
+            conn.execute(text("UPDATE logistics_requests SET taken_at = :t WHERE id = :id"),
+                         {"t": datetime.utcnow(), "id": completed[0]})
+        rebuild_performance(db, now.year, now.month, OPERATORS[1])
+        db.commit()
+        db.expire_all()
+        slowest_before = perf.slowest_reaction_seconds
+        client.delete(f"/logistics/requests/{completed[0]}").raise_for_status()
+        db.expire_all()
+        groups = exact_stats(db)
+        check("eliminazione: massimo e media ricalcolati",
+              perf.slowest_reaction_seconds < slowest_before and matches_exact(perf, groups[key]))
+
+        # Letture API
+        CURRENT["id"] = 1
+        me = client.get("/logistics/performance/me").json()
+        check("/performance/me dagli aggregati",
+              me["avg_reaction_seconds"] == perf.avg_reaction_seconds and me["reaction_count"] == perf.reaction_count
+              and me["reaction_p95_seconds"] is not None and me["eta_accuracy_percent"] == perf.eta_accuracy_percent)
+        board = client.get("/logistics/leaderboard").json()["entries"]
+        check("/leaderboard con percentili", len(board) == 2
+              and all(e["reaction_p50_seconds"] is not None for e in board))
+        db.close()
+
+    _session.close()
+    print("OK" if ok else "ERRORE: aggregati performance logistica non conformi")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main_check()
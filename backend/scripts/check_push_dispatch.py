@@ -0,0 +1,161 @@
+"""
+Verifica del dispatcher Web Push contro un push service FINTO in locale.
+
+Avvia un server HTTP su 127.0.0.1 che risponde come un push service:
+- /ok/...    -> 201 Created
+- /gone/...  -> 410 Gone          (subscription da eliminare)
+- /flaky/... -> 503 la prima volta, poi 201 (retry con backoff)
+- /slow/...  -> 201 dopo 200 ms   (verifica limite concorrenza per host)
+
+Controlla che enqueue() ritorni subito, che le subscription 410 vengano
+rimosse con una sola DELETE e che gli invii concorrenti per host non
+superino PUSH_MAX_PER_HOST.
+
+Uso:
+    python scripts/check_push_dispatch.py
+"""
+import base64
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# DB temporaneo PRIMA di importare database.py (engine creato all'import)
+_tmp_dir = tempfile.mkdtemp(prefix="sl_push_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'push.db')}"
+
+# Add parent directory to path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives import serialization
+from sqlalchemy import event
+
+import push_service
+from database import engine, SessionLocal, create_tables
+from models.core import User
+from models.chat import PushSubscription
+
+
+def b64url(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode("utf-8").rstrip("=")
+
+
+class StubPushService(BaseHTTPRequestHandler):
+    """Push service finto: l'esito dipende dal prefisso del path."""
+    lock = threading.Lock()
+    hits = {}
+    concurrent = 0
+    max_concurrent = 0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        cls = StubPushService
+        with cls.lock:
+            cls.hits[self.path] = cls.hits.get(self.path, 0) + 1
+            cls.concurrent += 1
+            cls.max_concurrent = max(cls.max_concurrent, cls.concurrent)
+            attempt = cls.hits[self.path]
+        try:
+            if self.path.startswith("/gone/"):
+                code = 410
+            elif self.path.startswith("/flaky/") and attempt == 1:
+                code = 503
+            else:
+                if self.path.startswith("/slow/"):
+                    time.sleep(0.2)
+                code = 201
+            self.send_response(code)
+            self.end_headers()
+        finally:
+            with cls.lock:
+                cls.concurrent -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+def make_subscription_keys():
+    """Chiavi p256dh/auth valide come quelle generate dal browser."""
+    key = ec.generate_private_key(ec.SECP256R1())
+    public = key.public_key().public_bytes(
+        serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint
+    )
+    return b64url(public), b64url(os.urandom(16))
+
+
+def main():
+    # VAPID di test
+    vapid_key = ec.generate_private_key(ec.SECP256R1())
+    push_service.VAPID_PRIVATE_KEY = b64url(vapid_key.private_numbers().private_value.to_bytes(32, "big"))
+    push_service.VAPID_PUBLIC_KEY = b64url(vapid_key.public_key().public_bytes(
+        serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint
+    ))
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubPushService)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    create_tables()
+    db = SessionLocal()
+    db.add(User(id=1, username="push", password_hash="x", full_name="Push Test"))
+    subs = []
+    for kind, n in (("ok", 5), ("gone", 3), ("flaky", 2), ("slow", 6)):
+        for i in range(n):
+            p256dh, auth = make_subscription_keys()
+            sub = PushSubscription(user_id=1, endpoint=f"{base}/{kind}/{i}", p256dh_key=p256dh, auth_key=auth)
+            db.add(sub)
+            subs.append(sub)
+    db.commit()
+
+    dispatcher = push_service.PushDispatcher(workers=8, max_per_host=2, retry_base_seconds=0.1, cleanup_interval=3600)
+    push_service._dispatcher = dispatcher
+    dispatcher.start()
+
+    start = time.perf_counter()
+    for sub in subs:
+        push_service.send_chat_notification(
+            {"endpoint": sub.endpoint, "keys": {"p256dh": sub.p256dh_key, "auth": sub.auth_key}},
+            "Tester", "Ciao!", 1
+        )
+    enqueue_ms = (time.perf_counter() - start) * 1000
+    db.close()
+
+    if not dispatcher.wait_idle(timeout=30):
+        print("ERRORE: coda non svuotata entro 30 s")
+        sys.exit(1)
+
+    deletes = []
+    def count_deletes(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith("DELETE"):
+            deletes.append(statement)
+    event.listen(engine, "before_cursor_execute", count_deletes)
+    dispatcher.stop()
+    event.remove(engine, "before_cursor_execute", count_deletes)
+
+    db = SessionLocal()
+    remaining = db.query(PushSubscription).count()
+    db.close()
+
+    print(f"Accodamento {len(subs)} notifiche: {enqueue_ms:.1f} ms")
+    print(f"Stats dispatcher: {dispatcher.stats}")
+    print(f"Max invii concorrenti verso lo stesso host: {StubPushService.max_concurrent}")
+    print(f"DELETE eseguite: {len(deletes)}, subscription rimaste: {remaining}")
+
+    ok = (
+        dispatcher.stats["sent"] == 13
+        and dispatcher.stats["retried"] == 2
+        and dispatcher.stats["dead_removed"] == 3
+        and len(deletes) == 1
+        and remaining == len(subs) - 3
+        and StubPushService.max_concurrent <= 2
+    )
+    server.shutdown()
+    print("OK" if ok else "ERRORE: risultati inattesi")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Regression check dei piani di esecuzione (SQLite EXPLAIN QUERY PLAN).
+
+1. Crea lo schema su un DB temporaneo SENZA gli indici hot path.
+2. Applica la migration Alembic c4e9a7b2d1f0 (upgrade) a quel DB.
+3. Per le query degli endpoint caldi verifica che il piano usi l'indice atteso.
+
+Controlla anche che la lista INDEXES della migration coincida con gli
+indici dichiarati nei modelli (__table_args__).
+
+Uso:
+    python scripts/check_query_plans.py
+"""
+import importlib.util
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+_tmp_dir = tempfile.mkdtemp(prefix="sl_plans_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'plans.db')}"
+
+# Add parent directory to path to import backend modules
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from sqlalchemy import select, or_, desc, event
+
+from database import engine, Base
+from models.core import Notification
+from models.logistics import LogisticsRequest
+from models.shifts import ShiftAssignment
+from models.production import KpiEntry, OvenItem
+from models.hr import LeaveRequest
+from models.fleet import FleetChargeCycle
+
+MIGRATION_FILE = os.path.join(BACKEND_DIR, "alembic", "versions", "c4e9a7b2d1f0_hot_path_composite_indexes.py")
+
+
+def load_migration():
+    spec = importlib.util.spec_from_file_location("hot_path_indexes", MIGRATION_FILE)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def hot_path_queries():
+    """(descrizione, statement, indice atteso) — stessi filtri usati dagli endpoint."""
+    day = datetime(2026, 3, 2)
+    return [
+        ("logistics pool (GET /logistics/requests?status=pending)",
+         select(LogisticsRequest).where(LogisticsRequest.status.in_(["pending", "prepared"]))
+         .order_by(LogisticsRequest.is_urgent.desc(), LogisticsRequest.created_at.asc()).limit(50),
+         "ix_logistics_requests_status_created"),
+        ("logistics escalation job",
+         select(LogisticsRequest).where(LogisticsRequest.status == "pending",
+                                        LogisticsRequest.created_at <= day),
+         "ix_logistics_requests_status_created"),
+        ("notifications unread-count (utente o ruolo)",
+         select(Notification.id).where(
+             or_(Notification.recipient_user_id == 1, Notification.recipient_role == "hr_manager"),
+             Notification.is_read == False),
+         ("ix_notifications_user_read_created", "ix_notifications_role_read_created")),
+        ("shift assignment del giorno (mobile)",
+         select(ShiftAssignment).where(ShiftAssignment.employee_id == 1,
+                                       ShiftAssignment.work_date >= day,
+                                       ShiftAssignment.work_date < day + timedelta(days=1)),
+         "ix_shift_assignments_employee_date"),
+        ("kpi entry per settore/giorno/turno",
+         select(KpiEntry).where(KpiEntry.kpi_config_id == 1,
+                                KpiEntry.work_date >= day,
+                                KpiEntry.work_date < day + timedelta(days=1),
+                                KpiEntry.shift_type == "morning"),
+         "ix_kpi_entries_config_date_shift"),
+        ("forno: articoli in_oven",
+         select(OvenItem).where(OvenItem.status == "in_oven"),
+         "ix_oven_items_status"),
+        ("ferie approvate di un dipendente nell'anno",
+         select(LeaveRequest).where(LeaveRequest.employee_id == 1,
+                                    LeaveRequest.status == "approved",
+                                    LeaveRequest.start_date >= datetime(2026, 1, 1),
+                                    LeaveRequest.start_date <= datetime(2026, 12, 31, 23, 59, 59)),
+         "ix_leave_requests_employee_status_start"),
+        ("ciclo di ricarica attivo del mezzo",
+         select(FleetChargeCycle).where(FleetChargeCycle.vehicle_id == 1,
+                                        FleetChargeCycle.status.in_(["in_use", "charging", "parked"]))
+         .order_by(desc(FleetChargeCycle.created_at)).limit(1),
+         "ix_fleet_charge_cycles_vehicle_status"),
+    ]
+
+
+def explain(conn, stmt) -> str:
+    """Esegue lo statement con il prefisso EXPLAIN QUERY PLAN (parametri espansi da SQLAlchemy)."""
+    def add_explain(conn, cursor, statement, parameters, context, executemany):
+        return "EXPLAIN QUERY PLAN " + statement, parameters
+
+    event.listen(engine, "before_cursor_execute", add_explain, retval=True)
+    try:
+        rows = conn.execute(stmt).fetchall()
+    finally:
+        event.remove(engine, "before_cursor_execute", add_explain)
+    return "\n".join(row[-1] for row in rows)
+
+
+def main():
+    migration = load_migration()
+    ok = True
+
+    # La migration deve creare esattamente gli indici dichiarati nei modelli
+    migration_indexes = {(name, table, tuple(cols)) for name, table, cols in migration.INDEXES}
+    model_indexes = {
+        (ix.name, table, tuple(c.name for c in ix.columns))
+        for table in {t for _, t, _ in migration.INDEXES}
+        for ix in Base.metadata.tables[table].indexes
+        if ix.name in {n for n, _, _ in migration.INDEXES}
+    }
+    if migration_indexes != model_indexes:
+        print(f"ERRORE: migration e modelli divergono: {migration_indexes ^ model_indexes}")
+        ok = False
+
+    # Schema senza indici hot path, poi upgrade della migration
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for name, _table, _cols in migration.INDEXES:
+            conn.exec_driver_sql(f"DROP INDEX IF EXISTS {name}")
+    with engine.begin() as conn:
+        with Operations.context(MigrationContext.configure(conn)):
+            migration.upgrade()
+
+    with engine.connect() as conn:
+        for label, stmt, expected in hot_path_queries():
+            expected = expected if isinstance(expected, tuple) else (expected,)
+            plan = explain(conn, stmt)
+            missing = [name for name in expected if f"INDEX {name}" not in plan]
+            status = "OK " if not missing else "KO "
+            ok = ok and not missing
+            print(f"{status} {label}")
+            for line in plan.splitlines():
+                print(f"      {line}")
+
+    print("OK" if ok else "ERRORE: piani di esecuzione senza indice atteso")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+"""
+Verifica degli export PDF/Excel con job in background e cache artefatti
+(report_jobs, data_versions) su DB temporaneo.
+
+- i 7 export storici rispondono con lo stesso file (nome, tipo, contenuto)
+  generato chiamando direttamente il renderer
+- seconda richiesta identica: servita dalla cache, nessuna generazione
+- scrittura ORM (singola o in blocco) su una tabella letta: nuova generazione;
+  scrittura annullata (rollback) o su tabella non letta: cache ancora valida
+- users: solo il cambio di full_name (letto dai report) rigenera, login e
+  altri campi del profilo no
+- richieste identiche in contemporanea: una sola generazione
+- POST /reports/jobs: job in background, notifica "report_job" su /ws/badges,
+  stato e download; job già in cache subito "done"
+- errori (404 del renderer, 403, 422) e job di altri utenti (404)
+- artefatto scaduto: download 410, rimosso da prune_report_cache
+
+Uso:
+    python scripts/check_report_jobs.py
+"""
+import asyncio
+import io
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# I worker del pool report (forkserver) rimportano questo file: ereditano l'ambiente del padre
+if __name__ == "__main__":
+    _tmp_dir = tempfile.mkdtemp(prefix="sl_report_jobs_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'reports.db')}"
+    os.environ["REPORT_CACHE_DIR"] = os.path.join(_tmp_dir, "cache")
+
+# Add parent directory to path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from fastapi.testclient import TestClient
+from openpyxl import load_workbook
+
+from database import (
+    SessionLocal, create_tables, User, Employee, Department, Banchina, KpiConfig, KpiEntry,
+    ShiftAssignment, LeaveRequest, Bonus, ProductionMaterial, BlockRequest, Notification, ReportJob
+)
+from models.checklist_web import ChecklistWebEntry
+from security import create_access_token, get_current_user
+import report_jobs
+import main
+
+DAY = datetime(2026, 3, 10)
+CURRENT = {"id": 1}
+XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+EXPORTS = [
+    # (nome, metodo, url, parametri, parametri del renderer, nome file atteso)
+    ("kpi_daily_pdf", "GET", "/kpi/report/daily/pdf", {"work_date": "2026-03-10"},
+     {"work_date": "2026-03-10"}, "report_kpi_2026-03-10.pdf"),
+    ("kpi_advanced_pdf", "GET", "/kpi/report/advanced/pdf", {"start_date": "2026-03-01", "end_date": "2026-03-31"},
+     {"start_date": "2026-03-01", "end_date": "2026-03-31"}, "report_avanzato_20260301_20260331.pdf"),
+    ("shifts_pdf", "GET", "/shifts/export/pdf", {"start_date": "2026-03-09", "end_date": "2026-03-15"},
+     {"start_date": "2026-03-09", "end_date": "2026-03-15"}, "Turni_20260309_TUTTI_I_REPARTI.pdf"),
+    ("bonuses_pdf", "GET", "/bonuses/export/pdf", {"month": 3, "year": 2026},
+     {"month": 3, "year": 2026}, "Bonus_Marzo_2026.pdf"),
+    ("checklist_pdf", "GET", "/api/checklist-web/pdf", {"date": "2026-03-10"},
+     {"date": "2026-03-10"}, "checklist_web_2026-03-10.pdf"),
+    ("production_excel", "GET", "/production/reports",
+     {"start_date": "2026-03-01", "end_date": "2026-03-31", "format": "excel"},
+     {"start_date": "2026-03-01", "end_date": "2026-03-31"}, "Report_Produzione_20260301_all.xlsx"),
+    ("absences_excel", "POST", "/reports/absences/export/excel", {"start_date": "2026-03-01", "end_date": "2026-03-31"},
+     {"start_date": "2026-03-01", "end_date": "2026-03-31"}, "Report_Assenze_2026-03-01_2026-03-31.xlsx"),
+]
+
+
+def seed():
+    create_tables()
+    db = SessionLocal()
+    db.add(User(id=1, username="admin", password_hash="x", full_name="Admin", role="super_admin", is_active=True))
+    db.add(User(id=2, username="coord", password_hash="x", full_name="Coord", role="coordinator", is_active=True))
+    db.add(Department(id=1, name="Produzione"))
+    db.add(Banchina(id=1, code="B1", name="Banchina 1"))
+    db.add_all([Employee(id=i, first_name=f"Nome{i}", last_name=f"Cognome{i}", department_id=1,
+                         default_banchina_id=1) for i in range(1, 31)])
+    db.add_all([KpiConfig(id=i, sector_name=f"Reparto {i}", kpi_target_8h=400, kpi_target_hourly=50, display_order=i)
+                for i in range(1, 6)])
+    for i in range(1, 6):
+        for d in range(1, 28):
+            for shift in ("morning", "afternoon"):
+                db.add(KpiEntry(kpi_config_id=i, work_date=datetime(2026, 3, d), shift_type=shift, recorded_by=1,
+                                hours_total=8, hours_downtime=d % 3, hours_net=8 - d % 3,
+                                quantity_produced=300 + 7 * d, downtime_notes="Guasto" if d % 5 == 0 else None))
+    for emp in range(1, 31):
+        for d in range(9, 16):
+            db.add(ShiftAssignment(employee_id=emp, work_date=datetime(2026, 3, d),
+                                   shift_type=("morning", "afternoon", "night")[(emp + d) % 3], assigned_by=1))
+        if emp % 4 == 0:
+            db.add(LeaveRequest(employee_id=emp, leave_type=("vacation", "sick")[emp % 2], status="approved",
+                                start_date=datetime(2026, 3, emp % 20 + 1), end_date=datetime(2026, 3, emp % 20 + 3)))
+        db.add(Bonus(employee_id=emp, amount=25.0 + emp, description="Premio", month=3, year=2026, created_by=1))
+    db.add_all([ChecklistWebEntry(data=DAY.date(), cliente=f"Cliente {i}", checked=i % 2 == 0, account_id=1,
+                                  updated_at=DAY) for i in range(1, 11)])
+    db.add(ProductionMaterial(id=1, category="memory", label="EM40 BIANCO"))
+    db.add(ProductionMaterial(id=2, category="sponge_density", label="D25"))
+    for i in range(300):
+        created = datetime(2026, 3, 1) + timedelta(minutes=97 * i)
+        db.add(BlockRequest(request_type=("memory", "sponge")[i % 2], target_sector="pantografo",
+                            material_id=1 if i % 2 == 0 else None, density_id=2 if i % 2 else None,
+                            dimensions="160x190", quantity=1 + i % 3, status="delivered", created_by_id=1,
+                            processed_by_id=2, created_at=created, processed_at=created + timedelta(minutes=12),
+                            delivered_at=created + timedelta(minutes=40)))
+    db.commit()
+    db.close()
+
+
+def current_user():
+    db = SessionLocal()
+    return db.get(User, CURRENT["id"])
+
+
+def call(client, method, url, params):
+    if method == "POST":
+        return client.post(url, json=params)
+    return client.get(url, params=params)
+
+
+def same_content(a: bytes, b: bytes, media_type: str) -> bool:
+    """Stesso contenuto: celle uguali per Excel, stessa struttura per PDF (i PDF contengono la data di creazione)."""
+    if media_type == XLSX:
+        wa, wb = load_workbook(io.BytesIO(a)), load_workbook(io.BytesIO(b))
+        return wa.sheetnames == wb.sheetnames and all(
+            [r for r in wa[name].iter_rows(values_only=True)] == [r for r in wb[name].iter_rows(values_only=True)]
+            for name in wa.sheetnames)
+    return a.startswith(b"%PDF") and b.startswith(b"%PDF") and abs(len(a) - len(b)) < 64
+
+
+def main_check():
+    seed()
+    main.app.dependency_overrides[get_current_user] = current_user
+    ok = True
+
+    def check(label, good):
+        nonlocal ok
+        ok = ok and good
+        print(f"{'OK ' if good else 'KO '} {label}")
+
+    renders = []
+    original_run = report_jobs.run_in_report_pool
+
+    async def counting_run(func, *args):
+        renders.append(args[2])
+        return await original_run(func, *args)
+    report_jobs.run_in_report_pool = counting_run
+
+    with TestClient(main.app) as client:
+        # 1. Export storici: stesso file del renderer, poi dalla cache
+        timings = []
+        for name, method, url, params, render_params, filename in EXPORTS:
+            renders.clear()
+            t0 = time.perf_counter()
+            first = call(client, method, url, params)
+            t_first = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            second = call(client, method, url, params)
+            t_second = time.perf_counter() - t0
+            timings.append((name, t_first, t_second))
+            if first.status_code != 200:
+                check(f"{name}: risposta 200 ({first.status_code} {first.text[:120]})", False)
+                continue
+            spec = report_jobs.REPORTS[name]
+            db = SessionLocal()
+            direct = spec.render(db, spec.params.model_validate(render_params))
+            db.close()
+            direct_content = direct.read()
+            if direct.path:
+                os.remove(direct.path)
+            check(f"{name}: file come il renderer ({filename})",
+                  first.headers["content-disposition"] == f"attachment; filename={filename}"
+                  and direct.filename == filename
+                  and first.headers["content-type"].startswith(direct.media_type)
+                  and same_content(first.content, direct_content, direct.media_type))
+            check(f"{name}: seconda richiesta dalla cache", len(renders) == 1 and second.content == first.content)
+
+        # 2. Invalidazione per versione dei dati
+        params = EXPORTS[0][3]
+        renders.clear()
+        db = SessionLocal()
+        db.add(KpiEntry(kpi_config_id=1, work_date=DAY, shift_type="night", recorded_by=1,
+                        hours_total=8, hours_downtime=0, hours_net=8, quantity_produced=999))
+        db.flush()
+        db.rollback()
+        db.close()
+        client.get("/kpi/report/daily/pdf", params=params)
+        check("rollback: cache ancora valida", renders == [])
+        db = SessionLocal()
+        db.add(Notification(recipient_user_id=1, notif_type="info", title="X", message="Y"))
+        db.commit()
+        db.close()
+        client.get("/kpi/report/daily/pdf", params=params)
+        check("scrittura su tabella non letta: cache ancora valida", renders == [])
+        db = SessionLocal()
+        db.add(KpiEntry(kpi_config_id=1, work_date=DAY, shift_type="night", recorded_by=1,
+                        hours_total=8, hours_downtime=0, hours_net=8, quantity_produced=999))
+        db.commit()
+        db.close()
+        client.get("/kpi/report/daily/pdf", params=params)
+        check("nuova KpiEntry: report rigenerato", len(renders) == 1)
+        db = SessionLocal()
+        db.query(KpiConfig).filter(KpiConfig.id == 2).update({KpiConfig.kpi_target_8h: 500})
+        db.commit()
+        db.close()
+        client.get("/kpi/report/daily/pdf", params=params)
+        check("UPDATE in blocco su kpi_configs: report rigenerato", len(renders) == 2)
+        checklist = EXPORTS[4]
+        call(client, checklist[1], checklist[2], checklist[3])
+        renders.clear()
+        db = SessionLocal()
+        admin = db.get(User, 1)
+        admin.last_login = datetime.utcnow()
+        admin.email = "admin@example.com"
+        db.commit()
+        call(client, checklist[1], checklist[2], checklist[3])
+        check("login / email utente: cache ancora valida", renders == [])
+        admin.full_name = "Amministratore"
+        db.commit()
+        db.close()
+        call(client, checklist[1], checklist[2], checklist[3])
+        check("nome utente cambiato: report rigenerato", len(renders) == 1)
+
+        # 3. Richieste identiche in contemporanea: una sola generazione
+        db = SessionLocal()
+        db.get(Bonus, 1).amount = 99.0
+        db.commit()
+        db.close()
+        renders.clear()
+
+        async def concurrent():
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+                return await asyncio.gather(*(ac.get("/bonuses/export/pdf", params={"month": 3, "year": 2026})
+                                              for _ in range(6)))
+        responses = client.portal.call(concurrent)
+        check("6 richieste identiche in contemporanea: 1 generazione",
+              len(renders) == 1 and all(r.status_code == 200 and r.content == responses[0].content for r in responses))
+
+        # 4. Job in background con notifica WebSocket
+        token = create_access_token({"sub": "admin", "role": "super_admin"})
+        with client.websocket_connect(f"/ws/badges?token={token}") as ws:
+            ws.receive_json()  # snapshot
+            renders.clear()
+            created = client.post("/reports/jobs", json={"report_type": "shifts_pdf", "params": {
+                "start_date": "2026-03-09", "end_date": "2026-03-15", "department_id": 1}})
+            job = created.json()
+            check("POST /reports/jobs: job creato", created.status_code == 200
+                  and job["status"] in ("pending", "running") and job["download_url"] is None)
+            message = ws.receive_json()
+            check("notifica report_job su /ws/badges",
+                  message["type"] == "report_job" and message["job_id"] == job["id"] and message["status"] == "done"
+                  and message["download_url"] == f"/reports/jobs/{job['id']}/download")
+            status = client.get(f"/reports/jobs/{job['id']}").json()
+            download = client.get(status["download_url"])
+            check("job done e download", status["status"] == "done" and download.status_code == 200
+                  and download.content.startswith(b"%PDF") and status["filename"] == "Turni_20260309_Produzione.pdf")
+            again = client.post("/reports/jobs", json={"report_type": "shifts_pdf", "params": {
+                "start_date": "2026-03-09", "end_date": "2026-03-15", "department_id": 1}}).json()
+            check("job già in cache: subito done", again["status"] == "done" and len(renders) == 1)
+
+            # Errore del renderer: job fallito, notificato
+            failed = client.post("/reports/jobs", json={"report_type": "checklist_pdf",
+                                                        "params": {"date": "2026-01-01"}}).json()
+            message = ws.receive_json()
+            status = client.get(f"/reports/jobs/{failed['id']}").json()
+            check("job con 404 del renderer: failed",
+                  message["status"] == "failed" and status["status"] == "failed" and "Nessuna checklist" in status["error"]
+                  and client.get(f"/reports/jobs/{failed['id']}/download").status_code == 409)
+
+        check("export diretto con 404 del renderer",
+              client.get("/api/checklist-web/pdf", params={"date": "2026-01-01"}).status_code == 404)
+        check("report sconosciuto: 404",
+              client.post("/reports/jobs", json={"report_type": "nope", "params": {}}).status_code == 404)
+        check("parametri non validi: 422",
+              client.post("/reports/jobs", json={"report_type": "bonuses_pdf", "params": {"month": 13, "year": 2026}})
+              .status_code == 422)
+
+        CURRENT["id"] = 2
+        check("bonus da non super_admin: 403 (diretto e job)",
+              client.get("/bonuses/export/pdf", params={"month": 3, "year": 2026}).status_code == 403
+              and client.post("/reports/jobs", json={"report_type": "bonuses_pdf",
+                                                     "params": {"month": 3, "year": 2026}}).status_code == 403)
+        check("job di un altro utente: 404", client.get(f"/reports/jobs/{job['id']}").status_code == 404)
+        CURRENT["id"] = 1
+
+        # 5. Scadenza e pulizia
+        db = SessionLocal()
+        job_key = db.get(ReportJob, job["id"]).cache_key
+        db.close()
+        meta = report_jobs.cached_artifact(job_key)
+        old = time.time() - (report_jobs.REPORT_CACHE_MAX_AGE_HOURS + 1) * 3600
+        os.utime(meta["path"], (old, old))
+        os.utime(os.path.join(report_jobs.REPORT_CACHE_DIR, f"{job_key}.json"), (old, old))
+        check("artefatto scaduto: download 410", client.get(f"/reports/jobs/{job['id']}/download").status_code == 410)
+        removed = report_jobs.prune_report_cache()
+        check("prune_report_cache rimuove i file scaduti", removed == 2 and not os.path.exists(meta["path"]))
+
+    print("\n      export                prima (ms)   cache (ms)")
+    for name, t_first, t_second in timings:
+        print(f"      {name:<20} {t_first * 1000:>10.1f} {t_second * 1000:>12.1f}")
+
+    print("OK" if ok else "ERRORE: verifiche fallite")
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main_check() else 1)
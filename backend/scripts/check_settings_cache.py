@@ -0,0 +1,183 @@
+"""
+Verifica della cache impostazioni (settings_cache) su DB temporaneo.
+
+- GET /admin/config/*: stessa risposta della lettura ORM di prima
+- completamento missione logistica: nessuna query su logistics_config
+  (prima: una per ogni get_config_value)
+- PUT /logistics/config e PATCH /admin/settings: valore nuovo subito
+  visibile (invalidazione al commit) e in un secondo "worker" via broker
+- scrittura annullata (rollback): versione e cache invariate
+- scrittura di un altro processo (versione incrementata a mano): vista al
+  controllo di versione successivo
+
+Uso:
+    python scripts/check_settings_cache.py
+"""
+import os
+import sys
+import tempfile
+import time
+
+_tmp_dir = tempfile.mkdtemp(prefix="sl_settings_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'settings.db')}"
+
+# Add parent directory to path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.testclient import TestClient
+from sqlalchemy import event, text
+
+from database import engine, SessionLocal, create_tables, User, Banchina, Employee
+from models.config import SystemSetting
+from models.hr import MedicalExamType, TrainingType, EventType
+from models.production import DowntimeReason
+from models.logistics import LogisticsConfig, LogisticsMaterialType
+from security import get_current_user
+from settings_cache import (
+    SettingsCache, get_settings_cache, get_int, bump_version, LOGISTICS, SYSTEM, LOOKUPS
+)
+from ws_broker import get_ws_broker
+import routers.logistics as logistics_router
+import main
+
+_session = SessionLocal()
+_users = {}
+
+
+def seed():
+    create_tables()
+    db = SessionLocal()
+    db.add(User(id=1, username="admin", password_hash="x", full_name="Admin", role="super_admin", is_active=True))
+    db.add(Employee(id=1, first_name="Mario", last_name="Rossi"))
+    db.add(Banchina(id=1, code="B1", name="Banchina 1"))
+    db.add(LogisticsMaterialType(id=1, label="Cartoni", icon="📦", base_points=1))
+    for key, value in {"points_base_mission": "3", "threshold_sla_warning_minutes": "3",
+                       "points_super_speed_bonus": "2"}.items():
+        db.add(LogisticsConfig(config_key=key, config_value=value))
+    db.add(SystemSetting(key="annual_leave_hours", value="256"))
+    db.add_all([DowntimeReason(label="Guasto", category="technical"),
+                DowntimeReason(label="Materiale", category="material", is_active=False)])
+    db.add(MedicalExamType(name="Visita periodica", frequency_months=12))
+    db.add(TrainingType(name="Sicurezza", validity_months=60))
+    db.add(EventType(label="Ritardo", default_points=-1, severity="warning", icon="⏰"))
+    db.commit()
+    # Nessun monte ore personale: vale il default di sistema
+    db.execute(text("UPDATE employees SET annual_leave_hours = NULL"))
+    db.commit()
+    db.close()
+
+
+def current_user():
+    if 1 not in _users:
+        _users[1] = _session.get(User, 1)
+    return _users[1]
+
+
+def orm_rows(model, **filters):
+    db = SessionLocal()
+    try:
+        rows = db.query(model).filter_by(**filters).all()
+        return jsonable_encoder(rows)
+    finally:
+        db.close()
+
+
+def main_check():
+    seed()
+    main.app.dependency_overrides[get_current_user] = current_user
+    ok = True
+
+    def check(label, good):
+        nonlocal ok
+        ok = ok and good
+        print(f"{'OK ' if good else 'KO '} {label}")
+
+    config_queries = []
+    event.listen(engine, "before_cursor_execute",
+                 lambda conn, cur, stmt, *args: config_queries.append(stmt) if "logistics_config" in stmt else None)
+
+    with TestClient(main.app) as client:
+        same = all(
+            client.get(f"/admin/config/{path}").json() == expected
+            for path, expected in (
+                ("downtime-reasons", orm_rows(DowntimeReason, is_active=True)),
+                ("exam-types", orm_rows(MedicalExamType)),
+                ("training-types", orm_rows(TrainingType)),
+                ("event-types", orm_rows(EventType)),
+            )
+        )
+        check("GET /admin/config/* identiche alla lettura ORM", same)
+        check("causali fermo mobile solo attive",
+              [r["label"] for r in client.get("/mobile/downtime-reasons").json()] == ["Guasto"])
+
+        # Secondo "worker": riceve le invalidazioni dal broker
+        other_worker = SettingsCache()
+        get_ws_broker().subscribe("settings", other_worker.on_broker_event)
+        db = SessionLocal()
+        check("altro worker: valore iniziale", int(other_worker.get(db, LOGISTICS)["points_base_mission"]) == 3)
+
+        # Completamento missione: get_config_value dalla memoria
+        calls = []
+        original = logistics_router.get_config_value
+        logistics_router.get_config_value = lambda *a, **k: calls.append(a[1]) or original(*a, **k)
+        rid = client.post("/logistics/requests", json={"material_type_id": 1, "banchina_id": 1, "quantity": 1}).json()["id"]
+        client.patch(f"/logistics/requests/{rid}/take", json={"promised_eta_minutes": 10}).raise_for_status()
+        config_queries.clear()
+        done = client.patch(f"/logistics/requests/{rid}/complete", json={})
+        done.raise_for_status()
+        logistics_router.get_config_value = original
+        print(f"      completamento: {len(calls)} letture di configurazione, "
+              f"query logistics_config prima {len(calls)}, dopo {len(config_queries)}")
+        check("completamento senza query su logistics_config", len(calls) > 0 and config_queries == [])
+
+        # Scrittura via endpoint: subito visibile qui e nell'altro worker
+        client.put("/logistics/config/points_base_mission", params={"value": "9"}).raise_for_status()
+        check("PUT /logistics/config: nuovo valore subito", get_int(db, LOGISTICS, "points_base_mission", 0) == 9)
+        check("PUT /logistics/config: altro worker invalidato",
+              int(other_worker.get(db, LOGISTICS)["points_base_mission"]) == 9)
+        client.patch("/admin/settings/annual_leave_hours", json={"value": "200"}).raise_for_status()
+        hours = client.get("/leaves/hours/1").json()
+        check("PATCH /admin/settings: monte ore dal nuovo default", hours["ore_totali"] == 200)
+        client.post("/admin/config/exam-types", json={"name": "Visita oculistica"}).raise_for_status()
+        check("nuovo tipo visita subito in lista",
+              [r["name"] for r in client.get("/admin/config/exam-types").json()] == ["Visita periodica", "Visita oculistica"])
+
+        # Rollback: nessuna invalidazione, versione invariata
+        cache = get_settings_cache()
+        before = (cache.get_stats()["invalidations"], cache.get(db, SYSTEM) is not None)
+        version = db.execute(text("SELECT version FROM settings_versions WHERE namespace = 'system'")).scalar()
+        tx = SessionLocal()
+        tx.query(SystemSetting).filter(SystemSetting.key == "annual_leave_hours").update({"value": "1"})
+        bump_version(tx, SYSTEM)
+        tx.rollback()
+        tx.close()
+        db.rollback()
+        check("rollback: versione e cache invariate",
+              cache.get_stats()["invalidations"] == before[0]
+              and db.execute(text("SELECT version FROM settings_versions WHERE namespace = 'system'")).scalar() == version
+              and get_int(db, SYSTEM, "annual_leave_hours", 0) == 200)
+
+        # Scrittura di un altro processo (senza eventi di sessione né broker)
+        fast = SettingsCache(check_seconds=0.2)
+        fast.get(db, LOOKUPS)
+        db.rollback()
+        with engine.begin() as conn:
+            conn.execute(text("INSERT INTO event_types (label, default_points, severity, icon) "
+                              "VALUES ('Assenza', -3, 'danger', '🚫')"))
+            conn.execute(text("UPDATE settings_versions SET version = version + 1 WHERE namespace = 'lookups'"))
+        still_cached = len(fast.get(db, LOOKUPS)["event_types"]) == 1
+        time.sleep(0.3)
+        db.rollback()
+        check("altro processo: visto al controllo di versione successivo",
+              still_cached and len(fast.get(db, LOOKUPS)["event_types"]) == 2)
+        db.close()
+        print(f"      statistiche: {cache.get_stats()}")
+
+    _session.close()
+    print("OK" if ok else "ERRORE: cache impostazioni non conforme")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main_check()
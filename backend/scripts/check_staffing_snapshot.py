@@ -0,0 +1,237 @@
+"""
+Verifica dello snapshot fabbisogni (settings_cache, namespace "staffing") su DB temporaneo.
+
+- /kpi/panoramica identica al calcolo precedente (requisiti letti ogni volta,
+  una SUM per settore) e con numero di query costante al crescere dei settori
+- calculate_staffing identico al calcolo precedente per ogni settore/turno
+- modifiche ai requisiti via /kpi/requirements, /kpi/configs/{id}/requirements,
+  /factory/requirements/{id}/kpi, /admin/workstations e DELETE /kpi/configs:
+  panoramica e /kpi/configs aggiornate subito (invalidazione al commit)
+
+Uso:
+    python scripts/check_staffing_snapshot.py
+"""
+import os
+import random
+import sys
+import tempfile
+from datetime import date, datetime, timedelta
+
+_tmp_dir = tempfile.mkdtemp(prefix="sl_staffing_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'staffing.db')}"
+
+# Add parent directory to path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event, func
+
+from database import (
+    engine, SessionLocal, create_tables, User, Employee, Banchina, KpiConfig, KpiEntry,
+    ShiftRequirement, ShiftAssignment, LeaveRequest
+)
+from date_ranges import on_day
+from security import get_current_user
+from routers.kpi import calculate_staffing
+import main
+
+WORK_DATE = date.today()
+SHIFTS = ("morning", "afternoon", "night", "manual", "custom", "day_off")
+_session = SessionLocal()
+_users = {}
+
+
+def seed(n_sectors: int, first_id: int = 1):
+    rnd = random.Random(n_sectors)
+    db = SessionLocal()
+    if db.get(User, 1) is None:
+        db.add(User(id=1, username="admin", password_hash="x", full_name="Admin", role="super_admin", is_active=True))
+        db.add(Banchina(id=1, code="B1", name="Banchina 1"))
+        db.add_all([Employee(id=i, first_name=f"Nome{i}", last_name=f"Cognome{i}") for i in range(1, 201)])
+        # Requisito non legato a KPI: non conta in nessun settore
+        db.add(ShiftRequirement(id=10_000, banchina_id=1, role_name="Mulettista", quantity=3))
+    day = datetime.combine(WORK_DATE, datetime.min.time())
+    for cid in range(first_id, first_id + n_sectors):
+        sector = f"Reparto {cid:03d}"
+        db.add(KpiConfig(id=cid, sector_name=sector, kpi_target_8h=400, kpi_target_hourly=50, display_order=cid))
+        for r in range(rnd.randint(0, 3)):
+            req_id = cid * 10 + r
+            db.add(ShiftRequirement(id=req_id, banchina_id=1, role_name=f"Ruolo {req_id}",
+                                    quantity=rnd.choice((1.0, 1.5, 2.0, None)), kpi_sector=sector))
+            for _ in range(rnd.randint(0, 4)):
+                db.add(ShiftAssignment(employee_id=rnd.randint(1, 200), requirement_id=req_id,
+                                       work_date=day + timedelta(hours=rnd.choice((0, 6))),
+                                       shift_type=rnd.choice(SHIFTS), assigned_by=1))
+        for shift in rnd.sample(("morning", "afternoon", "night", "custom"), rnd.randint(0, 3)):
+            db.add(KpiEntry(kpi_config_id=cid, work_date=day, shift_type=shift, recorded_by=1,
+                            quantity_produced=rnd.choice((0, 0, 120)), hours_downtime=rnd.choice((0.0, 1.0))))
+    db.add(LeaveRequest(employee_id=7, leave_type="vacation", status="approved",
+                        start_date=day - timedelta(days=1), end_date=day + timedelta(days=1)))
+    db.commit()
+    db.close()
+
+
+def current_user():
+    if 1 not in _users:
+        _users[1] = _session.get(User, 1)
+    return _users[1]
+
+
+# ============================================================
+# CALCOLO PRECEDENTE (copia)
+# ============================================================
+
+def legacy_panoramica(db, work_date):
+    configs = db.query(KpiConfig).filter(KpiConfig.is_active == True).order_by(KpiConfig.display_order).all()
+    entries_map = {(e.kpi_config_id, e.shift_type): e
+                   for e in db.query(KpiEntry).filter(on_day(KpiEntry.work_date, work_date)).all()}
+    req_map = {r.id: r.kpi_sector for r in db.query(ShiftRequirement).all() if r.kpi_sector}
+    ops_count = {}
+    for assign in db.query(ShiftAssignment).filter(on_day(ShiftAssignment.work_date, work_date)).all():
+        sector_name = req_map.get(assign.requirement_id)
+        if not sector_name:
+            continue
+        if sector_name not in ops_count:
+            ops_count[sector_name] = {'morning': 0, 'afternoon': 0, 'night': 0, 'custom': 0}
+        st = assign.shift_type
+        if st in ops_count[sector_name]:
+            ops_count[sector_name][st] += 1
+        elif st == 'custom' or st == 'manual':
+            ops_count[sector_name]['custom'] += 1
+    result = []
+    for cfg in configs:
+        ops_required = db.query(func.sum(ShiftRequirement.quantity)).filter(
+            ShiftRequirement.kpi_sector == cfg.sector_name
+        ).scalar() or 0
+        sector_ops = ops_count.get(cfg.sector_name, {})
+
+        def get_status(shift):
+            entry = entries_map.get((cfg.id, shift))
+            if not entry or (entry.quantity_produced == 0 and entry.hours_downtime == 0):
+                return "empty"
+            return "complete" if entry.quantity_produced > 0 else "partial"
+
+        result.append({
+            "config_id": cfg.id, "sector_name": cfg.sector_name,
+            "morning_status": get_status("morning"), "afternoon_status": get_status("afternoon"),
+            "night_status": get_status("night"), "custom_status": get_status("custom"),
+            "operators_required": ops_required,
+            "morning_ops": sector_ops.get('morning', 0), "afternoon_ops": sector_ops.get('afternoon', 0),
+            "night_ops": sector_ops.get('night', 0), "custom_ops": sector_ops.get('custom', 0),
+        })
+    return result
+
+
+def legacy_staffing(db, sector_name, work_date, shift_type):
+    requirements = db.query(ShiftRequirement).filter(ShiftRequirement.kpi_sector == sector_name).all()
+    if not requirements:
+        return None, None, None, None
+    req_ids = [r.id for r in requirements]
+    operators_required = sum(r.quantity or 0 for r in requirements)
+    work_datetime = datetime.combine(work_date, datetime.min.time())
+    target_shifts = [shift_type] + (['manual'] if shift_type == 'custom' else [])
+    assignments = db.query(ShiftAssignment).join(Employee).filter(
+        ShiftAssignment.requirement_id.in_(req_ids),
+        on_day(ShiftAssignment.work_date, work_date),
+        ShiftAssignment.shift_type.in_(target_shifts)
+    ).all()
+    assigned_employee_ids = [a.employee_id for a in assignments]
+    absences = 0
+    if assigned_employee_ids:
+        absences = db.query(LeaveRequest).filter(
+            LeaveRequest.employee_id.in_(assigned_employee_ids),
+            LeaveRequest.status == 'approved',
+            LeaveRequest.start_date <= work_datetime,
+            LeaveRequest.end_date >= work_datetime
+        ).count()
+    operators_present = len(assignments) - absences
+    delta = operators_present - operators_required
+    status = ("pieno" if delta == 0 else "surplus") if delta >= 0 else "sottoorganico"
+    return operators_present, operators_required, status, int(delta)
+
+
+# ============================================================
+# VERIFICA
+# ============================================================
+
+def main_check():
+    create_tables()
+    seed(10)
+    main.app.dependency_overrides[get_current_user] = current_user
+    ok = True
+
+    def check(label, good):
+        nonlocal ok
+        ok = ok and good
+        print(f"{'OK ' if good else 'KO '} {label}")
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda conn, cur, stmt, *args: statements.append(stmt))
+
+    def panoramica(client):
+        statements.clear()
+        response = client.get("/kpi/panoramica", params={"work_date": str(WORK_DATE)})
+        response.raise_for_status()
+        return response.json(), len(statements)
+
+    def same_as_legacy(client):
+        db = SessionLocal()
+        try:
+            return panoramica(client)[0] == legacy_panoramica(db, WORK_DATE)
+        finally:
+            db.close()
+
+    with TestClient(main.app) as client:
+        check("panoramica identica al calcolo precedente (10 settori)", same_as_legacy(client))
+        _, queries_10 = panoramica(client)
+        db = SessionLocal()
+        legacy_counter = []
+        event.listen(engine, "before_cursor_execute", lambda *a: legacy_counter.append(1))
+        legacy_panoramica(db, WORK_DATE)
+        legacy_10 = len(legacy_counter)
+        db.close()
+
+        seed(40, first_id=11)
+        # Requisiti inseriti fuori dagli endpoint: la cache li vede dopo la prossima scrittura via endpoint
+        client.patch("/kpi/requirements/10000", json={"note": "nuovi settori"}).raise_for_status()
+        check("panoramica identica al calcolo precedente (50 settori)", same_as_legacy(client))
+        _, queries_50 = panoramica(client)
+        legacy_counter.clear()
+        db = SessionLocal()
+        legacy_panoramica(db, WORK_DATE)
+        legacy_50 = len(legacy_counter)
+        print(f"      query panoramica: 10 settori prima {legacy_10} dopo {queries_10}, "
+              f"50 settori prima {legacy_50} dopo {queries_50}")
+        check("panoramica con numero di query costante", queries_10 == queries_50 <= 3)
+
+        same = all(
+            calculate_staffing(db, cfg.sector_name, WORK_DATE, shift)
+            == legacy_staffing(db, cfg.sector_name, WORK_DATE, shift)
+            for cfg in db.query(KpiConfig).all()
+            for shift in ("morning", "afternoon", "night", "custom")
+        )
+        check("calculate_staffing identico al calcolo precedente", same)
+        db.close()
+
+        def required(sector_id):
+            return next(c["operators_required"] for c in client.get("/kpi/configs").json() if c["id"] == sector_id)
+
+        # Scritture sui requisiti: visibili subito
+        client.post("/kpi/configs/3/requirements", json={"role_name": "Nuovo", "quantity": 5}).raise_for_status()
+        check("POST requisito: panoramica e /kpi/configs aggiornate", same_as_legacy(client) and required(3) >= 5)
+        new_id = max(r["id"] for r in client.get("/kpi/configs/3/requirements").json())
+        client.patch(f"/kpi/requirements/{new_id}", json={"quantity": 7.5}).raise_for_status()
+        check("PATCH requisito: quantità aggiornata", same_as_legacy(client))
+        client.patch(f"/factory/requirements/{new_id}/kpi", json={"kpi_target": 90}).raise_for_status()
+        client.delete(f"/admin/workstations/{new_id}").raise_for_status()
+        check("DELETE postazione: requisito rimosso", same_as_legacy(client))
+        empty_sector = next(c for c in client.get("/kpi/configs").json() if c["operators_required"] == 0)
+        client.delete(f"/kpi/configs/{empty_sector['id']}").raise_for_status()
+        check("DELETE settore: panoramica aggiornata", same_as_legacy(client))
+
+    print("OK" if ok else "ERRORE: verifiche fallite")
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main_check() else 1)
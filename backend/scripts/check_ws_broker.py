@@ -0,0 +1,147 @@
+"""
+Verifica del broker WebSocket tra processi (ws_broker.SQLiteBroker).
+
+Due "worker" (processi separati), ciascuno con i propri manager e le proprie
+socket simulate, collegati dallo stesso file SQLite:
+- un broadcast logistica/produzione pubblicato nel worker A arriva alle
+  socket del worker B (e a quelle di A, senza passare dal relay)
+- chat e delta dei badge arrivano solo agli utenti destinatari, su
+  qualunque worker siano connessi
+- nessun evento consegnato due volte; latenza del relay misurata
+
+Uso:
+    python scripts/check_ws_broker.py
+"""
+import asyncio
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+# Add parent directory to path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+N_EVENTS = 50
+POLL_MS = 20
+
+
+class SimulatedClient:
+    """Stessa interfaccia usata dai manager (accept/send_text/close)."""
+
+    def __init__(self):
+        self.messages = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text: str):
+        import json
+        self.messages.append((time.time(), json.loads(text)))
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+async def connect_clients(broker):
+    from websocket_manager import ChatConnectionManager, LogisticsConnectionManager, BadgeConnectionManager
+
+    pools = LogisticsConnectionManager(broker)
+    chat = ChatConnectionManager(broker)
+    badges = BadgeConnectionManager(broker)
+    clients = {"logistics": SimulatedClient(), "production": SimulatedClient(),
+               "chat_user": SimulatedClient(), "badge_user": SimulatedClient()}
+    await pools.connect(clients["logistics"], "logistics")
+    await pools.connect(clients["production"], "production_blocks")
+    return pools, chat, badges, clients
+
+
+async def worker_b(path: str, chat_user: int, ready, results):
+    """Worker B: solo consegna (nessuna pubblicazione)."""
+    from ws_broker import SQLiteBroker
+
+    broker = SQLiteBroker(path, poll_ms=POLL_MS)
+    pools, chat, badges, clients = await connect_clients(broker)
+    await chat.connect(clients["chat_user"], chat_user)
+    await badges.connect(clients["badge_user"], chat_user, "hr_manager")
+    await broker.start()
+    ready.set()
+
+    deadline = time.time() + 10
+    while time.time() < deadline and len(clients["logistics"].messages) < N_EVENTS:
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.3)   # eventuali duplicati o consegne indesiderate
+    await broker.stop()
+    results.put({name: client.messages for name, client in clients.items()})
+
+
+def run_worker_b(path, chat_user, ready, results):
+    asyncio.run(worker_b(path, chat_user, ready, results))
+
+
+async def worker_a(path: str, ready):
+    from ws_broker import SQLiteBroker
+
+    broker = SQLiteBroker(path, poll_ms=POLL_MS)
+    pools, chat, badges, clients = await connect_clients(broker)
+    await chat.connect(clients["chat_user"], 1)
+    await broker.start()
+    while not ready.is_set():
+        await asyncio.sleep(0.01)
+
+    sent_at = {}
+    for i in range(N_EVENTS):
+        sent_at[i] = time.time()
+        await pools.broadcast("logistics", {"type": "request_updated", "request_id": i})
+        await asyncio.sleep(0.002)
+    await pools.broadcast("production_blocks", {"type": "new_block", "block_id": 1})
+    await chat.broadcast_to_conversation(7, [1, 2, 3], {"type": "message_deleted", "message_id": 9}, exclude_user=1)
+    await chat.send_to_user(3, {"type": "typing", "user_id": 1})   # utente non connesso da nessuna parte
+    await badges.send_deltas([
+        {"counter": "pending_leaves", "delta": 1, "users": [], "notification_roles": [], "user_roles": ["hr_manager"]},
+        {"counter": "notifications", "delta": 1, "users": [99], "notification_roles": [], "user_roles": []},
+    ])
+    await asyncio.sleep(0.1)
+    await broker.stop()
+    return sent_at, clients
+
+
+def main():
+    path = os.path.join(tempfile.mkdtemp(prefix="sl_ws_broker_"), "ws_broker.db")
+    ctx = multiprocessing.get_context("spawn")
+    ready, results = ctx.Event(), ctx.Queue()
+    proc = ctx.Process(target=run_worker_b, args=(path, 2, ready, results))
+    proc.start()
+
+    sent_at, local = asyncio.run(worker_a(path, ready))
+    remote = results.get(timeout=20)
+    proc.join(timeout=10)
+
+    remote_ids = [m["request_id"] for _, m in remote["logistics"]]
+    latencies = sorted(t - sent_at[m["request_id"]] for t, m in remote["logistics"])
+    checks = [
+        ("broadcast logistica consegnato all'altro worker", remote_ids == list(range(N_EVENTS))),
+        ("broadcast consegnato anche in locale, una volta",
+         [m["request_id"] for _, m in local["logistics"].messages] == list(range(N_EVENTS))),
+        ("pool production_blocks separato",
+         [m["type"] for _, m in remote["production"]] == ["new_block"]),
+        ("chat all'utente connesso all'altro worker",
+         [m["type"] for _, m in remote["chat_user"]] == ["message_deleted"]),
+        ("mittente escluso dalla chat", local["chat_user"].messages == []),
+        ("delta badge per ruolo utente, solo ai destinatari",
+         [(m["counter"], m["delta"]) for _, m in remote["badge_user"]] == [("pending_leaves", 1)]),
+    ]
+    ok = True
+    for label, good in checks:
+        ok = ok and good
+        print(f"{'OK ' if good else 'KO '} {label}")
+    if latencies:
+        print(f"      latenza relay: p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, "
+              f"max {latencies[-1] * 1000:.1f} ms (poll {POLL_MS} ms)")
+
+    print("OK" if ok else "ERRORE: broker WebSocket non conforme")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
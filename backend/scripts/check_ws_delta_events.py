@@ -0,0 +1,169 @@
+"""
+Verifica degli eventi WebSocket "delta" di logistica e produzione su DB temporaneo.
+
+- ogni evento su /ws/logistics porta la richiesta arricchita e i contatori
+  del pool, identici a quelli che il client otterrebbe da GET /logistics/requests
+- eventi su /ws/production con l'ordine completo e i contatori live
+- query SQL: un evento (una volta sola sul server) contro la rilettura
+  completa della lista fatta da OGNI client connesso
+
+Uso:
+    python scripts/check_ws_delta_events.py [client_connessi]
+"""
+import os
+import sys
+import tempfile
+
+_tmp_dir = tempfile.mkdtemp(prefix="sl_ws_delta_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'delta.db')}"
+
+# Add parent directory to path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from database import engine, read_engine, SessionLocal, create_tables, User, Banchina
+from models.logistics import LogisticsMaterialType
+from models.production import BlockRequest, ProductionMaterial
+from security import get_current_user
+import main
+
+N_CLIENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+# Calcolati sull'istante di lettura (il client li aggiorna da created_at)
+TIME_DERIVED = {"wait_time_seconds"}
+_sessions = []
+
+
+def stable(item):
+    return {k: v for k, v in item.items() if k not in TIME_DERIVED} if item else item
+
+
+def seed():
+    create_tables()
+    db = SessionLocal()
+    db.add(User(id=1, username="admin", password_hash="x", full_name="Admin", role="super_admin", is_active=True))
+    db.add(Banchina(id=1, code="B1", name="Banchina 1"))
+    db.add(LogisticsMaterialType(id=1, label="Cartoni", icon="📦"))
+    db.add(ProductionMaterial(id=1, category="memory", label="Memory 50"))
+    db.commit()
+    db.close()
+
+
+def current_user():
+    db = SessionLocal()
+    _sessions.append(db)
+    return db.get(User, 1)
+
+
+class StatementCounter:
+    def __init__(self):
+        self.count = 0
+        for eng in {engine, read_engine}:
+            event.listen(eng, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+    def measure(self, fn):
+        start = self.count
+        result = fn()
+        return result, self.count - start
+
+
+def main_check():
+    seed()
+    main.app.dependency_overrides[get_current_user] = current_user
+    counter = StatementCounter()
+    ok = True
+
+    def check(label, good):
+        nonlocal ok
+        ok = ok and good
+        print(f"{'OK ' if good else 'KO '} {label}")
+
+    def pool_snapshot(client):
+        data = client.get("/logistics/requests", params={"status": "active"}).json()
+        return {item["id"]: item for item in data["items"]}, data
+
+    with TestClient(main.app) as client, client.websocket_connect("/ws/logistics") as ws:
+        def act(label, method, url, expected_type, **kwargs):
+            (getattr(client, method)(url, **kwargs)).raise_for_status()
+            evt = ws.receive_json()
+            items, data = pool_snapshot(client)
+            good = evt["type"] == expected_type and evt["pending_count"] == data["pending_count"] \
+                and evt["urgent_count"] == data["urgent_count"]
+            if "request" in evt and evt["request"]["status"] in ("pending", "prepared", "preparing", "processing"):
+                good = good and stable(evt["request"]) == stable(items.get(evt["request_id"]))
+            check(label, good)
+            if not good:
+                print(f"      evento: {evt}\n      lista:  {items.get(evt['request_id'])}")
+            return evt
+
+        created = act("new_request = riga di GET /requests", "post", "/logistics/requests", "new_request",
+                      json={"material_type_id": 1, "banchina_id": 1, "quantity": 3})
+        rid = created["request_id"]
+        evt = act("presa in carico", "patch", f"/logistics/requests/{rid}/take", "request_updated",
+                  json={"promised_eta_minutes": 5})
+        check("  stato e operatore nel delta", evt["status"] == "processing"
+              and evt["request"]["assigned_to_name"] == "Admin")
+        act("rilascio (prima senza evento)", "patch", f"/logistics/requests/{rid}/release", "request_updated")
+        evt = act("sollecito urgenza (prima senza evento)", "patch", f"/logistics/requests/{rid}/urgent",
+                  "request_updated")
+        check("  contatore urgenti", evt["urgent_count"] == 1)
+
+        # Costo: un evento sul server contro N client che rileggono la lista
+        _, event_queries = counter.measure(lambda: (
+            client.patch(f"/logistics/requests/{rid}/take", json={"promised_eta_minutes": 5}),
+            ws.receive_json()
+        ))
+        _, refetch_queries = counter.measure(lambda: pool_snapshot(client))
+        print(f"      query SQL per cambio di stato con {N_CLIENTS} client: "
+              f"prima {event_queries + N_CLIENTS * refetch_queries}, dopo {event_queries}")
+        check("delta più economico della rilettura per client", event_queries < N_CLIENTS * refetch_queries)
+
+        evt = act("completamento", "patch", f"/logistics/requests/{rid}/complete", "request_completed", json={})
+        check("  richiesta completata nel delta", evt["request"]["status"] == "completed")
+        evt = act("eliminazione", "delete", f"/logistics/requests/{rid}", "request_deleted")
+        check("  eliminata: solo id e contatori", "request" not in evt and evt["pending_count"] == 0)
+
+    with TestClient(main.app) as client, client.websocket_connect("/ws/production") as ws:
+        created = client.post("/production/requests", json={
+            "request_type": "memory", "material_id": 1, "dimensions": "160x190", "quantity": 2
+        })
+        created.raise_for_status()
+        evt = ws.receive_json()
+        listed = {item["id"]: item for item in client.get("/production/requests").json()}
+        check("new_block = riga di GET /production/requests",
+              evt["type"] == "new_block" and evt["block"] == listed[evt["block_id"]]
+              and evt["pending_count"] == 1)
+
+        block_id = evt["block_id"]
+        client.patch(f"/production/requests/{block_id}/status", json={"status": "processing"}).raise_for_status()
+        evt = ws.receive_json()
+        check("status_update con ordine e contatori",
+              evt["type"] == "status_update" and evt["new_status"] == "processing"
+              and evt["block"]["processor_name"] == "Admin"
+              and (evt["pending_count"], evt["processing_count"]) == (0, 1))
+
+        client.patch(f"/production/requests/{block_id}/urgency").raise_for_status()
+        evt = ws.receive_json()
+        check("urgency_update", evt["type"] == "urgency_update" and evt["is_urgent"] is True
+              and evt["urgent_count"] == 1)
+
+        client.patch("/production/requests/batch", params={"new_status": "delivered"}, json=[block_id]).raise_for_status()
+        evt = ws.receive_json()
+        db = SessionLocal()
+        delivered = db.get(BlockRequest, block_id).status
+        db.close()
+        check("batch (prima senza evento)", evt["type"] == "status_update" and evt["block"]["status"] == delivered
+              and evt["processing_count"] == 0)
+
+    for db in _sessions:
+        db.close()
+    print("OK" if ok else "ERRORE: eventi delta non conformi")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main_check()
@@ -0,0 +1,159 @@
+"""
+Verifica degli stati in memoria condivisi tra worker tramite il broker
+WebSocket (WS_BROKER=sqlite) su DB temporaneo.
+
+Due "worker" (processi separati) con lo stesso DB e lo stesso relay SQLite:
+- invalidate_user_cache(username) nel worker A rimuove l'utente dalla cache
+  autenticazione del worker B (gli altri utenti restano); senza username
+  svuota tutta la cache di B
+- invalidate_permission_index() in A fa ricostruire l'indice permessi di B
+- heartbeat ricevuto da A: dopo il flush l'utente è online anche per B
+- forget() in A (disattivazione / eliminazione) lo toglie dagli online di B
+
+Uso:
+    python scripts/check_ws_shared_state.py
+"""
+import asyncio
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+# Il worker B (spawn) rimporta questo file: eredita l'ambiente del padre
+if __name__ == "__main__":
+    _tmp_dir = tempfile.mkdtemp(prefix="sl_ws_shared_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'shared.db')}"
+    os.environ["WS_BROKER"] = "sqlite"
+    os.environ["WS_BROKER_PATH"] = os.path.join(_tmp_dir, "ws_broker.db")
+    os.environ["WS_BROKER_POLL_MS"] = "20"
+
+# Add parent directory to path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TIMEOUT = 5.0
+STEPS = ("ready", "user_invalidated")
+
+
+def seed():
+    from database import SessionLocal, create_tables, User
+    create_tables()
+    db = SessionLocal()
+    db.add_all([
+        User(id=1, username="admin", password_hash="x", full_name="Admin", role="super_admin", is_active=True),
+        User(id=2, username="mario", password_hash="x", full_name="Mario Rossi", role="coordinator", is_active=True),
+        User(id=3, username="luca", password_hash="x", full_name="Luca Bianchi", role="coordinator", is_active=True),
+    ])
+    db.commit()
+    db.close()
+
+
+async def wait_for(condition) -> bool:
+    deadline = time.monotonic() + TIMEOUT
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        await asyncio.sleep(0.01)
+    return False
+
+
+async def worker_b(steps, results):
+    """Worker B: riempie le proprie cache e osserva gli eventi del worker A."""
+    from database import SessionLocal, User
+    from ws_broker import start_ws_broker, shutdown_ws_broker
+    from security import auth_user_cache
+    from permission_index import get_permission_index
+    from presence import get_presence_store
+
+    await start_ws_broker()
+    db = SessionLocal()
+    for user in db.query(User).all():
+        auth_user_cache.put(user.username, "token", user)
+    index = get_permission_index()
+    index.resolve_user_ids(db, roles=("coordinator",))
+    store = get_presence_store()
+    store.touch(db.get(User, 3))   # Luca collegato a questo worker
+    db.close()
+    steps["ready"].set()
+
+    def cached(username):
+        db = SessionLocal()
+        try:
+            return auth_user_cache.get(db, username, "token") is not None
+        finally:
+            db.close()
+
+    def online_ids():
+        return {entry["id"] for entry in store.online()}
+
+    res = {}
+    res["user_invalidated"] = await wait_for(lambda: not cached("mario"))
+    res["others_kept"] = cached("admin") and cached("luca")
+    res["permissions_invalidated"] = await wait_for(lambda: index._built_version != index._version)
+    res["remote_heartbeat_online"] = await wait_for(lambda: 2 in online_ids())
+    res["forgotten_offline"] = await wait_for(lambda: 3 not in online_ids())
+    steps["user_invalidated"].set()
+    res["all_invalidated"] = await wait_for(lambda: not cached("admin") and not cached("luca"))
+    await shutdown_ws_broker()
+    results.put(res)
+
+
+def run_worker_b(steps, results):
+    asyncio.run(worker_b(steps, results))
+
+
+async def worker_a(steps):
+    """Worker A: le scritture (invalidazioni, heartbeat + flush, forget)."""
+    from database import SessionLocal, User
+    from ws_broker import start_ws_broker, shutdown_ws_broker
+    from security import invalidate_user_cache
+    from permission_index import invalidate_permission_index
+    from presence import get_presence_store, flush_presence
+
+    await start_ws_broker()
+    await wait_for(steps["ready"].is_set)
+
+    invalidate_user_cache("mario")
+    invalidate_permission_index()
+    db = SessionLocal()
+    get_presence_store().touch(db.get(User, 2))   # Heartbeat di Mario arrivato a questo worker
+    flush_presence(db)
+    db.close()
+    get_presence_store().forget(3)                # Luca disattivato da un admin su questo worker
+
+    await wait_for(steps["user_invalidated"].is_set)
+    invalidate_user_cache()
+    await asyncio.sleep(0.2)
+    await shutdown_ws_broker()
+
+
+def main():
+    seed()
+    ctx = multiprocessing.get_context("spawn")
+    steps = {name: ctx.Event() for name in STEPS}
+    results = ctx.Queue()
+    proc = ctx.Process(target=run_worker_b, args=(steps, results))
+    proc.start()
+    asyncio.run(worker_a(steps))
+    res = results.get(timeout=30)
+    proc.join(timeout=10)
+
+    checks = [
+        ("cache auth: utente invalidato anche sull'altro worker", res["user_invalidated"]),
+        ("cache auth: gli altri utenti restano in cache", res["others_kept"]),
+        ("cache auth: invalidazione totale arrivata all'altro worker", res["all_invalidated"]),
+        ("indice permessi da ricostruire sull'altro worker", res["permissions_invalidated"]),
+        ("presenza: heartbeat di un altro worker visibile dopo il flush", res["remote_heartbeat_online"]),
+        ("presenza: utente rimosso su un worker sparisce anche dall'altro", res["forgotten_offline"]),
+    ]
+    ok = True
+    for label, good in checks:
+        ok = ok and good
+        print(f"{'OK ' if good else 'KO '} {label}")
+
+    print("OK" if ok else "ERRORE: stati in memoria non condivisi tra worker")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""
+Ricostruisce i rollup KPI (kpi_daily_rollups, kpi_monthly_rollups) da tutte
+le KpiEntry in un solo passaggio (kpi_rollups).
+
+Da eseguire dopo la migration e2a8c6d4b1f3 o dopo modifiche alle KpiEntry
+fatte fuori dall'ORM (SQL a mano, import in blocco).
+
+Uso:
+    python scripts/rebuild_kpi_rollups.py
+"""
+import os
+import sys
+import time
+
+# Add parent directory to path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import SessionLocal
+from kpi_rollups import rebuild_kpi_rollups
+
+
+def main():
+    db = SessionLocal()
+    try:
+        t0 = time.perf_counter()
+        rebuilt = rebuild_kpi_rollups(db)
+        db.commit()
+        print(f"[KPI ROLLUP] {rebuilt} giorni/settore ricostruiti in {time.perf_counter() - t0:.2f}s")
+    except Exception as e:
+        db.rollback()
+        print(f"ERRORE: {e}")
+        sys.exit(1)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
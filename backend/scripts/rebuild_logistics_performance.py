@@ -0,0 +1,48 @@
+"""
+Ricostruisce gli aggregati performance logistica (missioni, tempi di reazione,
+ETA) da logistics_requests in un solo passaggio (logistics_stats).
+
+Da eseguire dopo la migration d7b3e5f1a9c2 o dopo correzioni manuali sulle
+richieste. Punti e penalità non vengono toccati.
+
+Uso:
+    python scripts/rebuild_logistics_performance.py [--year 2026] [--month 10] [--employee 12]
+"""
+import argparse
+import os
+import sys
+import time
+
+# Add parent directory to path to import backend modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import SessionLocal
+from logistics_stats import rebuild_performance
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--year", type=int, default=None)
+    parser.add_argument("--month", type=int, default=None)
+    parser.add_argument("--employee", type=int, default=None, help="employee_id")
+    args = parser.parse_args()
+    if args.month is not None and args.year is None:
+        parser.error("--month richiede --year")
+
+    db = SessionLocal()
+    try:
+        t0 = time.perf_counter()
+        rebuilt = rebuild_performance(db, year=args.year, month=args.month, employee_id=args.employee)
+        db.commit()
+        print(f"[LOGISTICS STATS] {rebuilt} record performance ricostruiti "
+              f"in {time.perf_counter() - t0:.2f}s")
+    except Exception as e:
+        db.rollback()
+        print(f"ERRORE: {e}")
+        sys.exit(1)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
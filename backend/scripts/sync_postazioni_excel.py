@@ -8,6 +8,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from database import SessionLocal, ShiftRequirement, Banchina
 from sqlalchemy import func
+from settings_cache import bump_version, STAFFING
 
 EXCEL_PATH = "Macchine_Ruoli_Banchine.xlsx"
 
@@ -85,6 +86,7 @@ def sync_postazioni():
                 
                 updated_count += 1
         
+        bump_version(db, STAFFING)  # worker già avviati: rileggono i fabbisogni
         db.commit()
         
         # Post-process: Update `requires_kpi` using Raw SQL to be safe if model isn't updated yet
@@ -4,12 +4,16 @@ JWT Token management e password hashing.
 """
 from datetime import datetime, timedelta
 from typing import Optional
+from collections import OrderedDict
 from jose import JWTError, jwt
 import bcrypt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import event, inspect as sa_inspect
+from sqlalchemy.orm import Session, joinedload, make_transient_to_detached
 import os
+import threading
+import time
 from dotenv import load_dotenv
 
 from database import get_db, User
@@ -97,6 +101,145 @@ def decode_token(token: str) -> Optional[TokenData]:
         return None
 
 
+# ============================================================
+# CACHE UTENTI AUTENTICATI (TTL + LRU)
+# ============================================================
+
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "1000"))
+_CACHED_USER_INFO_KEY = "auth_cached_user"
+
+
+class AuthUserCache:
+    """
+    Cache (username, token) -> snapshot detached di User + Role.
+
+    Su hit lo snapshot viene riattaccato alla sessione della richiesta con
+    merge(load=False): nessuna query, ma relazioni lazy e modifiche
+    (es. last_seen) funzionano come su un utente caricato normalmente.
+    Lo snapshot serve solo ai controlli della dependency (attivo, ruolo,
+    permessi): ogni query su User fatta poi dall'handler nella stessa
+    sessione rilegge il DB e sovrascrive le colonne (es. pin_hash).
+
+    Con più worker le invalidazioni viaggiano sul canale "auth" del broker
+    WebSocket: la cache si iscrive al primo utente memorizzato.
+    """
+
+    def __init__(self, ttl_seconds: float = AUTH_CACHE_TTL_SECONDS, max_entries: int = AUTH_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._subscribed = False
+
+    @staticmethod
+    def _snapshot(obj):
+        """Copia detached delle sole colonne (nessuna relazione caricata)."""
+        mapper = sa_inspect(obj).mapper
+        return mapper.class_(**{attr.key: getattr(obj, attr.key) for attr in mapper.column_attrs})
+
+    def get(self, db: Session, username: str, token: str) -> Optional[User]:
+        key = (username, token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            snapshot = entry[1]
+        db.info[_CACHED_USER_INFO_KEY] = True
+        return db.merge(snapshot, load=False)
+
+    def put(self, username: str, token: str, user: User):
+        if not self._subscribed:
+            self._subscribe()
+        snapshot = self._snapshot(user)
+        if user.role_obj is not None:
+            snapshot.role_obj = self._snapshot(user.role_obj)
+            make_transient_to_detached(snapshot.role_obj)
+        make_transient_to_detached(snapshot)
+        with self._lock:
+            self._entries[(username, token)] = (time.monotonic() + self.ttl_seconds, snapshot)
+            self._entries.move_to_end((username, token))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, username: Optional[str] = None):
+        """Rimuove le voci di un utente (tutti i token) o dell'intera cache se username è None."""
+        with self._lock:
+            self.invalidations += 1
+            if username is None:
+                self._entries.clear()
+                return
+            for key in [k for k in self._entries if k[0] == username]:
+                del self._entries[key]
+
+    def _subscribe(self):
+        from ws_broker import get_ws_broker
+        with self._lock:
+            if self._subscribed:
+                return
+            self._subscribed = True
+        get_ws_broker().subscribe("auth", self.on_broker_event)
+
+    def on_broker_event(self, payload: dict):
+        """Handler del canale "auth": invalidazioni di questo e degli altri worker."""
+        if payload.get("all"):
+            self.invalidate()
+        for username in payload.get("usernames", ()):
+            self.invalidate(username)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+                "invalidations": self.invalidations,
+            }
+
+
+auth_user_cache = AuthUserCache()
+
+
+def invalidate_user_cache(username: Optional[str] = None):
+    """
+    Da chiamare dopo modifiche a utenti (username) o ruoli (None = tutto),
+    così disattivazioni e cambi ruolo valgono dalla richiesta successiva
+    (sugli altri worker appena arriva l'evento del broker).
+    """
+    auth_user_cache.invalidate(username)
+    try:
+        from ws_broker import get_ws_broker
+        get_ws_broker().publish("auth", {"all": True} if username is None else {"usernames": [username]})
+    except Exception as e:
+        print(f"[AUTH] Invalidazione non pubblicata: {e}")
+
+
+def get_user_cache_stats() -> dict:
+    return auth_user_cache.stats()
+
+
+def _do_orm_execute(orm_execute_state):
+    # Sessione con uno snapshot dalla cache: le SELECT su User ricaricano le
+    # righe già nell'identity map invece di restituire lo snapshot
+    if not orm_execute_state.is_select or not orm_execute_state.session.info.get(_CACHED_USER_INFO_KEY):
+        return
+    if any(mapper.class_ is User for mapper in orm_execute_state.all_mappers):
+        orm_execute_state.update_execution_options(populate_existing=True)
+
+
+event.listen(Session, "do_orm_execute", _do_orm_execute)
+
+
 # ============================================================
 # DEPENDENCIES (Per proteggere endpoints)
 # ============================================================
@@ -119,11 +262,13 @@ async def get_current_user(
     if token_data is None:
         raise credentials_exception
     
-    # Load user WITH role relationship for permissions
-    from sqlalchemy.orm import joinedload
-    user = db.query(User).options(joinedload(User.role_obj)).filter(User.username == token_data.username).first()
+    user = auth_user_cache.get(db, token_data.username, token)
     if user is None:
-        raise credentials_exception
+        # Load user WITH role relationship for permissions
+        user = db.query(User).options(joinedload(User.role_obj)).filter(User.username == token_data.username).first()
+        if user is None:
+            raise credentials_exception
+        auth_user_cache.put(token_data.username, token, user)
     
     if not user.is_active:
         raise HTTPException(
@@ -0,0 +1,254 @@
+"""
+SL Enterprise - Settings Cache
+Cache in memoria delle impostazioni lette sui percorsi caldi.
+
+Namespace:
+- "logistics": LogisticsConfig (punti, penalità, soglie; chiave -> valore)
+- "system":    SystemSetting (impostazioni globali; chiave -> valore)
+- "lookups":   liste di configurazione di /admin/config (causali fermo,
+               tipi visita, tipi corso, tipi evento; tabella -> righe)
+- "staffing":  fabbisogni ShiftRequirement per settore KPI (StaffingSnapshot:
+               requisito -> settore, requisiti e operatori richiesti per
+               settore), usati da panoramica e calcolo staffing KPI
+
+Invalidazione con versione:
+- ogni scrittura (endpoint e script di seed) chiama bump_version(db, namespace)
+  nella STESSA transazione: la riga di settings_versions viene incrementata
+  insieme ai dati (upsert: su un DB creato da create_tables() la prima
+  scrittura di un namespace non fa scontrare due worker sull'INSERT)
+- al commit il namespace viene invalidato in questo worker e pubblicato sul
+  broker WebSocket (canale "settings") per gli altri worker; rollback -> niente
+- alla lettura la versione sul DB si ricontrolla al massimo ogni
+  SETTINGS_VERSION_CHECK_SECONDS (scritture di altri processi, es. gli
+  script di seed): tra un controllo e l'altro le impostazioni arrivano dalla
+  memoria. Modifiche a mano sul DB: incrementare anche settings_versions
+"""
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from db_profile import increment_counter
+from models.config import SystemSetting, SettingsVersion
+from models.logistics import LogisticsConfig
+from models.hr import MedicalExamType, TrainingType, EventType
+from models.production import DowntimeReason
+from models.shifts import ShiftRequirement
+
+SETTINGS_VERSION_CHECK_SECONDS = float(os.getenv("SETTINGS_VERSION_CHECK_SECONDS", "30"))
+
+LOGISTICS = "logistics"
+SYSTEM = "system"
+LOOKUPS = "lookups"
+STAFFING = "staffing"
+
+LOOKUP_TABLES = {
+    "downtime_reasons": DowntimeReason,
+    "exam_types": MedicalExamType,
+    "training_types": TrainingType,
+    "event_types": EventType,
+}
+
+_INFO_KEY = "settings_bumped"
+
+
+def _row_dict(obj) -> dict:
+    return {attr.key: getattr(obj, attr.key) for attr in inspect(obj).mapper.column_attrs}
+
+
+def _load_logistics(db: Session) -> Dict[str, str]:
+    return {c.config_key: c.config_value for c in db.query(LogisticsConfig).all()}
+
+
+def _load_system(db: Session) -> Dict[str, str]:
+    return {s.key: s.value for s in db.query(SystemSetting).all()}
+
+
+def _load_lookups(db: Session) -> Dict[str, List[dict]]:
+    return {
+        name: [_row_dict(row) for row in db.query(model).order_by(model.id).all()]
+        for name, model in LOOKUP_TABLES.items()
+    }
+
+
+class StaffingSnapshot(NamedTuple):
+    """Fabbisogni per settore KPI (ShiftRequirement.kpi_sector), in sola lettura."""
+    sector_of: Dict[int, str]                     # requirement_id -> settore
+    requirement_ids: Dict[str, Tuple[int, ...]]   # settore -> requirement_id
+    operators_required: Dict[str, float]          # settore -> SUM(quantity)
+
+
+def _load_staffing(db: Session) -> StaffingSnapshot:
+    sector_of: Dict[int, str] = {}
+    requirement_ids: Dict[str, List[int]] = {}
+    operators_required: Dict[str, float] = {}
+    rows = db.query(ShiftRequirement.id, ShiftRequirement.kpi_sector, ShiftRequirement.quantity).filter(
+        ShiftRequirement.kpi_sector.isnot(None), ShiftRequirement.kpi_sector != ""
+    ).order_by(ShiftRequirement.id)
+    for req_id, sector, quantity in rows:
+        sector_of[req_id] = sector
+        requirement_ids.setdefault(sector, []).append(req_id)
+        operators_required[sector] = operators_required.get(sector, 0) + (quantity or 0)
+    return StaffingSnapshot(
+        sector_of, {sector: tuple(ids) for sector, ids in requirement_ids.items()}, operators_required
+    )
+
+
+class _Namespace:
+    __slots__ = ("loader", "data", "version", "checked_at", "stale", "invalidations")
+
+    def __init__(self, loader: Callable[[Session], Any]):
+        self.loader = loader
+        self.data = None
+        self.version = None
+        self.checked_at = 0.0
+        self.stale = True
+        self.invalidations = 0
+
+
+class SettingsCache:
+    """Impostazioni per namespace, ricaricate solo quando cambia la versione sul DB."""
+
+    def __init__(self, check_seconds: float = SETTINGS_VERSION_CHECK_SECONDS):
+        self.check_seconds = check_seconds
+        self._lock = threading.Lock()
+        self._namespaces: Dict[str, _Namespace] = {
+            LOGISTICS: _Namespace(_load_logistics),
+            SYSTEM: _Namespace(_load_system),
+            LOOKUPS: _Namespace(_load_lookups),
+            STAFFING: _Namespace(_load_staffing),
+        }
+        self.stats = {"hits": 0, "version_checks": 0, "loads": 0, "invalidations": 0}
+
+    def get(self, db: Session, namespace: str):
+        ns = self._namespaces[namespace]
+        now = time.monotonic()
+        if not ns.stale and now - ns.checked_at < self.check_seconds:
+            self.stats["hits"] += 1
+            return ns.data
+
+        self.stats["version_checks"] += 1
+        seen = ns.invalidations
+        version = db.query(SettingsVersion.version).filter(SettingsVersion.namespace == namespace).scalar() or 0
+        if ns.data is None or version != ns.version:
+            data = ns.loader(db)
+            self.stats["loads"] += 1
+            with self._lock:
+                ns.data, ns.version = data, version
+        ns.checked_at = now
+        # Invalidazione arrivata durante il caricamento: resta da ricontrollare
+        ns.stale = ns.invalidations != seen
+        return ns.data
+
+    def invalidate(self, namespace: str):
+        """La prossima lettura ricontrolla la versione (e ricarica se cambiata)."""
+        ns = self._namespaces.get(namespace)
+        if ns is not None:
+            ns.invalidations += 1
+            ns.stale = True
+            self.stats["invalidations"] += 1
+
+    def on_broker_event(self, payload: dict):
+        """Handler del canale "settings": scritture di questo e degli altri worker."""
+        for namespace in payload.get("namespaces", ()):
+            self.invalidate(namespace)
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "versions": {name: ns.version for name, ns in self._namespaces.items() if ns.data is not None},
+        }
+
+
+_cache: Optional[SettingsCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_settings_cache() -> SettingsCache:
+    """Cache singleton, iscritta al canale "settings" del broker WebSocket."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            from ws_broker import get_ws_broker
+            _cache = SettingsCache()
+            get_ws_broker().subscribe("settings", _cache.on_broker_event)
+        return _cache
+
+
+# ============================================================
+# LETTURA (tipizzata)
+# ============================================================
+
+def get_setting(db: Session, namespace: str, key: str, default: Optional[str] = None) -> Optional[str]:
+    return get_settings_cache().get(db, namespace).get(key, default)
+
+
+def get_int(db: Session, namespace: str, key: str, default: int) -> int:
+    try:
+        return int(get_setting(db, namespace, key))
+    except (TypeError, ValueError):
+        return default
+
+
+def get_float(db: Session, namespace: str, key: str, default: float) -> float:
+    try:
+        return float(get_setting(db, namespace, key))
+    except (TypeError, ValueError):
+        return default
+
+
+def get_bool(db: Session, namespace: str, key: str, default: bool) -> bool:
+    value = get_setting(db, namespace, key)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "si", "on")
+
+
+def get_settings(db: Session, namespace: str) -> Dict[str, str]:
+    """Tutte le chiavi di un namespace chiave -> valore (copia)."""
+    return dict(get_settings_cache().get(db, namespace))
+
+
+def get_lookup(db: Session, table: str) -> List[dict]:
+    """Righe di una lista di configurazione (copie: il chiamante può modificarle)."""
+    return [dict(row) for row in get_settings_cache().get(db, LOOKUPS)[table]]
+
+
+def get_staffing(db: Session) -> StaffingSnapshot:
+    """Fabbisogni per settore KPI (condivisi: non modificare)."""
+    return get_settings_cache().get(db, STAFFING)
+
+
+# ============================================================
+# SCRITTURA
+# ============================================================
+
+def bump_version(db: Session, namespace: str):
+    """Da chiamare prima del commit di ogni scrittura del namespace."""
+    increment_counter(db.connection(), SettingsVersion, "namespace", namespace)
+    db.info.setdefault(_INFO_KEY, set()).add(namespace)
+
+
+def _after_commit(session: Session):
+    namespaces = session.info.pop(_INFO_KEY, None)
+    if not namespaces:
+        return
+    cache = get_settings_cache()
+    for namespace in namespaces:
+        cache.invalidate(namespace)
+    try:
+        from ws_broker import get_ws_broker
+        get_ws_broker().publish("settings", {"namespaces": sorted(namespaces)})
+    except Exception as e:
+        print(f"[SETTINGS] Invalidazione non pubblicata: {e}")
+
+
+def _after_rollback(session: Session, previous_transaction):
+    session.info.pop(_INFO_KEY, None)
+
+
+event.listen(Session, "after_commit", _after_commit)
+event.listen(Session, "after_soft_rollback", _after_rollback)
@@ -1,23 +1,211 @@
 """
 SL Enterprise - Chat WebSocket Manager
 Gestione connessioni WebSocket per messaggistica real-time.
+
+Gli invii non sono mai "await ws.send_json()" in sequenza: ogni socket ha una
+coda di uscita limitata e un proprio task di scrittura (SocketSender), il
+messaggio è serializzato UNA volta per broadcast e messo in coda a tutti.
+Un client lento (tablet su Wi-Fi debole) non rallenta gli altri: se la sua
+coda si riempie o un invio supera WS_SEND_TIMEOUT viene disconnesso.
+
+Con più worker uvicorn ogni processo possiede solo le proprie socket: i
+metodi pubblici (broadcast, send_to_user, ...) pubblicano sul broker
+(ws_broker.py) e ogni worker consegna alle sue socket con deliver*().
 """
 from fastapi import WebSocket, WebSocketDisconnect, Depends, Query
-from typing import Dict, List, Set
+from typing import Callable, Dict, Iterable, List, Optional, Set
+from collections import deque
+import asyncio
 import json
+import os
+import time
 from datetime import datetime
 
+from ws_broker import LocalBroker, get_ws_broker
+
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "100"))
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "5"))
+
+
+# ============================================================
+# EVENT LOOP (invii da thread: scheduler, job, endpoint sync)
+# ============================================================
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def bind_event_loop(loop: asyncio.AbstractEventLoop):
+    """Event loop dell'applicazione (lifespan): serve per inviare dai thread in background."""
+    global _loop
+    _loop = loop
+
+
+def schedule(coro) -> bool:
+    """Esegue una coroutine di invio sull'event loop, sia dal loop stesso sia da un thread."""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    if loop is not None:
+        loop.create_task(coro)
+        return True
+    if _loop is not None and _loop.is_running():
+        asyncio.run_coroutine_threadsafe(coro, _loop)
+        return True
+    coro.close()
+    return False
+
+
+# ============================================================
+# INVIO CONCORRENTE (code di uscita per socket)
+# ============================================================
+
+def encode_message(message) -> str:
+    """Serializza una volta sola (stesso formato di WebSocket.send_json)."""
+    if isinstance(message, str):
+        return message
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+class SocketSender:
+    """Coda di uscita limitata + task di scrittura per una singola connessione."""
+
+    def __init__(self, websocket: WebSocket, fanout: "FanOut", on_evict: Callable[[WebSocket], None]):
+        self.websocket = websocket
+        self.fanout = fanout
+        self.on_evict = on_evict
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=WS_SEND_QUEUE_SIZE)
+        self.closed = False
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def offer(self, text: str, enqueued_at: float) -> bool:
+        """Accoda senza attendere; coda piena = consumatore lento -> disconnesso."""
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait((text, enqueued_at))
+            return True
+        except asyncio.QueueFull:
+            self.evict("queue_full", "coda di uscita piena")
+            return False
+
+    async def _run(self):
+        while True:
+            text, enqueued_at = await self.queue.get()
+            try:
+                await asyncio.wait_for(self.websocket.send_text(text), WS_SEND_TIMEOUT)
+            except asyncio.TimeoutError:
+                self.evict("timeout", f"invio oltre {WS_SEND_TIMEOUT:g}s")
+                return
+            except Exception as e:
+                self.evict("error", f"errore invio: {e}")
+                return
+            self.fanout.record_sent(time.perf_counter() - enqueued_at)
+
+    def evict(self, reason: str, detail: str):
+        """Chiude la connessione e la rimuove dal manager (idempotente)."""
+        if self.closed:
+            return
+        self.closed = True
+        self.fanout.record_evicted(self, reason, detail)
+        self.on_evict(self.websocket)
+        if self._task is not asyncio.current_task():
+            self._task.cancel()
+        asyncio.get_running_loop().create_task(self._close_socket())
+
+    def stop(self):
+        """Disconnessione normale: ferma il task di scrittura."""
+        if not self.closed:
+            self.closed = True
+            self._task.cancel()
+
+    async def _close_socket(self):
+        try:
+            # 1013 = "try again later": il client si riconnette e riceve uno snapshot fresco
+            await asyncio.wait_for(self.websocket.close(code=1013), WS_SEND_TIMEOUT)
+        except Exception:
+            pass
+
+
+class FanOut:
+    """
+    Registro dei SocketSender di un manager + metriche:
+    profondità code, socket scartati, latenza di consegna (accodamento -> invio).
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.senders: Dict[WebSocket, SocketSender] = {}
+        self.messages = 0
+        self.sent = 0
+        self.evicted = 0
+        self.evict_reasons: Dict[str, int] = {}
+        self.latencies = deque(maxlen=1000)
+
+    def attach(self, websocket: WebSocket, on_evict: Callable[[WebSocket], None]):
+        self.senders[websocket] = SocketSender(websocket, self, on_evict)
+
+    def detach(self, websocket: WebSocket):
+        sender = self.senders.pop(websocket, None)
+        if sender is not None:
+            sender.stop()
+
+    def send(self, sockets: Iterable[WebSocket], message) -> int:
+        """Serializza una volta e accoda a tutte le socket. Ritorna quante l'hanno accettato."""
+        targets = [self.senders[ws] for ws in sockets if ws in self.senders]
+        if not targets:
+            return 0
+        text = encode_message(message)
+        now = time.perf_counter()
+        self.messages += 1
+        return sum(sender.offer(text, now) for sender in targets)
+
+    def record_sent(self, latency: float):
+        self.sent += 1
+        self.latencies.append(latency)
+
+    def record_evicted(self, sender: SocketSender, reason: str, detail: str):
+        self.senders.pop(sender.websocket, None)
+        self.evicted += 1
+        self.evict_reasons[reason] = self.evict_reasons.get(reason, 0) + 1
+        print(f"[WS] Connessione lenta scartata ({self.name}): {detail}")
+
+    def stats(self) -> dict:
+        depths = [sender.queue.qsize() for sender in self.senders.values()]
+        latencies = sorted(self.latencies)
+        return {
+            "connections": len(self.senders),
+            "queue_depth_total": sum(depths),
+            "queue_depth_max": max(depths, default=0),
+            "messages": self.messages,
+            "sent": self.sent,
+            "dropped_sockets": self.evicted,
+            "drop_reasons": dict(self.evict_reasons),
+            "latency_ms_avg": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+            "latency_ms_p95": _percentile_ms(latencies, 0.95),
+            "latency_ms_max": _percentile_ms(latencies, 1.0),
+        }
+
+
+def _percentile_ms(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return round(sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))] * 1000, 2)
+
 
 class ChatConnectionManager:
     """Gestisce le connessioni WebSocket attive per la chat."""
     
-    def __init__(self):
+    def __init__(self, broker: Optional[LocalBroker] = None):
         # user_id -> lista di websocket (un utente può avere più tab)
         self.active_connections: Dict[int, List[WebSocket]] = {}
         # conversation_id -> set di user_id che stanno visualizzando
         self.conversation_viewers: Dict[int, Set[int]] = {}
         # user_id -> conversation_id dove sta scrivendo
         self.typing_users: Dict[int, int] = {}
+        self.fanout = FanOut("chat")
+        self.broker = broker or LocalBroker()
+        self.broker.subscribe("chat", self.deliver)
     
     async def connect(self, websocket: WebSocket, user_id: int):
         """Accetta una nuova connessione WebSocket."""
@@ -25,10 +213,12 @@ class ChatConnectionManager:
         if user_id not in self.active_connections:
             self.active_connections[user_id] = []
         self.active_connections[user_id].append(websocket)
+        self.fanout.attach(websocket, lambda ws: self.disconnect(ws, user_id))
         print(f"[WS] User {user_id} connected. Total connections: {len(self.active_connections)}")
     
     def disconnect(self, websocket: WebSocket, user_id: int):
         """Rimuove una connessione WebSocket."""
+        self.fanout.detach(websocket)
         if user_id in self.active_connections:
             if websocket in self.active_connections[user_id]:
                 self.active_connections[user_id].remove(websocket)
@@ -51,24 +241,22 @@ class ChatConnectionManager:
             self.conversation_viewers[conversation_id].discard(user_id)
     
     async def send_to_user(self, user_id: int, message: dict):
-        """Invia un messaggio a tutte le connessioni di un utente."""
-        if user_id in self.active_connections:
-            dead_connections = []
-            for ws in self.active_connections[user_id]:
-                try:
-                    await ws.send_json(message)
-                except Exception as e:
-                    print(f"[WS] Error sending to user {user_id}: {e}")
-                    dead_connections.append(ws)
-            # Cleanup dead connections
-            for ws in dead_connections:
-                self.disconnect(ws, user_id)
+        """Invia un messaggio a tutte le connessioni di un utente (accodato, non bloccante)."""
+        self.broker.publish("chat", {"user_ids": [user_id], "message": message})
     
     async def broadcast_to_conversation(self, conversation_id: int, member_ids: List[int], message: dict, exclude_user: int = None):
-        """Invia un messaggio a tutti i membri di una conversazione."""
-        for user_id in member_ids:
-            if user_id != exclude_user:
-                await self.send_to_user(user_id, message)
+        """Invia un messaggio a tutti i membri di una conversazione (una sola serializzazione)."""
+        user_ids = [user_id for user_id in member_ids if user_id != exclude_user]
+        self.broker.publish("chat", {"user_ids": user_ids, "message": message})
+    
+    def deliver(self, payload: dict):
+        """Consegna alle socket di QUESTO worker (chiamato dal broker)."""
+        sockets = [
+            ws
+            for user_id in payload["user_ids"]
+            for ws in self.active_connections.get(user_id, ())
+        ]
+        self.fanout.send(sockets, payload["message"])
     
     async def notify_typing(self, conversation_id: int, member_ids: List[int], user_id: int, user_name: str, is_typing: bool):
         """Notifica gli altri membri che qualcuno sta scrivendo."""
@@ -88,48 +276,170 @@ class ChatConnectionManager:
 
 
 # Singleton manager
-chat_manager = ChatConnectionManager()
+chat_manager = ChatConnectionManager(get_ws_broker())
 
 
 class LogisticsConnectionManager:
     """Gestisce connessioni per Dashboard Logistica e Produzione."""
     
-    def __init__(self):
+    def __init__(self, broker: Optional[LocalBroker] = None):
         # pool_name -> lista di websocket
         self.pools: Dict[str, List[WebSocket]] = {
             "logistics": [],
             "production_blocks": [],
             "notifications": [] # Per tutti gli utenti per alert globali
         }
+        self.fanout = FanOut("pools")
+        self.broker = broker or LocalBroker()
+        self.broker.subscribe("pool", self.deliver)
     
     async def connect(self, websocket: WebSocket, pool: str):
         await websocket.accept()
         if pool not in self.pools:
             self.pools[pool] = []
         self.pools[pool].append(websocket)
+        self.fanout.attach(websocket, lambda ws: self.disconnect(ws, pool))
         print(f"[WS] Client joined pool '{pool}'. Total: {len(self.pools[pool])}")
     
     def disconnect(self, websocket: WebSocket, pool: str):
+        self.fanout.detach(websocket)
         if pool in self.pools and websocket in self.pools[pool]:
             self.pools[pool].remove(websocket)
         print(f"[WS] Client left pool '{pool}'")
     
     async def broadcast(self, pool: str, message: dict):
-        """Invia a tutti i connessi a un pool specifico."""
-        if pool in self.pools:
-            dead = []
-            for ws in self.pools[pool]:
-                try:
-                    await ws.send_json(message)
-                except Exception:
-                    dead.append(ws)
-            for ws in dead:
-                self.disconnect(ws, pool)
-
-logistics_manager = LogisticsConnectionManager()
+        """Invia a tutti i connessi a un pool specifico (accodato, non bloccante)."""
+        self.broker.publish("pool", {"pool": pool, "message": message})
+    
+    def deliver(self, payload: dict):
+        """Consegna alle socket di QUESTO worker (chiamato dal broker)."""
+        self.fanout.send(self.pools.get(payload["pool"], ()), payload["message"])
+
+logistics_manager = LogisticsConnectionManager(get_ws_broker())
+
+
+# Ruoli delle notifiche "per ruolo" visibili a ciascun ruolo utente (come /notifications)
+NOTIFICATION_ROLE_VISIBILITY: Dict[str, Set[str]] = {
+    "super_admin": {"super_admin", "admin", "hr_manager", "maintenance", "production_manager"},
+    "admin": {"admin", "hr_manager", "maintenance"},
+}
+
+# Ruoli che vedono i contatori approvazioni pendenti (come /hr/stats/pending-counts)
+HR_BADGE_ROLES = {"hr_manager", "super_admin"}
+
+
+def visible_notification_roles(role: Optional[str]) -> Set[str]:
+    return NOTIFICATION_ROLE_VISIBILITY.get(role, {role} if role else set())
+
+
+class BadgeConnectionManager:
+    """
+    Canale "badge" per utente: una connessione sostituisce il polling di
+    /notifications/unread-count, /chat/unread-count, /chat/notifications/summary
+    e /hr/stats/pending-counts.
+
+    Messaggi in uscita:
+    - {"type": "badges", "counters": {...}, "chat_conversations": {conv_id: n}}  (snapshot)
+    - {"type": "badge_delta", "counter": "notifications", "delta": 1}
+    - {"type": "badge_delta", "counter": "chat", "delta": -3, "conversation_id": 12}
+    - {"type": "report_job", "job_id": "...", "status": "done", ...}  (export in background pronto)
+    Contatori: notifications, chat, pending_events, pending_leaves.
+    """
+
+    def __init__(self, broker: Optional[LocalBroker] = None):
+        # user_id -> lista di websocket (più tab/dispositivi)
+        self.connections: Dict[int, List[WebSocket]] = {}
+        # user_id -> ruoli di notifica visibili (per i delta delle notifiche per ruolo)
+        self.user_roles: Dict[int, Set[str]] = {}
+        # user_id -> ruolo utente (per i contatori HR)
+        self.user_role: Dict[int, Optional[str]] = {}
+        self.fanout = FanOut("badges")
+        self.broker = broker or LocalBroker()
+        self.broker.subscribe("badges", self.deliver)
+
+    async def connect(self, websocket: WebSocket, user_id: int, role: Optional[str]):
+        await websocket.accept()
+        self.connections.setdefault(user_id, []).append(websocket)
+        self.user_roles[user_id] = visible_notification_roles(role)
+        self.user_role[user_id] = role
+        self.fanout.attach(websocket, lambda ws: self.disconnect(ws, user_id))
+
+    def disconnect(self, websocket: WebSocket, user_id: int):
+        self.fanout.detach(websocket)
+        sockets = self.connections.get(user_id)
+        if sockets and websocket in sockets:
+            sockets.remove(websocket)
+        if not sockets:
+            self.connections.pop(user_id, None)
+            self.user_roles.pop(user_id, None)
+            self.user_role.pop(user_id, None)
+
+    def connected_users(self) -> int:
+        return len(self.connections)
+
+    def audience(self, user_ids: Iterable[int] = (), notification_roles: Iterable[str] = (),
+                 user_roles: Iterable[str] = ()) -> Set[int]:
+        """Utenti CONNESSI interessati: per ID, per ruolo notifica visibile o per ruolo utente."""
+        targets = {uid for uid in user_ids if uid in self.connections}
+        notification_roles = set(notification_roles)
+        user_roles = set(user_roles)
+        if notification_roles or user_roles:
+            for uid in self.connections:
+                if self.user_roles.get(uid, set()) & notification_roles or self.user_role.get(uid) in user_roles:
+                    targets.add(uid)
+        return targets
+
+    async def send_to_socket(self, websocket: WebSocket, message: dict):
+        """Snapshot alla sola connessione che l'ha chiesto (stessa coda dei delta, ordine garantito)."""
+        self.fanout.send((websocket,), message)
+
+    async def send_deltas(self, deltas: List[dict]):
+        """Pubblica una lista di delta {"users"|"notification_roles"|"user_roles", "counter", "delta", ...}."""
+        self.broker.publish("badges", {"deltas": deltas})
+
+    async def notify_users(self, user_ids: Iterable[int], message: dict):
+        """Pubblica un messaggio completo (non un delta) per gli utenti indicati."""
+        self.broker.publish("badges", {"messages": [{"users": list(user_ids), "message": message}]})
+
+    def deliver(self, payload: dict):
+        """
+        Consegna i delta alle socket di QUESTO worker, sommando quelli
+        sullo stesso contatore per utente (un messaggio per contatore).
+        I messaggi completi ("messages") sono inoltrati così come sono.
+        """
+        for item in payload.get("messages", ()):
+            for uid in self.audience(item["users"]):
+                self.fanout.send(self.connections.get(uid, ()), item["message"])
+        deltas = payload.get("deltas", ())
+        per_user: Dict[int, Dict[tuple, int]] = {}
+        for d in deltas:
+            key = (d["counter"], d.get("conversation_id"))
+            for uid in self.audience(d.get("users", ()), d.get("notification_roles", ()), d.get("user_roles", ())):
+                bucket = per_user.setdefault(uid, {})
+                bucket[key] = bucket.get(key, 0) + d["delta"]
+        for uid, bucket in per_user.items():
+            for (counter, conversation_id), delta in bucket.items():
+                if delta == 0:
+                    continue
+                message = {"type": "badge_delta", "counter": counter, "delta": delta}
+                if conversation_id is not None:
+                    message["conversation_id"] = conversation_id
+                self.fanout.send(self.connections.get(uid, ()), message)
+
+
+badge_manager = BadgeConnectionManager(get_ws_broker())
 
 def get_chat_manager() -> ChatConnectionManager:
     return chat_manager
 
 def get_logistics_manager() -> LogisticsConnectionManager:
     return logistics_manager
+
+def get_badge_manager() -> BadgeConnectionManager:
+    return badge_manager
+
+def get_ws_stats() -> dict:
+    """Metriche di invio WebSocket per manager e del broker (esposte su /health)."""
+    stats = {fanout.name: fanout.stats() for fanout in (chat_manager.fanout, logistics_manager.fanout, badge_manager.fanout)}
+    stats["broker"] = get_ws_broker().stats()
+    return stats
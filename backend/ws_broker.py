@@ -0,0 +1,178 @@
+"""
+SL Enterprise - WebSocket Broker
+Pub/sub tra i worker dell'API per gli eventi WebSocket.
+
+Ogni worker uvicorn tiene SOLO le proprie socket: i manager di
+websocket_manager.py pubblicano gli eventi sul broker e ogni worker li
+consegna alle socket che possiede.
+
+Backend (WS_BROKER):
+- "local" (default): in-process, consegna diretta; un solo worker
+- "sqlite": relay su un file SQLite condiviso (WS_BROKER_PATH, WAL).
+  publish() consegna subito alle socket locali e scrive l'evento;
+  ogni worker legge gli eventi degli ALTRI worker ogni WS_BROKER_POLL_MS.
+  Nessun servizio esterno: basta che i worker girino sulla stessa macchina.
+
+Oltre alle socket, il broker tiene allineati gli stati in memoria di ogni
+worker: "settings" (settings_cache), "auth" (cache utenti di security),
+"permissions" (permission_index), "presence" (presence), "pool" e
+"pool_state" (logistics_pool).
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional, Tuple
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+WS_BROKER = os.getenv("WS_BROKER", "local").lower()
+WS_BROKER_PATH = os.getenv("WS_BROKER_PATH", os.path.join(BASE_DIR, "ws_broker.db"))
+WS_BROKER_POLL_MS = int(os.getenv("WS_BROKER_POLL_MS", "50"))
+WS_BROKER_RETENTION_SECONDS = int(os.getenv("WS_BROKER_RETENTION_SECONDS", "60"))
+
+Handler = Callable[[dict], None]
+
+
+class LocalBroker:
+    """Broker in-process: publish() chiama direttamente gli handler del canale."""
+
+    name = "local"
+
+    def __init__(self):
+        self.handlers: Dict[str, List[Handler]] = {}
+        self.published = 0
+        self.delivered_remote = 0
+
+    def subscribe(self, channel: str, handler: Handler):
+        """Handler del canale: il manager che possiede le socket, più eventuali stati in memoria."""
+        self.handlers.setdefault(channel, []).append(handler)
+
+    def publish(self, channel: str, payload: dict):
+        self.published += 1
+        self._dispatch(channel, payload)
+
+    def _dispatch(self, channel: str, payload: dict):
+        for handler in self.handlers.get(channel, ()):
+            try:
+                handler(payload)
+            except Exception as e:
+                print(f"[WS BROKER] Errore consegna canale '{channel}': {e}")
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def stats(self) -> dict:
+        return {"backend": self.name, "published": self.published, "delivered_remote": self.delivered_remote}
+
+
+class SQLiteBroker(LocalBroker):
+    """Relay tra processi su file SQLite: tabella append-only letta per id crescente."""
+
+    name = "sqlite"
+
+    def __init__(self, path: str = WS_BROKER_PATH, poll_ms: int = WS_BROKER_POLL_MS,
+                 retention_seconds: int = WS_BROKER_RETENTION_SECONDS):
+        super().__init__()
+        self.path = path
+        self.poll_interval = poll_ms / 1000
+        self.retention_seconds = retention_seconds
+        self.origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS ws_events ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, origin TEXT NOT NULL, channel TEXT NOT NULL, "
+            "payload TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        # Solo eventi successivi all'avvio (nessun replay dello storico)
+        self._last_id = self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM ws_events").fetchone()[0]
+        self._task: Optional[asyncio.Task] = None
+        self._last_cleanup = time.monotonic()
+
+    def publish(self, channel: str, payload: dict):
+        # Socket di questo worker: subito, senza attendere il giro del relay
+        super().publish(channel, payload)
+        data = json.dumps(payload, separators=(",", ":"), ensure_ascii=False, default=str)
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT INTO ws_events (origin, channel, payload, created_at) VALUES (?, ?, ?, ?)",
+                    (self.origin, channel, data, time.time())
+                )
+        except sqlite3.Error as e:
+            print(f"[WS BROKER] Pubblicazione fallita su '{channel}': {e}")
+
+    def _fetch(self) -> List[Tuple[int, str, str, str]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, origin, channel, payload FROM ws_events WHERE id > ? ORDER BY id",
+                (self._last_id,)
+            ).fetchall()
+            if time.monotonic() - self._last_cleanup > self.retention_seconds:
+                self._last_cleanup = time.monotonic()
+                self._conn.execute("DELETE FROM ws_events WHERE created_at < ?",
+                                   (time.time() - self.retention_seconds,))
+        return rows
+
+    async def _poll(self):
+        while True:
+            try:
+                rows = await asyncio.to_thread(self._fetch)
+            except sqlite3.Error as e:
+                print(f"[WS BROKER] Lettura eventi fallita: {e}")
+                rows = []
+            for event_id, origin, channel, data in rows:
+                self._last_id = event_id
+                if origin == self.origin:
+                    continue
+                self.delivered_remote += 1
+                self._dispatch(channel, json.loads(data))
+            await asyncio.sleep(self.poll_interval)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._poll())
+            print(f"[WS BROKER] Relay SQLite attivo ({self.path}, worker {self.origin})")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        with self._lock:
+            self._conn.close()
+
+    def stats(self) -> dict:
+        return {**super().stats(), "origin": self.origin, "last_event_id": self._last_id}
+
+
+_broker: Optional[LocalBroker] = None
+
+
+def get_ws_broker() -> LocalBroker:
+    """Broker del processo, scelto con WS_BROKER."""
+    global _broker
+    if _broker is None:
+        _broker = SQLiteBroker() if WS_BROKER == "sqlite" else LocalBroker()
+    return _broker
+
+
+async def start_ws_broker():
+    await get_ws_broker().start()
+
+
+async def shutdown_ws_broker():
+    if _broker is not None:
+        await _broker.stop()
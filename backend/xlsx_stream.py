@@ -0,0 +1,108 @@
+"""
+SL Enterprise - XLSX Stream
+Export Excel con i fogli write-only di openpyxl: le righe vanno su disco man
+mano che arrivano, nessuna cella resta in memoria.
+
+- Le righe arrivano da un iterabile (cursore DB con yield_per, itertuples di
+  un DataFrame): nessuna lista completa di righe o celle.
+- Larghezza colonne calcolata su un campione delle prime XLSX_WIDTH_SAMPLE_ROWS
+  righe (prima si rileggevano tutte le celle del foglio finito).
+- Il file viene scritto direttamente su un path (in report_jobs: file
+  temporaneo nella cache artefatti), poi servito dal disco a blocchi.
+"""
+import os
+from itertools import chain, islice
+from typing import Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, Side
+from openpyxl.utils import get_column_letter
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+XLSX_WIDTH_SAMPLE_ROWS = int(os.getenv("XLSX_WIDTH_SAMPLE_ROWS", "1000"))
+MAX_COLUMN_WIDTH = 255  # limite di Excel
+
+_THIN = Side(style="thin")
+# Stile intestazione di pandas.to_excel (grassetto, bordo sottile, centrato)
+DEFAULT_HEADER_STYLE = {
+    "font": Font(bold=True),
+    "border": Border(left=_THIN, right=_THIN, top=_THIN, bottom=_THIN),
+    "alignment": Alignment(horizontal="center", vertical="top"),
+}
+
+
+class Styled(NamedTuple):
+    """Valore di cella con stile (intestazioni, titoli)."""
+    value: object
+    font: Optional[Font] = None
+    fill: Optional[object] = None
+    border: Optional[Border] = None
+    alignment: Optional[Alignment] = None
+
+
+class XlsxSheet(NamedTuple):
+    title: str
+    headers: Sequence[str]             # vuoto: foglio senza intestazione
+    rows: Iterable[Sequence]           # valori semplici o Styled
+    widths: Optional[Sequence[float]] = None  # None: calcolate sul campione di righe
+    header_style: Optional[dict] = None       # kwargs di Styled (default: come pandas)
+
+
+def _text_length(value) -> int:
+    if isinstance(value, Styled):
+        value = value.value
+    return 0 if value is None else len(str(value))
+
+
+def sample_widths(headers: Sequence[str], rows: Iterable[Sequence],
+                  sample_size: int = XLSX_WIDTH_SAMPLE_ROWS) -> Tuple[List[float], Iterable[Sequence]]:
+    """
+    Larghezze (testo più lungo + 2) da intestazione e prime sample_size righe.
+    Ritorna anche l'iteratore delle righe con il campione rimesso in testa.
+    """
+    rows = iter(rows)
+    sample = list(islice(rows, sample_size))
+    columns = max([len(headers)] + [len(row) for row in sample])
+    lengths = [_text_length(headers[i]) if i < len(headers) else 0 for i in range(columns)]
+    for row in sample:
+        for i, value in enumerate(row):
+            length = _text_length(value)
+            if length > lengths[i]:
+                lengths[i] = length
+    return [min(length + 2, MAX_COLUMN_WIDTH) for length in lengths], chain(sample, rows)
+
+
+def _cell(ws, value):
+    if not isinstance(value, Styled):
+        return value
+    cell = WriteOnlyCell(ws, value=value.value)
+    for attr in ("font", "fill", "border", "alignment"):
+        style = getattr(value, attr)
+        if style is not None:
+            setattr(cell, attr, style)
+    return cell
+
+
+def write_xlsx(target, sheets: Iterable[XlsxSheet]) -> int:
+    """Scrive i fogli in modalità write-only su target (path o file binario). Ritorna le righe dati scritte."""
+    wb = Workbook(write_only=True)
+    written = 0
+    for sheet in sheets:
+        ws = wb.create_sheet(sheet.title)
+        rows = sheet.rows
+        widths = sheet.widths
+        if widths is None:
+            widths, rows = sample_widths(sheet.headers, rows)
+        # In write-only le larghezze vanno impostate prima della prima riga
+        for i, width in enumerate(widths, 1):
+            ws.column_dimensions[get_column_letter(i)].width = width
+
+        if sheet.headers:
+            header_style = sheet.header_style if sheet.header_style is not None else DEFAULT_HEADER_STYLE
+            ws.append([_cell(ws, Styled(header, **header_style)) for header in sheet.headers])
+        for row in rows:
+            ws.append([_cell(ws, value) for value in row] if any(isinstance(v, Styled) for v in row) else row)
+            written += 1
+    wb.save(target)
+    return written
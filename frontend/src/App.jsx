@@ -1,5 +1,6 @@
 import { BrowserRouter, Routes, Route, Navigate } from 'react-router-dom';
 import { AuthProvider } from './context/AuthContext';
+import { BadgeProvider } from './context/BadgeContext';
 import ProtectedRoute from './components/ProtectedRoute';
 import PermissionRoute from './components/PermissionRoute';
 import HomeRedirect from './components/HomeRedirect';
@@ -79,7 +80,10 @@ function App() {
               path="/"
               element={
                 <ProtectedRoute>
-                  <MainLayout />
+                  {/* Una sola socket /ws/badges per i contatori di Sidebar e campanella */}
+                  <BadgeProvider>
+                    <MainLayout />
+                  </BadgeProvider>
                 </ProtectedRoute>
               }
             >
@@ -6,6 +6,7 @@ import { useState, useEffect, useRef, useCallback } from 'react';
 import { Link } from 'react-router-dom';
 import { notificationsApi, chatApi } from '../../api/client';
 import { useAuth } from '../../context/AuthContext';
+import { useBadges } from '../../context/BadgeContext';
 import { useUI } from '../ui/CustomUI';
 
 export default function NotificationBell() {
@@ -21,6 +22,11 @@ export default function NotificationBell() {
     const unreadCountRef = useRef(0); // Ref stabile per il confronto (no stale closure)
     const lastSoundTimeRef = useRef(0); // Cooldown anti-sovrapposizione suoni
     const { toast } = useUI();
+    const { counters, connected } = useBadges();
+    const badgeCountersRef = useRef(counters); // Ultimi contatori da /ws/badges
+    badgeCountersRef.current = counters;
+    const connectedRef = useRef(connected);
+    connectedRef.current = connected;
 
     // Determine destination based on role
     const viewAllLink = ['coordinator', 'operator', 'production_manager'].includes(user?.role)
@@ -58,88 +64,100 @@ export default function NotificationBell() {
         }
     }, []);
 
-    // Fetch unread count and play sound if increased — runs ONCE at mount
-    useEffect(() => {
-        const fetchCount = async () => {
-            try {
-                // Sequential fetch to avoid DB locking issues
-                let notifData = { unread_count: 0 };
-                let chatData = { total_unread: 0, conversations: [] };
-
+    // Fetch unread count and play sound if increased
+    const fetchCountRef = useRef(null);
+    fetchCountRef.current = async () => {
+        try {
+            // Sequential fetch to avoid DB locking issues
+            let notifData = { unread_count: 0 };
+            let chatData = { total_unread: 0, conversations: [] };
+
+            if (connectedRef.current) {
+                // Contatore notifiche già aggiornato da /ws/badges
+                notifData = { unread_count: badgeCountersRef.current.notifications };
+            } else {
                 try {
                     notifData = await notificationsApi.getUnreadCount();
                 } catch (e) {
                     console.error("Notif count fetch failed", e);
                 }
+            }
 
-                try {
-                    chatData = await chatApi.getNotificationsSummary();
-                } catch (e) {
-                    console.error("Chat summary fetch failed - Keeping previous state or 0", e);
-                }
+            try {
+                chatData = await chatApi.getNotificationsSummary();
+            } catch (e) {
+                console.error("Chat summary fetch failed - Keeping previous state or 0", e);
+            }
 
-                const notifCount = notifData.unread_count || 0;
-                const chatCount = chatData.total_unread || 0;
+            const notifCount = notifData.unread_count || 0;
+            const chatCount = chatData.total_unread || 0;
 
-                const newTotal = notifCount + chatCount;
+            const newTotal = notifCount + chatCount;
 
-                // Toast Logic per Chat
-                const currentConvs = {};
-                (chatData.conversations || []).forEach(c => {
-                    currentConvs[c.conversation_id] = c.unread_count;
-                });
+            // Toast Logic per Chat
+            const currentConvs = {};
+            (chatData.conversations || []).forEach(c => {
+                currentConvs[c.conversation_id] = c.unread_count;
+            });
 
-                const prevTotal = unreadCountRef.current;
+            const prevTotal = unreadCountRef.current;
 
-                if (!isFirstLoadRef.current) {
-                    // Chat Toasts
-                    (chatData.conversations || []).forEach(conv => {
-                        const prevCount = prevConversationsRef.current[conv.conversation_id] || 0;
-                        if (conv.unread_count > prevCount) {
-                            toast.info(`Nuovo messaggio da ${conv.name}`);
-                        }
-                    });
-
-                    if (newTotal > prevTotal) {
-                        playElegantSound();
-
-                        // Se l'incremento non è solo chat, mostra toast di sistema
-                        const chatIncrease = Object.values(currentConvs).reduce((a, b) => a + b, 0) -
-                            Object.values(prevConversationsRef.current || {}).reduce((a, b) => a + b, 0);
-
-                        if ((newTotal - prevTotal) > chatIncrease) {
-                            // È arrivata una notifica di sistema!
-                            try {
-                                const latest = await notificationsApi.getNotifications({ limit: 1 });
-                                if (latest[0]) {
-                                    const n = latest[0];
-                                    if (n.notif_type === 'critical') toast.error(n.title);
-                                    else if (n.notif_type === 'urgent') toast.warning(n.title);
-                                    else toast.info(n.title);
-                                }
-                            } catch (err) {
-                                console.error("Failed to fetch latest notif for toast", err);
+            if (!isFirstLoadRef.current) {
+                // Chat Toasts
+                (chatData.conversations || []).forEach(conv => {
+                    const prevCount = prevConversationsRef.current[conv.conversation_id] || 0;
+                    if (conv.unread_count > prevCount) {
+                        toast.info(`Nuovo messaggio da ${conv.name}`);
+                    }
+                });
+
+                if (newTotal > prevTotal) {
+                    playElegantSound();
+
+                    // Se l'incremento non è solo chat, mostra toast di sistema
+                    const chatIncrease = Object.values(currentConvs).reduce((a, b) => a + b, 0) -
+                        Object.values(prevConversationsRef.current || {}).reduce((a, b) => a + b, 0);
+
+                    if ((newTotal - prevTotal) > chatIncrease) {
+                        // È arrivata una notifica di sistema!
+                        try {
+                            const latest = await notificationsApi.getNotifications({ limit: 1 });
+                            if (latest[0]) {
+                                const n = latest[0];
+                                if (n.notif_type === 'critical') toast.error(n.title);
+                                else if (n.notif_type === 'urgent') toast.warning(n.title);
+                                else toast.info(n.title);
                             }
+                        } catch (err) {
+                            console.error("Failed to fetch latest notif for toast", err);
                         }
                     }
-                } else {
-                    isFirstLoadRef.current = false;
                 }
-
-                // Aggiorna Refs e State
-                prevConversationsRef.current = currentConvs;
-                unreadCountRef.current = newTotal;
-                setUnreadCount(newTotal);
-            } catch (error) {
-                console.error('Error fetching notification count:', error);
+            } else {
+                isFirstLoadRef.current = false;
             }
-        };
 
-        fetchCount();
-        const interval = setInterval(fetchCount, 5000);
+            // Aggiorna Refs e State
+            prevConversationsRef.current = currentConvs;
+            unreadCountRef.current = newTotal;
+            setUnreadCount(newTotal);
+        } catch (error) {
+            console.error('Error fetching notification count:', error);
+        }
+    };
+
+    // Polling solo come ripiego, finché /ws/badges non è connesso
+    useEffect(() => {
+        if (connected) return;
+        fetchCountRef.current();
+        const interval = setInterval(() => fetchCountRef.current(), 5000);
         return () => clearInterval(interval);
-        // eslint-disable-next-line react-hooks/exhaustive-deps
-    }, []);
+    }, [connected]);
+
+    // Con /ws/badges connesso: ricalcolo (toast, suono) solo quando cambia un contatore
+    useEffect(() => {
+        if (connected) fetchCountRef.current();
+    }, [connected, counters.notifications, counters.chat]);
 
     // Fetch notifications when dropdown opens
     useEffect(() => {
@@ -5,6 +5,7 @@
 import { useState, useEffect } from 'react';
 import { Link, useLocation, useNavigate } from 'react-router-dom';
 import { useAuth } from '../../context/AuthContext';
+import { useBadges } from '../../context/BadgeContext';
 import { hrStatsApi, chatApi, pickingApi, logisticsApi, ovenApi } from '../../api/client';
 import OnlineUsersWidget from '../ui/OnlineUsersWidget';
 import {
@@ -366,6 +367,7 @@ export default function Sidebar({ isOpen, onToggle, mobileOpen, setMobileOpen })
     const { user, logout, hasPermission } = useAuth();
     const navigate = useNavigate();
     const [pendingCounts, setPendingCounts] = useState({ events: 0, leaves: 0, chat: 0 });
+    const { counters, connected } = useBadges();
 
     useEffect(() => {
         console.log("🚀 SL ENTERPRISE SIDEBAR v5.0 LOADED - Light Enterprise");
@@ -376,10 +378,11 @@ export default function Sidebar({ isOpen, onToggle, mobileOpen, setMobileOpen })
 
     useEffect(() => {
         const fetchPending = async () => {
-            let newCounts = { events: 0, leaves: 0, chat: 0 };
+            // Con /ws/badges connesso HR e chat arrivano dalla socket (effetto sotto)
+            let newCounts = connected ? {} : { events: 0, leaves: 0, chat: 0 };
 
             // HR Stats
-            if (hasPermission('manage_attendance') || hasPermission('manage_employees')) {
+            if (!connected && (hasPermission('manage_attendance') || hasPermission('manage_employees'))) {
                 try {
                     const counts = await hrStatsApi.getPendingCounts();
                     newCounts = { ...newCounts, ...counts };
@@ -389,11 +392,13 @@ export default function Sidebar({ isOpen, onToggle, mobileOpen, setMobileOpen })
             }
 
             // Chat Stats
-            try {
-                const chatData = await chatApi.getNotificationsSummary();
-                newCounts.chat = chatData.total_unread || 0;
-            } catch (err) {
-                console.error("Failed to fetch chat counts", err);
+            if (!connected) {
+                try {
+                    const chatData = await chatApi.getNotificationsSummary();
+                    newCounts.chat = chatData.total_unread || 0;
+                } catch (err) {
+                    console.error("Failed to fetch chat counts", err);
+                }
             }
 
             // Production Supply Stats (for warehouse/admins)
@@ -438,7 +443,18 @@ export default function Sidebar({ isOpen, onToggle, mobileOpen, setMobileOpen })
         fetchPending();
         const interval = setInterval(fetchPending, 5000);
         return () => clearInterval(interval);
-    }, [user, hasPermission]);
+    }, [user, hasPermission, connected]);
+
+    // Badge HR e chat da /ws/badges (snapshot + delta)
+    useEffect(() => {
+        if (!connected) return;
+        setPendingCounts(prev => ({
+            ...prev,
+            events: counters.pending_events,
+            leaves: counters.pending_leaves,
+            chat: counters.chat
+        }));
+    }, [connected, counters.pending_events, counters.pending_leaves, counters.chat]);
 
     const handleLogout = () => {
         logout();
@@ -0,0 +1,91 @@
+/**
+ * SL Enterprise - Badge Context
+ * Contatori dei badge (notifiche, chat, approvazioni HR) da UNA connessione
+ * WebSocket per client (/ws/badges): snapshot all'apertura, poi solo delta.
+ * Finché la socket non è connessa `connected` è false e i componenti
+ * tornano al polling dei rispettivi endpoint.
+ */
+import { createContext, useContext, useEffect, useRef, useState } from 'react';
+import { useAuth } from './AuthContext';
+
+const WS_URL = window.location.protocol === 'https:'
+    ? `wss://${window.location.host}/api/ws/badges`
+    : `ws://${window.location.host}/api/ws/badges`;
+
+const RECONNECT_MS = 3000;
+
+const EMPTY_COUNTERS = { notifications: 0, chat: 0, pending_events: 0, pending_leaves: 0 };
+
+const BadgeContext = createContext({ counters: EMPTY_COUNTERS, conversations: {}, connected: false });
+
+export function BadgeProvider({ children }) {
+    const { user } = useAuth();
+    const [counters, setCounters] = useState(EMPTY_COUNTERS);
+    const [conversations, setConversations] = useState({});
+    const [connected, setConnected] = useState(false);
+    const wsRef = useRef(null);
+
+    useEffect(() => {
+        if (!user) return;
+        let reconnectTimer = null;
+        let closedByUs = false;
+
+        const connect = () => {
+            const token = localStorage.getItem('token');
+            if (!token) return;
+            const ws = new WebSocket(`${WS_URL}?token=${encodeURIComponent(token)}`);
+            wsRef.current = ws;
+
+            ws.onmessage = (event) => {
+                try {
+                    const data = JSON.parse(event.data);
+                    if (data.type === 'badges') {
+                        setCounters({ ...EMPTY_COUNTERS, ...data.counters });
+                        setConversations(data.chat_conversations || {});
+                        setConnected(true);
+                    } else if (data.type === 'badge_delta') {
+                        setCounters(prev => ({
+                            ...prev,
+                            [data.counter]: Math.max(0, (prev[data.counter] || 0) + data.delta)
+                        }));
+                        if (data.counter === 'chat' && data.conversation_id != null) {
+                            const key = String(data.conversation_id);
+                            setConversations(prev => ({ ...prev, [key]: Math.max(0, (prev[key] || 0) + data.delta) }));
+                        }
+                    }
+                } catch (e) {
+                    console.error('[BADGES WS] Error parsing message:', e);
+                }
+            };
+
+            ws.onclose = (event) => {
+                setConnected(false);
+                if (closedByUs) return;
+                // 4401 = token non valido: niente riconnessione, resta il polling
+                if (event.code === 4401) return;
+                reconnectTimer = setTimeout(connect, RECONNECT_MS);
+            };
+
+            ws.onerror = () => ws.close();
+        };
+
+        connect();
+        return () => {
+            closedByUs = true;
+            clearTimeout(reconnectTimer);
+            if (wsRef.current) wsRef.current.close();
+            wsRef.current = null;
+            setConnected(false);
+        };
+    }, [user]);
+
+    return (
+        <BadgeContext.Provider value={{ counters, conversations, connected }}>
+            {children}
+        </BadgeContext.Provider>
+    );
+}
+
+export function useBadges() {
+    return useContext(BadgeContext);
+}